@@ -0,0 +1,122 @@
+"""Concurrent download and parsing of many files at once, for bulk ingestion."""
+
+from __future__ import annotations
+
+import concurrent.futures
+import itertools
+from typing import TYPE_CHECKING, Dict, Generator, Iterable, List, Tuple
+
+from . import gcp_apis, models, transform
+
+if TYPE_CHECKING:
+	from google.cloud import storage
+
+
+def list_files(
+	CS: storage.Client,
+	bucket_name: str,
+	prefix: str | None = None,
+	manifest: str | None = None,
+) -> List[str]:
+	"""Lists the files to ingest, either every blob under a prefix or the ones named in a manifest.
+
+	Args:
+	    CS (google.cloud.storage.Client): A Google Cloud Storage client object.
+	    bucket_name (str): The name of the bucket.
+	    prefix (str, optional): The prefix of the files inside the bucket.
+	    manifest (str, optional): The location of a file in the bucket, with the
+	        location of one file to ingest per line. Takes precedence over `prefix`.
+
+	Returns:
+	    List[str]: The locations of the files inside the bucket.
+
+	Raises:
+	    ValueError: If neither a prefix nor a manifest is given.
+	"""
+	if manifest:
+		file_contents = gcp_apis.storage_download_blob_as_string(CS=CS, bucket_name=bucket_name, file_path=manifest)
+		return [line.strip() for line in transform.split_lines(content=file_contents) if line.strip()]
+
+	if prefix is not None:
+		return gcp_apis.storage_list_blobs(CS=CS, bucket_name=bucket_name, prefix=prefix)
+
+	raise ValueError('Either a prefix or a manifest is required.')
+
+
+def download_and_parse(
+	CS: storage.Client,
+	bucket_name: str,
+	file_path: str,
+	run_hash: str,
+	has_headers: bool = True,
+) -> List[models.TitanicData]:
+	"""Downloads a CSV file and parses all its rows.
+
+	Args:
+	    CS (google.cloud.storage.Client): A Google Cloud Storage client object.
+	    bucket_name (str): The name of the bucket.
+	    file_path (str): The location of the file inside the bucket.
+	    run_hash (str): The hash of the run.
+	    has_headers (bool, optional): Whether the first line holds the column names. Defaults to True.
+
+	Returns:
+	    List[models.TitanicData]: The rows of the file.
+	"""
+	file_contents = gcp_apis.storage_download_blob_as_string(CS=CS, bucket_name=bucket_name, file_path=file_path)
+
+	datapoints = transform.split_lines(content=file_contents)
+	if has_headers:
+		datapoints = datapoints[1:]
+
+	return list(transform.titanic_transform(run_hash=run_hash, datapoints=datapoints))
+
+
+def download_and_parse_files(
+	CS: storage.Client,
+	bucket_name: str,
+	file_paths: Iterable[str],
+	run_hash: str,
+	max_workers: int = 8,
+) -> Generator[Tuple[str, List[models.TitanicData]], None, None]:
+	"""Downloads and parses files in a thread pool, yielding each file as soon as it is ready.
+
+	At most `max_workers` files are downloaded at the same time, and at most
+	`max_workers` more wait, parsed, to be consumed. So memory stays bounded however
+	many files there are, and the caller can write the rows of a file while the
+	next ones are still downloading. Files are yielded in completion order.
+
+	Args:
+	    CS (google.cloud.storage.Client): A Google Cloud Storage client object.
+	        Its connection pool holds 10 connections, keep `max_workers` at or under it.
+	    bucket_name (str): The name of the bucket.
+	    file_paths (Iterable[str]): The locations of the files inside the bucket.
+	    run_hash (str): The hash of the run.
+	    max_workers (int, optional): The number of files downloaded at the same time. Defaults to 8.
+
+	Yields:
+	    Tuple[str, List[models.TitanicData]]: The location of a file and its rows.
+	"""
+	paths = iter(file_paths)
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+		def _submit(file_path: str) -> concurrent.futures.Future:
+			return executor.submit(download_and_parse, CS=CS, bucket_name=bucket_name, file_path=file_path, run_hash=run_hash)
+
+		pending: Dict[concurrent.futures.Future, str] = {_submit(path): path for path in itertools.islice(paths, 2 * max_workers)}
+
+		try:
+			while pending:
+				done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+				for future in done:
+					file_path = pending.pop(future)
+
+					for next_path in itertools.islice(paths, 1):
+						pending[_submit(next_path)] = next_path
+
+					yield file_path, future.result()
+		finally:
+			# Do not start the files left behind after an error
+			for future in pending:
+				future.cancel()
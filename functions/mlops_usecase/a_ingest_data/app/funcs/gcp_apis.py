@@ -1,9 +1,18 @@
 """This module contains the functions that interact with the GCP APIs."""
 
+from __future__ import annotations
+
+import concurrent.futures
 import json
-from typing import Any, Dict, Sequence
+import tempfile
+import time
+from types import TracebackType
+from typing import IO, TYPE_CHECKING, Any, Dict, Generator, List, Sequence, Tuple, Type
+
+from . import models
 
-from google.cloud import bigquery, pubsub, storage
+if TYPE_CHECKING:
+	from google.cloud import bigquery, pubsub, storage
 
 
 def storage_download_blob_as_string(
@@ -37,6 +46,66 @@ def storage_download_blob_as_string(
 		raise ValueError(f'Blob {file_path} does not exist.')
 
 
+def storage_list_blobs(
+	CS: storage.Client,
+	bucket_name: str,
+	prefix: str,
+) -> List[str]:
+	"""Lists the blobs of a Google Cloud Storage bucket under a prefix.
+
+	Args:
+	    CS (google.cloud.storage.Client): A Google Cloud Storage client object.
+	    bucket_name (str): The name of the bucket.
+	    prefix (str): The prefix of the blobs, e.g. a folder inside the bucket.
+
+	Returns:
+	    List[str]: The locations of the blobs inside the bucket, folder placeholders excluded.
+	"""
+	return [blob.name for blob in CS.list_blobs(bucket_name, prefix=prefix) if not blob.name.endswith('/')]
+
+
+def storage_stream_blob_lines(
+	CS: storage.Client,
+	bucket_name: str,
+	file_path: str,
+	chunk_size: int = 1024 * 1024,
+) -> Generator[Tuple[int, str], None, None]:
+	"""Streams the lines of a blob from a Google Cloud Storage bucket.
+
+	The blob is read with ranged requests of `chunk_size` bytes, so only one
+	chunk is held in memory at a time, however big the file is. Empty lines are
+	skipped, but still counted, so each line keeps its number in the file.
+
+	Args:
+	    CS (google.cloud.storage.Client): A Google Cloud Storage client object.
+	    bucket_name (str): The name of the bucket.
+	    file_path (str): The location of the blob/file inside the bucket.
+	    chunk_size (int, optional): The size in bytes of each ranged request.
+	        Must be a multiple of 256KB. Defaults to 1MB.
+
+	Yields:
+	    Tuple[int, str]: The number of each non empty line in the file, starting at 1,
+	        and the line without its terminator.
+
+	Raises:
+	    ValueError: If the blob does not exist.
+	"""
+	# Getting the bucket
+	bucket = CS.bucket(bucket_name)
+
+	# Getting the blob
+	blob = bucket.blob(file_path)
+
+	if not blob.exists():
+		raise ValueError(f'Blob {file_path} does not exist.')
+
+	with blob.open('rt', chunk_size=chunk_size, encoding='utf-8') as f:
+		for line_number, line in enumerate(f, start=1):
+			line = line.rstrip('\r\n')
+			if line:
+				yield line_number, line
+
+
 def bigquery_insert_json_row(
 	BQ: bigquery.Client,
 	table_fqn: str,
@@ -68,14 +137,291 @@ def bigquery_insert_json_row(
 		return None
 
 
+class BigQueryBatchWriter:
+	"""Collects rows and streams them into a bigquery table in chunks.
+
+	A chunk is sent with a single `insert_rows_json` request as soon as it
+	reaches `max_rows` rows or `max_bytes` of JSON payload, instead of one
+	request per row. Errors returned by BigQuery are mapped back to the line
+	number of the row in the source file.
+
+	Args:
+	    BQ (bigquery.Client): The bigquery client.
+	    table_fqn (str): The fully qualified name of the table.
+	    max_rows (int, optional): Maximum number of rows per request. Defaults to 500.
+	    max_bytes (int, optional): Maximum JSON payload size per request.
+	        Defaults to 9MB, under the 10MB BigQuery request limit.
+
+	Attributes:
+	    errors (List[Dict[str, Any]]): The rows that failed, as dictionaries with
+	        the source `line`, the BigQuery `errors` and, when given, the source `file`.
+	    requests (int): The number of insert requests sent.
+	"""
+
+	def __init__(
+		self,
+		BQ: bigquery.Client,
+		table_fqn: str,
+		max_rows: int = 500,
+		max_bytes: int = 9 * 1024 * 1024,
+	) -> None:
+		"""Initializes the writer with an empty chunk."""
+		self.BQ = BQ
+		self.table_fqn = table_fqn
+		self.max_rows = max_rows
+		self.max_bytes = max_bytes
+		self.errors: List[Dict[str, Any]] = []
+		self.requests = 0
+		self._rows: List[Dict[str, Any]] = []
+		self._lines: List[Tuple[str | None, int]] = []
+		self._bytes = 0
+
+	def add(self, row: Dict[str, Any], line_number: int, file_path: str | None = None) -> None:
+		"""Adds a row to the current chunk, sending the chunk first if the row does not fit.
+
+		Args:
+		    row (Dict[str, Any]): The row to insert into the table.
+		    line_number (int): The line of the source file the row came from.
+		    file_path (str, optional): The source file, when rows of several files share the writer.
+		"""
+		row_bytes = len(json.dumps(row)) + 1
+
+		if self._rows and (len(self._rows) >= self.max_rows or self._bytes + row_bytes > self.max_bytes):
+			self.flush()
+
+		self._rows.append(row)
+		self._lines.append((file_path, line_number))
+		self._bytes += row_bytes
+
+	def flush(self) -> None:
+		"""Sends the pending rows to bigquery in a single request."""
+		if not self._rows:
+			return
+
+		errors = bigquery_insert_json_row(
+			BQ=self.BQ,
+			table_fqn=self.table_fqn,
+			row=self._rows,
+		)
+		self.requests += 1
+
+		for error in errors or []:
+			file_path, line_number = self._lines[error['index']]
+			self.errors.append({'line': line_number, 'errors': error['errors']} | ({'file': file_path} if file_path else {}))
+
+		self._rows = []
+		self._lines = []
+		self._bytes = 0
+
+	def __enter__(self) -> 'BigQueryBatchWriter':
+		"""Returns the writer to be used as a context manager."""
+		return self
+
+	def __exit__(
+		self,
+		exc_type: Type[BaseException] | None,
+		exc_value: BaseException | None,
+		traceback: TracebackType | None,
+	) -> None:
+		"""Sends the last chunk when the block exits without errors."""
+		if exc_type is None:
+			self.flush()
+
+
+class BigQueryLoadJobWriter:
+	"""Collects rows into a Parquet file and loads it into a bigquery table with a single load job.
+
+	Rows are converted to the column types of `schema` and written to a temporary
+	Parquet file in record batches of `batch_rows` rows, so only one batch is held
+	in memory at a time. The load job is submitted when the writer is closed.
+
+	The Parquet columns keep the modes of the table, so the load does not change them.
+	Rows with a value that does not convert to its column type, or without a value
+	for a required column, are left out of the file and reported with their line.
+
+	Args:
+	    BQ (bigquery.Client): The bigquery client.
+	    table_fqn (str): The fully qualified name of the table.
+	    schema (Dict[str, str], optional): The BigQuery type of each column.
+	        Defaults to the raw titanic table schema.
+	    required (Tuple[str, ...], optional): The REQUIRED columns of the table.
+	        Defaults to the ones of the raw titanic table.
+	    batch_rows (int, optional): Number of rows per Parquet record batch. Defaults to 10000.
+
+	Attributes:
+	    errors (List[Dict[str, Any]]): The rows left out, as dictionaries with the source `line`,
+	        the `errors` and, when given, the source `file`. The errors of the load job itself
+	        follow, with a `line` of None, as load jobs do not report the failing rows.
+	    requests (int): The number of load jobs submitted.
+	"""
+
+	_ARROW_TYPES = {
+		'STRING': 'string',
+		'INTEGER': 'int64',
+		'FLOAT': 'float64',
+		'BOOLEAN': 'bool',
+	}
+
+	def __init__(
+		self,
+		BQ: bigquery.Client,
+		table_fqn: str,
+		schema: Dict[str, str] = models.TITANIC_RAW_SCHEMA,
+		required: Tuple[str, ...] = models.TITANIC_RAW_REQUIRED,
+		batch_rows: int = 10000,
+	) -> None:
+		"""Initializes the writer with an empty Parquet file."""
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+
+		self.BQ = BQ
+		self.table_fqn = table_fqn
+		self.schema = schema
+		self.batch_rows = batch_rows
+		self.errors: List[Dict[str, Any]] = []
+		self.requests = 0
+		self._arrow_schema = pa.schema(
+			[pa.field(name, self._ARROW_TYPES[bq_type], nullable=name not in required) for name, bq_type in schema.items()]
+		)
+		self._columns: Dict[str, List[str | None]] = {name: [] for name in schema}
+		self._lines: List[Tuple[str | None, int]] = []
+		self._file: IO[bytes] = tempfile.TemporaryFile()
+		self._parquet = pq.ParquetWriter(self._file, self._arrow_schema)
+
+	def add(self, row: Dict[str, Any], line_number: int, file_path: str | None = None) -> None:
+		"""Adds a row to the current record batch, writing the batch first if it is full.
+
+		Args:
+		    row (Dict[str, Any]): The row to insert into the table.
+		    line_number (int): The line of the source file the row came from.
+		    file_path (str, optional): The source file, when rows of several files share the writer.
+		"""
+		if len(self._lines) >= self.batch_rows:
+			self.flush()
+
+		for name, values in self._columns.items():
+			value = row.get(name)
+			values.append(value if isinstance(value, str) and value.strip() else None)
+		self._lines.append((file_path, line_number))
+
+	def add_columns(self, columns: Dict[str, List[str]], line_numbers: List[int], file_path: str | None = None) -> None:
+		"""Adds a batch of rows given by column, as built by `transform.titanic_transform_columns`.
+
+		Args:
+		    columns (Dict[str, List[str]]): The values of each column of the rows.
+		    line_numbers (List[int]): The line of the source file each row came from.
+		    file_path (str, optional): The source file, when rows of several files share the writer.
+		"""
+		for name, values in self._columns.items():
+			values.extend(value if isinstance(value, str) and value.strip() else None for value in columns.get(name, [None] * len(line_numbers)))
+		self._lines.extend((file_path, line_number) for line_number in line_numbers)
+
+		if len(self._lines) >= self.batch_rows:
+			self.flush()
+
+	def _invalid_rows(self) -> Dict[int, List[Dict[str, str]]]:
+		"""The errors of each pending row that cannot be written, by index in the batch."""
+		import pyarrow as pa
+
+		invalid: Dict[int, List[Dict[str, str]]] = {}
+		for field in self._arrow_schema:
+			values = self._columns[field.name]
+			if not field.nullable:
+				for index, value in enumerate(values):
+					if value is None:
+						invalid.setdefault(index, []).append(
+							{'reason': 'invalid', 'location': field.name, 'message': f'Missing required field: {field.name}.'}
+						)
+			try:
+				pa.array(values, pa.string()).cast(field.type)
+			except pa.ArrowInvalid:
+				# Only a batch with a bad value pays for converting its values one by one
+				for index, value in enumerate(values):
+					try:
+						pa.array([value], pa.string()).cast(field.type)
+					except pa.ArrowInvalid as error:
+						invalid.setdefault(index, []).append({'reason': 'invalid', 'location': field.name, 'message': str(error)})
+		return invalid
+
+	def flush(self) -> None:
+		"""Writes the pending rows to the Parquet file as one record batch, without the invalid ones."""
+		import pyarrow as pa
+
+		if not self._lines:
+			return
+
+		columns = self._columns
+		invalid = self._invalid_rows()
+		rows = len(self._lines) - len(invalid)
+		if invalid:
+			for index, errors in sorted(invalid.items()):
+				file_path, line_number = self._lines[index]
+				self.errors.append({'line': line_number, 'errors': errors} | ({'file': file_path} if file_path else {}))
+			valid = [index for index in range(len(self._lines)) if index not in invalid]
+			columns = {name: [values[index] for index in valid] for name, values in columns.items()}
+
+		if rows:
+			batch = pa.record_batch(
+				[pa.array(columns[field.name], pa.string()).cast(field.type) for field in self._arrow_schema],
+				schema=self._arrow_schema,
+			)
+			self._parquet.write_batch(batch)
+		self._columns = {name: [] for name in self.schema}
+		self._lines = []
+
+	def close(self) -> None:
+		"""Writes the last record batch and loads the Parquet file into the table."""
+		from google.api_core import exceptions
+		from google.cloud import bigquery
+
+		self.flush()
+		self._parquet.close()
+
+		job = self.BQ.load_table_from_file(
+			self._file,
+			self.table_fqn,
+			rewind=True,
+			job_config=bigquery.LoadJobConfig(
+				source_format=bigquery.SourceFormat.PARQUET,
+				write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+			),
+		)
+		self.requests += 1
+
+		try:
+			job.result()
+		except exceptions.GoogleAPICallError:
+			print(json.dumps({'message': job.errors, 'severity': 'ERROR'}))
+			self.errors.append({'line': None, 'errors': job.errors})
+		finally:
+			self._file.close()
+
+	def __enter__(self) -> 'BigQueryLoadJobWriter':
+		"""Returns the writer to be used as a context manager."""
+		return self
+
+	def __exit__(
+		self,
+		exc_type: Type[BaseException] | None,
+		exc_value: BaseException | None,
+		traceback: TracebackType | None,
+	) -> None:
+		"""Submits the load job when the block exits without errors."""
+		if exc_type is None:
+			self.close()
+		else:
+			self._parquet.close()
+			self._file.close()
+
+
 def pubsub_publish_message(
 	PS: pubsub.PublisherClient,
 	project_id: str,
 	topic_id: str,
 	message: str,
 	attributes: Dict[str, str] = {},
-) -> None:
-	"""Publishes a message to a Pub/Sub topic.
+) -> concurrent.futures.Future:
+	"""Publishes a message to a Pub/Sub topic, without waiting for it to be sent.
 
 	Args:
 	    PS (pubsub.PublisherClient): The pubsub client.
@@ -84,11 +430,114 @@ def pubsub_publish_message(
 	    message (str): The message to publish.
 	    attributes (Dict[str, str], optional): The attributes of the message.
 	        Defaults to {}.
+
+	Returns:
+	    concurrent.futures.Future: A future that resolves to the message ID once the message is sent.
 	"""
 	_topic = PS.topic_path(project_id, topic_id)
 
-	PS.publish(
+	return PS.publish(
 		topic=_topic,
 		data=message.encode('utf-8'),
 		**attributes,
 	)
+
+
+class PubSubPublisher:
+	"""Publishes messages concurrently and waits for all of them before the function returns.
+
+	Messages are handed to the client, which sends them in the background, and their
+	futures are kept. Leaving the `with` block waits for every message to be sent, so
+	the function does not return before its messages are delivered.
+
+	Args:
+	    PS (pubsub.PublisherClient): The pubsub client.
+	    project_id (str): The ID of the project where the topics are located.
+	    timeout (float, optional): Seconds to wait for all the messages to be sent. Defaults to 30.
+
+	Attributes:
+	    latencies (List[float]): Seconds between publishing and sending each message.
+	"""
+
+	def __init__(self, PS: pubsub.PublisherClient, project_id: str, timeout: float = 30.0) -> None:
+		"""Initializes the publisher without pending messages."""
+		self.PS = PS
+		self.project_id = project_id
+		self.timeout = timeout
+		self.latencies: List[float] = []
+		self._futures: List[concurrent.futures.Future] = []
+
+	def publish(self, topic_id: str, message: str, attributes: Dict[str, str] = {}) -> concurrent.futures.Future:
+		"""Publishes a message to a Pub/Sub topic, without waiting for it to be sent.
+
+		Args:
+		    topic_id (str): The ID of the topic.
+		    message (str): The message to publish.
+		    attributes (Dict[str, str], optional): The attributes of the message.
+		        Defaults to {}.
+
+		Returns:
+		    concurrent.futures.Future: A future that resolves to the message ID once the message is sent.
+		"""
+		start = time.perf_counter()
+		# Resolved only after the latency is recorded, so waiting on it sees every latency
+		tracked: concurrent.futures.Future = concurrent.futures.Future()
+
+		def _sent(future: concurrent.futures.Future) -> None:
+			self.latencies.append(time.perf_counter() - start)
+			if future.exception() is not None:
+				tracked.set_exception(future.exception())
+			else:
+				tracked.set_result(future.result())
+
+		pubsub_publish_message(
+			PS=self.PS,
+			project_id=self.project_id,
+			topic_id=topic_id,
+			message=message,
+			attributes=attributes,
+		).add_done_callback(_sent)
+
+		self._futures.append(tracked)
+		return tracked
+
+	def wait(self) -> List[str]:
+		"""Waits for every published message to be sent.
+
+		Returns:
+		    List[str]: The IDs of the messages, in publishing order.
+
+		Raises:
+		    TimeoutError: If some messages are not sent within the timeout.
+		    Exception: The error of the first message that failed to be sent.
+		"""
+		_, not_done = concurrent.futures.wait(self._futures, timeout=self.timeout)
+		if not_done:
+			raise TimeoutError(f'{len(not_done)} of {len(self._futures)} messages were not published after {self.timeout}s.')
+
+		message_ids = [future.result() for future in self._futures]
+
+		print(
+			json.dumps(
+				{
+					'message': f'Published {len(message_ids)} messages',
+					'severity': 'INFO',
+					'publish_latency_max_s': max(self.latencies, default=0.0),
+				}
+			)
+		)
+		return message_ids
+
+	def __enter__(self) -> 'PubSubPublisher':
+		"""Returns the publisher to be used as a context manager."""
+		return self
+
+	def __exit__(
+		self,
+		exc_type: Type[BaseException] | None,
+		exc_value: BaseException | None,
+		traceback: TracebackType | None,
+	) -> None:
+		"""Waits for the published messages when the block exits without errors."""
+		if exc_type is None:
+			self.wait()
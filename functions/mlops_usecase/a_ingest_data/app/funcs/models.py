@@ -1,23 +1,115 @@
 """Models for the ingest_data function. Simplifies type hinting."""
 
-from dataclasses import dataclass
-from typing import Any, Dict, NamedTuple
+from __future__ import annotations
 
-from google.cloud import bigquery, pubsub, storage
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Tuple
 
+if TYPE_CHECKING:
+	from google.cloud import bigquery, pubsub, storage
 
-class GCPClients(NamedTuple):
-	"""A named tuple that contains GCP client objects for Storage, BigQuery, and Pub/Sub.
+
+def _build_storage_client(gcp_project_id: str | None) -> storage.Client:
+	from google.cloud import storage
+
+	return storage.Client(project=gcp_project_id)
+
+
+def _build_bigquery_client(gcp_project_id: str | None) -> bigquery.Client:
+	from google.cloud import bigquery
+
+	return bigquery.Client(project=gcp_project_id)
+
+
+def _build_publisher(gcp_project_id: str | None) -> pubsub.PublisherClient:
+	from google.cloud import pubsub
+
+	# Messages are sent in the background, in batches of up to 10ms
+	return pubsub.PublisherClient(
+		batch_settings=pubsub.types.BatchSettings(max_messages=100, max_latency=0.01),
+		publisher_options=pubsub.types.PublisherOptions(
+			flow_control=pubsub.types.PublishFlowControl(
+				message_limit=1000,
+				limit_exceeded_behavior=pubsub.types.LimitExceededBehavior.BLOCK,
+			),
+		),
+	)
+
+
+class GCPClients:
+	"""GCP client objects for Storage, BigQuery, and Pub/Sub, each one built the first time it is used.
+
+	The google.cloud libraries are imported by the first use of their client too, so a
+	code path only pays for the clients it needs. Clients given to the constructor are
+	used as they are, e.g. mocks in tests.
+
+	Args:
+	    gcp_project_id (str, optional): The project of the clients built on first use.
+	    storage_client (google.cloud.storage.Client, optional): A client to use instead of building one.
+	    bigquery_client (google.cloud.bigquery.Client, optional): A client to use instead of building one.
+	    publisher (google.cloud.pubsub_v1.PublisherClient, optional): A client to use instead of building one.
 
 	Attributes:
 	    storage_client (google.cloud.storage.Client): A client object for Google Cloud Storage.
 	    bigquery_client (google.cloud.bigquery.Client): A client object for Google BigQuery.
 	    publisher (google.cloud.pubsub_v1.PublisherClient): A client object for Google Cloud Pub/Sub.
+	    closed (bool): Whether the clients are closed, after which they cannot be used.
 	"""
 
-	storage_client: storage.Client
-	bigquery_client: bigquery.Client
-	publisher: pubsub.PublisherClient
+	def __init__(
+		self,
+		gcp_project_id: str | None = None,
+		storage_client: storage.Client | None = None,
+		bigquery_client: bigquery.Client | None = None,
+		publisher: pubsub.PublisherClient | None = None,
+	) -> None:
+		"""Keeps the given clients, the others are built on first use."""
+		self.gcp_project_id = gcp_project_id
+		self._clients: Dict[str, Any] = {
+			'storage_client': storage_client,
+			'bigquery_client': bigquery_client,
+			'publisher': publisher,
+		}
+		self._lock = threading.Lock()
+		self.closed = False
+
+	def _client(self, name: str, build: Callable[[str | None], Any]) -> Any:
+		"""Returns the client called `name`, built only once even when first used by several threads."""
+		if self.closed:
+			raise ValueError('The GCP clients are closed.')
+
+		if self._clients[name] is None:
+			with self._lock:
+				if self._clients[name] is None:
+					self._clients[name] = build(self.gcp_project_id)
+		return self._clients[name]
+
+	def close(self) -> None:
+		"""Closes the clients built so far, and their connection pools."""
+		with self._lock:
+			self.closed = True
+			for name, client in self._clients.items():
+				if client is None:
+					continue
+				if name == 'publisher':
+					client.stop()
+				else:
+					client.close()
+
+	@property
+	def storage_client(self) -> storage.Client:
+		"""The Google Cloud Storage client."""
+		return self._client('storage_client', _build_storage_client)
+
+	@property
+	def bigquery_client(self) -> bigquery.Client:
+		"""The Google BigQuery client."""
+		return self._client('bigquery_client', _build_bigquery_client)
+
+	@property
+	def publisher(self) -> pubsub.PublisherClient:
+		"""The Google Cloud Pub/Sub publisher client."""
+		return self._client('publisher', _build_publisher)
 
 
 class EnvVars(NamedTuple):
@@ -27,17 +119,46 @@ class EnvVars(NamedTuple):
 	    gcp_project_id (str): The ID of the Google Cloud Platform project.
 	    bq_table_fqn (str): The fully-qualified name of the BigQuery table.
 	    topic_ingestion_complete (str): The name of the Pub/Sub topic for ingestion completion notifications.
+	    load_job_row_threshold (int): Files with more rows than this are ingested with a load job
+	        instead of streaming inserts.
+	    bulk_max_workers (int): The number of files downloaded at the same time by the bulk ingestion.
 	"""
 
 	gcp_project_id: str
 	bq_table_fqn: str
 	topic_ingestion_complete: str
-
-
-@dataclass(kw_only=True, frozen=True)
-class TitanicData:
+	load_job_row_threshold: int = 10000
+	bulk_max_workers: int = 8
+
+
+# BigQuery column types of the raw titanic table.
+# Mirrors resources/mlops_usecase/bigquery/titanic_schema_raw.json
+TITANIC_RAW_SCHEMA: Dict[str, str] = {
+	'run_hash': 'STRING',
+	'PassengerId': 'INTEGER',
+	'Survived': 'INTEGER',
+	'Pclass': 'INTEGER',
+	'Name': 'STRING',
+	'Sex': 'STRING',
+	'Age': 'FLOAT',
+	'SibSp': 'INTEGER',
+	'Parch': 'INTEGER',
+	'Ticket': 'STRING',
+	'Fare': 'FLOAT',
+	'Cabin': 'STRING',
+	'Embarked': 'STRING',
+}
+
+# The REQUIRED columns of the raw titanic table, the others are NULLABLE
+TITANIC_RAW_REQUIRED: Tuple[str, ...] = ('run_hash', 'PassengerId')
+
+
+class TitanicData(NamedTuple):
 	"""A class representing the data for the titanic dataset.
 
+	A named tuple instead of a dataclass: rows are immutable, have no per instance
+	`__dict__` and are built with a single tuple allocation.
+
 	Attributes:
 		run_hash (str): The hash of the run.
 		PassengerId (Optional[str]): The ID of the passenger.
@@ -58,7 +179,7 @@ class TitanicData:
 	PassengerId: str | None
 	Survived: str | None = None
 	Pclass: str | None = None
-	Name: str | None
+	Name: str | None = None
 	Sex: str | None = None
 	Age: str | None = None
 	SibSp: str | None = None
@@ -78,7 +199,6 @@ class TitanicData:
 		Returns:
 		    TitanicData: A new instance of the TitanicData class.
 		"""
-		# Convert the Survived column to a boolean
 		return cls(**data)
 
 	def to_dict(self) -> Dict[str, Any]:
@@ -87,18 +207,15 @@ class TitanicData:
 		Returns:
 		    Dict[str, Any]: A dictionary containing the data for a single passenger.
 		"""
-		return {
-			'run_hash': self.run_hash,
-			'PassengerId': self.PassengerId,
-			'Survived': self.Survived,
-			'Pclass': self.Pclass,
-			'Name': self.Name,
-			'Sex': self.Sex,
-			'Age': self.Age,
-			'SibSp': self.SibSp,
-			'Parch': self.Parch,
-			'Ticket': self.Ticket,
-			'Fare': self.Fare,
-			'Cabin': self.Cabin,
-			'Embarked': self.Embarked,
-		}
+		return self._asdict()
+
+	def to_json_row(self) -> Dict[str, str]:
+		"""Converts the TitanicData instance to a bigquery streaming insert row.
+
+		Same as filtering `to_dict()`, without building the full dictionary first:
+		empty and missing values are left out, so BigQuery stores them as NULL.
+
+		Returns:
+		    Dict[str, str]: The non empty values of the passenger.
+		"""
+		return {k: v for k, v in zip(self._fields, self) if isinstance(v, str) and v.strip()}
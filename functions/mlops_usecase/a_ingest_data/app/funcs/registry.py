@@ -0,0 +1,96 @@
+"""Process-wide registry of the GCP clients, shared by every invocation of the function."""
+
+import json
+import os
+import threading
+from typing import Dict, Tuple
+
+from . import models
+
+
+class ClientRegistry:
+	"""Keeps one set of GCP clients per project for the whole process.
+
+	A warm instance handles many invocations, so its clients and their connection
+	pools are built once and reused by all of them, whatever the thread. Clients are
+	checked before being handed out: closed ones, and the ones inherited from the
+	parent process after a fork, whose connections are shared with it, are replaced.
+
+	Every build is logged with the counters, and one reuse in `log_every`, so a warm
+	instance that only reuses its clients still reports how many times it did.
+
+	Args:
+	    log_every (int, optional): The reuses between two logs of the counters. Defaults to 100.
+
+	Attributes:
+	    reused (int): The number of invocations that reused the clients.
+	    built (int): The number of invocations that built new clients.
+	"""
+
+	def __init__(self, log_every: int = 100) -> None:
+		"""Initializes the registry without clients."""
+		self.log_every = log_every
+		self.reused = 0
+		self.built = 0
+		# Project ID -> process ID that built the clients, and the clients
+		self._entries: Dict[str, Tuple[int, models.GCPClients]] = {}
+		self._lock = threading.Lock()
+
+	def get(self, gcp_project_id: str) -> models.GCPClients:
+		"""Returns the clients of the project, building them if there are none or they are unhealthy.
+
+		Args:
+		    gcp_project_id (str): The GCP project ID.
+
+		Returns:
+		    models.GCPClients: The clients of the project.
+		"""
+		with self._lock:
+			entry = self._entries.get(gcp_project_id)
+			reused = entry is not None and self._healthy(*entry)
+
+			if reused:
+				_, gcp_clients = entry  # type: ignore
+				self.reused += 1
+				# The reuses are sampled, logging each one would add an entry per invocation
+				if self.reused % self.log_every:
+					return gcp_clients
+				message = 'Reused GCP clients'
+			else:
+				gcp_clients = models.GCPClients(gcp_project_id=gcp_project_id)
+				self._entries[gcp_project_id] = (os.getpid(), gcp_clients)
+				self.built += 1
+				message = 'Built new GCP clients'
+
+			print(json.dumps({'message': message, 'severity': 'DEBUG'} | self.stats()))
+
+		return gcp_clients
+
+	def stats(self) -> Dict[str, int]:
+		"""The counters of the registry.
+
+		Returns:
+		    Dict[str, int]: The invocations that reused the clients, and the ones that built new ones.
+		"""
+		return {'clients_reused': self.reused, 'clients_built': self.built}
+
+	def invalidate(self, gcp_project_id: str) -> None:
+		"""Closes the clients of the project, so the next invocation builds new ones.
+
+		Args:
+		    gcp_project_id (str): The GCP project ID.
+		"""
+		with self._lock:
+			entry = self._entries.pop(gcp_project_id, None)
+
+		if entry is not None and entry[0] == os.getpid():
+			entry[1].close()
+
+	@staticmethod
+	def _healthy(pid: int, gcp_clients: models.GCPClients) -> bool:
+		"""Whether the clients can be reused by this process."""
+		return pid == os.getpid() and not gcp_clients.closed
+
+
+# The registry of this process
+clients = ClientRegistry()
@@ -1,5 +1,6 @@
 import csv
-from typing import Generator, List
+import itertools
+from typing import Dict, Generator, Iterable, List
 
 from . import models
 
@@ -18,38 +19,79 @@ def split_lines(
 	return content.strip().split('\n')
 
 
+# The columns of the titanic CSV files, in file order
+TITANIC_CSV_COLUMNS = tuple(name for name in models.TITANIC_RAW_SCHEMA if name != 'run_hash')
+
+
 def titanic_transform(
 	run_hash: str,
-	datapoints: List[str],
+	datapoints: Iterable[str],
 ) -> Generator[models.TitanicData, None, None]:
 	"""Generator that transforms a CSV datapoint into a titanic data object.
 
+	All the datapoints are decoded by a single CSV reader, in one pass. Empty
+	values are kept as empty strings.
+
 	Args:
 	    run_hash (str): The hash of the run.
-	    datapoints (List[str]): A list of CSV datapoints.
+	    datapoints (Iterable[str]): A list, or a stream, of CSV datapoints.
 
 	Yields:
 	    models.TitanicData: A titanic data object.
-	"""
-	for datapoint in datapoints:
-		datapoint_decoded = list(csv.reader([datapoint]))[0]
 
-		# Zip the headers and values together into a dictionary
-		datapoint_obj = models.TitanicData(
+	Raises:
+	    IndexError: If a datapoint has less columns than the titanic dataset.
+	"""
+	for datapoint_decoded in csv.reader(datapoints):
+		# A datapoint with missing columns raises an IndexError
+		yield models.TitanicData(
 			run_hash=run_hash,
-			PassengerId=datapoint_decoded[0] if datapoint_decoded[0] else '',
-			Survived=datapoint_decoded[1] if datapoint_decoded[1] else '',
-			Pclass=datapoint_decoded[2] if datapoint_decoded[2] else '',
-			Name=datapoint_decoded[3] if datapoint_decoded[3] else '',
-			Sex=datapoint_decoded[4] if datapoint_decoded[4] else '',
-			Age=datapoint_decoded[5] if datapoint_decoded[5] else '',
-			SibSp=datapoint_decoded[6] if datapoint_decoded[6] else '',
-			Parch=datapoint_decoded[7] if datapoint_decoded[7] else '',
-			Ticket=datapoint_decoded[8] if datapoint_decoded[8] else '',
-			Fare=datapoint_decoded[9] if datapoint_decoded[9] else '',
-			Cabin=datapoint_decoded[10] if datapoint_decoded[10] else '',
-			Embarked=datapoint_decoded[11] if datapoint_decoded[11] else '',
+			PassengerId=datapoint_decoded[0],
+			Survived=datapoint_decoded[1],
+			Pclass=datapoint_decoded[2],
+			Name=datapoint_decoded[3],
+			Sex=datapoint_decoded[4],
+			Age=datapoint_decoded[5],
+			SibSp=datapoint_decoded[6],
+			Parch=datapoint_decoded[7],
+			Ticket=datapoint_decoded[8],
+			Fare=datapoint_decoded[9],
+			Cabin=datapoint_decoded[10],
+			Embarked=datapoint_decoded[11],
 		)
 
-		# Yield the datapoint object
-		yield datapoint_obj
+
+def titanic_transform_columns(
+	run_hash: str,
+	datapoints: Iterable[str],
+	batch_rows: int = 10000,
+) -> Generator[Dict[str, List[str]], None, None]:
+	"""Generator that transforms CSV datapoints into batches of titanic columns.
+
+	Instead of one object per row, each batch holds one list of values per column,
+	built by transposing the decoded rows at once. The values are the same as the
+	attributes of the objects built by `titanic_transform`. The batches feed the
+	record batches of `gcp_apis.BigQueryLoadJobWriter` directly.
+
+	Args:
+	    run_hash (str): The hash of the run.
+	    datapoints (Iterable[str]): A list, or a stream, of CSV datapoints.
+	    batch_rows (int, optional): The maximum number of rows per batch. Defaults to 10000.
+
+	Yields:
+	    Dict[str, List[str]]: The values of each column of the batch, `run_hash` included.
+
+	Raises:
+	    IndexError: If a datapoint has less columns than the titanic dataset.
+	"""
+	n_columns = len(TITANIC_CSV_COLUMNS)
+	reader = csv.reader(datapoints)
+
+	while batch := list(itertools.islice(reader, batch_rows)):
+		# zip stops at the shortest row, so missing columns show up as a short transpose
+		columns = list(zip(*batch))
+		if len(columns) < n_columns:
+			short = next(row for row in batch if len(row) < n_columns)
+			raise IndexError(f'Expected {n_columns} columns, got {len(short)}: {short}')
+
+		yield {'run_hash': [run_hash] * len(batch)} | {name: list(columns[i]) for i, name in enumerate(TITANIC_CSV_COLUMNS)}
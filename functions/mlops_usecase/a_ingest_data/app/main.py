@@ -1,40 +1,40 @@
 """Cloud Function to Ingest Data."""
 
+import base64
+import itertools
+import json
 import os
 import uuid
 
 import functions_framework
 from cloudevents.http import CloudEvent
-from google.cloud import bigquery, pubsub, storage
 
 try:
-	from funcs import gcp_apis, models, transform
+	from funcs import bulk, gcp_apis, models, registry, transform
 except ImportError:
 	from a_ingest_data.app.funcs import (
+		bulk,
 		gcp_apis,
 		models,
+		registry,
 		transform,
 	)
 
 
 def load_clients(gcp_project_id: str) -> models.GCPClients:
-	"""Load the GCP clients.
+	"""Load the GCP clients, shared by every invocation of this instance.
 
 	Args:
 	    gcp_project_id (str): The GCP project ID.
 
 	Returns:
-	    GCPClients: A tuple of GCP clients.
+	    GCPClients: The GCP clients of the process, each one built the first time it is used.
 	        With the following attributes:
 	            storage_client: A storage client.
 	            bigquery_client: A bigquery client.
 	            publisher: A pubsub publisher client.
 	"""
-	storage_client = storage.Client(project=gcp_project_id)
-	bigquery_client = bigquery.Client(project=gcp_project_id)
-	publisher = pubsub.PublisherClient()
-
-	return models.GCPClients(storage_client=storage_client, bigquery_client=bigquery_client, publisher=publisher)
+	return registry.clients.get(gcp_project_id=gcp_project_id)
 
 
 ##############################
@@ -51,6 +51,10 @@ def _env_vars() -> models.EnvVars:
 	                 project_id.dataset_id.table_id.
 	    topic_ingestion_complete: The name of the Pub/Sub topic to publish a message
 	    to when data ingestion is complete.
+	    load_job_row_threshold: Files with more rows than this are ingested with a
+	    load job instead of streaming inserts.
+	    bulk_max_workers: The number of files downloaded at the same time by the
+	    bulk ingestion.
 
 	Returns:
 	    models.EnvVars: The env vars.
@@ -64,9 +68,12 @@ def _env_vars() -> models.EnvVars:
 {os.getenv("_BIGQUERY_DATASET_ID", "bq_table_fqn_dst")}.\
 {os.getenv("_BIGQUERY_TABLE_ID", "bq_table_fqn_tbl")}""",
 		topic_ingestion_complete=os.getenv('_TOPIC_INGESTION_COMPLETE', 'topic_ingestion_complete'),
+		load_job_row_threshold=int(os.getenv('_LOAD_JOB_ROW_THRESHOLD', '10000')),
+		bulk_max_workers=int(os.getenv('_BULK_MAX_WORKERS', '8')),
 	)
 
 
+# Registers the clients at cold start, every invocation reuses them
 if os.getenv('_CI_TESTING', 'no') == 'no':
 	env_vars = _env_vars()
 	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
@@ -80,67 +87,145 @@ def main(cloud_event: CloudEvent) -> None:
 	    cloud_event (CloudEvent): The cloud event that triggered this function.
 	"""
 	run_hash = str(uuid.uuid4())
-	if not hasattr(main, 'env_vars'):
-		env_vars = _env_vars()
-
-	if not hasattr(main, 'gcp_clients'):
-		gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)  # type: ignore
+	env_vars = _env_vars()
+	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
 
 	# Get the data from the cloud event
 	data: dict = cloud_event.get_data()  # type: ignore
 
-	file_contents = gcp_apis.storage_download_blob_as_string(
+	# Stream the file line by line, without holding it all in memory
+	numbered_lines = gcp_apis.storage_stream_blob_lines(
 		CS=gcp_clients.storage_client,  # type: ignore
 		bucket_name=data['bucket'],
 		file_path=data['name'],
 	)
 
-	# Split the content by lines
-	datapoints = transform.split_lines(content=file_contents)
-
 	# Get the headers (column names) from the first line
 	has_headers = True
 	if has_headers:
-		datapoints = datapoints[1:]
+		next(numbered_lines, None)
+
+	# Small files are streamed into BigQuery, big files are sent in a single load job.
+	# Only the lines up to the threshold are held in memory to make the choice.
+	head = list(itertools.islice(numbered_lines, env_vars.load_job_row_threshold + 1))
 
-	# Iterate through the the datapoints and insert them into BigQuery
-	errors = [
-		gcp_apis.bigquery_insert_json_row(
+	# Each row keeps the number of its line in the file, empty lines included
+	line_numbers, lines = itertools.tee(itertools.chain(head, numbered_lines))
+	numbers = (line_number for line_number, _ in line_numbers)
+	datapoints = (line for _, line in lines)
+
+	writer: gcp_apis.BigQueryBatchWriter | gcp_apis.BigQueryLoadJobWriter
+	if len(head) > env_vars.load_job_row_threshold:
+		# Decoded by column, without an object per row, and written in typed record batches
+		with gcp_apis.BigQueryLoadJobWriter(
+			BQ=gcp_clients.bigquery_client,
+			table_fqn=env_vars.bq_table_fqn,
+		) as writer:
+			for columns in transform.titanic_transform_columns(
+				run_hash=run_hash,
+				datapoints=datapoints,
+				batch_rows=writer.batch_rows,
+			):
+				writer.add_columns(columns=columns, line_numbers=list(itertools.islice(numbers, len(columns['run_hash']))))
+	else:
+		# Insert the datapoints into BigQuery in chunks, while the file is still being read
+		with gcp_apis.BigQueryBatchWriter(
 			BQ=gcp_clients.bigquery_client,
 			table_fqn=env_vars.bq_table_fqn,
-			row=[datapoint.to_dict()],
+		) as writer:
+			for line_number, datapoint in zip(
+				numbers,
+				transform.titanic_transform(
+					run_hash=run_hash,
+					datapoints=datapoints,
+				),
+			):
+				writer.add(row=datapoint.to_json_row(), line_number=line_number)
+
+	if writer.errors:
+		raise ValueError(f'Errors found: {writer.errors}')
+
+	# Both messages are sent concurrently, and waited for before returning
+	with gcp_apis.PubSubPublisher(
+		PS=gcp_clients.publisher,
+		project_id=env_vars.gcp_project_id,
+	) as publisher:
+		publisher.publish(
+			topic_id=env_vars.topic_ingestion_complete,
+			message=f"I finished ingesting the file {data['name']}!!",
+			attributes={
+				'closer-origin-function': 'functions.mlops.ingest_data',
+				'closer-run-hash': run_hash,
+			},
 		)
-		for datapoint in transform.titanic_transform(
-			run_hash=run_hash,
-			datapoints=datapoints,
+
+		########################################
+		# 2. Send the verification attribute ###
+		########################################
+
+		publisher.publish(
+			topic_id='verification',
+			message='ok',
+			attributes={
+				'closer-origin-function': 'functions.mlops.ingest_data',
+				'closer-origin-topic': env_vars.topic_ingestion_complete,
+			},
 		)
-	]
 
-	if any(errors):
-		raise ValueError(f'Errors found: {errors}')
 
-	_ = gcp_apis.pubsub_publish_message(
-		PS=gcp_clients.publisher,
-		project_id=env_vars.gcp_project_id,
-		topic_id=env_vars.topic_ingestion_complete,
-		message=f"I finished ingesting the file {data['name']}!!",
-		attributes={
-			'closer-origin-function': 'functions.mlops.ingest_data',
-			'closer-run-hash': run_hash,
-		},
+@functions_framework.cloud_event
+def bulk_main(cloud_event: CloudEvent) -> None:
+	"""Entrypoint of the cloud function for the bulk ingestion of many files at once.
+
+	Triggered by a Pub/Sub message whose data is a JSON object with the `bucket` and
+	either the `prefix` of the files to ingest or the location of a `manifest` file
+	that lists them, one per line. The files are downloaded and parsed concurrently,
+	their rows are written to BigQuery in batches as each file becomes ready, and a
+	single completion message is published for all of them.
+
+	Args:
+	    cloud_event (CloudEvent): The cloud event that triggered this function.
+	"""
+	run_hash = str(uuid.uuid4())
+	env_vars = _env_vars()
+	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
+
+	# Get the data from the pubsub message
+	data: dict = json.loads(base64.b64decode(cloud_event.data['message']['data']).decode('utf-8'))
+
+	file_paths = bulk.list_files(
+		CS=gcp_clients.storage_client,
+		bucket_name=data['bucket'],
+		prefix=data.get('prefix'),
+		manifest=data.get('manifest'),
 	)
 
-	########################################
-	# 2. Send the verification attribute ###
-	########################################
+	with gcp_apis.BigQueryBatchWriter(
+		BQ=gcp_clients.bigquery_client,
+		table_fqn=env_vars.bq_table_fqn,
+	) as writer:
+		for file_path, rows in bulk.download_and_parse_files(
+			CS=gcp_clients.storage_client,
+			bucket_name=data['bucket'],
+			file_paths=file_paths,
+			run_hash=run_hash,
+			max_workers=env_vars.bulk_max_workers,
+		):
+			for line_number, datapoint in enumerate(rows, start=2):
+				writer.add(row=datapoint.to_json_row(), line_number=line_number, file_path=file_path)
 
-	_ = gcp_apis.pubsub_publish_message(
+	if writer.errors:
+		raise ValueError(f'Errors found: {writer.errors}')
+
+	with gcp_apis.PubSubPublisher(
 		PS=gcp_clients.publisher,
 		project_id=env_vars.gcp_project_id,
-		topic_id='verification',
-		message='ok',
-		attributes={
-			'closer-origin-function': 'functions.mlops.ingest_data',
-			'closer-origin-topic': env_vars.topic_ingestion_complete,
-		},
-	)
+	) as publisher:
+		publisher.publish(
+			topic_id=env_vars.topic_ingestion_complete,
+			message=f'I finished ingesting {len(file_paths)} files from {data["bucket"]}!!',
+			attributes={
+				'closer-origin-function': 'functions.mlops.ingest_data',
+				'closer-run-hash': run_hash,
+			},
+		)
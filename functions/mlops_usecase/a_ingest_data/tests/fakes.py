@@ -0,0 +1,86 @@
+"""Local stand-ins for the GCP clients, to run the ingestion paths offline."""
+
+import concurrent.futures
+from typing import IO, Any, Dict, List, Sequence
+
+import pyarrow.parquet as pq
+from google.api_core import exceptions
+from google.cloud import bigquery
+
+
+class FakeLoadJob:
+    """A finished load job, optionally failed with `errors`."""
+
+    def __init__(self, errors: List[Dict[str, Any]] | None = None) -> None:
+        self.errors = errors
+
+    def result(self) -> 'FakeLoadJob':
+        if self.errors:
+            raise exceptions.BadRequest('Load job failed', errors=self.errors)
+        return self
+
+
+class FakeBigQueryClient:
+    """Keeps the rows written to each table in memory.
+
+    Implements the subset of `bigquery.Client` used by the ingest function:
+    `insert_rows_json` for streaming inserts and `load_table_from_file` for
+    Parquet load jobs.
+
+    Attributes:
+        tables (Dict[str, List[Dict[str, Any]]]): The rows of each table.
+        insert_requests (int): The number of `insert_rows_json` calls.
+        load_jobs (List[bigquery.LoadJobConfig]): The configuration of each load job.
+        row_errors (Dict[str, List[Dict[str, Any]]]): Errors to return for the
+            rows with the given PassengerId.
+        load_errors (List[Dict[str, Any]]): Errors to fail the load jobs with.
+        required (Dict[str, Sequence[str]]): The REQUIRED columns of each table. A load job
+            with one of them NULLABLE fails, as it would change the mode of the column.
+    """
+
+    def __init__(self) -> None:
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.insert_requests = 0
+        self.load_jobs: List[bigquery.LoadJobConfig] = []
+        self.row_errors: Dict[str, List[Dict[str, Any]]] = {}
+        self.load_errors: List[Dict[str, Any]] = []
+        self.required: Dict[str, Sequence[str]] = {}
+
+    def insert_rows_json(self, table: str, json_rows: Sequence[Dict[str, Any]], **kwargs: Any) -> List[Dict[str, Any]]:
+        self.insert_requests += 1
+        errors = []
+        for index, row in enumerate(json_rows):
+            if row.get('PassengerId') in self.row_errors:
+                errors.append({'index': index, 'errors': self.row_errors[row['PassengerId']]})
+            else:
+                self.tables.setdefault(table, []).append(dict(row))
+        return errors
+
+    def load_table_from_file(
+        self,
+        file_obj: IO[bytes],
+        destination: str,
+        rewind: bool = False,
+        job_config: bigquery.LoadJobConfig | None = None,
+        **kwargs: Any,
+    ) -> FakeLoadJob:
+        self.load_jobs.append(job_config)
+        if self.load_errors:
+            return FakeLoadJob(errors=self.load_errors)
+
+        if rewind:
+            file_obj.seek(0)
+        table = pq.read_table(file_obj)
+        for name in self.required.get(destination, ()):
+            if table.schema.field(name).nullable:
+                return FakeLoadJob(errors=[{'reason': 'invalid', 'message': f'Field {name} has changed mode from REQUIRED to NULLABLE'}])
+        rows = table.to_pylist()
+        self.tables.setdefault(destination, []).extend({k: v for k, v in row.items() if v is not None} for row in rows)
+        return FakeLoadJob()
+
+
+def published_future(message_id: str = '1') -> concurrent.futures.Future:
+    """A publish future of a message that was already sent."""
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    future.set_result(message_id)
+    return future
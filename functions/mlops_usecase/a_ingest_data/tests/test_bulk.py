@@ -0,0 +1,67 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+from google.cloud import storage
+
+from a_ingest_data.app.funcs import bulk, gcp_apis
+
+CSV_CONTENT = '''PassengerId,Survived,Pclass,Name,Sex,Age,SibSp,Parch,Ticket,Fare,Cabin,Embarked
+1,0,3,"Braund, Mr. Owen Harris",male,22,1,0,A/5 21171,7.25,,S
+2,1,1,"Cumings, Mrs. John Bradley (Florence Briggs Thayer)",female,38,1,0,PC 17599,71.2833,C85,C
+'''
+
+
+@pytest.fixture
+def storage_client() -> mock.Mock:
+    return mock.Mock(spec=storage.Client)
+
+
+def test_list_files_prefix(storage_client: mock.Mock) -> None:
+    blobs = [mock.Mock(), mock.Mock(), mock.Mock()]
+    blobs[0].name, blobs[1].name, blobs[2].name = 'drop/', 'drop/a.csv', 'drop/b.csv'
+    storage_client.list_blobs.return_value = blobs
+
+    assert bulk.list_files(CS=storage_client, bucket_name='bucket', prefix='drop/') == ['drop/a.csv', 'drop/b.csv']
+    storage_client.list_blobs.assert_called_once_with('bucket', prefix='drop/')
+
+
+def test_list_files_manifest(storage_client: mock.Mock) -> None:
+    with mock.patch.object(gcp_apis, 'storage_download_blob_as_string', return_value='drop/a.csv\n\ndrop/b.csv \n'):
+        assert bulk.list_files(CS=storage_client, bucket_name='bucket', prefix='drop/', manifest='manifest.txt') == ['drop/a.csv', 'drop/b.csv']
+
+
+def test_list_files_requires_prefix_or_manifest(storage_client: mock.Mock) -> None:
+    with pytest.raises(ValueError):
+        bulk.list_files(CS=storage_client, bucket_name='bucket')
+
+
+def test_download_and_parse_files_bounded_concurrency(storage_client: mock.Mock) -> None:
+    lock = threading.Lock()
+    running = {'now': 0, 'max': 0}
+
+    def _download(CS: mock.Mock, bucket_name: str, file_path: str) -> str:
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(0.01)
+        with lock:
+            running['now'] -= 1
+        return CSV_CONTENT
+
+    file_paths = [f'drop/{i}.csv' for i in range(20)]
+
+    with mock.patch.object(gcp_apis, 'storage_download_blob_as_string', side_effect=_download):
+        results = dict(bulk.download_and_parse_files(CS=storage_client, bucket_name='bucket', file_paths=file_paths, run_hash='test', max_workers=3))
+
+    assert sorted(results) == sorted(file_paths)
+    assert 1 < running['max'] <= 3
+    assert [row.PassengerId for row in results['drop/7.csv']] == ['1', '2']
+    assert results['drop/7.csv'][0].run_hash == 'test'
+
+
+def test_download_and_parse_files_error(storage_client: mock.Mock) -> None:
+    with mock.patch.object(gcp_apis, 'storage_download_blob_as_string', side_effect=ValueError('Blob drop/0.csv does not exist.')):
+        with pytest.raises(ValueError):
+            list(bulk.download_and_parse_files(CS=storage_client, bucket_name='bucket', file_paths=['drop/0.csv'], run_hash='test'))
@@ -0,0 +1,188 @@
+import concurrent.futures
+import io
+from unittest import mock
+
+import pytest
+from google.cloud import bigquery, pubsub, storage
+
+from a_ingest_data.app.funcs import gcp_apis, models
+from a_ingest_data.tests import fakes
+
+
+@pytest.fixture
+def bigquery_client() -> mock.Mock:
+    client = mock.Mock(spec=bigquery.Client)
+    client.insert_rows_json.return_value = []
+    return client
+
+
+def _rows(n: int) -> list:
+    return [{'run_hash': 'test', 'PassengerId': str(i), 'Name': f'Passenger {i}'} for i in range(n)]
+
+
+def test_batch_writer_sends_one_request_per_chunk(bigquery_client: mock.Mock) -> None:
+    with gcp_apis.BigQueryBatchWriter(BQ=bigquery_client, table_fqn='p.d.t', max_rows=2) as writer:
+        for line_number, row in enumerate(_rows(5), start=2):
+            writer.add(row=row, line_number=line_number)
+
+    assert writer.requests == 3
+    assert [len(c.kwargs['json_rows']) for c in bigquery_client.insert_rows_json.call_args_list] == [2, 2, 1]
+    assert writer.errors == []
+
+
+def test_batch_writer_bounded_by_bytes(bigquery_client: mock.Mock) -> None:
+    rows = _rows(4)
+    row_bytes = len(gcp_apis.json.dumps(rows[0])) + 1
+
+    with gcp_apis.BigQueryBatchWriter(BQ=bigquery_client, table_fqn='p.d.t', max_bytes=row_bytes * 2) as writer:
+        for line_number, row in enumerate(rows, start=2):
+            writer.add(row=row, line_number=line_number)
+
+    assert writer.requests == 2
+
+
+def test_batch_writer_maps_errors_to_lines(bigquery_client: mock.Mock) -> None:
+    bigquery_client.insert_rows_json.side_effect = [
+        [],
+        [{'index': 0, 'errors': [{'reason': 'invalid'}]}],
+    ]
+
+    with gcp_apis.BigQueryBatchWriter(BQ=bigquery_client, table_fqn='p.d.t', max_rows=3) as writer:
+        for line_number, row in enumerate(_rows(5), start=2):
+            writer.add(row=row, line_number=line_number)
+
+    assert writer.errors == [{'line': 5, 'errors': [{'reason': 'invalid'}]}]
+
+
+def test_batch_writer_no_rows(bigquery_client: mock.Mock) -> None:
+    with gcp_apis.BigQueryBatchWriter(BQ=bigquery_client, table_fqn='p.d.t') as writer:
+        pass
+
+    assert writer.requests == 0
+    bigquery_client.insert_rows_json.assert_not_called()
+
+
+@pytest.fixture
+def storage_client() -> mock.Mock:
+    return mock.Mock(spec=storage.Client)
+
+
+def test_storage_stream_blob_lines(storage_client: mock.Mock) -> None:
+    blob = storage_client.bucket.return_value.blob.return_value
+    blob.exists.return_value = True
+    blob.open.return_value = io.StringIO('col1,col2\r\nvalue1,value2\n\nvalue3,value4\n')
+
+    lines = gcp_apis.storage_stream_blob_lines(CS=storage_client, bucket_name='bucket', file_path='file.csv', chunk_size=256 * 1024)
+
+    assert list(lines) == [(1, 'col1,col2'), (2, 'value1,value2'), (4, 'value3,value4')]
+    blob.open.assert_called_once_with('rt', chunk_size=256 * 1024, encoding='utf-8')
+
+
+def test_storage_stream_blob_lines_missing_blob(storage_client: mock.Mock) -> None:
+    storage_client.bucket.return_value.blob.return_value.exists.return_value = False
+
+    with pytest.raises(ValueError):
+        list(gcp_apis.storage_stream_blob_lines(CS=storage_client, bucket_name='bucket', file_path='file.csv'))
+
+
+def test_load_job_writer_types_and_batches() -> None:
+    bigquery_client = fakes.FakeBigQueryClient()
+    bigquery_client.required = {'p.d.t': models.TITANIC_RAW_REQUIRED}
+
+    with gcp_apis.BigQueryLoadJobWriter(BQ=bigquery_client, table_fqn='p.d.t', batch_rows=2) as writer:
+        for line_number, row in enumerate(_rows(5), start=2):
+            writer.add(row=row | {'Age': '22.5', 'Survived': ' '}, line_number=line_number)
+
+    assert writer.requests == 1
+    assert writer.errors == []
+    assert bigquery_client.load_jobs[0].source_format == bigquery.SourceFormat.PARQUET
+    assert bigquery_client.tables['p.d.t'] == [
+        {'run_hash': 'test', 'PassengerId': i, 'Name': f'Passenger {i}', 'Age': 22.5} for i in range(5)
+    ]
+
+
+def test_load_job_writer_maps_invalid_rows_to_lines() -> None:
+    bigquery_client = fakes.FakeBigQueryClient()
+    rows = _rows(5)
+    rows[1] |= {'Age': 'twenty'}
+    rows[3] |= {'PassengerId': ' '}
+
+    with gcp_apis.BigQueryLoadJobWriter(BQ=bigquery_client, table_fqn='p.d.t', batch_rows=2) as writer:
+        for line_number, row in enumerate(rows, start=2):
+            writer.add(row=row, line_number=line_number, file_path='drop/a.csv')
+
+    assert [(error['file'], error['line'], error['errors'][0]['location']) for error in writer.errors] == [
+        ('drop/a.csv', 3, 'Age'),
+        ('drop/a.csv', 5, 'PassengerId'),
+    ]
+    assert [row['PassengerId'] for row in bigquery_client.tables['p.d.t']] == [0, 2, 4]
+
+
+def test_load_job_writer_add_columns() -> None:
+    rows = [row | {'Age': '22.5', 'Survived': ' '} for row in _rows(5)]
+    columns = {name: [row.get(name, '') for row in rows] for name in models.TITANIC_RAW_SCHEMA}
+    by_row, by_column = fakes.FakeBigQueryClient(), fakes.FakeBigQueryClient()
+
+    with gcp_apis.BigQueryLoadJobWriter(BQ=by_row, table_fqn='p.d.t') as writer:
+        for line_number, row in enumerate(rows, start=2):
+            writer.add(row=row, line_number=line_number)
+    with gcp_apis.BigQueryLoadJobWriter(BQ=by_column, table_fqn='p.d.t', batch_rows=2) as writer:
+        writer.add_columns(columns={name: values[:3] for name, values in columns.items()}, line_numbers=[2, 3, 4])
+        writer.add_columns(columns={name: values[3:] for name, values in columns.items()}, line_numbers=[5, 6])
+
+    assert by_column.tables == by_row.tables
+
+
+def test_load_job_writer_errors() -> None:
+    bigquery_client = fakes.FakeBigQueryClient()
+    bigquery_client.load_errors = [{'reason': 'invalid', 'message': 'bad row'}]
+
+    with gcp_apis.BigQueryLoadJobWriter(BQ=bigquery_client, table_fqn='p.d.t') as writer:
+        writer.add(row=_rows(1)[0], line_number=2)
+
+    assert writer.errors == [{'line': None, 'errors': [{'reason': 'invalid', 'message': 'bad row'}]}]
+
+
+@pytest.fixture
+def publisher() -> mock.Mock:
+    publisher = mock.Mock(spec=pubsub.PublisherClient)
+    publisher.topic_path.side_effect = lambda project_id, topic_id: f'projects/{project_id}/topics/{topic_id}'
+    return publisher
+
+
+def test_pubsub_publisher_waits_for_all_messages(publisher: mock.Mock) -> None:
+    futures = [concurrent.futures.Future(), concurrent.futures.Future()]
+    publisher.publish.side_effect = futures
+
+    with gcp_apis.PubSubPublisher(PS=publisher, project_id='project') as tracker:
+        first = tracker.publish(topic_id='topic', message='one', attributes={'key': 'value'})
+        second = tracker.publish(topic_id='verification', message='two')
+
+        # Both messages are handed to the client before any of them is sent
+        assert publisher.publish.call_count == 2
+        assert not first.done() and not second.done()
+
+        futures[1].set_result('2')
+        futures[0].set_result('1')
+
+    assert tracker.wait() == ['1', '2']
+    assert len(tracker.latencies) == 2
+    publisher.publish.assert_any_call(topic='projects/project/topics/topic', data=b'one', key='value')
+
+
+def test_pubsub_publisher_error(publisher: mock.Mock) -> None:
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    future.set_exception(RuntimeError('not found'))
+    publisher.publish.return_value = future
+
+    with pytest.raises(RuntimeError):
+        with gcp_apis.PubSubPublisher(PS=publisher, project_id='project') as tracker:
+            tracker.publish(topic_id='topic', message='one')
+
+
+def test_pubsub_publisher_timeout(publisher: mock.Mock) -> None:
+    publisher.publish.return_value = concurrent.futures.Future()
+
+    with pytest.raises(TimeoutError):
+        with gcp_apis.PubSubPublisher(PS=publisher, project_id='project', timeout=0.01) as tracker:
+            tracker.publish(topic_id='topic', message='one')
@@ -1,3 +1,5 @@
+import base64
+import json
 from dataclasses import dataclass
 from typing import List
 from unittest import mock
@@ -8,6 +10,7 @@ from google.cloud import bigquery, pubsub, storage
 
 from a_ingest_data.app import main
 from a_ingest_data.app.funcs import gcp_apis, models, transform
+from a_ingest_data.tests import fakes
 
 TEST_ENV = {
     '_GCP_PROJECT_ID': 'test-project',
@@ -100,6 +103,9 @@ class Datapoint:
             'col2': self.col2
         }
 
+    def to_json_row(self) -> dict:
+        return self.to_dict()
+
 
 @pytest.fixture
 def datapoint_in_class() -> List[Datapoint]:
@@ -129,46 +135,177 @@ def test_main(
     datapoint_in_class: List[Datapoint],
 ) -> None:
     # Mock the necessary functions
-    with mock.patch.object(gcp_apis, 'storage_download_blob_as_string') as mock_download_blob_as_string, \
-            mock.patch.object(transform, 'split_lines', return_value=datapoints), \
+    with mock.patch.object(gcp_apis, 'storage_stream_blob_lines') as mock_stream_blob_lines, \
             mock.patch.object(gcp_apis, 'bigquery_insert_json_row'), \
-            mock.patch.object(gcp_apis, 'pubsub_publish_message') as mock_publish_message, \
+            mock.patch.object(gcp_apis, 'pubsub_publish_message', return_value=fakes.published_future()) as mock_publish_message, \
             mock.patch.object(main, 'load_clients', return_value=gcp_clients), \
             mock.patch.object(transform, 'titanic_transform', return_value=datapoint_in_class), \
             mock.patch.object(main, '_env_vars', return_value=env_vars):
 
         # Set the mock return values
-        mock_download_blob_as_string.return_value = 'col1,col2\nvalue1,value2\nvalue3,value4\n'
+        mock_stream_blob_lines.return_value = iter([(1, 'col1,col2'), (2, 'value1,value2'), (3, 'value3,value4')])
         gcp_apis.bigquery_insert_json_row.return_value = None
 
         # Call the function
         main.main(cloud_event)
 
         # Assert that the necessary functions were called with the correct arguments
-        mock_download_blob_as_string.assert_called_once_with(
+        mock_stream_blob_lines.assert_called_once_with(
             CS=storage_client,
             bucket_name=cloud_event.get_data()['bucket'],
             file_path=cloud_event.get_data()['name']
         )
-        transform.split_lines.assert_called_once_with(
-            content='col1,col2\nvalue1,value2\nvalue3,value4\n'
+        assert list(transform.titanic_transform.call_args.kwargs['datapoints']) == ['value1,value2', 'value3,value4']
+        gcp_apis.bigquery_insert_json_row.assert_called_once_with(
+            BQ=bigquery_client,
+            table_fqn=env_vars.bq_table_fqn,
+            row=[datapoints[0], datapoints[1]]
         )
-        gcp_apis.bigquery_insert_json_row.assert_has_calls([
+        mock_publish_message.assert_has_calls([
             mock.call(
-                BQ=bigquery_client,
-                table_fqn=env_vars.bq_table_fqn,
-                row=[datapoints[0]]
+                PS=publisher,
+                project_id=env_vars.gcp_project_id,
+                topic_id=env_vars.topic_ingestion_complete,
+                message=f"I finished ingesting the file {cloud_event.get_data()['name']}!!",
+                attributes={
+                    'closer-origin-function': 'functions.mlops.ingest_data',
+                    'closer-run-hash': mock.ANY,
+                }
             ),
             mock.call(
-                BQ=bigquery_client,
-                table_fqn=env_vars.bq_table_fqn,
-                row=[datapoints[1]]
-            )
+                PS=publisher,
+                project_id=env_vars.gcp_project_id,
+                topic_id='verification',
+                message='ok',
+                attributes={
+                    'closer-origin-function': 'functions.mlops.ingest_data',
+                    'closer-origin-topic': env_vars.topic_ingestion_complete,
+                }
+            ),
         ])
-        mock_publish_message.assert_called_once_with(
-            PS=publisher,
-            project_id=env_vars.gcp_project_id,
-            topic_id=env_vars.topic_ingestion_complete,
-            message=f"I finished ingesting the file {cloud_event.get_data()['name']}!!",
-            attributes={}
-        )
+
+
+@mock.patch.dict('os.environ', {'_CI_TESTING': 'no'})
+def test_main_insert_errors(
+    cloud_event: mock.Mock,
+    gcp_clients: models.GCPClients,
+    env_vars: models.EnvVars,
+    datapoint_in_class: List[Datapoint],
+) -> None:
+    with mock.patch.object(gcp_apis, 'storage_stream_blob_lines', return_value=iter([(1, 'col1,col2'), (2, 'value1,value2'), (4, 'value3,value4')])), \
+            mock.patch.object(gcp_apis, 'bigquery_insert_json_row', return_value=[{'index': 1, 'errors': ['invalid']}]), \
+            mock.patch.object(gcp_apis, 'pubsub_publish_message', return_value=fakes.published_future()) as mock_publish_message, \
+            mock.patch.object(main, 'load_clients', return_value=gcp_clients), \
+            mock.patch.object(transform, 'titanic_transform', return_value=datapoint_in_class), \
+            mock.patch.object(main, '_env_vars', return_value=env_vars):
+
+        # The empty line 3 of the file is counted
+        with pytest.raises(ValueError, match="'line': 4"):
+            main.main(cloud_event)
+
+        mock_publish_message.assert_not_called()
+
+
+TITANIC_CSV_LINES = [
+    'PassengerId,Survived,Pclass,Name,Sex,Age,SibSp,Parch,Ticket,Fare,Cabin,Embarked',
+    '1,0,3,"Braund, Mr. Owen Harris",male,22,1,0,A/5 21171,7.25,,S',
+    '2,1,1,"Cumings, Mrs. John Bradley (Florence Briggs Thayer)",female,38,1,0,PC 17599,71.2833,C85,C',
+    '3,1,3,"Heikkinen, Miss. Laina",female,26,0,0,STON/O2. 3101282,7.925,,S',
+]
+
+
+@pytest.mark.parametrize('load_job_row_threshold, insert_requests, load_jobs', [(10, 1, 0), (2, 0, 1)])
+@mock.patch.dict('os.environ', {'_CI_TESTING': 'no'})
+def test_main_offline(
+    cloud_event: mock.Mock,
+    storage_client: mock.Mock,
+    publisher: mock.Mock,
+    env_vars: models.EnvVars,
+    load_job_row_threshold: int,
+    insert_requests: int,
+    load_jobs: int,
+) -> None:
+    """Small files are streamed, files above the threshold go through a load job, with the same rows."""
+    bigquery_client = fakes.FakeBigQueryClient()
+    gcp_clients = models.GCPClients(storage_client=storage_client, bigquery_client=bigquery_client, publisher=publisher)
+    env_vars = env_vars._replace(load_job_row_threshold=load_job_row_threshold)
+    bigquery_client.required = {env_vars.bq_table_fqn: models.TITANIC_RAW_REQUIRED}
+
+    with mock.patch.object(gcp_apis, 'storage_stream_blob_lines', return_value=enumerate(TITANIC_CSV_LINES, start=1)), \
+            mock.patch.object(gcp_apis, 'pubsub_publish_message', return_value=fakes.published_future()), \
+            mock.patch.object(transform, 'titanic_transform_columns', wraps=transform.titanic_transform_columns) as mock_transform_columns, \
+            mock.patch.object(main, 'load_clients', return_value=gcp_clients), \
+            mock.patch.object(main, '_env_vars', return_value=env_vars):
+        main.main(cloud_event)
+
+    assert bigquery_client.insert_requests == insert_requests
+    assert len(bigquery_client.load_jobs) == load_jobs
+    # The load job is fed by column
+    assert mock_transform_columns.call_count == load_jobs
+
+    rows = bigquery_client.tables[env_vars.bq_table_fqn]
+    assert [str(row['PassengerId']) for row in rows] == ['1', '2', '3']
+    assert [str(row['Fare']) for row in rows] == ['7.25', '71.2833', '7.925']
+    assert 'Cabin' not in rows[0] and rows[1]['Cabin'] == 'C85'
+
+
+@pytest.fixture
+def bulk_cloud_event() -> CloudEvent:
+    attributes = {
+        'specversion': '1.0',
+        'id': '8608612983684497',
+        'source': '//pubsub.googleapis.com/projects/closeracademy-handson/topics/your_name_in_lowercase-bulk-ingestion',
+        'type': 'google.cloud.pubsub.topic.v1.messagePublished',
+        'datacontenttype': 'application/json',
+        'time': '2023-09-13T15:11:47.233Z'
+    }
+    data = {
+        'message': {
+            'data': base64.b64encode(json.dumps({'bucket': 'bucket', 'prefix': 'drop/'}).encode()).decode(),
+            'messageId': '8608612983684497',
+            'publishTime': '2023-09-13T15:11:47.233Z',
+        },
+    }
+    return CloudEvent(attributes=attributes, data=data)
+
+
+@mock.patch.dict('os.environ', {'_CI_TESTING': 'no'})
+def test_bulk_main(
+    bulk_cloud_event: CloudEvent,
+    storage_client: mock.Mock,
+    publisher: mock.Mock,
+    env_vars: models.EnvVars,
+) -> None:
+    """The rows of every file are written in shared batches, with one completion message."""
+    bigquery_client = fakes.FakeBigQueryClient()
+    bigquery_client.row_errors = {'3': ['invalid']}
+    gcp_clients = models.GCPClients(storage_client=storage_client, bigquery_client=bigquery_client, publisher=publisher)
+    files = {
+        'drop/a.csv': '\n'.join(TITANIC_CSV_LINES[:3]),
+        'drop/b.csv': '\n'.join(TITANIC_CSV_LINES[:1] + TITANIC_CSV_LINES[3:]),
+    }
+
+    with mock.patch.object(gcp_apis, 'storage_list_blobs', return_value=list(files)), \
+            mock.patch.object(gcp_apis, 'storage_download_blob_as_string', side_effect=lambda CS, bucket_name, file_path: files[file_path]), \
+            mock.patch.object(gcp_apis, 'pubsub_publish_message', return_value=fakes.published_future()) as mock_publish_message, \
+            mock.patch.object(main, 'load_clients', return_value=gcp_clients), \
+            mock.patch.object(main, '_env_vars', return_value=env_vars):
+
+        with pytest.raises(ValueError, match="'file': 'drop/b.csv'"):
+            main.bulk_main(bulk_cloud_event)
+
+        bigquery_client.row_errors = {}
+        main.bulk_main(bulk_cloud_event)
+
+    assert bigquery_client.insert_requests == 2
+    assert sorted(row['PassengerId'] for row in bigquery_client.tables[env_vars.bq_table_fqn]) == ['1', '1', '2', '2', '3']
+    mock_publish_message.assert_called_once_with(
+        PS=publisher,
+        project_id=env_vars.gcp_project_id,
+        topic_id=env_vars.topic_ingestion_complete,
+        message='I finished ingesting 2 files from bucket!!',
+        attributes={
+            'closer-origin-function': 'functions.mlops.ingest_data',
+            'closer-run-hash': mock.ANY,
+        },
+    )
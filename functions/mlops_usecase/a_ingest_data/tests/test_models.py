@@ -1,4 +1,7 @@
+import threading
 import unittest
+from unittest import mock
+
 from a_ingest_data.app.funcs import models
 
 
@@ -51,6 +54,7 @@ class TestTitanicPassenger(unittest.TestCase):
 		expected = {
 			'run_hash': 'test',
 			'PassengerId': '1',
+			'Survived': None,
 			'Pclass': '3',
 			'Name': 'Braund, Mr. Owen Harris',
 			'Sex': 'male',
@@ -64,3 +68,74 @@ class TestTitanicPassenger(unittest.TestCase):
 		}
 
 		self.assertDictEqual(expected, passenger.to_dict())
+
+	def test_to_json_row(self):
+		"""Empty and missing values are left out of the insert row."""
+		passenger = models.TitanicData(
+			run_hash='test',
+			PassengerId='1',
+			Name='Braund, Mr. Owen Harris',
+			Age=' ',
+			Cabin='',
+		)
+
+		expected = {
+			'run_hash': 'test',
+			'PassengerId': '1',
+			'Name': 'Braund, Mr. Owen Harris',
+		}
+
+		self.assertDictEqual(expected, passenger.to_json_row())
+
+	def test_to_json_row_non_str_values(self):
+		"""Values that are not strings are left out, as by the insert itself."""
+		passenger = models.TitanicData('test', 1, None, 3)
+
+		self.assertDictEqual({'run_hash': 'test'}, passenger.to_json_row())
+
+	def test_from_dict(self):
+		data = {'run_hash': 'test', 'PassengerId': '1', 'Sex': 'male'}
+
+		passenger = models.TitanicData.from_dict(data)
+
+		self.assertEqual(passenger.Sex, 'male')
+		self.assertDictEqual(data, {k: v for k, v in passenger.to_dict().items() if v is not None})
+		self.assertFalse(hasattr(passenger, '__dict__'))
+
+
+class TestGCPClients(unittest.TestCase):
+	def test_clients_built_on_first_use(self):
+		with mock.patch('google.cloud.storage.Client') as storage_client, mock.patch('google.cloud.bigquery.Client') as bigquery_client:
+			gcp_clients = models.GCPClients(gcp_project_id='test')
+			storage_client.assert_not_called()
+
+			self.assertIs(gcp_clients.storage_client, storage_client.return_value)
+			self.assertIs(gcp_clients.storage_client, storage_client.return_value)
+
+		storage_client.assert_called_once_with(project='test')
+		bigquery_client.assert_not_called()
+
+	def test_client_built_once_across_threads(self):
+		barrier = threading.Barrier(8)
+
+		def _use() -> None:
+			barrier.wait()
+			gcp_clients.bigquery_client
+
+		with mock.patch('google.cloud.bigquery.Client') as bigquery_client:
+			gcp_clients = models.GCPClients(gcp_project_id='test')
+			threads = [threading.Thread(target=_use) for _ in range(8)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+
+		bigquery_client.assert_called_once_with(project='test')
+
+	def test_given_clients_are_kept(self):
+		publisher = mock.Mock()
+
+		with mock.patch('google.cloud.pubsub.PublisherClient') as publisher_client:
+			self.assertIs(models.GCPClients(publisher=publisher).publisher, publisher)
+
+		publisher_client.assert_not_called()
@@ -0,0 +1,95 @@
+import json
+import threading
+from unittest import mock
+
+import pytest
+
+from a_ingest_data.app import main
+from a_ingest_data.app.funcs import models, registry
+
+
+def test_clients_reused_across_invocations() -> None:
+    client_registry = registry.ClientRegistry()
+
+    first = client_registry.get(gcp_project_id='test')
+    second = client_registry.get(gcp_project_id='test')
+    other_project = client_registry.get(gcp_project_id='other')
+
+    assert first is second
+    assert other_project is not first
+    assert (client_registry.reused, client_registry.built) == (1, 2)
+
+
+def test_reuses_are_logged_once_every_log_every(capsys: pytest.CaptureFixture) -> None:
+    client_registry = registry.ClientRegistry(log_every=2)
+
+    for _ in range(5):
+        client_registry.get(gcp_project_id='test')
+
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(log['message'], log['clients_reused'], log['clients_built']) for log in logs] == [
+        ('Built new GCP clients', 0, 1),
+        ('Reused GCP clients', 2, 1),
+        ('Reused GCP clients', 4, 1),
+    ]
+    assert client_registry.stats() == {'clients_reused': 4, 'clients_built': 1}
+
+
+def test_clients_built_once_across_threads() -> None:
+    client_registry = registry.ClientRegistry()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def _get() -> None:
+        barrier.wait()
+        results.append(client_registry.get(gcp_project_id='test'))
+
+    threads = [threading.Thread(target=_get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(gcp_clients is results[0] for gcp_clients in results)
+    assert (client_registry.reused, client_registry.built) == (7, 1)
+
+
+def test_closed_clients_are_replaced() -> None:
+    client_registry = registry.ClientRegistry()
+    first = client_registry.get(gcp_project_id='test')
+
+    first.close()
+
+    assert client_registry.get(gcp_project_id='test') is not first
+    assert client_registry.built == 2
+
+
+def test_clients_of_another_process_are_replaced() -> None:
+    client_registry = registry.ClientRegistry()
+    first = client_registry.get(gcp_project_id='test')
+
+    # As seen by a child process after a fork
+    with mock.patch('os.getpid', return_value=-1):
+        assert client_registry.get(gcp_project_id='test') is not first
+
+
+def test_invalidate_closes_the_clients() -> None:
+    client_registry = registry.ClientRegistry()
+    storage_client = mock.Mock()
+    first = client_registry.get(gcp_project_id='test')
+    first._clients['storage_client'] = storage_client
+
+    client_registry.invalidate(gcp_project_id='test')
+
+    assert first.closed
+    storage_client.close.assert_called_once_with()
+    assert client_registry.get(gcp_project_id='test') is not first
+
+
+def test_load_clients_uses_the_process_registry() -> None:
+    with mock.patch.object(registry, 'clients', registry.ClientRegistry()):
+        gcp_clients = main.load_clients(gcp_project_id='test')
+
+        assert isinstance(gcp_clients, models.GCPClients)
+        assert main.load_clients(gcp_project_id='test') is gcp_clients
+        assert registry.clients.reused == 1
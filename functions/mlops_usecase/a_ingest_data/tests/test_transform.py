@@ -1,8 +1,13 @@
+import csv
+import pathlib
+
 import deepdiff
 import pytest
 
 from a_ingest_data.app.funcs import transform
 
+TITANIC_CSV = pathlib.Path(__file__).parents[4] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
 # Headers: PassengerId,Survived,Pclass,Name,Sex,Age,SibSp,Parch,Ticket,Fare,Cabin,Embarked
 TITANTIC_HEADERS = [
     'PassengerId',
@@ -25,10 +30,11 @@ def test_titanic_transform_line() -> None:
     line = '1,0,3,"Braund, Mr. Owen Harris",male,22,1,0,A/5 21171,7.25,,S'
 
     actual = {}
-    for data in transform.titanic_transform(datapoints=[line]):
+    for data in transform.titanic_transform(run_hash='test', datapoints=[line]):
         actual = data.to_dict()
 
     expected = {
+        'run_hash': 'test',
         'PassengerId': '1',
         'Survived': '0',
         'Pclass': '3',
@@ -51,10 +57,11 @@ def test_titanic_line_with_several_quotes() -> None:
     line = '23,1,3,"McGowan, Miss. Anna ""Annie""",female,15,0,0,330923,8.0292,,Q'
 
     actual = {}
-    for data in transform.titanic_transform(datapoints=[line]):
+    for data in transform.titanic_transform(run_hash='test', datapoints=[line]):
         actual = data.to_dict()
 
     expected = {
+        'run_hash': 'test',
         'PassengerId': '23',
         'Survived': '1',
         'Pclass': '3',
@@ -77,5 +84,38 @@ def test_titanic_incomplete_line() -> None:
     with pytest.raises(IndexError):
         line = '23,1,3,"McGowan, Miss. Anna ""Annie"""'
 
-        for data in transform.titanic_transform(datapoints=[line]):
+        for data in transform.titanic_transform(run_hash='test', datapoints=[line]):
             data.to_dict()
+
+
+def _titanic_lines() -> list:
+    return transform.split_lines(content=TITANIC_CSV.read_text())[1:]
+
+
+def test_titanic_transform_matches_line_by_line_parsing() -> None:
+    """Parsing the file in one pass gives the same values as decoding each line on its own."""
+    lines = _titanic_lines()
+
+    expected = [['test'] + list(csv.reader([line]))[0][:12] for line in lines]
+    actual = [list(data.to_dict().values()) for data in transform.titanic_transform(run_hash='test', datapoints=lines)]
+
+    assert actual == expected
+
+
+def test_titanic_transform_columns() -> None:
+    """The column batches hold the same values as the titanic data objects."""
+    lines = _titanic_lines()
+
+    rows = [data.to_dict() for data in transform.titanic_transform(run_hash='test', datapoints=lines)]
+    batches = list(transform.titanic_transform_columns(run_hash='test', datapoints=lines, batch_rows=100))
+
+    assert [len(batch['run_hash']) for batch in batches] == [100] * 8 + [91]
+    for name in rows[0]:
+        assert [value for batch in batches for value in batch[name]] == [row[name] for row in rows]
+
+
+def test_titanic_transform_columns_incomplete_line() -> None:
+    with pytest.raises(IndexError):
+        line = '23,1,3,"McGowan, Miss. Anna ""Annie"""'
+
+        list(transform.titanic_transform_columns(run_hash='test', datapoints=[line]))
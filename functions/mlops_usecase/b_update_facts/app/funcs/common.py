@@ -1,5 +1,19 @@
 """Common functions for the train_model pipeline."""
 from pathlib import Path
+from typing import Dict
+
+from . import models
+
+# The standard SQL type of each type of a table schema
+SQL_TYPES: Dict[str, str] = {
+    'INTEGER': 'INT64',
+    'FLOAT': 'FLOAT64',
+    'NUMERIC': 'NUMERIC',
+    'BOOLEAN': 'BOOL',
+    'STRING': 'STRING',
+    'DATE': 'DATE',
+    'TIMESTAMP': 'TIMESTAMP',
+}
 
 
 def file_contents(path: Path) -> str:
@@ -7,22 +21,50 @@ def file_contents(path: Path) -> str:
         return f.read().replace('\n', ' ')
 
 
+def merge_columns(schema: Dict[str, str]) -> Dict[str, str]:
+    """Builds the column lists of a MERGE into a table, from the schema of the table.
+
+    Args:
+        schema (Dict[str, str]): The type of each column of the target table, in order.
+
+    Returns:
+        Dict[str, str]: The lists, to format the query with:
+            select_columns: Each source column cast to the type of the target column.
+            insert_columns: The target columns.
+            insert_values: The source columns, `S.<name>`.
+
+    Raises:
+        ValueError: If a column has a type without a standard SQL type.
+    """
+    unknown = {name: column_type for name, column_type in schema.items() if column_type not in SQL_TYPES}
+    if unknown:
+        raise ValueError(f'Columns with a type without a standard SQL type: {unknown}')
+
+    return {
+        'select_columns': ', '.join(f'CAST({name} AS {SQL_TYPES[column_type]}) AS {name}' for name, column_type in schema.items()),
+        'insert_columns': ', '.join(schema),
+        'insert_values': ', '.join(f'S.{name}' for name in schema),
+    }
+
+
 def load_query(
     table_facts: str,
     table_raw: str,
     query_path: Path,
-    run_hash: str,
+    schema: Dict[str, str] = models.FACTS_TITANIC_SCHEMA,
 ) -> str:
     """Inserts raw data into a temporary table. Common pattern in our ETL pipelines.
 
     This function uses the function file_contents to call the appropriate
-    SQL query and formats it with this function parameters.
+    SQL query and formats it with this function parameters. The values that change
+    with every run, as the run hash, are query parameters.
 
     Args:
         table_facts (str): The fqn of the facts table in BigQuery.
         table_raw (str): The fqn of the raw table in BigQuery.
         query_path (Path): The path to the SQL query script.
-        run_hash (str): A unique identifier for the run.
+        schema (Dict[str, str], optional): The type of each column of the facts table, see
+            `merge_columns`. Defaults to `models.FACTS_TITANIC_SCHEMA`.
 
     Returns:
         str: A string with the query built based on the args.
@@ -33,6 +75,6 @@ def load_query(
     ).format(
         table_source=table_raw,
         table_target=table_facts,
-        run_hash=run_hash,
+        **merge_columns(schema=schema),
     )
     return query
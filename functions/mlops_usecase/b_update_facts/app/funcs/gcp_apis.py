@@ -1,7 +1,14 @@
 """This module contains the functions that interact with the GCP APIs."""
-from typing import Any, Dict
+from __future__ import annotations
 
-from google.cloud import bigquery, pubsub
+import concurrent.futures
+import json
+import time
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Type
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery, pubsub
 
 
 def execute_query(
@@ -34,8 +41,7 @@ def execute_query(
 def execute_query_result(
     BQ: bigquery.Client,
     query: str,
-    job_config: bigquery.QueryJobConfig = bigquery.QueryJobConfig(
-        dry_run=False, use_query_cache=True),
+    job_config: bigquery.QueryJobConfig | None = None,
     job_id: str | None = None,
     location: str | None = None,
 ) -> Any:
@@ -57,6 +63,11 @@ def execute_query_result(
     Returns:
         The results of the query execution.
     """
+    if job_config is None:
+        from google.cloud import bigquery
+
+        job_config = bigquery.QueryJobConfig(dry_run=False, use_query_cache=True)
+
     return execute_query(
         BQ=BQ,
         query=query,
@@ -66,14 +77,73 @@ def execute_query_result(
     ).result()
 
 
+def execute_script(
+    BQ: bigquery.Client,
+    query: str,
+    query_parameters: Dict[str, Tuple[str, Any]] | None = None,
+    location: str | None = None,
+) -> bigquery.QueryJob:
+    """Executes a query, or a script of several statements, and waits for it to finish.
+
+    Args:
+        BQ (bigquery.Client): The BigQuery client instance.
+        query (str): The query or the script.
+        query_parameters (Dict[str, Tuple[str, Any]], optional): The type and the value of each
+            named parameter, `@<name>` in the query. Defaults to None.
+        location (str, optional): The location where the query will be run. Defaults to None.
+
+    Returns:
+        bigquery.QueryJob: The finished job, with its statistics.
+    """
+    from google.cloud import bigquery
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter(name, parameter_type, value)
+            for name, (parameter_type, value) in (query_parameters or {}).items()
+        ],
+    )
+    job = execute_query(BQ=BQ, query=query, job_config=job_config, location=location)
+    job.result()
+    return job
+
+
+def query_job_stats(BQ: bigquery.Client, job: bigquery.QueryJob) -> Dict[str, Any]:
+    """The bytes processed by a finished query job, and by each statement of a script.
+
+    Args:
+        BQ (bigquery.Client): The BigQuery client instance.
+        job (bigquery.QueryJob): The finished job.
+
+    Returns:
+        Dict[str, Any]: The statistics of the job, and of each of its statements, in order.
+    """
+    # A script runs each of its statements as a child job, listed newest first
+    children = list(BQ.list_jobs(parent_job=job.job_id)) if job.num_child_jobs else []
+    return {
+        'job_id': job.job_id,
+        'total_bytes_processed': job.total_bytes_processed,
+        'total_bytes_billed': job.total_bytes_billed,
+        'slot_millis': job.slot_millis,
+        'statements': [
+            {
+                'statement_type': child.statement_type,
+                'total_bytes_processed': child.total_bytes_processed,
+                'num_dml_affected_rows': child.num_dml_affected_rows,
+            }
+            for child in reversed(children)
+        ],
+    }
+
+
 def pubsub_publish_message(
     PS: pubsub.PublisherClient,
     project_id: str,
     topic_id: str,
     message: str,
     attributes: Dict[str, str] = {},
-) -> None:
-    """Publishes a message to a Pub/Sub topic.
+) -> concurrent.futures.Future:
+    """Publishes a message to a Pub/Sub topic, without waiting for it to be sent.
 
     Args:
         PS (pubsub.PublisherClient): The pubsub client.
@@ -82,10 +152,109 @@ def pubsub_publish_message(
         message (str): The message to publish.
         attributes (Dict[str, str], optional): The attributes of the message.
             Defaults to {}.
+
+    Returns:
+        concurrent.futures.Future: A future that resolves to the message ID once the message is sent.
     """
     _topic = PS.topic_path(project_id, topic_id)
 
-    PS.publish(
+    return PS.publish(
         topic=_topic,
         data=message.encode('utf-8'),
         **attributes,)
+
+
+class PubSubPublisher:
+    """Publishes messages concurrently and waits for all of them before the function returns.
+
+    Messages are handed to the client, which sends them in the background, and their
+    futures are kept. Leaving the `with` block waits for every message to be sent, so
+    the function does not return before its messages are delivered.
+
+    Args:
+        PS (pubsub.PublisherClient): The pubsub client.
+        project_id (str): The ID of the project where the topics are located.
+        timeout (float, optional): Seconds to wait for all the messages to be sent. Defaults to 30.
+
+    Attributes:
+        latencies (List[float]): Seconds between publishing and sending each message.
+    """
+
+    def __init__(self, PS: pubsub.PublisherClient, project_id: str, timeout: float = 30.0) -> None:
+        """Initializes the publisher without pending messages."""
+        self.PS = PS
+        self.project_id = project_id
+        self.timeout = timeout
+        self.latencies: List[float] = []
+        self._futures: List[concurrent.futures.Future] = []
+
+    def publish(self, topic_id: str, message: str, attributes: Dict[str, str] = {}) -> concurrent.futures.Future:
+        """Publishes a message to a Pub/Sub topic, without waiting for it to be sent.
+
+        Args:
+            topic_id (str): The ID of the topic.
+            message (str): The message to publish.
+            attributes (Dict[str, str], optional): The attributes of the message.
+                Defaults to {}.
+
+        Returns:
+            concurrent.futures.Future: A future that resolves to the message ID once the message is sent.
+        """
+        start = time.perf_counter()
+        # Resolved only after the latency is recorded, so waiting on it sees every latency
+        tracked: concurrent.futures.Future = concurrent.futures.Future()
+
+        def _sent(future: concurrent.futures.Future) -> None:
+            self.latencies.append(time.perf_counter() - start)
+            if future.exception() is not None:
+                tracked.set_exception(future.exception())
+            else:
+                tracked.set_result(future.result())
+
+        pubsub_publish_message(
+            PS=self.PS,
+            project_id=self.project_id,
+            topic_id=topic_id,
+            message=message,
+            attributes=attributes,
+        ).add_done_callback(_sent)
+
+        self._futures.append(tracked)
+        return tracked
+
+    def wait(self) -> List[str]:
+        """Waits for every published message to be sent.
+
+        Returns:
+            List[str]: The IDs of the messages, in publishing order.
+
+        Raises:
+            TimeoutError: If some messages are not sent within the timeout.
+            Exception: The error of the first message that failed to be sent.
+        """
+        _, not_done = concurrent.futures.wait(self._futures, timeout=self.timeout)
+        if not_done:
+            raise TimeoutError(f'{len(not_done)} of {len(self._futures)} messages were not published after {self.timeout}s.')
+
+        message_ids = [future.result() for future in self._futures]
+
+        print(json.dumps({
+            'message': f'Published {len(message_ids)} messages',
+            'severity': 'INFO',
+            'publish_latency_max_s': max(self.latencies, default=0.0),
+        }))
+        return message_ids
+
+    def __enter__(self) -> 'PubSubPublisher':
+        """Returns the publisher to be used as a context manager."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Waits for the published messages when the block exits without errors."""
+        if exc_type is None:
+            self.wait()
@@ -1,24 +1,104 @@
 """This module contains named tuples for the update_facts function.
 
-The module contains two named tuples: GCPClients and EnvVars. GCPClients is a named tuple containing
+The module contains GCPClients and the EnvVars named tuple. GCPClients holds the lazily built
 instances of Google Cloud Platform clients for interacting with BigQuery and Pub/Sub. EnvVars is a named tuple
 containing environment variables required for the update_facts function.
 """
 
-from typing import NamedTuple
+from __future__ import annotations
 
-from google.cloud import bigquery, pubsub
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple
 
+if TYPE_CHECKING:
+    from google.cloud import bigquery, pubsub
 
-class GCPClients(NamedTuple):
-    """A named tuple containing GCP client instances.
+
+def _build_bigquery_client(gcp_project_id: str | None) -> bigquery.Client:
+    from google.cloud import bigquery
+
+    return bigquery.Client(project=gcp_project_id)
+
+
+def _build_publisher(gcp_project_id: str | None) -> pubsub.PublisherClient:
+    from google.cloud import pubsub
+
+    # Messages are sent in the background, in batches of up to 10ms
+    return pubsub.PublisherClient(
+        batch_settings=pubsub.types.BatchSettings(max_messages=100, max_latency=0.01),
+        publisher_options=pubsub.types.PublisherOptions(
+            flow_control=pubsub.types.PublishFlowControl(
+                message_limit=1000,
+                limit_exceeded_behavior=pubsub.types.LimitExceededBehavior.BLOCK,
+            ),
+        ),
+    )
+
+
+class GCPClients:
+    """GCP client instances, each one built the first time it is used.
+
+    The google.cloud libraries are imported by the first use of their client too.
+    Clients given to the constructor are used as they are, e.g. mocks in tests.
+
+    Args:
+        gcp_project_id (str, optional): The project of the clients built on first use.
+        bigquery_client (google.cloud.bigquery.client.Client, optional): A client to use instead of building one.
+        publisher (google.cloud.pubsub_v1.PublisherClient, optional): A client to use instead of building one.
 
     Attributes:
         bigquery_client (google.cloud.bigquery.client.Client): A client for interacting with BigQuery.
         publisher (google.cloud.pubsub_v1.PublisherClient): A client for interacting with Pub/Sub.
+        closed (bool): Whether the clients are closed, after which they cannot be used.
     """
-    bigquery_client: bigquery.Client
-    publisher: pubsub.PublisherClient
+
+    def __init__(
+        self,
+        gcp_project_id: str | None = None,
+        bigquery_client: bigquery.Client | None = None,
+        publisher: pubsub.PublisherClient | None = None,
+    ) -> None:
+        """Keeps the given clients, the others are built on first use."""
+        self.gcp_project_id = gcp_project_id
+        self._clients: Dict[str, Any] = {
+            'bigquery_client': bigquery_client,
+            'publisher': publisher,
+        }
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _client(self, name: str, build: Callable[[str | None], Any]) -> Any:
+        """Returns the client called `name`, built only once even when first used by several threads."""
+        if self.closed:
+            raise ValueError('The GCP clients are closed.')
+
+        if self._clients[name] is None:
+            with self._lock:
+                if self._clients[name] is None:
+                    self._clients[name] = build(self.gcp_project_id)
+        return self._clients[name]
+
+    def close(self) -> None:
+        """Closes the clients built so far, and their connection pools."""
+        with self._lock:
+            self.closed = True
+            for name, client in self._clients.items():
+                if client is None:
+                    continue
+                if name == 'publisher':
+                    client.stop()
+                else:
+                    client.close()
+
+    @property
+    def bigquery_client(self) -> bigquery.Client:
+        """The BigQuery client."""
+        return self._client('bigquery_client', _build_bigquery_client)
+
+    @property
+    def publisher(self) -> pubsub.PublisherClient:
+        """The Pub/Sub publisher client."""
+        return self._client('publisher', _build_publisher)
 
 
 class EnvVars(NamedTuple):
@@ -29,8 +109,29 @@ class EnvVars(NamedTuple):
         bq_facts_table_fqn (str): The fully-qualified name of the BigQuery table containing facts data.
         bq_staging_table_fqn (str): The fully-qualified name of the BigQuery table containing staging data.
         topic_update_facts_complete (str): The name of the Pub/Sub topic to publish a message to when the update_facts function completes.
+        staging_lookback_hours (float): How long before the ingestion complete message the rows of its run can be ingested.
+            The MERGE reads the partitions of the staging table ingested since then.
     """
     gcp_project_id: str
     bq_facts_table_fqn: str
     bq_staging_table_fqn: str
     topic_update_facts_complete: str
+    staging_lookback_hours: float = 24.0
+
+
+# BigQuery column types of the facts titanic table, the MERGE casts the staging columns to them.
+# Mirrors resources/mlops_usecase/bigquery/facts_titanic_schema.json
+FACTS_TITANIC_SCHEMA: Dict[str, str] = {
+    'PassengerId': 'INTEGER',
+    'Survived': 'BOOLEAN',
+    'Pclass': 'INTEGER',
+    'Name': 'STRING',
+    'Sex': 'STRING',
+    'Age': 'FLOAT',
+    'SibSp': 'INTEGER',
+    'Parch': 'INTEGER',
+    'Ticket': 'STRING',
+    'Fare': 'FLOAT',
+    'Cabin': 'STRING',
+    'Embarked': 'STRING',
+}
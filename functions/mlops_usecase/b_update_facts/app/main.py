@@ -8,40 +8,38 @@ It then executes the query and publishes a message to the Pub/Sub topic.
 """
 
 import base64
+import datetime
 import json
 import os
 from pathlib import Path
 
 import functions_framework
 from cloudevents.http import CloudEvent
-from google.cloud import bigquery, pubsub
 
 try:
-	from funcs import common, gcp_apis, models
+	from funcs import common, gcp_apis, models, registry
 except ImportError:
 	from b_update_facts.app.funcs import (
 		common,
 		gcp_apis,
 		models,
+		registry,
 	)
 
 
 def load_clients(gcp_project_id: str) -> models.GCPClients:
-	"""Load the GCP clients.
+	"""Load the GCP clients, shared by every invocation of this instance.
 
 	Args:
 	    gcp_project_id (str): The GCP project ID.
 
 	Returns:
-	    GCPClients: A tuple of GCP clients.
+	    GCPClients: The GCP clients of the process, each one built the first time it is used.
 	        With the following attributes:
 	            bigquery_client: A bigquery client.
 	            publisher: A pubsub publisher client.
 	"""
-	bigquery_client = bigquery.Client(project=gcp_project_id)
-	publisher = pubsub.PublisherClient()
-
-	return models.GCPClients(bigquery_client=bigquery_client, publisher=publisher)
+	return registry.clients.get(gcp_project_id=gcp_project_id)
 
 
 ##############################
@@ -67,9 +65,11 @@ def _env_vars() -> models.EnvVars:
 {os.getenv("_BIGQUERY_DATASET_ID", "bq_table_fqn_dst")}.\
 {os.getenv("_BIGQUERY_FACTS_TABLE_ID", "bq_facts_table_fqn")}""",
 		topic_update_facts_complete=os.getenv('_TOPIC_UPDATE_FACTS_COMPLETE', 'topic_update_facts_complete'),
+		staging_lookback_hours=float(os.getenv('_STAGING_LOOKBACK_HOURS', '24')),
 	)
 
 
+# Registers the clients at cold start, every invocation reuses them
 if os.getenv('_CI_TESTING', 'no') == 'no':
 	env_vars = _env_vars()
 	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
@@ -85,30 +85,43 @@ def main(cloud_event: CloudEvent) -> None:
 	# event_data = base64.b64decode(cloud_event.data['message']['data']).decode()
 	event_attributes = cloud_event.data['message']['attributes']
 
-	if not hasattr(main, 'env_vars'):
-		env_vars = _env_vars()
-
-	if not hasattr(main, 'gcp_clients'):
-		gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
+	env_vars = _env_vars()
+	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
 
 	path = Path('./resources/staging_to_facts.sql')
+	run_hash = event_attributes['closer-run-hash']
+	# The rows of the run are ingested before the message is published
+	ingested_after = datetime.datetime.fromisoformat(cloud_event['time']) - datetime.timedelta(hours=env_vars.staging_lookback_hours)
 
 	query = common.load_query(
 		table_facts=env_vars.bq_facts_table_fqn,
 		table_raw=env_vars.bq_staging_table_fqn,
 		query_path=path,
-		run_hash=event_attributes['closer-run-hash'],
 	)
 
-	_ = gcp_apis.execute_query_result(
+	job = gcp_apis.execute_script(
 		BQ=gcp_clients.bigquery_client,
 		query=query,
+		query_parameters={'run_hash': ('STRING', run_hash), 'ingested_after': ('TIMESTAMP', ingested_after)},
+	)
+	print(
+		json.dumps(
+			{
+				'severity': 'INFO',
+				'message': f'Merged the staging rows of run {run_hash} into the facts',
+				'run_hash': run_hash,
+			}
+			| gcp_apis.query_job_stats(BQ=gcp_clients.bigquery_client, job=job)
+		)
 	)
 
-	gcp_apis.pubsub_publish_message(
+	# Waits for the message to be sent before returning
+	with gcp_apis.PubSubPublisher(
 		PS=gcp_clients.publisher,  # type: ignore
 		project_id=env_vars.gcp_project_id,  # type: ignore
-		topic_id=env_vars.topic_update_facts_complete,  # type: ignore
-		message=json.dumps({'message': 'I finished passing the staging data to facts', 'training_data_table': env_vars.bq_facts_table_fqn}),
-		attributes={'train_model': 'True', 'dataset': 'titanic'},
-	)
+	) as publisher:
+		publisher.publish(
+			topic_id=env_vars.topic_update_facts_complete,  # type: ignore
+			message=json.dumps({'message': 'I finished passing the staging data to facts', 'training_data_table': env_vars.bq_facts_table_fqn}),
+			attributes={'train_model': 'True', 'dataset': 'titanic'},
+		)
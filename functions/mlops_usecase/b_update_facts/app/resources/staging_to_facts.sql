@@ -1,25 +1,25 @@
+DECLARE passenger_ids STRUCT<min_id INT64, max_id INT64>;
+
+/* The rows of the run, read from the partitions ingested since @ingested_after, or still in the streaming buffer, and from the blocks clustered on its run_hash */
+CREATE TEMP TABLE staged AS
+SELECT
+    {select_columns}
+FROM
+    `{table_source}`
+WHERE
+    (_PARTITIONTIME >= TIMESTAMP_TRUNC(@ingested_after, DAY) OR _PARTITIONTIME IS NULL)
+    AND run_hash = @run_hash
+QUALIFY ROW_NUMBER() OVER (PARTITION BY PassengerId ORDER BY Survived DESC) = 1;
+
+/* A constant range of PassengerId, the MERGE reads only the blocks of the facts clustered on it */
+SET passenger_ids = (SELECT AS STRUCT MIN(PassengerId) AS min_id, MAX(PassengerId) AS max_id FROM staged);
+
 MERGE `{table_target}` AS T
-USING (
-    SELECT
-        ???
-        IF(Survived = 1, True, False) AS Survived,
-        ????
-    FROM
-        `{table_source}`
-    WHERE run_hash = "{run_hash}"
-    QUALIFY ROW_NUMBER() OVER (PARTITION BY PassengerId ORDER BY Survived DESC) = 1
-) S
+USING staged AS S
 ON (
     S.PassengerId = T.PassengerId
+    AND T.PassengerId BETWEEN passenger_ids.min_id AND passenger_ids.max_id
 )
 WHEN NOT MATCHED BY TARGET THEN
-INSERT (
-    ???,
-    ???,
-    ...
-)
-VALUES (
-    ???,
-    ???,
-    ...
-)
+INSERT ({insert_columns})
+VALUES ({insert_values});
@@ -1,6 +1,10 @@
+import json
 from pathlib import Path
 
-from b_update_facts.app.funcs.common import file_contents, load_query
+import pytest
+
+from b_update_facts.app.funcs import models
+from b_update_facts.app.funcs.common import file_contents, load_query, merge_columns
 
 
 def test_file_contents(tmp_path: Path) -> None:
@@ -26,3 +30,34 @@ def test_load_query(tmp_path: Path) -> None:
         table_target=table_facts,
     )
     assert load_query(table_facts, table_raw, query_path) == expected_query
+
+
+def test_facts_schema_mirrors_the_json() -> None:
+    schema_path = Path(__file__).parents[4] / "resources" / "mlops_usecase" / "bigquery" / "facts_titanic_schema.json"
+    schema = json.loads(schema_path.read_text())
+
+    assert models.FACTS_TITANIC_SCHEMA == {column["name"]: column["type"] for column in schema}
+
+
+def test_load_query_staging_to_facts() -> None:
+    query = load_query(
+        table_facts="my_project.my_dataset.my_facts_table",
+        table_raw="my_project.my_dataset.my_raw_table",
+        query_path=Path(__file__).parents[1] / "app" / "resources" / "staging_to_facts.sql",
+    )
+
+    assert "???" not in query and "--" not in query
+    assert "CAST(PassengerId AS INT64) AS PassengerId, CAST(Survived AS BOOL) AS Survived" in query
+    assert "CAST(Age AS FLOAT64) AS Age" in query
+    assert "INSERT (PassengerId, Survived, Pclass, Name, Sex, Age, SibSp, Parch, Ticket, Fare, Cabin, Embarked)" in query
+    assert "VALUES (S.PassengerId, S.Survived," in query
+    # Pruned by query parameters and constants, both sides
+    assert "_PARTITIONTIME >= TIMESTAMP_TRUNC(@ingested_after, DAY)" in query
+    assert "run_hash = @run_hash" in query
+    assert "T.PassengerId BETWEEN passenger_ids.min_id AND passenger_ids.max_id" in query
+    assert "`my_project.my_dataset.my_raw_table`" in query and "`my_project.my_dataset.my_facts_table`" in query
+
+
+def test_merge_columns_unknown_type() -> None:
+    with pytest.raises(ValueError, match="GEOGRAPHY"):
+        merge_columns(schema={"PassengerId": "INTEGER", "Home": "GEOGRAPHY"})
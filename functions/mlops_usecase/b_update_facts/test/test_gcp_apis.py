@@ -0,0 +1,74 @@
+import concurrent.futures
+import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from google.cloud import bigquery, pubsub
+
+from b_update_facts.app.funcs import gcp_apis
+
+
+@pytest.fixture
+def publisher() -> mock.Mock:
+    publisher = mock.Mock(spec=pubsub.PublisherClient)
+    publisher.topic_path.side_effect = lambda project_id, topic_id: f'projects/{project_id}/topics/{topic_id}'
+    return publisher
+
+
+def test_pubsub_publisher_waits_for_all_messages(publisher: mock.Mock) -> None:
+    futures = [concurrent.futures.Future(), concurrent.futures.Future()]
+    publisher.publish.side_effect = futures
+
+    with gcp_apis.PubSubPublisher(PS=publisher, project_id='project') as tracker:
+        first = tracker.publish(topic_id='topic', message='one', attributes={'train_model': 'True'})
+        second = tracker.publish(topic_id='topic', message='two')
+
+        assert not first.done() and not second.done()
+
+        futures[0].set_result('1')
+        futures[1].set_result('2')
+
+    assert tracker.wait() == ['1', '2']
+    assert len(tracker.latencies) == 2
+    publisher.publish.assert_any_call(topic='projects/project/topics/topic', data=b'one', train_model='True')
+
+
+def test_pubsub_publisher_timeout(publisher: mock.Mock) -> None:
+    publisher.publish.return_value = concurrent.futures.Future()
+
+    with pytest.raises(TimeoutError):
+        with gcp_apis.PubSubPublisher(PS=publisher, project_id='project', timeout=0.01) as tracker:
+            tracker.publish(topic_id='topic', message='one')
+
+
+def test_execute_script() -> None:
+    bigquery_client = mock.Mock(spec=bigquery.Client)
+    ingested_after = datetime.datetime(2023, 9, 12, tzinfo=datetime.timezone.utc)
+
+    job = gcp_apis.execute_script(
+        BQ=bigquery_client,
+        query='SELECT @run_hash',
+        query_parameters={'run_hash': ('STRING', 'abc'), 'ingested_after': ('TIMESTAMP', ingested_after)},
+    )
+
+    assert job is bigquery_client.query.return_value
+    job.result.assert_called_once()
+    job_config = bigquery_client.query.call_args.kwargs['job_config']
+    assert [(p.name, p.type_, p.value) for p in job_config.query_parameters] == [('run_hash', 'STRING', 'abc'), ('ingested_after', 'TIMESTAMP', ingested_after)]
+
+
+def test_query_job_stats() -> None:
+    bigquery_client = mock.Mock(spec=bigquery.Client)
+    job = SimpleNamespace(job_id='script', num_child_jobs=2, total_bytes_processed=3000, total_bytes_billed=20971520, slot_millis=150)
+    bigquery_client.list_jobs.return_value = [
+        SimpleNamespace(statement_type='MERGE', total_bytes_processed=1000, num_dml_affected_rows=5),
+        SimpleNamespace(statement_type='CREATE_TABLE_AS_SELECT', total_bytes_processed=2000, num_dml_affected_rows=None),
+    ]
+
+    stats = gcp_apis.query_job_stats(BQ=bigquery_client, job=job)
+
+    bigquery_client.list_jobs.assert_called_once_with(parent_job='script')
+    assert stats['total_bytes_processed'] == 3000
+    assert [statement['statement_type'] for statement in stats['statements']] == ['CREATE_TABLE_AS_SELECT', 'MERGE']
+    assert stats['statements'][1]['num_dml_affected_rows'] == 5
@@ -1,3 +1,6 @@
+import concurrent.futures
+import datetime
+import json
 from unittest import mock
 
 import pytest
@@ -19,6 +22,9 @@ def cloud_event():
         'time': '2023-09-13T15:11:47.233Z'}
     data = {
         'message': {
+            'attributes': {
+                'closer-origin-function': 'functions.mlops.ingest_data',
+                'closer-run-hash': '0d6b4d4e-9a62-4a6b-8a5e-2f3c1b7e6a10'},
             'data': 'SSBmaW5pc2hlZCBpbmdlc3RpbmcgdGhlIGZpbGUgdGl0YW5pYy5jc3YhIQ==',
             'messageId': '8608612983684497',
             'message_id': '8608612983684497',
@@ -91,25 +97,41 @@ def test_main(
     Returns:
         None
     """
-    with mock.patch.object(gcp_apis, 'execute_query_result') as mock_execute_query_results, \
-            mock.patch.object(gcp_apis, 'pubsub_publish_message') as mock_pubsub_publish_message, \
+    published_future: concurrent.futures.Future = concurrent.futures.Future()
+    published_future.set_result('1')
+
+    with mock.patch.object(gcp_apis, 'execute_script') as mock_execute_script, \
+            mock.patch.object(gcp_apis, 'query_job_stats', return_value={'total_bytes_processed': 1024}) as mock_query_job_stats, \
+            mock.patch.object(gcp_apis, 'pubsub_publish_message', return_value=published_future) as mock_pubsub_publish_message, \
             mock.patch.object(main, 'load_clients', return_value=gcp_clients), \
             mock.patch.object(main, '_env_vars', return_value=env_vars), \
-            mock.patch.object(common, 'load_query', return_value='SELECT * FROM table'):
+            mock.patch.object(common, 'load_query', return_value='SELECT * FROM table'), \
+            mock.patch('builtins.print') as mock_print:
 
         # Call the function
         main.main(cloud_event)
 
-        mock_execute_query_results.assert_called_once_with(
+        # The run hash and the partitions of the staging table read are query parameters
+        mock_execute_script.assert_called_once_with(
             BQ=gcp_clients.bigquery_client,
-            query='SELECT * FROM table'
+            query='SELECT * FROM table',
+            query_parameters={
+                'run_hash': ('STRING', '0d6b4d4e-9a62-4a6b-8a5e-2f3c1b7e6a10'),
+                'ingested_after': ('TIMESTAMP', datetime.datetime(2023, 9, 12, 15, 11, 47, 233000, tzinfo=datetime.timezone.utc)),
+            },
         )
 
+        # The bytes processed are logged for every run
+        mock_query_job_stats.assert_called_once_with(BQ=gcp_clients.bigquery_client, job=mock_execute_script.return_value)
+        log, = [json.loads(call.args[0]) for call in mock_print.call_args_list if 'Merged' in call.args[0]]
+        assert log['total_bytes_processed'] == 1024
+        assert log['run_hash'] == '0d6b4d4e-9a62-4a6b-8a5e-2f3c1b7e6a10'
+
         mock_pubsub_publish_message.assert_called_once_with(
             PS=gcp_clients.publisher,
             project_id=env_vars.gcp_project_id,
             topic_id=env_vars.topic_update_facts_complete,
-            message="I finished passing the staging data to facts",
+            message=json.dumps({'message': 'I finished passing the staging data to facts', 'training_data_table': env_vars.bq_facts_table_fqn}),
             attributes={
                 'train_model': 'True',
                 'dataset': 'titanic'
@@ -0,0 +1,6 @@
+"""Benchmarks for the mlops use case functions.
+
+Run them from the functions/mlops_usecase folder, e.g.:
+
+    python -m benchmarks.bench_titanic_transform
+"""
@@ -0,0 +1,80 @@
+"""Records per second of the predictions endpoint, one record per request against batches.
+
+Runs `predict` in process with the test model of the endpoint, on the
+passengers of the titanic dataset. The BigQuery insert is patched out, so the
+round trip each single record request also pays for is left out and the
+measure is the request handling and the model alone.
+
+    python -m benchmarks.bench_batch_predictions --records 1000
+"""
+
+import argparse
+import itertools
+import os
+import pathlib
+import time
+import warnings
+from typing import Any, Dict, List
+from unittest import mock
+
+import flask
+import joblib
+import pandas as pd
+
+os.environ.setdefault('_CI_TESTING', 'yes')
+
+from d_predictions_endpoint.app import main as endpoint  # noqa: E402
+from d_predictions_endpoint.app.funcs import models  # noqa: E402
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TEST_MODEL = pathlib.Path(__file__).parents[1] / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+
+
+def _points(records: int) -> List[Dict[str, Any]]:
+	df = pd.read_csv(TITANIC_CSV, usecols=['Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass'])
+	points = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+	return list(itertools.islice(itertools.cycle(points), records))
+
+
+def _post(app: flask.Flask, body: Any) -> Any:
+	with app.test_request_context('/', method='POST', json=body):
+		return endpoint.predict(flask.request)
+
+
+def main() -> None:
+	"""Prints the records per second of single record requests and of batches of each size."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--records', type=int, default=1000, help='Number of records to predict.')
+	parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 1000], help='Records per batch request.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	points = _points(args.records)
+	app = flask.Flask(__name__)
+
+	with (
+		mock.patch.object(endpoint, 'served_model', models.ServedModel(version='bench', pipeline=joblib.load(TEST_MODEL), compiled_pipeline=None)),
+		mock.patch.object(endpoint, 'load_clients', return_value=models.GCPClients(bigquery_client=mock.Mock())),
+		mock.patch.object(endpoint.gcp_apis, 'bigquery_insert_json_row') as mock_insert,
+		mock.patch('builtins.print'),
+	):
+		start = time.perf_counter()
+		for point in points:
+			_post(app, point)
+		baseline = len(points) / (time.perf_counter() - start)
+		rates = {'1 record per request': (baseline, mock_insert.call_count)}
+
+		for batch_size in args.batch_sizes:
+			mock_insert.reset_mock()
+			start = time.perf_counter()
+			for i in range(0, len(points), batch_size):
+				_post(app, points[i : i + batch_size])
+			rates[f'batches of {batch_size}'] = (len(points) / (time.perf_counter() - start), mock_insert.call_count)
+
+	print(f'{len(points)} records')
+	for name, (rate, inserts) in rates.items():
+		print(f'{name:<32}{rate:>10,.0f} records/s{rate / baseline:>8.1f}x{inserts:>7} inserts')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,107 @@
+"""Rows per second per core of the bulk scoring job, against a request per row.
+
+Scores `--rows` titanic passengers with the test model of the endpoint, compiled
+as at cold start. Before, each row is a request to `predict`, in process, with
+the BigQuery insert patched out. The job scores chunks of `--chunk-rows` rows:
+read from a CSV, validated, predicted in one call and encoded as the NDJSON
+rows of the load job, by a pool of `--workers` processes forked once the model
+is loaded, as `score.run` does without the reads and writes of the buckets.
+
+    python -m benchmarks.bench_bulk_scoring --rows 50000 --workers 1 2 4
+"""
+
+import argparse
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import pathlib
+import time
+import warnings
+from typing import Any, List
+from unittest import mock
+
+import flask
+import joblib
+import pandas as pd
+
+os.environ.setdefault('_CI_TESTING', 'yes')
+
+from d_predictions_endpoint.app import main as endpoint  # noqa: E402
+from d_predictions_endpoint.app.funcs import models, scoring  # noqa: E402
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TEST_MODEL = pathlib.Path(__file__).parents[1] / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+
+# The CSV files of the chunks, inherited by the processes of the pool
+_chunks: List[bytes] = []
+
+
+def _score_chunk(index: int) -> int:
+	"""Scores a chunk as `score._score_chunk` does, returns its rows."""
+	model = endpoint.served_model
+	rows, _ = scoring.score_records(
+		data=scoring.frame_records(pd.read_csv(io.BytesIO(_chunks[index]))),
+		predict=lambda features: endpoint._predict(model=model, features=features),
+		version=model.version,
+	)
+	scoring.ndjson(rows)
+	return len(rows)
+
+
+def _run(workers: int) -> float:
+	"""Scores every chunk with a pool of `workers` processes, returns the wall-clock time."""
+	start = time.perf_counter()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+		list(executor.map(_score_chunk, range(len(_chunks))))
+	return time.perf_counter() - start
+
+
+def main() -> None:
+	"""Prints the rows per second, overall and per core, of each case."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows', type=int, default=50000, help='Rows scored.')
+	parser.add_argument('--chunk-rows', type=int, default=5000, help='Rows of a chunk.')
+	parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Processes of the pool.')
+	parser.add_argument('--requests', type=int, default=2000, help='Rows of the request per row case, timed and scaled.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	df = pd.read_csv(TITANIC_CSV, usecols=['PassengerId', 'Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass'])
+	df = pd.concat([df] * (args.rows // len(df) + 1), ignore_index=True).iloc[:args.rows]
+	_chunks.extend(df.iloc[start:start + args.chunk_rows].to_csv(index=False).encode('utf-8') for start in range(0, len(df), args.chunk_rows))
+
+	pipeline = joblib.load(TEST_MODEL)
+	served_model = models.ServedModel(version='bench', pipeline=pipeline, compiled_pipeline=endpoint.compile_model(pipeline))
+	app = flask.Flask(__name__)
+	cores = os.cpu_count() or 1
+
+	results = {}
+	with (
+		mock.patch.object(endpoint, 'served_model', served_model),
+		mock.patch.object(endpoint, 'load_clients', return_value=models.GCPClients(bigquery_client=mock.Mock())),
+		mock.patch.object(endpoint, 'prediction_logger', mock.Mock()),
+		mock.patch.object(endpoint, 'prediction_cache', None),
+		mock.patch.object(endpoint, 'request_coalescer', None),
+		mock.patch('builtins.print'),
+	):
+		points: List[Any] = df.drop(columns='PassengerId').astype(object).where(df.notna(), None).to_dict(orient='records')[:args.requests]
+		start = time.perf_counter()
+		for point in points:
+			with app.test_request_context('/', method='POST', json=point):
+				endpoint.predict(flask.request)
+		results['a request per row (before)'] = (len(points) / (time.perf_counter() - start), 1)
+
+		for workers in args.workers:
+			seconds = _run(workers)
+			results[f'chunks, {workers} processes'] = (len(df) / seconds, min(workers, cores))
+
+	baseline = results['a request per row (before)'][0]
+	print(f'{len(df):,} rows, chunks of {args.chunk_rows:,} rows, {cores} cores')
+	print(f'{"":<28}{"rows/s":>10}{"rows/s/core":>13}{"speedup":>10}')
+	for name, (rows_per_second, used) in results.items():
+		print(f'{name:<28}{rows_per_second:>10,.0f}{rows_per_second / used:>13,.0f}{rows_per_second / baseline:>9.1f}x')
+
+
+if __name__ == '__main__':
+	main()
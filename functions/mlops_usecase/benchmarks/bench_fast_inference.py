@@ -0,0 +1,79 @@
+"""Latency of single record predictions, with the pipeline on a DataFrame against the compiled pipeline.
+
+Predicts the passengers of the titanic dataset one at a time, with the test
+model of the endpoint and with a RandomForest from `titanic_train`. The
+DataFrame path builds a one row DataFrame and calls `pipeline.predict`, as
+the endpoint did; the compiled path encodes the record with the fitted
+parameters of the pipeline and calls the classifier on a float matrix.
+Batches of `--batch-size` records are timed too, the endpoint uses the
+compiled pipeline for both.
+
+    python -m benchmarks.bench_fast_inference --records 500
+"""
+
+import argparse
+import itertools
+import pathlib
+import statistics
+import time
+import warnings
+from typing import Any, Callable, Dict, List
+
+import joblib
+import pandas as pd
+
+from c_train_model.app.funcs.train_models import titanic_train
+from d_predictions_endpoint.app.funcs import compiled, records
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TEST_MODEL = pathlib.Path(__file__).parents[1] / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+
+
+def _features(df: pd.DataFrame, count: int) -> List[Dict[str, Any]]:
+	df = df[list(records.FEATURES)]
+	points = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+	return [records.validate(point).features for point in itertools.islice(itertools.cycle(points), count)]
+
+
+def _latencies(run: Callable[[List[Dict[str, Any]]], Any], batches: List[List[Dict[str, Any]]]) -> List[float]:
+	latencies = []
+	for batch in batches:
+		start = time.perf_counter()
+		run(batch)
+		latencies.append(time.perf_counter() - start)
+	return latencies
+
+
+def main() -> None:
+	"""Prints the p50 and p99 latency of each path, for each model."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--records', type=int, default=500, help='Number of single record predictions.')
+	parser.add_argument('--batch-size', type=int, default=100, help='Records per batch.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	titanic = pd.read_csv(TITANIC_CSV)
+	features = _features(titanic, args.records)
+	batches = [features[i : i + args.batch_size] for i in range(0, len(features), args.batch_size)]
+	pipelines = {'nar-rayya': joblib.load(TEST_MODEL), 'titanic_train': titanic_train(titanic)}
+
+	print(f'{args.records} records, batches of {args.batch_size}')
+	print(f'{"":<48}{"p50 ms":>8}{"p99 ms":>8}{"speedup":>9}')
+	for model, pipeline in pipelines.items():
+		compiled_pipeline = compiled.compile_pipeline(pipeline)
+
+		def _dataframe(batch: List[Dict[str, Any]], pipeline: Any = pipeline) -> Any:
+			return pipeline.predict(pd.DataFrame.from_records(batch, columns=list(records.FEATURES)))
+
+		assert compiled_pipeline.predict(features) == _dataframe(features).tolist(), f'{model} predictions differ'
+
+		for size, inputs in (('1 record', [[feature] for feature in features]), (f'{args.batch_size} records', batches)):
+			results = {name: _latencies(run, inputs) for name, run in (('DataFrame (before)', _dataframe), ('compiled', compiled_pipeline.predict))}
+			baseline = statistics.median(results['DataFrame (before)'])
+			for name, latencies in results.items():
+				p50, p99 = statistics.median(latencies), statistics.quantiles(latencies, n=100)[98]
+				print(f'{f"{model}, {size}, {name}":<48}{p50 * 1000:>8.3f}{p99 * 1000:>8.3f}{baseline / p50:>8.1f}x')
+
+
+if __name__ == '__main__':
+	main()
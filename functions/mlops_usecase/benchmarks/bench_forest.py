@@ -0,0 +1,77 @@
+"""Load time and predict latency of the RandomForest of `titanic_train`, sklearn against the flat arrays.
+
+Trains the forest on the titanic dataset, saves it as the training does, as a
+joblib pickle and as the `.npz` arrays of `forest.export_forest`, then times
+loading each file and predicting batches of each size on the transformed
+passengers. The predictions of both are checked to be identical first.
+
+    python -m benchmarks.bench_forest --repeat 200
+"""
+
+import argparse
+import io
+import pathlib
+import statistics
+import time
+import warnings
+from typing import Any, Callable, List
+
+import joblib
+import pandas as pd
+
+from c_train_model.app.funcs.forest import export_forest, forest_to_bytes
+from c_train_model.app.funcs.train_models import titanic_train
+from d_predictions_endpoint.app.funcs import forest
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
+
+def _timings(run: Callable[[], Any], repeat: int) -> List[float]:
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		run()
+		timings.append(time.perf_counter() - start)
+	return timings
+
+
+def _row(name: str, timings: List[float], baseline: float) -> str:
+	p50 = statistics.median(timings)
+	return f'{name:<36}{p50 * 1000:>9.3f}{baseline / p50:>9.1f}x'
+
+
+def main() -> None:
+	"""Prints the median load and predict times of sklearn and of the flat arrays."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--repeat', type=int, default=200, help='Timed runs of each case.')
+	parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 891], help='Records per prediction.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	titanic = pd.read_csv(TITANIC_CSV)
+	pipeline = titanic_train(titanic)
+	classifier = pipeline[-1]
+	X = pipeline[:-1].transform(titanic)
+
+	pickled = io.BytesIO()
+	joblib.dump(classifier, pickled)
+	exported = forest_to_bytes(export_forest(classifier))
+	model = forest.Forest.load(io.BytesIO(exported))
+	assert (model.predict_proba(X) == classifier.predict_proba(X)).all(), 'The probabilities differ'
+
+	print(f'{len(classifier.estimators_)} trees, pickle {len(pickled.getvalue()) / 1e6:.1f}MB, arrays {len(exported) / 1e6:.1f}MB')
+	print(f'{"":<36}{"p50 ms":>9}{"speedup":>10}')
+
+	load_sklearn = _timings(lambda: joblib.load(io.BytesIO(pickled.getvalue())), args.repeat // 10 or 1)
+	print(_row('load, joblib pickle (before)', load_sklearn, statistics.median(load_sklearn)))
+	print(_row('load, flat arrays', _timings(lambda: forest.Forest.load(io.BytesIO(exported)), args.repeat // 10 or 1), statistics.median(load_sklearn)))
+
+	for batch_size in args.batch_sizes:
+		batch = X[:batch_size]
+		baseline = _timings(lambda: classifier.predict(batch), args.repeat)
+		print(_row(f'predict {batch_size}, sklearn (before)', baseline, statistics.median(baseline)))
+		print(_row(f'predict {batch_size}, flat arrays', _timings(lambda: model.predict(batch), args.repeat), statistics.median(baseline)))
+
+
+if __name__ == '__main__':
+	main()
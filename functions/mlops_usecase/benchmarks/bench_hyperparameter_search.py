@@ -0,0 +1,60 @@
+"""Wall-clock time and cross validated accuracy of the fixed training against the parameter searches.
+
+Trains on the titanic dataset: the fixed RandomForest of `titanic_train`,
+cross validated on the same folds as the searches, then `titanic_search` with
+each strategy. The candidates run in `--n-jobs` worker processes, so the time
+of the searches depends on the cores of the machine.
+
+    python -m benchmarks.bench_hyperparameter_search --candidates 20 --n-jobs -1
+"""
+
+import argparse
+import pathlib
+import statistics
+import time
+import warnings
+
+import joblib
+import pandas as pd
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+
+from c_train_model.app.funcs import train_models
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
+
+def main() -> None:
+	"""Prints the time, the best accuracy and the candidates of each training."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--candidates', type=int, default=20, help='Candidates of each search.')
+	parser.add_argument('--cv', type=int, default=5, help='Folds of the cross validation.')
+	parser.add_argument('--n-jobs', type=int, default=-1, help='Worker processes of the searches.')
+	parser.add_argument('--time-budget', type=float, default=None, help='Seconds each search runs for at most.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	df = pd.read_csv(TITANIC_CSV)
+
+	start = time.perf_counter()
+	X, y = train_models._training_data(df)
+	folds = StratifiedKFold(n_splits=args.cv, shuffle=True, random_state=42)
+	scores = cross_val_score(train_models.titanic_pipeline(), X, y, cv=folds, scoring='accuracy')
+	cv_seconds = time.perf_counter() - start
+	train_models.titanic_train(df)
+	results = {'fixed RandomForest (before)': (time.perf_counter() - start, scores.mean(), 1, cv_seconds)}
+
+	for strategy in ('random', 'halving'):
+		result = train_models.titanic_search(
+			df, strategy=strategy, n_candidates=args.candidates, cv=args.cv, n_jobs=args.n_jobs, time_budget=args.time_budget
+		)
+		median_seconds = statistics.median(candidate.seconds for candidate in result.candidates)
+		results[f'{strategy} search'] = (result.seconds, result.best.mean_score, len(result.candidates), median_seconds)
+
+	print(f'{len(y)} passengers, {args.cv} folds, {joblib.effective_n_jobs(args.n_jobs)} workers')
+	print(f'{"":<30}{"seconds":>9}{"CV accuracy":>13}{"candidates":>12}{"s/candidate":>13}')
+	for name, (seconds, score, candidates, per_candidate) in results.items():
+		print(f'{name:<30}{seconds:>9.1f}{score:>13.3f}{candidates:>12}{per_candidate:>13.2f}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,147 @@
+"""Cold start time and memory of the predictions endpoint, with each model artifact format.
+
+Trains a RandomForest with `titanic_train` and saves it in /tmp as the
+training does: the joblib pickle with the forest arrays next to it, or the
+mmap artifact. For each format, `--workers` fresh processes run alongside
+each other as the workers of one instance, started one after the other: each
+imports the endpoint, runs `load_model` (the download from Cloud Storage is
+left out) and predicts one record. Memory is read from /proc once they are
+all loaded: RSS counts shared pages in every worker, PSS splits them between
+the workers that share them, and anonymous memory is the private heap. The
+load time includes the sklearn modules the unpickling imports.
+
+    python -m benchmarks.bench_model_artifact --workers 4 --n-estimators 500
+"""
+
+import argparse
+import io
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from typing import Any, Dict, List
+
+FUNCTIONS_DIR = pathlib.Path(__file__).parents[1]
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+POINT = {'Age': 22, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': 3}
+FORMATS = {'joblib pickle + forest (before)': 'bench-model-joblib', 'mmap artifact': 'bench-model-mmap'}
+
+
+def _memory(pid: int | str = 'self') -> Dict[str, float]:
+	"""The Rss, Pss and Anonymous lines of /proc/<pid>/smaps_rollup, in MB."""
+	memory = {}
+	for line in pathlib.Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines():
+		name, _, value = line.partition(':')
+		if name in ('Rss', 'Pss', 'Anonymous'):
+			memory[name] = int(value.split()[0]) / 1024
+	return memory
+
+
+def _worker(model_name: str) -> None:
+	"""Loads the model as the endpoint does at cold start, then waits for the parent to read its memory."""
+	start = time.perf_counter()
+	os.environ['_CI_TESTING'] = 'yes'
+	from unittest import mock
+
+	from d_predictions_endpoint.app import main as endpoint
+
+	def _transfer(CS: Any, gcs_input_bucket: str, file_location: str, model_name: str = 'model') -> None:
+		# The download is left out, the saved file is linked where it would be downloaded
+		os.symlink(f'/tmp/{file_location}', f'/tmp/{model_name}')
+
+	imported = time.perf_counter()
+	with mock.patch.object(endpoint.gcp_apis, 'transfer_blob_to_temp', side_effect=_transfer):
+		model = endpoint.load_version(env_vars=endpoint._env_vars(), gcp_clients=mock.Mock(), version=str(os.getpid()), location=model_name, model_name=model_name)
+	loaded = time.perf_counter()
+	prediction = model.compiled_pipeline.predict([POINT])
+	predicted = time.perf_counter()
+	for path in model.files:
+		os.remove(path)
+
+	print(json.dumps({'import': imported - start, 'load': loaded - imported, 'first_prediction': predicted - loaded, 'prediction': prediction}), flush=True)
+	sys.stdin.read()
+
+
+def _save_models(n_estimators: int) -> None:
+	import joblib
+	import pandas as pd
+	from sklearn.ensemble import RandomForestClassifier
+
+	from c_train_model.app.funcs import forest
+	from c_train_model.app.funcs.train_models import titanic_train
+
+	warnings.simplefilter('ignore')
+	pipeline = titanic_train(pd.read_csv(TITANIC_CSV), classifier=RandomForestClassifier(n_estimators=n_estimators, random_state=42))
+
+	joblib_name, mmap_name = FORMATS.values()
+	joblib.dump(pipeline, f'/tmp/{joblib_name}')
+	pathlib.Path(f'/tmp/{joblib_name}.forest.npz').write_bytes(forest.forest_to_bytes(forest.export_forest(pipeline[-1])))
+
+	# As gcp_apis.model_save_to_storage, through a bytes container
+	bytes_container = io.BytesIO()
+	joblib.dump(forest.mmap_artifact(pipeline), bytes_container)
+	pathlib.Path(f'/tmp/{mmap_name}').write_bytes(bytes_container.getvalue())
+
+
+def _run_workers(model_name: str, workers: int) -> List[Dict[str, float]]:
+	"""Starts the workers one after the other, each one once the previous one is loaded and waiting."""
+	env = os.environ | {'PYTHONPATH': str(FUNCTIONS_DIR)}
+	processes, results = [], []
+	for _ in range(workers):
+		process = subprocess.Popen(
+			[sys.executable, '-W', 'ignore', '-m', 'benchmarks.bench_model_artifact', '--worker', model_name],
+			cwd=FUNCTIONS_DIR,
+			env=env,
+			stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE,
+			text=True,
+		)
+		processes.append(process)
+		results.append(json.loads(process.stdout.readline()))
+
+	# Read once every worker is loaded, the pages they share are split between them
+	results = [result | _memory(process.pid) for result, process in zip(results, processes)]
+	for process in processes:
+		process.communicate()
+	return results
+
+
+def main() -> None:
+	"""Prints the cold start time and the memory of the workers with each format."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workers', type=int, default=4, help='Workers loading the model side by side.')
+	parser.add_argument('--n-estimators', type=int, default=500, help='Trees of the RandomForest.')
+	parser.add_argument('--worker', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.worker:
+		_worker(args.worker)
+		return
+
+	_save_models(n_estimators=args.n_estimators)
+	sizes = {name: sum(f.stat().st_size for f in pathlib.Path('/tmp').glob(f'{model_name}*')) / 1e6 for name, model_name in FORMATS.items()}
+
+	print(f'{args.n_estimators} trees, {args.workers} workers, medians per worker')
+	print(f'{"":<34}{"file MB":>8}{"load ms":>9}{"cold ms":>9}{"RSS MB":>8}{"PSS MB":>8}{"anon MB":>9}{"total PSS":>11}')
+	predictions = set()
+	for name, model_name in FORMATS.items():
+		results = _run_workers(model_name=model_name, workers=args.workers)
+		predictions.update(tuple(result['prediction']) for result in results)
+
+		def _median(key: str, results: List[Dict[str, float]] = results) -> float:
+			return statistics.median(result[key] for result in results)
+
+		cold = statistics.median(result['import'] + result['load'] + result['first_prediction'] for result in results)
+		print(
+			f'{name:<34}{sizes[name]:>8.1f}{_median("load") * 1000:>9.1f}{cold * 1000:>9.1f}'
+			f'{_median("Rss"):>8.1f}{_median("Pss"):>8.1f}{_median("Anonymous"):>9.1f}{sum(r["Pss"] for r in results):>11.1f}'
+		)
+	assert len(predictions) == 1, f'The formats predict differently: {predictions}'
+
+
+if __name__ == '__main__':
+	main()
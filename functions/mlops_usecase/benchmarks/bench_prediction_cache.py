@@ -0,0 +1,86 @@
+"""Latency of single record requests to the predictions endpoint, with and without the prediction cache.
+
+Runs `predict` in process with the test model of the endpoint, compiled as at
+cold start, the BigQuery insert patched out. The requests cycle over the first
+`distinct` passengers of the titanic dataset, so all but the first request of
+each passenger are repeats, as retries and dashboard refreshes are.
+
+    python -m benchmarks.bench_prediction_cache --requests 2000 --distinct 20 200 2000
+"""
+
+import argparse
+import itertools
+import os
+import pathlib
+import statistics
+import time
+import warnings
+from typing import Any, Dict, List
+from unittest import mock
+
+import flask
+import joblib
+import pandas as pd
+
+os.environ.setdefault('_CI_TESTING', 'yes')
+
+from d_predictions_endpoint.app import main as endpoint  # noqa: E402
+from d_predictions_endpoint.app.funcs import cache, models  # noqa: E402
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TEST_MODEL = pathlib.Path(__file__).parents[1] / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+
+
+def _points(requests: int, distinct: int) -> List[Dict[str, Any]]:
+	df = pd.read_csv(TITANIC_CSV, usecols=['Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass'])
+	points = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+	return list(itertools.islice(itertools.cycle(points[:distinct]), requests))
+
+
+def _latencies(app: flask.Flask, points: List[Dict[str, Any]]) -> List[float]:
+	latencies = []
+	for point in points:
+		start = time.perf_counter()
+		with app.test_request_context('/', method='POST', json=point):
+			endpoint.predict(flask.request)
+		latencies.append(time.perf_counter() - start)
+	return latencies
+
+
+def main() -> None:
+	"""Prints the median and p99 latency of single record requests, without and with the cache."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--requests', type=int, default=2000, help='Number of single record requests.')
+	parser.add_argument('--distinct', type=int, nargs='+', default=[20, 200, 891], help='Distinct passengers the requests cycle over.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	pipeline = joblib.load(TEST_MODEL)
+	served_model = models.ServedModel(version='bench', pipeline=pipeline, compiled_pipeline=endpoint.compile_model(pipeline))
+	app = flask.Flask(__name__)
+
+	results = {}
+	with (
+		mock.patch.object(endpoint, 'served_model', served_model),
+		mock.patch.object(endpoint, 'load_clients', return_value=models.GCPClients(bigquery_client=mock.Mock())),
+		mock.patch.object(endpoint, 'prediction_logger', mock.Mock()),
+		mock.patch('builtins.print'),
+	):
+		for distinct in args.distinct:
+			points = _points(requests=args.requests, distinct=distinct)
+			for name, prediction_cache in {'no cache (before)': None, 'prediction cache': cache.PredictionCache()}.items():
+				with mock.patch.object(endpoint, 'prediction_cache', prediction_cache):
+					results[distinct, name] = (_latencies(app, points), prediction_cache.stats() if prediction_cache else None)
+
+	print(f'{args.requests} requests')
+	print(f'{"":<38}{"hit rate":>9}{"p50 ms":>9}{"p99 ms":>9}{"speedup":>10}')
+	for (distinct, name), (latencies, stats) in results.items():
+		baseline = statistics.median(results[distinct, 'no cache (before)'][0])
+		hit_rate = stats['hits'] / (stats['hits'] + stats['misses']) if stats else 0.0
+		p50, p99 = statistics.median(latencies), statistics.quantiles(latencies, n=100)[98]
+		label = f'{distinct} passengers, {name}'
+		print(f'{label:<38}{hit_rate:>9.0%}{p50 * 1000:>9.3f}{p99 * 1000:>9.3f}{baseline / p50:>9.1f}x')
+
+
+if __name__ == '__main__':
+	main()
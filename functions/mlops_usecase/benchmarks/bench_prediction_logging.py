@@ -0,0 +1,118 @@
+"""Latency of single record predictions, with the BigQuery insert on and off the request path.
+
+Runs `predict` in process with the test model of the endpoint. BigQuery is a
+stand-in whose inserts take `--insert-ms`. The baseline inserts the rows
+before returning, as the endpoint did; the background logger only queues them.
+The model alone, a one row DataFrame and `pipeline.predict`, is the floor.
+
+    python -m benchmarks.bench_prediction_logging --requests 500 --insert-ms 40
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Sequence
+from unittest import mock
+
+import flask
+import joblib
+import pandas as pd
+
+os.environ.setdefault('_CI_TESTING', 'yes')
+
+from d_predictions_endpoint.app import main as endpoint  # noqa: E402
+from d_predictions_endpoint.app.funcs import gcp_apis, models, records  # noqa: E402
+
+TEST_MODEL = pathlib.Path(__file__).parents[1] / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+POINT = {'Age': 22, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': 3}
+
+
+class SlowBigQueryClient:
+	"""Inserts that take a fixed time, like a streaming insert round trip."""
+
+	def __init__(self, insert_seconds: float) -> None:
+		"""Sets the time each insert takes."""
+		self.insert_seconds = insert_seconds
+		self.rows = 0
+
+	def insert_rows_json(self, table: str, json_rows: Sequence[Dict[str, Any]], **kwargs: Any) -> List[Dict[str, Any]]:
+		"""Waits for the insert time and counts the rows."""
+		time.sleep(self.insert_seconds)
+		self.rows += len(json_rows)
+		return []
+
+
+class InlineLogger:
+	"""Inserts the rows before returning, as the endpoint did before the background logger."""
+
+	def __init__(self, BQ: SlowBigQueryClient, table_fqn: str) -> None:
+		"""Keeps the client and the table."""
+		self.BQ = BQ
+		self.table_fqn = table_fqn
+
+	def log(self, rows: Sequence[Dict[str, Any]]) -> None:
+		"""Inserts the rows."""
+		gcp_apis.bigquery_insert_json_row(BQ=self.BQ, table_fqn=self.table_fqn, row=rows)
+
+	def close(self) -> None:
+		"""Nothing is left to insert."""
+
+
+def _latencies(run: Callable[[], Any], requests: int) -> List[float]:
+	latencies = []
+	for _ in range(requests):
+		start = time.perf_counter()
+		run()
+		latencies.append(time.perf_counter() - start)
+	return latencies
+
+
+def main() -> None:
+	"""Prints the p50 and p99 latency of each way of logging the predictions."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--requests', type=int, default=500, help='Number of single record requests.')
+	parser.add_argument('--insert-ms', type=float, default=40.0, help='Time each BigQuery insert takes.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	pipeline = joblib.load(TEST_MODEL)
+	app = flask.Flask(__name__)
+	bigquery_client = SlowBigQueryClient(insert_seconds=args.insert_ms / 1000)
+
+	def _request() -> None:
+		with app.test_request_context('/', method='POST', json=POINT):
+			endpoint.predict(flask.request)
+
+	def _model_only() -> None:
+		pipeline.predict(pd.DataFrame.from_records([POINT], columns=list(records.FEATURES)))
+
+	loggers = {
+		'insert in the request (before)': InlineLogger(BQ=bigquery_client, table_fqn='bench'),
+		'background logger': gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='bench', max_latency=0.5),
+	}
+	results = {'model only': _latencies(_model_only, args.requests)}
+
+	with (
+		mock.patch.object(endpoint, 'served_model', models.ServedModel(version='bench', pipeline=pipeline, compiled_pipeline=None)),
+		mock.patch.object(endpoint, 'load_clients', return_value=models.GCPClients(bigquery_client=bigquery_client)),
+		mock.patch('builtins.print'),
+	):
+		for name, logger in loggers.items():
+			bigquery_client.rows = 0
+			with mock.patch.object(endpoint, 'prediction_logger', logger):
+				results[name] = _latencies(_request, args.requests)
+				logger.close()
+			assert bigquery_client.rows == args.requests, f'{name} logged {bigquery_client.rows} of {args.requests} rows'
+
+	print(f'{args.requests} requests, {args.insert_ms:.0f}ms per insert, every row logged')
+	print(f'{"":<34}{"p50 ms":>8}{"p99 ms":>8}')
+	for name, latencies in results.items():
+		p50, p99 = statistics.quantiles(latencies, n=100)[49], statistics.quantiles(latencies, n=100)[98]
+		print(f'{name:<34}{p50 * 1000:>8.2f}{p99 * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+	main()
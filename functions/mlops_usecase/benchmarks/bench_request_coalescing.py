@@ -0,0 +1,118 @@
+"""Load test of concurrent single record requests, with and without the request coalescer.
+
+Runs `predict` in process with the test model of the endpoint, compiled as at
+cold start, the BigQuery insert patched out and the prediction cache disabled.
+`--threads` clients each send `--requests` single record requests back to back,
+the titanic passengers in turn. Each window of the coalescer is a point of the
+trade-off: a longer window makes larger batches, for more throughput under
+load, and adds up to the window to the latency of a request. Pass
+`--compiled no` to predict with the sklearn pipeline on DataFrames, whose
+overhead per call is the largest.
+
+    python -m benchmarks.bench_request_coalescing --threads 16 --windows 0 1 2 5
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import threading
+import time
+import warnings
+from typing import Any, Dict, List
+from unittest import mock
+
+import flask
+import joblib
+import pandas as pd
+
+os.environ.setdefault('_CI_TESTING', 'yes')
+
+from d_predictions_endpoint.app import main as endpoint  # noqa: E402
+from d_predictions_endpoint.app.funcs import batching, models  # noqa: E402
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TEST_MODEL = pathlib.Path(__file__).parents[1] / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+
+
+def _points() -> List[Dict[str, Any]]:
+	df = pd.read_csv(TITANIC_CSV, usecols=['Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass'])
+	return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def _load(app: flask.Flask, points: List[Dict[str, Any]], threads: int, requests: int) -> tuple:
+	"""Runs the clients, returns the wall-clock time and the latency of every request."""
+	latencies: List[float] = []
+	lock = threading.Lock()
+	barrier = threading.Barrier(threads + 1)
+
+	def _client(offset: int) -> None:
+		own = []
+		barrier.wait()
+		for index in range(requests):
+			point = points[(offset + index) % len(points)]
+			start = time.perf_counter()
+			with app.test_request_context('/', method='POST', json=point):
+				endpoint.predict(flask.request)
+			own.append(time.perf_counter() - start)
+		with lock:
+			latencies.extend(own)
+
+	clients = [threading.Thread(target=_client, args=(offset * requests,)) for offset in range(threads)]
+	for client in clients:
+		client.start()
+	barrier.wait()
+	start = time.perf_counter()
+	for client in clients:
+		client.join()
+	return time.perf_counter() - start, latencies
+
+
+def main() -> None:
+	"""Prints the throughput, the latency and the batch size of each window."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--threads', type=int, default=16, help='Concurrent clients.')
+	parser.add_argument('--requests', type=int, default=200, help='Requests of each client.')
+	parser.add_argument('--windows', type=float, nargs='+', default=[1.0, 2.0, 5.0], help='Windows of the coalescer, in milliseconds.')
+	parser.add_argument('--max-records', type=int, default=64, help='Records that end the wait of a batch.')
+	parser.add_argument('--compiled', choices=['yes', 'no'], default='yes', help='Whether to predict with the compiled pipeline.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	pipeline = joblib.load(TEST_MODEL)
+	compiled_pipeline = endpoint.compile_model(pipeline) if args.compiled == 'yes' else None
+	served_model = models.ServedModel(version='bench', pipeline=pipeline, compiled_pipeline=compiled_pipeline)
+	app = flask.Flask(__name__)
+	points = _points()
+
+	results = {}
+	with (
+		mock.patch.object(endpoint, 'served_model', served_model),
+		mock.patch.object(endpoint, 'load_clients', return_value=models.GCPClients(bigquery_client=mock.Mock())),
+		mock.patch.object(endpoint, 'prediction_logger', mock.Mock()),
+		mock.patch.object(endpoint, 'prediction_cache', None),
+		mock.patch('builtins.print'),
+	):
+		cases: Dict[str, Any] = {'no coalescer (before)': None}
+		for window in args.windows:
+			cases[f'{window:g} ms window'] = batching.RequestCoalescer(
+				predict=lambda model, features: endpoint._predict(model=model, features=features),
+				max_wait=window / 1000,
+				max_records=args.max_records,
+			)
+		for name, coalescer in cases.items():
+			with mock.patch.object(endpoint, 'request_coalescer', coalescer):
+				seconds, latencies = _load(app, points, threads=args.threads, requests=args.requests)
+			results[name] = (seconds, latencies, coalescer.stats()['records_per_batch'] if coalescer else 1.0)
+
+	total = args.threads * args.requests
+	baseline = total / results['no coalescer (before)'][0]
+	print(f'{args.threads} clients x {args.requests} requests, {"compiled pipeline" if compiled_pipeline else "sklearn pipeline"}')
+	print(f'{"":<24}{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"batch":>8}{"speedup":>10}')
+	for name, (seconds, latencies, batch) in results.items():
+		p50, p99 = statistics.median(latencies), statistics.quantiles(latencies, n=100)[98]
+		print(f'{name:<24}{total / seconds:>9,.0f}{p50 * 1000:>9.2f}{p99 * 1000:>9.2f}{batch:>8.1f}{total / seconds / baseline:>9.1f}x')
+
+
+if __name__ == '__main__':
+	main()
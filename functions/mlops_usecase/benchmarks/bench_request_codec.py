@@ -0,0 +1,94 @@
+"""Cost of decoding, validating and encoding a request of the endpoint, per record.
+
+Builds bodies of `--records` titanic passengers, a JSON object for one record and
+a JSON array for more, and runs the JSON work of `predict` on them, without the
+model: the body logged, parsed and validated, and the response encoded. Before,
+the body is decoded by `request.get_json` for the log line, again by
+`parse_body`, with the standard library, and the response is encoded by
+`jsonify`. After, the body is decoded once by `codec`, against the compiled
+spec of the features, and the response encoded by `codec`: with orjson, and
+with the standard library, as when orjson is not installed. Each case is the
+best of `--repeat` timings of `--number` requests.
+
+    python -m benchmarks.bench_request_codec --records 1 100 1000
+"""
+
+import argparse
+import json
+import pathlib
+import timeit
+import uuid
+from typing import Any, Callable, Dict, List
+from unittest import mock
+
+import flask
+import pandas as pd
+
+from d_predictions_endpoint.app.funcs import codec, records
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
+
+def _points() -> List[Dict[str, Any]]:
+	df = pd.read_csv(TITANIC_CSV, usecols=['PassengerId', 'Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass'])
+	return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def _results(batch: List[records.Record]) -> Dict[str, Any]:
+	"""The payload of the response, as `predict` returns it."""
+	results = [{'index': index, 'prediction': index % 2, 'uuid': str(uuid.uuid4())} for index, _ in enumerate(batch)]
+	if len(results) == 1:
+		return {'prediction': results[0]['prediction'], 'uuid': results[0]['uuid']}
+	return {'predictions': results}
+
+
+def _before(app: flask.Flask, body: bytes) -> Callable[[], Any]:
+	def _request() -> Any:
+		str(json.loads(body))
+		batch, _ = records.parse_body(body=body, mimetype='application/json')
+		with app.app_context():
+			return flask.jsonify(_results(batch)).get_data()
+
+	return _request
+
+
+def _after(body: bytes) -> Callable[[], Any]:
+	def _request() -> Any:
+		body.decode('utf-8', errors='replace')
+		batch, _ = records.parse_body(body=body, mimetype='application/json')
+		return codec.dumps(_results(batch))
+
+	return _request
+
+
+def main() -> None:
+	"""Prints the microseconds per record of each case, for each size of request."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--records', type=int, nargs='+', default=[1, 100, 1000], help='Records of each request.')
+	parser.add_argument('--number', type=int, default=0, help='Requests of each timing, 0 for about 20k records.')
+	parser.add_argument('--repeat', type=int, default=5, help='Timings of each case.')
+	args = parser.parse_args()
+
+	app = flask.Flask(__name__)
+	points = _points()
+	cases = ('stdlib, decoded twice (before)', 'stdlib codec, once', 'orjson codec, once')
+
+	print(f'{"records":>8}' + ''.join(f'{name:>32}' for name in cases) + f'{"speedup":>10}')
+	for size in args.records:
+		selected = [points[index % len(points)] for index in range(size)]
+		body = json.dumps(selected[0] if size == 1 else selected).encode('utf-8')
+		number = args.number or max(1, 20_000 // size)
+
+		timings = {}
+		timings[cases[0]] = min(timeit.repeat(_before(app, body), number=number, repeat=args.repeat))
+		with mock.patch.object(codec, 'orjson', None):
+			timings[cases[1]] = min(timeit.repeat(_after(body), number=number, repeat=args.repeat))
+		timings[cases[2]] = min(timeit.repeat(_after(body), number=number, repeat=args.repeat))
+
+		per_record = {name: seconds / number / size * 1e6 for name, seconds in timings.items()}
+		speedup = per_record[cases[0]] / per_record[cases[2]]
+		print(f'{size:>8}' + ''.join(f'{per_record[name]:>29.2f} us' for name in cases) + f'{speedup:>9.1f}x')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,124 @@
+"""Memory of the serving workers, each one loading the model against the model loaded before they are forked.
+
+Trains a forest of `--trees` trees on the titanic dataset, as the training
+function does, and dumps it like the pickle the endpoint downloads. Then
+`--workers` processes are forked, as gunicorn forks them, and each one predicts
+`--requests` single records with its BLAS and OpenMP threads pinned to one, as
+`serve.post_fork` does. Before, each worker loads its own copy of the pickle.
+With `serve`, the server loads it once before forking and freezes the garbage
+collector, and the workers share its pages copy on write. The memory of each
+worker is read from /proc/<pid>/smaps_rollup: USS, the pages only it uses, and
+PSS, its share of the pages it uses.
+
+    python -m benchmarks.bench_serving --workers 4 --trees 300
+"""
+
+import argparse
+import gc
+import os
+import pathlib
+import tempfile
+import time
+import warnings
+from typing import Any, Dict, List
+
+import joblib
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from threadpoolctl import threadpool_limits
+
+from c_train_model.app.funcs import train_models
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+FEATURES = ['Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass']
+
+
+def _memory(pid: int) -> Dict[str, int]:
+	"""The USS and PSS of a process, in bytes."""
+	fields = {}
+	with open(f'/proc/{pid}/smaps_rollup') as f:
+		for line in f:
+			name, _, value = line.partition(':')
+			if value.strip().endswith('kB'):
+				fields[name] = int(value.split()[0]) * 1024
+	return {'uss': fields['Private_Clean'] + fields['Private_Dirty'], 'pss': fields['Pss']}
+
+
+def _worker(model: Any, model_path: str, points: pd.DataFrame, requests: int, ready: int, done: int) -> None:
+	"""Predicts single records, then tells the parent to read its memory and waits to be stopped."""
+	threadpool_limits(limits=1)
+	if model is None:
+		model = joblib.load(model_path)
+	for index in range(requests):
+		model.predict(points.iloc[[index % len(points)]])
+	os.write(ready, b'x')
+	os.read(done, 1)
+	os._exit(0)
+
+
+def _run(preload: bool, model_path: str, points: pd.DataFrame, workers: int, requests: int) -> List[Dict[str, int]]:
+	"""Forks the workers, returns their memory once they all served their requests."""
+	model = joblib.load(model_path) if preload else None
+	if preload:
+		gc.freeze()
+
+	ready_read, ready_write = os.pipe()
+	done_read, done_write = os.pipe()
+	pids = []
+	for _ in range(workers):
+		pid = os.fork()
+		if pid == 0:
+			_worker(model, model_path, points, requests, ready_write, done_read)
+		pids.append(pid)
+
+	for _ in pids:
+		os.read(ready_read, 1)
+	memory = [_memory(pid) for pid in pids]
+
+	os.write(done_write, b'x' * len(pids))
+	for pid in pids:
+		os.waitpid(pid, 0)
+	for fd in (ready_read, ready_write, done_read, done_write):
+		os.close(fd)
+	del model
+	gc.unfreeze()
+	gc.collect()
+	return memory
+
+
+def main() -> None:
+	"""Prints the memory of the workers, without and with the model preloaded."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workers', type=int, default=4, help='Worker processes forked.')
+	parser.add_argument('--trees', type=int, default=300, help='Trees of the forest.')
+	parser.add_argument('--requests', type=int, default=200, help='Single record requests of each worker.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	df = pd.read_csv(TITANIC_CSV)
+	pipeline = train_models.titanic_train(df, classifier=RandomForestClassifier(n_estimators=args.trees, random_state=42))
+	points = df[FEATURES]
+
+	results = {}
+	with tempfile.TemporaryDirectory() as folder:
+		model_path = os.path.join(folder, 'model')
+		joblib.dump(pipeline, model_path)
+		model_mb = os.path.getsize(model_path) / 1e6
+		del pipeline
+		gc.collect()
+
+		for name, preload in (('each worker loads (before)', False), ('preloaded before fork', True)):
+			start = time.perf_counter()
+			memory = _run(preload=preload, model_path=model_path, points=points, workers=args.workers, requests=args.requests)
+			results[name] = (memory, time.perf_counter() - start)
+
+	print(f'{args.workers} workers, model pickle {model_mb:.1f} MB')
+	print(f'{"":<28}{"USS/worker MB":>15}{"PSS total MB":>14}{"seconds":>9}')
+	for name, (memory, seconds) in results.items():
+		uss = sum(m['uss'] for m in memory) / len(memory)
+		pss = sum(m['pss'] for m in memory)
+		print(f'{name:<28}{uss / 1e6:>15.1f}{pss / 1e6:>14.1f}{seconds:>9.1f}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,185 @@
+"""Cold start of each function: import time plus first request time.
+
+Every measure runs in a fresh interpreter, from the `app` folder of the
+function as in its deployment. The import is the function module alone,
+with `_CI_TESTING=yes` so nothing is built at import. The first request then
+loads the environment variables, the clients (and the model of the
+predictions endpoint) and handles one event; `c_train_model:no-train` is an
+event that does not ask for training. The GCP clients are real, with
+anonymous credentials, while the calls that would reach GCP are patched out.
+`google.auth` is imported before the clock starts to patch the credentials,
+so it is left out of both measures.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import importlib
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from unittest import mock
+
+FUNCTIONS_DIR = pathlib.Path(__file__).parents[1]
+TITANIC_CSV = FUNCTIONS_DIR.parents[1] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TEST_MODEL = FUNCTIONS_DIR / 'd_predictions_endpoint' / 'tests' / 'resources' / 'nar-rayya'
+
+# Libraries worth knowing whether a code path paid for
+HEAVY_MODULES = ['google.cloud.bigquery', 'google.cloud.storage', 'google.cloud.pubsub', 'pandas', 'sklearn', 'joblib', 'pyarrow']
+
+
+def _sent_future() -> concurrent.futures.Future:
+	future: concurrent.futures.Future = concurrent.futures.Future()
+	future.set_result('1')
+	return future
+
+
+def _pubsub_event(data: Dict[str, Any], attributes: Dict[str, str]) -> Any:
+	from cloudevents.http import CloudEvent
+
+	return CloudEvent(
+		attributes={'type': 'google.cloud.pubsub.topic.v1.messagePublished', 'source': 'bench'},
+		data={'message': {'data': base64.b64encode(json.dumps(data).encode('utf-8')).decode('utf-8'), 'attributes': attributes}},
+	)
+
+
+def _request_ingest_data(main: Any) -> None:
+	from cloudevents.http import CloudEvent
+
+	lines = TITANIC_CSV.read_text().splitlines()
+	with (
+		mock.patch.object(main.gcp_apis, 'storage_stream_blob_lines', return_value=enumerate(lines, start=1)),
+		mock.patch.object(main.gcp_apis, 'bigquery_insert_json_row', return_value=None),
+		mock.patch.object(main.gcp_apis, 'pubsub_publish_message', side_effect=lambda **kwargs: _sent_future()),
+	):
+		main.main(CloudEvent(attributes={'type': 'google.cloud.storage.object.v1.finalized', 'source': 'bench'}, data={'bucket': 'bench', 'name': 'titanic.csv'}))
+
+
+def _request_update_facts(main: Any) -> None:
+	with (
+		mock.patch.object(main.gcp_apis, 'execute_query_result', return_value=None),
+		mock.patch.object(main.gcp_apis, 'pubsub_publish_message', side_effect=lambda **kwargs: _sent_future()),
+	):
+		main.main(_pubsub_event(data={}, attributes={'closer-run-hash': 'bench'}))
+
+
+def _request_train_model(main: Any) -> None:
+	def _query(query: str, BQ: Any, **kwargs: Any) -> Any:
+		import pandas as pd
+
+		return pd.read_csv(TITANIC_CSV)
+
+	with (
+		mock.patch.object(main.gcp_apis, 'query_to_pandas_dataframe', side_effect=_query),
+		mock.patch.object(main.gcp_apis, '_storage_write_bytes_file_to_bucket', return_value=None),
+	):
+		main.main(_pubsub_event(data={'training_data_table': 'bench.bench.titanic_facts'}, attributes={'train_model': 'True', 'dataset': 'titanic'}))
+
+
+def _request_skip_training(main: Any) -> None:
+	main.main(_pubsub_event(data={'training_data_table': 'bench.bench.titanic_facts'}, attributes={'train_model': 'False', 'dataset': 'titanic'}))
+
+
+def _request_predictions_endpoint(main: Any) -> None:
+	import flask
+
+	def _transfer(CS: Any, gcs_input_bucket: str, file_location: str, model_name: str = 'model') -> None:
+		# The test model is a pickle without exported forest
+		if file_location.endswith(main.gcp_apis.FOREST_SUFFIX):
+			raise ValueError(f'Blob {file_location} does not exist.')
+		shutil.copy(TEST_MODEL, '/tmp/' + model_name)
+
+	# No published version, the model is the legacy blob at the model location
+	with (
+		mock.patch.object(main.gcp_apis, 'transfer_blob_to_temp', side_effect=_transfer),
+		mock.patch.object(main.gcp_apis.BlobPoller, 'poll', return_value=False),
+		mock.patch.object(main.gcp_apis.BlobPoller, 'start'),
+		mock.patch.object(main.gcp_apis, 'bigquery_insert_json_row', return_value=None),
+	):
+		main.env_vars = main._env_vars()
+		main.gcp_clients = main.load_clients(gcp_project_id=main.env_vars.gcp_project_id)
+		main.load_model(env_vars=main.env_vars, gcp_clients=main.gcp_clients)
+
+		point = {'Age': 22, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': '3'}
+		with flask.Flask(__name__).test_request_context('/', method='POST', json=point):
+			main.predict(flask.request)
+
+
+# Each case is the function folder and its first request
+CASES: Dict[str, Tuple[str, Callable[[Any], None]]] = {
+	'a_ingest_data': ('a_ingest_data', _request_ingest_data),
+	'b_update_facts': ('b_update_facts', _request_update_facts),
+	'c_train_model': ('c_train_model', _request_train_model),
+	'c_train_model:no-train': ('c_train_model', _request_skip_training),
+	'd_predictions_endpoint': ('d_predictions_endpoint', _request_predictions_endpoint),
+}
+
+
+def _child(case: str) -> None:
+	"""Measures one cold start in this interpreter and prints it as JSON."""
+	import google.auth
+	from google.auth.credentials import AnonymousCredentials
+
+	function, request = CASES[case]
+	os.environ['_CI_TESTING'] = 'yes'
+
+	with mock.patch.object(google.auth, 'default', return_value=(AnonymousCredentials(), 'bench')):
+		start = time.perf_counter()
+		main = importlib.import_module(f'{function}.app.main')
+		import_s = time.perf_counter() - start
+
+		# The functions log their progress, which is not part of the measure
+		with mock.patch('builtins.print'):
+			start = time.perf_counter()
+			request(main)
+			request_s = time.perf_counter() - start
+
+	loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+	print(json.dumps({'import_s': import_s, 'request_s': request_s, 'loaded': loaded}))
+
+
+def _run_child(case: str) -> Dict[str, Any]:
+	env = os.environ | {'PYTHONPATH': str(FUNCTIONS_DIR)}
+	function, _ = CASES[case]
+	result = subprocess.run(
+		[sys.executable, '-m', 'benchmarks.bench_startup', '--child', case],
+		cwd=FUNCTIONS_DIR / function / 'app',
+		env=env,
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+	return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+	"""Prints the median import and first request time of each function."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per function, the median is reported.')
+	parser.add_argument('--child', choices=CASES, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		_child(args.child)
+		return
+
+	print(f'median of {args.runs} cold starts, in ms')
+	print(f'{"":<24}{"import":>8}{"request":>9}{"total":>8}  loaded by the end')
+	for case in CASES:
+		runs: List[Dict[str, Any]] = [_run_child(case) for _ in range(args.runs)]
+		import_ms = statistics.median(run['import_s'] for run in runs) * 1000
+		request_ms = statistics.median(run['request_s'] for run in runs) * 1000
+		total_ms = statistics.median((run['import_s'] + run['request_s']) for run in runs) * 1000
+		print(f'{case:<24}{import_ms:>8.0f}{request_ms:>9.0f}{total_ms:>8.0f}  {", ".join(runs[0]["loaded"]) or "-"}')
+
+
+if __name__ == '__main__':
+	main()
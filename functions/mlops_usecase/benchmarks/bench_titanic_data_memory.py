@@ -0,0 +1,110 @@
+"""Memory and serialisation cost of the ingest function row types, at 1M rows.
+
+Compares the original frozen dataclass with the `models.TitanicData` named
+tuple, and with the column batches of `transform.titanic_transform_columns`.
+
+    python -m benchmarks.bench_titanic_data_memory --rows 1000000
+"""
+
+import argparse
+import csv
+import gc
+import itertools
+import pathlib
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from a_ingest_data.app.funcs import models, transform
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
+
+@dataclass(kw_only=True, frozen=True)
+class DataclassTitanicData:
+	"""The row type before the named tuple, kept as the baseline."""
+
+	run_hash: str
+	PassengerId: str | None
+	Survived: str | None = None
+	Pclass: str | None = None
+	Name: str | None
+	Sex: str | None = None
+	Age: str | None = None
+	SibSp: str | None = None
+	Parch: str | None = None
+	Ticket: str | None = None
+	Fare: str | None = None
+	Cabin: str | None = None
+	Embarked: str | None = None
+
+	def to_dict(self) -> Dict[str, Any]:
+		"""Same as the original to_dict, one key per attribute."""
+		return {name: getattr(self, name) for name in models.TitanicData._fields}
+
+
+def _filter_dict(d: Dict[str, Any]) -> Dict[str, Any]:
+	return {k: v for k, v in d.items() if isinstance(v, str) and bool(v.strip())}
+
+
+def _measure(build: Callable[[], Any]) -> tuple[Any, int, float]:
+	"""Returns the built object, the memory it holds and the time to build it.
+
+	The object is built twice: once timed, once traced, as tracing slows every allocation down.
+	"""
+	gc.collect()
+	start = time.perf_counter()
+	built = build()
+	elapsed = time.perf_counter() - start
+	del built
+
+	gc.collect()
+	tracemalloc.start()
+	built = build()
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return built, size, elapsed
+
+
+def main() -> None:
+	"""Prints the memory per row and the time to build and serialise each row type."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows', type=int, default=1_000_000, help='Number of rows to build.')
+	args = parser.parse_args()
+
+	lines = transform.split_lines(content=TITANIC_CSV.read_text())[1:]
+	# Decode once, so every row type holds the very same strings and only the containers are measured
+	decoded: List[List[str]] = list(itertools.islice(itertools.cycle(csv.reader(lines)), args.rows))
+	fields = models.TitanicData._fields[1:]
+
+	builders: Dict[str, Callable[[], Any]] = {
+		'frozen dataclass (before)': lambda: [DataclassTitanicData(run_hash='bench', **dict(zip(fields, row))) for row in decoded],
+		'named tuple': lambda: [models.TitanicData('bench', *row) for row in decoded],
+		'column batches': lambda: [
+			{'run_hash': ['bench'] * len(batch)} | {name: list(column) for name, column in zip(fields, zip(*batch))}
+			for batch in (decoded[i : i + 10000] for i in range(0, len(decoded), 10000))
+		],
+	}
+	serialisers: Dict[str, Callable[[Any], int]] = {
+		'frozen dataclass (before)': lambda rows: sum(len(_filter_dict(row.to_dict())) for row in rows),
+		'named tuple': lambda rows: sum(len(row.to_json_row()) for row in rows),
+	}
+
+	print(f'{args.rows:,} rows')
+	print(f'{"":<28}{"bytes/row":>10}{"total MB":>10}{"build s":>9}{"serialise s":>13}')
+	for name, build in builders.items():
+		built, size, build_time = _measure(build)
+
+		serialise = '-'
+		if name in serialisers:
+			start = time.perf_counter()
+			serialisers[name](built)
+			serialise = f'{time.perf_counter() - start:.2f}'
+
+		print(f'{name:<28}{size / args.rows:>10.1f}{size / 1e6:>10.1f}{build_time:>9.2f}{serialise:>13}')
+		del built
+
+
+if __name__ == '__main__':
+	main()
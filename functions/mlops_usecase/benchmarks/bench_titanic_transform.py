@@ -0,0 +1,79 @@
+"""Rows per second of the titanic CSV parsers of the ingest function.
+
+Compares the original line by line parser, a new CSV reader per line, with
+`transform.titanic_transform` and `transform.titanic_transform_columns`,
+which decode all the lines with a single reader.
+
+    python -m benchmarks.bench_titanic_transform --copies 200
+"""
+
+import argparse
+import csv
+import pathlib
+import time
+from typing import Callable, Generator, Iterable, List
+
+from a_ingest_data.app.funcs import models, transform
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
+
+def line_by_line_transform(run_hash: str, datapoints: Iterable[str]) -> Generator[models.TitanicData, None, None]:
+	"""The parser before the single pass reader, kept as the baseline."""
+	for datapoint in datapoints:
+		datapoint_decoded = list(csv.reader([datapoint]))[0]
+
+		yield models.TitanicData(
+			run_hash=run_hash,
+			PassengerId=datapoint_decoded[0] if datapoint_decoded[0] else '',
+			Survived=datapoint_decoded[1] if datapoint_decoded[1] else '',
+			Pclass=datapoint_decoded[2] if datapoint_decoded[2] else '',
+			Name=datapoint_decoded[3] if datapoint_decoded[3] else '',
+			Sex=datapoint_decoded[4] if datapoint_decoded[4] else '',
+			Age=datapoint_decoded[5] if datapoint_decoded[5] else '',
+			SibSp=datapoint_decoded[6] if datapoint_decoded[6] else '',
+			Parch=datapoint_decoded[7] if datapoint_decoded[7] else '',
+			Ticket=datapoint_decoded[8] if datapoint_decoded[8] else '',
+			Fare=datapoint_decoded[9] if datapoint_decoded[9] else '',
+			Cabin=datapoint_decoded[10] if datapoint_decoded[10] else '',
+			Embarked=datapoint_decoded[11] if datapoint_decoded[11] else '',
+		)
+
+
+def _rows_per_second(parse: Callable[[], int], rounds: int) -> float:
+	best = float('inf')
+	rows = 0
+	for _ in range(rounds):
+		start = time.perf_counter()
+		rows = parse()
+		best = min(best, time.perf_counter() - start)
+	return rows / best
+
+
+def main() -> None:
+	"""Prints the rows per second of each parser."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--copies', type=int, default=100, help='Times the titanic dataset is repeated.')
+	parser.add_argument('--rounds', type=int, default=5, help='Rounds per parser, the best one is reported.')
+	args = parser.parse_args()
+
+	lines: List[str] = transform.split_lines(content=TITANIC_CSV.read_text())[1:] * args.copies
+
+	parsers = {
+		'line by line (before)': lambda: sum(1 for _ in line_by_line_transform(run_hash='bench', datapoints=lines)),
+		'titanic_transform': lambda: sum(1 for _ in transform.titanic_transform(run_hash='bench', datapoints=lines)),
+		'titanic_transform_columns': lambda: sum(
+			len(batch['run_hash']) for batch in transform.titanic_transform_columns(run_hash='bench', datapoints=lines)
+		),
+	}
+
+	print(f'{len(lines)} rows, best of {args.rounds} rounds')
+	baseline = 0.0
+	for name, parse in parsers.items():
+		rate = _rows_per_second(parse, rounds=args.rounds)
+		baseline = baseline or rate
+		print(f'{name:<28}{rate:>14,.0f} rows/s{rate / baseline:>8.2f}x')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,72 @@
+"""Bytes the training query scans, `SELECT *` against the columns the pipeline uses.
+
+BigQuery bills a query by the size of the columns it reads, counted with the
+sizes of its data types: 8 bytes per INT64 or FLOAT64, 1 per BOOL, and 2 plus
+the UTF-8 length per STRING. The sizes are computed on the titanic dataset
+repeated up to `--rows` rows, as the facts table stores it. The label filter
+and the sample cut the rows returned, and the sample the blocks read too.
+
+    python -m benchmarks.bench_train_query --rows 10000000 --sample-percent 10
+"""
+
+import argparse
+import pathlib
+from typing import Dict, List
+
+import pandas as pd
+
+from c_train_model.app.funcs import common
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+QUERY_PATH = pathlib.Path(__file__).parents[1] / 'c_train_model' / 'app' / 'resources' / 'select_train_data.sql'
+SCHEMA_TYPES = {'PassengerId': 'INT64', 'Survived': 'BOOL', 'Pclass': 'INT64', 'Age': 'FLOAT64', 'SibSp': 'INT64', 'Parch': 'INT64', 'Fare': 'FLOAT64'}
+
+
+def _column_bytes(df: pd.DataFrame) -> Dict[str, int]:
+	"""The logical size of each column, as BigQuery counts it. NULLs count as 0 bytes."""
+	sizes = {}
+	for name in df.columns:
+		values = df[name].dropna()
+		bq_type = SCHEMA_TYPES.get(name, 'STRING')
+		if bq_type == 'STRING':
+			sizes[name] = int((values.astype(str).str.encode('utf-8').str.len() + 2).sum())
+		else:
+			sizes[name] = len(values) * (1 if bq_type == 'BOOL' else 8)
+	return sizes
+
+
+def main() -> None:
+	"""Prints the bytes scanned and the rows returned by each query."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows', type=int, default=10_000_000, help='Rows of the facts table.')
+	parser.add_argument('--sample-percent', type=float, default=10.0, help='Percent of the table sampled.')
+	args = parser.parse_args()
+
+	df = pd.read_csv(TITANIC_CSV)
+	scale = args.rows / len(df)
+	sizes = {name: size * scale for name, size in _column_bytes(df).items()}
+	labelled = df['Survived'].notna().mean()
+
+	columns: List[str] = list(common.TRAIN_FEATURES) + [common.TRAIN_LABEL]
+	cases = {
+		'SELECT * (before)': (list(df.columns), 1.0, 1.0, 'SELECT * FROM `project.dataset.facts`'),
+		'training columns': (columns, 1.0, labelled, common.query_train_data('project.dataset.facts', QUERY_PATH).query),
+		f'training columns, {args.sample_percent:g}% sample': (
+			columns,
+			args.sample_percent / 100,
+			labelled * args.sample_percent / 100,
+			common.query_train_data('project.dataset.facts', QUERY_PATH, sample_percent=args.sample_percent).query,
+		),
+	}
+
+	baseline = sum(sizes.values())
+	print(f'{args.rows:,} rows, {baseline / 1e9:.2f} GB')
+	print(f'{"":<36}{"GB scanned":>11}{"rows":>14}{"reduction":>11}')
+	for name, (selected, scanned, returned, query) in cases.items():
+		scanned_bytes = sum(sizes[column] for column in selected) * scanned
+		print(f'{name:<36}{scanned_bytes / 1e9:>11.3f}{args.rows * returned:>14,.0f}{baseline / scanned_bytes:>10.1f}x')
+		print(f'    {query}')
+
+
+if __name__ == '__main__':
+	main()
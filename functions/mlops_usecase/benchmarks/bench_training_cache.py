@@ -0,0 +1,91 @@
+"""Time of a training invocation with the training cache, against a full training.
+
+Runs `main` in process on the titanic dataset repeated up to `--rows` rows, the
+query patched to return it and the bucket a local folder. Three invocations are
+timed: a full training (before), the same snapshot again, skipped from the table
+metadata without a query, and a changed table with the same training data, whose
+preprocessed features are loaded from the bucket so only the classifier is fitted.
+
+    python -m benchmarks.bench_training_cache --rows 100000
+"""
+
+import argparse
+import base64
+import json
+import os
+import pathlib
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+from cloudevents.http import CloudEvent
+
+os.environ.setdefault('_CI_TESTING', 'yes')
+
+from c_train_model.app import main as train  # noqa: E402
+from c_train_model.app.funcs import models  # noqa: E402
+from c_train_model.tests import fakes  # noqa: E402
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+TABLE_FQN = 'project.dataset.facts'
+
+
+def _cloud_event() -> CloudEvent:
+	data = base64.b64encode(json.dumps({'training_data_table': TABLE_FQN}).encode('utf-8')).decode('utf-8')
+	return CloudEvent(
+		attributes={'type': 'google.cloud.pubsub.topic.v1.messagePublished', 'source': '//pubsub.googleapis.com/'},
+		data={'message': {'attributes': {'dataset': 'titanic', 'train_model': 'True'}, 'data': data}},
+	)
+
+
+def main() -> None:
+	"""Prints the time of each invocation."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows', type=int, default=100_000, help='Rows of the training data.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	df = pd.read_csv(TITANIC_CSV)
+	df = pd.concat([df] * (args.rows // len(df) + 1), ignore_index=True).head(args.rows)
+	facts = SimpleNamespace(modified=datetime(2024, 1, 15, tzinfo=timezone.utc), num_rows=args.rows)
+
+	results = {}
+	with tempfile.TemporaryDirectory() as folder:
+		clients = models.GCPClients(
+			storage_client=fakes.FakeStorageClient(pathlib.Path(folder)),
+			bigquery_client=fakes.FakeBigQueryClient(tables={TABLE_FQN: facts}),
+		)
+		env_vars = models.EnvVars(gcp_project_id='project', bucket_name='models', topic_training_complete='topic')
+		with (
+			mock.patch.object(train, 'load_clients', return_value=clients),
+			mock.patch.object(train.common, 'query_train_data', return_value=train.common.TrainQuery('SELECT * FROM facts')),
+			mock.patch.object(train.gcp_apis, 'query_to_pandas_dataframe', return_value=df),
+			mock.patch('builtins.print'),
+		):
+			cases = {
+				'full training (before)': (env_vars, None),
+				'first training, cached': (env_vars._replace(training_cache=True), None),
+				'unchanged snapshot': (env_vars._replace(training_cache=True), None),
+				'changed table, same data': (env_vars._replace(training_cache=True), datetime(2024, 1, 16, tzinfo=timezone.utc)),
+			}
+			for name, (case_env_vars, modified) in cases.items():
+				if modified is not None:
+					facts.modified = modified
+				with mock.patch.object(train, '_env_vars', return_value=case_env_vars):
+					start = time.perf_counter()
+					train.main(_cloud_event())
+					results[name] = time.perf_counter() - start
+
+	baseline = results['full training (before)']
+	print(f'{args.rows:,} rows')
+	print(f'{"":<28}{"seconds":>9}{"speedup":>10}')
+	for name, seconds in results.items():
+		print(f'{name:<28}{seconds:>9.3f}{baseline / seconds:>9.1f}x')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,108 @@
+"""Client side cost of fetching the training data: REST JSON pages against Storage Read API Arrow streams.
+
+The titanic passengers are repeated up to `--rows` rows. The REST fetch is
+timed on the pages the `tabledata.list` API returns, every value a string in
+`{"f": [{"v": ...}]}` rows, decoded and converted to a typed DataFrame. The
+Storage Read fetch is timed on the Arrow IPC messages the local fake serves,
+read in parallel streams and converted with the compact training types. The
+network is left out of both, the time is the decoding and the conversion the
+function pays for once the bytes are there, and the bytes each one transfers
+are printed next to it.
+
+    python -m benchmarks.bench_training_fetch --rows 1000000 --streams 4
+"""
+
+import argparse
+import json
+import pathlib
+import time
+import warnings
+from typing import Any, Dict, List
+
+import pandas as pd
+import pyarrow as pa
+
+from c_train_model.app.funcs import gcp_apis
+from c_train_model.tests import fakes
+
+TITANIC_CSV = pathlib.Path(__file__).parents[3] / 'resources' / 'mlops_usecase' / 'data' / 'titanic.csv'
+
+# The types of the facts table, as `to_dataframe` returns them
+REST_DTYPES = {
+	'PassengerId': 'Int64',
+	'Survived': 'boolean',
+	'Pclass': 'Int64',
+	'Age': 'float64',
+	'SibSp': 'Int64',
+	'Parch': 'Int64',
+	'Fare': 'float64',
+}
+
+
+def _titanic(rows: int) -> pa.Table:
+	df = pd.read_csv(TITANIC_CSV)
+	df = pd.concat([df] * (rows // len(df) + 1), ignore_index=True).head(rows)
+	df['Survived'] = df['Survived'].astype(bool)
+	return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _rest_pages(table: pa.Table, page_rows: int) -> List[bytes]:
+	"""The table as the JSON pages of `tabledata.list`."""
+	pages = []
+	for batch in table.to_batches(max_chunksize=page_rows):
+		rows = [{'f': [{'v': None if value is None else str(value).lower() if isinstance(value, bool) else str(value)} for value in row.values()]}
+				for row in batch.to_pylist()]
+		pages.append(json.dumps({'rows': rows}).encode('utf-8'))
+	return pages
+
+
+def _rest_to_pandas(pages: List[bytes], columns: List[str]) -> pd.DataFrame:
+	records: Dict[str, List[Any]] = {name: [] for name in columns}
+	for page in pages:
+		for row in json.loads(page)['rows']:
+			for name, cell in zip(columns, row['f']):
+				records[name].append(cell['v'])
+
+	df = pd.DataFrame(records)
+	for name, dtype in REST_DTYPES.items():
+		values = df[name].map({'true': True, 'false': False}) if dtype == 'boolean' else pd.to_numeric(df[name])
+		df[name] = values.astype(dtype)
+	return df
+
+
+def main() -> None:
+	"""Prints the time, bytes and DataFrame memory of each fetch."""
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows', type=int, default=1_000_000, help='Rows of the training data.')
+	parser.add_argument('--streams', type=int, default=4, help='Streams of the Storage Read API read in parallel.')
+	parser.add_argument('--page-rows', type=int, default=10_000, help='Rows per REST page.')
+	args = parser.parse_args()
+
+	warnings.simplefilter('ignore')
+	table = _titanic(args.rows)
+	pages = _rest_pages(table, page_rows=args.page_rows)
+
+	start = time.perf_counter()
+	rest = _rest_to_pandas(pages, columns=table.column_names)
+	rest_seconds = time.perf_counter() - start
+
+	read_client = fakes.FakeBigQueryReadClient(table=table, max_streams=args.streams, batch_rows=args.page_rows)
+	start = time.perf_counter()
+	storage_read = gcp_apis.query_to_pandas_dataframe(
+		query='SELECT * FROM facts', BQ=fakes.FakeBigQueryClient(), read_client=read_client, max_streams=args.streams, dtypes=gcp_apis.TRAIN_DTYPES
+	)
+	storage_seconds = time.perf_counter() - start
+	pd.testing.assert_frame_equal(storage_read, rest, check_dtype=False)
+
+	arrow_bytes = sum(len(batch.serialize()) for batch in table.to_batches(max_chunksize=args.page_rows))
+	print(f'{args.rows:,} rows, {args.streams} streams')
+	print(f'{"":<28}{"seconds":>9}{"rows/s":>12}{"wire MB":>9}{"frame MB":>10}')
+	for name, seconds, wire, df in (
+		('REST JSON pages (before)', rest_seconds, sum(map(len, pages)), rest),
+		('Storage Read Arrow', storage_seconds, arrow_bytes, storage_read),
+	):
+		print(f'{name:<28}{seconds:>9.2f}{args.rows / seconds:>12,.0f}{wire / 1e6:>9.1f}{df.memory_usage(deep=True).sum() / 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+	main()
@@ -1,6 +1,54 @@
 """Common functions for the update_facts pipeline."""
 import base64
+import math
+import re
+import uuid
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Dict, NamedTuple, Sequence, Tuple
+
+from . import models
+
+# The columns `titanic_train` uses, the features of the model and the label
+TRAIN_FEATURES = ('Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass')
+TRAIN_LABEL = 'Survived'
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# The type of the query parameters, and the Python types of their values, by column type
+_PARAMETER_TYPES: Dict[str, Tuple[str, Tuple[type, ...]]] = {
+    'INTEGER': ('INT64', (int,)),
+    'FLOAT': ('FLOAT64', (int, float)),
+    'BOOLEAN': ('BOOL', (bool,)),
+    'STRING': ('STRING', (str,)),
+}
+
+
+class Window(NamedTuple):
+    """Rows whose column is in [start, end) and in values, e.g. the ingestion dates or the run hashes of a period.
+
+    Attributes:
+        column (str): The column of the table.
+        start (Any, optional): The first value, unbounded if None.
+        end (Any, optional): The first value after the window, unbounded if None.
+        values (Sequence[Any], optional): The values the column can have, any if empty.
+    """
+    column: str
+    start: Any = None
+    end: Any = None
+    values: Sequence[Any] = ()
+
+
+class TrainQuery(NamedTuple):
+    """The training query, and the values of its named parameters.
+
+    Attributes:
+        query (str): The SQL of the query, `@<name>` for each parameter.
+        parameters (Dict[str, Tuple[str, Any]]): The BigQuery type and the value of each parameter.
+            A list of values is an array of that type.
+    """
+    query: str
+    parameters: Dict[str, Tuple[str, Any]] = {}
 
 
 def get_path_to_file(path: str = './resources/select_train_data.sql') -> Path:
@@ -20,29 +68,97 @@ def file_contents(path: Path) -> str:
         return f.read().replace('\n', ' ')
 
 
+def _identifier(name: str) -> str:
+    """Quotes a column name, which must be a plain BigQuery identifier."""
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f'{name!r} is not a column name.')
+    return f'`{name}`'
+
+
+def _parameter_value(value: Any, column: str, column_type: str) -> Any:
+    """Checks that a value of a window can be compared to its column, and returns it."""
+    _, python_types = _PARAMETER_TYPES[column_type]
+    # A bool is an int too
+    if not isinstance(value, python_types) or (isinstance(value, bool) and bool not in python_types):
+        raise ValueError(f'{value!r} is not a value of the {column_type} column {column}.')
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f'{value!r} is not a finite value of the column {column}.')
+    return value
+
+
 def query_train_data(
     table_fqn: str,
     query_path: Path,
-) -> str:
+    columns: Sequence[str] = TRAIN_FEATURES + (TRAIN_LABEL,),
+    labelled_only: bool = True,
+    windows: Sequence[Window] = (),
+    sample_percent: float | None = None,
+    schema: Dict[str, str] = models.FACTS_TITANIC_SCHEMA,
+) -> TrainQuery:
     """Query to get training data from BigQuery.
 
     This function uses the function file_contents to call the appropriate
-    SQL query and formats it with this function parameters.
+    SQL query and formats it with this function parameters. Only the columns the
+    pipeline uses are selected and the rows are filtered in BigQuery, so columns
+    and rows that would be dropped in pandas are neither scanned nor transferred.
+    The values of the windows are sent as query parameters, never written in the SQL.
 
     Args:
         table_fqn (str): The fully-qualified name of the table in BigQuery.
         query_path (Path): The path to the SQL query script.
+        columns (Sequence[str], optional): The columns to select. Defaults to the features and the label.
+        labelled_only (bool, optional): Whether to select only the rows with a label. Defaults to True.
+        windows (Sequence[Window], optional): The ranges of columns the rows must be in. Defaults to none.
+            On a partitioned or clustered column, they prune what is scanned.
+        sample_percent (float, optional): The percent of the table to sample, by storage blocks, which cuts
+            the bytes scanned too. Defaults to the whole table.
+        schema (Dict[str, str], optional): The BigQuery type of each column of the table.
+            Defaults to the facts titanic table schema.
 
     Returns:
-        str: A string with the query built based on the args.
+        TrainQuery: The query built based on the args, and its parameters.
         This query can be executed later.
+
+    Raises:
+        ValueError: If a column is not a plain identifier, a window is on a column the table does not have,
+            or a value of a window is not a finite value of its column type.
     """
+    conditions = [f'{_identifier(TRAIN_LABEL)} IS NOT NULL'] if labelled_only else []
+    parameters: Dict[str, Tuple[str, Any]] = {}
+    for index, window in enumerate(windows):
+        if window.column not in schema:
+            raise ValueError(f'The table has no column {window.column!r}, a window is on one of {", ".join(schema)}.')
+        column = _identifier(window.column)
+        parameter_type, _ = _PARAMETER_TYPES[schema[window.column]]
+
+        def _value(value: Any) -> Any:
+            return _parameter_value(value=value, column=window.column, column_type=schema[window.column])
+
+        if window.start is not None:
+            parameters[f'window_{index}_start'] = (parameter_type, _value(window.start))
+            conditions.append(f'{column} >= @window_{index}_start')
+        if window.end is not None:
+            parameters[f'window_{index}_end'] = (parameter_type, _value(window.end))
+            conditions.append(f'{column} < @window_{index}_end')
+        if window.values:
+            parameters[f'window_{index}_values'] = (parameter_type, [_value(value) for value in window.values])
+            conditions.append(f'{column} IN UNNEST(@window_{index}_values)')
+
+    sample = ''
+    if sample_percent is not None:
+        if not 0 < sample_percent <= 100:
+            raise ValueError(f'The sample must be a percent in (0, 100], got {sample_percent}.')
+        sample = f' TABLESAMPLE SYSTEM ({sample_percent:g} PERCENT)'
+
     query: str = file_contents(
         path=query_path
     ).format(
         table_source=table_fqn,
+        columns=', '.join(_identifier(column) for column in columns),
+        sample=sample,
+        where=f'WHERE {" AND ".join(conditions)}' if conditions else '',
     )
-    return query
+    return TrainQuery(query=query.strip(), parameters=parameters)
 
 
 def decode_base64_to_string(
@@ -57,3 +173,19 @@ def decode_base64_to_string(
         str: The decoded string.
     """
     return base64.b64decode(base64_string).decode('utf-8')
+
+
+def model_version(now: datetime | None = None) -> str:
+    """Names a new version of the model.
+
+    Versions sort by the time they are trained, the random suffix keeps two trainings
+    in the same second apart.
+
+    Args:
+        now (datetime, optional): The time of the training. Defaults to the current time.
+
+    Returns:
+        str: The version, e.g. `20240115T093000Z-1a2b3c`.
+    """
+    now = now or datetime.now(timezone.utc)
+    return f'{now.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:6]}'
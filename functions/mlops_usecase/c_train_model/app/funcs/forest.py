@@ -0,0 +1,114 @@
+"""Export of a fitted RandomForestClassifier to flat NumPy arrays.
+
+The nodes of every tree are concatenated into one contiguous array per node
+attribute, the predictions endpoint scores batches over them without
+unpickling the estimator. Leaves point to themselves, so walking a tree for
+`max_depth` steps ends on the leaf of every sample.
+"""
+
+from __future__ import annotations
+
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Dict
+
+if TYPE_CHECKING:
+    import numpy as np
+    from sklearn.base import ClassifierMixin
+    from sklearn.pipeline import Pipeline
+
+
+def export_forest(classifier: ClassifierMixin) -> Dict[str, np.ndarray]:
+    """Flattens the trees of a fitted RandomForestClassifier.
+
+    Args:
+        classifier (ClassifierMixin): The fitted forest, the last step of the pipeline.
+
+    Returns:
+        Dict[str, np.ndarray]: The arrays of the forest:
+            feature, threshold, children_left, children_right, missing_go_to_left: One value per node,
+                the children are indices in the concatenated nodes.
+            value: The class probabilities of each node, normalised as `predict_proba` does.
+            roots: The index of the root of each tree.
+            classes: The classes of the forest.
+            max_depth, n_features: The depth of the deepest tree and the number of features.
+
+    Raises:
+        ValueError: If the classifier is not a fitted single output RandomForestClassifier.
+    """
+    import numpy as np
+    from sklearn.ensemble import RandomForestClassifier
+
+    if not isinstance(classifier, RandomForestClassifier) or not hasattr(classifier, 'estimators_'):
+        raise ValueError('Only a fitted RandomForestClassifier can be exported.')
+    if classifier.n_outputs_ != 1:
+        raise ValueError('Only a single output RandomForestClassifier can be exported.')
+
+    arrays: Dict[str, list] = {name: [] for name in ('feature', 'threshold', 'children_left', 'children_right', 'missing_go_to_left', 'value')}
+    roots = []
+    offset = 0
+    for estimator in classifier.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        roots.append(offset)
+        arrays['feature'].append(np.where(is_leaf, 0, tree.feature))
+        arrays['threshold'].append(tree.threshold)
+        arrays['children_left'].append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        arrays['children_right'].append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        arrays['missing_go_to_left'].append(tree.missing_go_to_left.astype(bool))
+
+        # As DecisionTreeClassifier.predict_proba, the same float operations give the same probabilities
+        value = tree.value[:, 0, : classifier.n_classes_]
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        arrays['value'].append(value / normalizer)
+
+        offset += tree.node_count
+
+    forest = {name: np.ascontiguousarray(np.concatenate(values)) for name, values in arrays.items()}
+    for name in ('feature', 'children_left', 'children_right'):
+        forest[name] = forest[name].astype(np.intp)
+    forest['roots'] = np.array(roots, dtype=np.intp)
+    forest['classes'] = classifier.classes_
+    forest['max_depth'] = np.array(max(estimator.tree_.max_depth for estimator in classifier.estimators_))
+    forest['n_features'] = np.array(classifier.n_features_in_)
+    return forest
+
+
+def forest_to_bytes(forest: Dict[str, np.ndarray]) -> bytes:
+    """Saves the arrays of a forest as an uncompressed `.npz` file.
+
+    Args:
+        forest (Dict[str, np.ndarray]): The arrays returned by `export_forest`.
+
+    Returns:
+        bytes: The contents of the file.
+    """
+    import numpy as np
+
+    bytes_container = BytesIO()
+    np.savez(bytes_container, **forest)
+    return bytes_container.getvalue()
+
+
+def mmap_artifact(pipeline: Pipeline) -> Dict[str, Any]:
+    """Builds the model artifact the predictions endpoint memory maps.
+
+    `joblib.dump` stores NumPy arrays uncompressed and aligned in the file, and
+    `joblib.load(mmap_mode='r')` maps them instead of copying them to the heap. The trees of
+    a RandomForestClassifier are copied into sklearn's own buffers whatever the mode, so the
+    artifact holds the flat arrays of the forest instead of the estimator.
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline, ending with a RandomForestClassifier.
+
+    Returns:
+        Dict[str, Any]: The artifact, to save with `gcp_apis.model_save_to_storage`:
+            preprocessor: The pipeline without its classifier.
+            forest: The arrays returned by `export_forest`.
+
+    Raises:
+        ValueError: If the classifier of the pipeline cannot be exported.
+    """
+    return {'preprocessor': pipeline[:-1], 'forest': export_forest(pipeline[-1])}
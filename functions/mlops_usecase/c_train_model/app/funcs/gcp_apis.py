@@ -1,9 +1,41 @@
+from __future__ import annotations
+
+import json
 from io import BytesIO
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple
+
+from . import models
+
+# Only the training path needs these, they are imported on first use
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+    from google.cloud import bigquery, bigquery_storage, storage
+    from sklearn.pipeline import Pipeline
+
+    from .train_models import Features
+
+# The forest of a model is saved next to it, as `<model_name>.forest.npz`
+FOREST_SUFFIX = '.forest.npz'
 
-import joblib
-import pandas as pd
-from google.cloud import bigquery, storage
-from sklearn.pipeline import Pipeline
+# The latest version of a model is written to `<model_name>.latest`, the endpoint polls it
+LATEST_SUFFIX = '.latest'
+
+# The snapshot of the last training is saved next to the model, as `<model_name>.snapshot`
+SNAPSHOT_SUFFIX = '.snapshot'
+
+# The preprocessed features are saved under `<model_name>.features/`, by the key of their data
+FEATURES_PREFIX = '.features/'
+
+# Compact types of the training columns read as Arrow, as Arrow type aliases or `dictionary`.
+# Floats stay float64 and strings stay objects with None for missing values, as the REST fetch
+# returns them: the pipeline imputes a missing category, not a None one, and trains another model
+TRAIN_DTYPES: Dict[str, str] = {
+    'Survived': 'bool',
+    'Pclass': 'int8',
+    'SibSp': 'int8',
+    'Parch': 'int8',
+}
 
 
 def _storage_write_bytes_file_to_bucket(
@@ -36,19 +68,43 @@ def _storage_write_bytes_file_to_bucket(
     print(f'Model {model_name} uploaded to {bucket_name}.')
 
 
+def _storage_read_bytes_file_from_bucket(
+    CS: storage.Client,
+    bucket_name: str,
+    file_name: str,
+) -> bytes | None:
+    """Downloads a file from a Google Cloud Storage bucket.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket to download the file from.
+        file_name (str): The name of the file to download.
+
+    Returns:
+        bytes | None: The contents of the file, None if there is no such file.
+    """
+    blob = CS.bucket(bucket_name).get_blob(file_name)
+    if blob is None:
+        return None
+    return blob.download_as_bytes()
+
+
 def model_save_to_storage(
     CS: storage.Client,
     bucket_name: str,
-    model: Pipeline,
+    model: Pipeline | Dict[str, Any],
     model_name: str = 'nar-rayya',
     content_type: str = 'text/plain',
 ) -> None:
     """Saves a machine learning model to Google Cloud Storage.
 
+    The model is dumped uncompressed, so its NumPy arrays can be loaded with `joblib.load(mmap_mode='r')`.
+
     Args:
         CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
         bucket_name (str): The name of the bucket to save the model to.
-        model (sklearn.pipeline.Pipeline): The machine learning model to save.
+        model (sklearn.pipeline.Pipeline | Dict[str, Any]): The machine learning model to save,
+            or the artifact returned by `forest.mmap_artifact`.
         model_name (str, optional): The name to give the saved model. Defaults to 'nar-rayya'.
         content_type (str, optional): The content type of the saved model. Defaults to 'text/plain'.
 
@@ -57,6 +113,8 @@ def model_save_to_storage(
     """
     # https://stackoverflow.com/questions/56880703/read-model-as-bytes-without-saving-in-location-in-python
     # https://stackoverflow.com/questions/51921142/how-to-load-a-model-saved-in-joblib-file-from-google-cloud-storage-bucket
+    import joblib
+
     bytes_container = BytesIO()
     joblib.dump(model, bytes_container)
     bytes_container.seek(0)  # update to enable reading
@@ -70,18 +128,332 @@ def model_save_to_storage(
     )
 
 
+def forest_save_to_storage(
+    CS: storage.Client,
+    bucket_name: str,
+    forest_bytes: bytes,
+    model_name: str = 'nar-rayya',
+) -> None:
+    """Saves the flat arrays of the forest next to the model, for the predictions endpoint.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket to save the forest to.
+        forest_bytes (bytes): The forest, as returned by `forest.forest_to_bytes`.
+        model_name (str, optional): The name of the saved model. Defaults to 'nar-rayya'.
+            The forest is saved as `<model_name>.forest.npz`.
+    """
+    _storage_write_bytes_file_to_bucket(
+        CS=CS,
+        bucket_name=bucket_name,
+        model_content=forest_bytes,
+        model_name=model_name + FOREST_SUFFIX,
+        content_type='application/octet-stream',
+    )
+
+
+def model_publish_version(
+    CS: storage.Client,
+    bucket_name: str,
+    version: str,
+    model_name: str = 'nar-rayya',
+) -> None:
+    """Points the predictions endpoint to a new version of the model.
+
+    Each version is saved under its own name, `<model_name>/<version>`. Writing the pointer
+    once the version is saved makes it visible to the endpoint whole.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket the model is saved to.
+        version (str): The version, as returned by `common.model_version`.
+        model_name (str, optional): The name of the model. Defaults to 'nar-rayya'.
+    """
+    _storage_write_bytes_file_to_bucket(
+        CS=CS,
+        bucket_name=bucket_name,
+        model_content=version.encode('utf-8'),
+        model_name=model_name + LATEST_SUFFIX,
+    )
+
+
+def snapshot_load_from_storage(
+    CS: storage.Client,
+    bucket_name: str,
+    model_name: str = 'nar-rayya',
+) -> Dict[str, Any] | None:
+    """Loads the record of the last training, saved by `snapshot_save_to_storage`.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket the model is saved to.
+        model_name (str, optional): The name of the model. Defaults to 'nar-rayya'.
+
+    Returns:
+        Dict[str, Any] | None: The fingerprint of its snapshot and the version it trained, None before the first training.
+    """
+    content = _storage_read_bytes_file_from_bucket(CS=CS, bucket_name=bucket_name, file_name=model_name + SNAPSHOT_SUFFIX)
+    return None if content is None else json.loads(content)
+
+
+def snapshot_save_to_storage(
+    CS: storage.Client,
+    bucket_name: str,
+    snapshot: models.Snapshot,
+    version: str,
+    model_name: str = 'nar-rayya',
+) -> None:
+    """Records the snapshot a version of the model was trained on, once the version is published.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket the model is saved to.
+        snapshot (models.Snapshot): The snapshot of the training.
+        version (str): The version trained on it.
+        model_name (str, optional): The name of the model. Defaults to 'nar-rayya'.
+            The record is saved as `<model_name>.snapshot`.
+    """
+    record = {'fingerprint': snapshot.fingerprint(), 'version': version, 'snapshot': snapshot._asdict()}
+    _storage_write_bytes_file_to_bucket(
+        CS=CS,
+        bucket_name=bucket_name,
+        model_content=json.dumps(record, default=str).encode('utf-8'),
+        model_name=model_name + SNAPSHOT_SUFFIX,
+        content_type='application/json',
+    )
+
+
+def features_load_from_storage(
+    CS: storage.Client,
+    bucket_name: str,
+    key: str,
+    model_name: str = 'nar-rayya',
+) -> Features | None:
+    """Loads the preprocessed features of a training data, saved by `features_save_to_storage`.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket the model is saved to.
+        key (str): The key of the training data, as returned by `train_models.features_key`.
+        model_name (str, optional): The name of the model. Defaults to 'nar-rayya'.
+
+    Returns:
+        Features | None: The features, None if they were never saved.
+    """
+    import joblib
+
+    content = _storage_read_bytes_file_from_bucket(CS=CS, bucket_name=bucket_name, file_name=model_name + FEATURES_PREFIX + key)
+    return None if content is None else joblib.load(BytesIO(content))
+
+
+def features_save_to_storage(
+    CS: storage.Client,
+    bucket_name: str,
+    features: Features,
+    key: str,
+    model_name: str = 'nar-rayya',
+) -> None:
+    """Saves the preprocessed features of a training data, for the next trainings on the same data.
+
+    Args:
+        CS (google.cloud.storage.client.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket the model is saved to.
+        features (Features): The features, as returned by `train_models.titanic_features`.
+        key (str): The key of the training data, as returned by `train_models.features_key`.
+        model_name (str, optional): The name of the model. Defaults to 'nar-rayya'.
+            The features are saved as `<model_name>.features/<key>`.
+    """
+    import joblib
+
+    bytes_container = BytesIO()
+    joblib.dump(features, bytes_container, compress=3)
+
+    _storage_write_bytes_file_to_bucket(
+        CS=CS,
+        bucket_name=bucket_name,
+        model_content=bytes_container.getvalue(),
+        model_name=model_name + FEATURES_PREFIX + key,
+        content_type='application/octet-stream',
+    )
+
+
+def table_snapshot(
+    BQ: bigquery.Client,
+    table_fqn: str,
+    query: str = '',
+    parameters: Dict[str, Tuple[str, Any]] | None = None,
+    settings: Dict[str, Any] | None = None,
+) -> models.Snapshot:
+    """The snapshot of the training table, from its metadata, without running a query.
+
+    Args:
+        BQ (bigquery.Client): The BigQuery client object.
+        table_fqn (str): The fully-qualified name of the training table.
+        query (str, optional): The training query. Defaults to ''.
+        parameters (Dict[str, Tuple[str, Any]], optional): The parameters of the training query. Defaults to None.
+        settings (Dict[str, Any], optional): The settings of the training. Defaults to None.
+
+    Returns:
+        models.Snapshot: The snapshot.
+    """
+    table = BQ.get_table(table_fqn)
+    return models.Snapshot(
+        table_fqn=table_fqn,
+        modified=table.modified.isoformat() if table.modified else '',
+        num_rows=int(table.num_rows or 0),
+        query=query,
+        parameters=parameters or {},
+        settings=settings or {},
+    )
+
+
+def _query_job_config(query_parameters: Dict[str, Tuple[str, Any]] | None) -> bigquery.QueryJobConfig | None:
+    """The configuration of a query job with named parameters, a list value is an array parameter."""
+    if not query_parameters:
+        return None
+
+    from google.cloud import bigquery
+
+    return bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter(name, parameter_type, value)
+            if isinstance(value, list)
+            else bigquery.ScalarQueryParameter(name, parameter_type, value)
+            for name, (parameter_type, value) in query_parameters.items()
+        ],
+    )
+
+
 def query_to_pandas_dataframe(
     query: str,
-    BQ: bigquery.Client
+    BQ: bigquery.Client,
+    read_client: bigquery_storage.BigQueryReadClient | None = None,
+    columns: Sequence[str] | None = None,
+    max_streams: int = 0,
+    dtypes: Dict[str, str] | None = None,
+    query_parameters: Dict[str, Tuple[str, Any]] | None = None,
 ) -> pd.DataFrame:
     """This function takes a SQL query and a BigQuery client object as input, and
     returns the result of the query as a pandas DataFrame.
 
+    Without `read_client` the result is paged through the REST API, the other arguments
+    are ignored. With it, the result is read as Arrow by `query_to_arrow`.
+
     Args:
         query (str): The SQL query to execute.
         BQ (bigquery.Client): The BigQuery client object to use for executing the query.
+        read_client (bigquery_storage.BigQueryReadClient, optional): The client of the Storage Read API. Defaults to None.
+        columns (Sequence[str], optional): The columns to read. Defaults to all of them.
+        max_streams (int, optional): The most streams read in parallel, 0 to let BigQuery choose. Defaults to 0.
+        dtypes (Dict[str, str], optional): The compact type of each column, see `arrow_to_pandas`. Defaults to None.
+        query_parameters (Dict[str, Tuple[str, Any]], optional): The type and the value of each
+            named parameter, `@<name>` in the query. Defaults to None.
 
     Returns:
         pd.DataFrame: The result of the query as a pandas DataFrame.
     """
-    return BQ.query(query).to_dataframe()
+    if read_client is None:
+        return BQ.query(query, job_config=_query_job_config(query_parameters)).to_dataframe()
+
+    table = query_to_arrow(
+        query=query, BQ=BQ, read_client=read_client, columns=columns, max_streams=max_streams, query_parameters=query_parameters
+    )
+    return arrow_to_pandas(table=table, dtypes=dtypes)
+
+
+def query_to_arrow(
+    query: str,
+    BQ: bigquery.Client,
+    read_client: bigquery_storage.BigQueryReadClient,
+    columns: Sequence[str] | None = None,
+    max_streams: int = 0,
+    query_parameters: Dict[str, Tuple[str, Any]] | None = None,
+) -> pa.Table:
+    """Runs a query and reads its result through the BigQuery Storage Read API, as Arrow record batches.
+
+    The result of a query is a table: its rows are read over gRPC, in parallel streams, instead of
+    being paged through the REST API as JSON.
+
+    Args:
+        query (str): The SQL query to execute.
+        BQ (bigquery.Client): The BigQuery client object to use for executing the query.
+        read_client (bigquery_storage.BigQueryReadClient): The client of the Storage Read API.
+        columns (Sequence[str], optional): The columns to read. Defaults to all of them.
+        max_streams (int, optional): The most streams read in parallel, 0 to let BigQuery choose.
+            BigQuery may create fewer. Defaults to 0.
+        query_parameters (Dict[str, Tuple[str, Any]], optional): The type and the value of each
+            named parameter, `@<name>` in the query. Defaults to None.
+
+    Returns:
+        pa.Table: The result of the query.
+    """
+    import concurrent.futures
+
+    import pyarrow as pa
+
+    job = BQ.query(query, job_config=_query_job_config(query_parameters))
+    job.result()
+    table = job.destination
+
+    session = read_client.create_read_session(
+        parent=f'projects/{BQ.project}',
+        read_session={
+            'table': f'projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}',
+            'data_format': 'ARROW',
+            'read_options': {'selected_fields': list(columns or [])},
+        },
+        max_stream_count=max_streams,
+    )
+    schema = pa.ipc.read_schema(pa.py_buffer(session.arrow_schema.serialized_schema))
+
+    def _read_stream(stream_name: str) -> List[pa.RecordBatch]:
+        return [
+            pa.ipc.read_record_batch(pa.py_buffer(response.arrow_record_batch.serialized_record_batch), schema)
+            for response in read_client.read_rows(stream_name)
+        ]
+
+    # An empty result has no stream
+    if not session.streams:
+        return schema.empty_table()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(session.streams)) as executor:
+        streams = list(executor.map(_read_stream, [stream.name for stream in session.streams]))
+    return pa.Table.from_batches([batch for batches in streams for batch in batches], schema=schema)
+
+
+def arrow_to_pandas(table: pa.Table, dtypes: Dict[str, str] | None = None) -> pd.DataFrame:
+    """Converts an Arrow table to a DataFrame, with the compact types given to its columns.
+
+    Integers and booleans are nullable pandas types, as `to_dataframe` returns them, and
+    `dictionary` columns are categories.
+
+    Args:
+        table (pa.Table): The table.
+        dtypes (Dict[str, str], optional): The type of each column, an Arrow type alias such as `int8`
+            or `float32`, or `dictionary`. Columns missing from the table are skipped. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The table as a DataFrame.
+
+    Raises:
+        pa.ArrowInvalid: If a value does not fit its type.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    for name, dtype in (dtypes or {}).items():
+        index = table.schema.get_field_index(name)
+        if index == -1:
+            continue
+        column = table.column(index)
+        column = column.dictionary_encode() if dtype == 'dictionary' else column.cast(pa.type_for_alias(dtype))
+        table = table.set_column(index, name, column)
+
+    nullable_types = {
+        pa.int8(): pd.Int8Dtype(),
+        pa.int16(): pd.Int16Dtype(),
+        pa.int32(): pd.Int32Dtype(),
+        pa.int64(): pd.Int64Dtype(),
+        pa.bool_(): pd.BooleanDtype(),
+    }
+    return table.to_pandas(types_mapper=nullable_types.get)
@@ -1,19 +1,132 @@
 """Models for the ingest_data function. Simplifies type hinting."""
-from typing import NamedTuple
 
-from google.cloud import bigquery, storage
+from __future__ import annotations
 
+import hashlib
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Tuple
 
-class GCPClients(NamedTuple):
-    """A named tuple that contains clients for Google Cloud Platform services.
+if TYPE_CHECKING:
+    from google.cloud import bigquery, bigquery_storage, storage
+
+
+def _build_storage_client(gcp_project_id: str | None) -> storage.Client:
+    from google.cloud import storage
+
+    return storage.Client(project=gcp_project_id)
+
+
+def _build_bigquery_client(gcp_project_id: str | None) -> bigquery.Client:
+    from google.cloud import bigquery
+
+    return bigquery.Client(project=gcp_project_id)
+
+
+def _build_bigquery_read_client(gcp_project_id: str | None) -> bigquery_storage.BigQueryReadClient:
+    from google.cloud import bigquery_storage
+
+    # Read sessions are billed to the project given to each request, not to the client
+    return bigquery_storage.BigQueryReadClient()
+
+
+class GCPClients:
+    """Clients for Google Cloud Platform services, each one built the first time it is used.
+
+    The google.cloud libraries are imported by the first use of their client too, so a
+    code path only pays for the clients it needs. Clients given to the constructor are
+    used as they are, e.g. mocks in tests.
+
+    Args:
+        gcp_project_id (str, optional): The project of the clients built on first use.
+        storage_client (google.cloud.storage.Client, optional): A client to use instead of building one.
+        bigquery_client (google.cloud.bigquery.Client, optional): A client to use instead of building one.
+        bigquery_read_client (google.cloud.bigquery_storage.BigQueryReadClient, optional): A client to use
+            instead of building one.
 
     Attributes:
         storage_client (google.cloud.storage.Client): A client for Google Cloud Storage.
         bigquery_client (google.cloud.bigquery.Client): A client for Google BigQuery.
-        publisher (google.cloud.pubsub_v1.PublisherClient): A client for Google Cloud Pub/Sub.
+        bigquery_read_client (google.cloud.bigquery_storage.BigQueryReadClient): A client for the BigQuery Storage Read API.
+        closed (bool): Whether the clients are closed, after which they cannot be used.
+    """
+
+    def __init__(
+        self,
+        gcp_project_id: str | None = None,
+        storage_client: storage.Client | None = None,
+        bigquery_client: bigquery.Client | None = None,
+        bigquery_read_client: bigquery_storage.BigQueryReadClient | None = None,
+    ) -> None:
+        """Keeps the given clients, the others are built on first use."""
+        self.gcp_project_id = gcp_project_id
+        self._clients: Dict[str, Any] = {
+            'storage_client': storage_client,
+            'bigquery_client': bigquery_client,
+            'bigquery_read_client': bigquery_read_client,
+        }
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _client(self, name: str, build: Callable[[str | None], Any]) -> Any:
+        """Returns the client called `name`, built only once even when first used by several threads."""
+        if self.closed:
+            raise ValueError('The GCP clients are closed.')
+
+        if self._clients[name] is None:
+            with self._lock:
+                if self._clients[name] is None:
+                    self._clients[name] = build(self.gcp_project_id)
+        return self._clients[name]
+
+    def close(self) -> None:
+        """Closes the clients built so far, and their connection pools."""
+        with self._lock:
+            self.closed = True
+            for client in self._clients.values():
+                if client is not None:
+                    # The gRPC clients close their transport
+                    close = getattr(client, 'close', None) or client.transport.close
+                    close()
+
+    @property
+    def storage_client(self) -> storage.Client:
+        """The Google Cloud Storage client."""
+        return self._client('storage_client', _build_storage_client)
+
+    @property
+    def bigquery_client(self) -> bigquery.Client:
+        """The Google BigQuery client."""
+        return self._client('bigquery_client', _build_bigquery_client)
+
+    @property
+    def bigquery_read_client(self) -> bigquery_storage.BigQueryReadClient:
+        """The BigQuery Storage Read API client."""
+        return self._client('bigquery_read_client', _build_bigquery_read_client)
+
+
+class Snapshot(NamedTuple):
+    """What a training is trained on, the model only changes when one of these does.
+
+    Attributes:
+        table_fqn (str): The fully-qualified name of the training table.
+        modified (str): The time the table was last modified, in ISO format.
+        num_rows (int): The rows of the table.
+        query (str): The training query, with its columns, filters and sample.
+        parameters (Dict[str, Tuple[str, Any]]): The parameters of the training query, the values of its filters.
+        settings (Dict[str, Any]): The settings of the training, e.g. the environment variables.
     """
-    storage_client: storage.Client
-    bigquery_client: bigquery.Client
+    table_fqn: str
+    modified: str
+    num_rows: int
+    query: str = ''
+    parameters: Dict[str, Tuple[str, Any]] = {}
+    settings: Dict[str, Any] = {}
+
+    def fingerprint(self) -> str:
+        """A hash of the snapshot, the same for two trainings on the same data with the same settings."""
+        content = json.dumps(self._asdict(), sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
 
 class EnvVars(NamedTuple):
@@ -23,7 +136,51 @@ class EnvVars(NamedTuple):
         gcp_project_id (str): The ID of the Google Cloud Platform project.
         bucket_name (str): The name of the Google Cloud Storage bucket where the model artifacts will be stored.
         topic_training_complete (str): The name of the Pub/Sub topic to which a message is published when training is complete.
+        model_artifact_format (str): How the model is saved: `joblib`, the pickled pipeline and the forest arrays
+            next to it, or `mmap`, an artifact whose forest arrays the endpoint memory maps.
+        model_name (str): The name of the model, its versions are saved as `<model_name>/<version>`.
+        training_data_fetch (str): How the training data is read: `rest`, paged through the REST API
+            as JSON, or `storage`, read as Arrow through the BigQuery Storage Read API.
+        read_streams (int): The most streams of the Storage Read API read in parallel, 0 to let BigQuery choose.
+        train_sample_percent (float | None): The percent of the facts table sampled for the training, None for all of it.
+        training_mode (str): How the model is trained: `fixed`, the default parameters, or a search of the
+            parameters, `random` or `halving`, see `train_models.titanic_search`.
+        search_candidates (int): The candidates of the search.
+        search_cv (int): The folds of the cross validation of each candidate.
+        search_n_jobs (int): The worker processes of the search, -1 for one per core.
+        search_seconds (float | None): The time budget of the search, None for no limit.
+        training_cache (bool): Whether to skip the training when its snapshot is unchanged and, in the `fixed`
+            mode, to reuse the preprocessed features saved to the bucket when the data is the same.
     """
     gcp_project_id: str
     bucket_name: str
     topic_training_complete: str
+    model_artifact_format: str = 'joblib'
+    model_name: str = 'nar-rayya'
+    training_data_fetch: str = 'rest'
+    read_streams: int = 4
+    train_sample_percent: float | None = None
+    training_mode: str = 'fixed'
+    search_candidates: int = 20
+    search_cv: int = 5
+    search_n_jobs: int = -1
+    search_seconds: float | None = None
+    training_cache: bool = False
+
+
+# BigQuery column types of the facts titanic table, the training query filters on its columns.
+# Mirrors resources/mlops_usecase/bigquery/facts_titanic_schema.json
+FACTS_TITANIC_SCHEMA: Dict[str, str] = {
+    'PassengerId': 'INTEGER',
+    'Survived': 'BOOLEAN',
+    'Pclass': 'INTEGER',
+    'Name': 'STRING',
+    'Sex': 'STRING',
+    'Age': 'FLOAT',
+    'SibSp': 'INTEGER',
+    'Parch': 'INTEGER',
+    'Ticket': 'STRING',
+    'Fare': 'FLOAT',
+    'Cabin': 'STRING',
+    'Embarked': 'STRING',
+}
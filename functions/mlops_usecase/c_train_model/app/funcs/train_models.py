@@ -1,33 +1,97 @@
-import pandas as pd
-from sklearn.base import ClassifierMixin
-from sklearn.compose import ColumnTransformer
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.impute import SimpleImputer
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from __future__ import annotations
 
+import hashlib
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Sequence, Tuple
 
-def titanic_train(
-	df: pd.DataFrame,
-	classifier: ClassifierMixin = RandomForestClassifier(n_estimators=100, random_state=42),
+# sklearn is imported by the first training, not by the function module
+if TYPE_CHECKING:
+	import pandas as pd
+	from sklearn.base import ClassifierMixin
+	from sklearn.compose import ColumnTransformer
+	from sklearn.pipeline import Pipeline
+
+# The parameters the search draws its candidates from, of the classifier and of the preprocessing
+SEARCH_SPACE: Dict[str, Sequence[Any]] = {
+	'classifier__n_estimators': [50, 100, 200, 400],
+	'classifier__max_depth': [None, 4, 6, 8, 12],
+	'classifier__min_samples_leaf': [1, 2, 4, 8],
+	'classifier__max_features': ['sqrt', 'log2', 0.5],
+	'preprocessor__num__imputer__strategy': ['median', 'mean'],
+}
+
+
+class Features(NamedTuple):
+	"""The preprocessing of the training data, fitted once and reused by the trainings on the same data.
+
+	Attributes:
+	    preprocessor (ColumnTransformer): The fitted preprocessing of the pipeline.
+	    matrix (Any): The transformed features, a NumPy array or a sparse matrix.
+	    label (pd.Series): The label of each row of the matrix.
+	"""
+
+	preprocessor: ColumnTransformer
+	matrix: Any
+	label: pd.Series
+
+
+class Candidate(NamedTuple):
+	"""The cross validation of a candidate of the search.
+
+	Attributes:
+	    params (Dict[str, Any]): The parameters of the pipeline.
+	    mean_score (float): The mean accuracy of the folds.
+	    std_score (float): The standard deviation of the accuracy of the folds.
+	    seconds (float): The wall-clock time of its cross validation.
+	    n_samples (int): The rows it was cross validated on.
+	    iteration (int): The iteration of successive halving, 0 for a randomized search.
+	"""
+
+	params: Dict[str, Any]
+	mean_score: float
+	std_score: float
+	seconds: float
+	n_samples: int
+	iteration: int = 0
+
+
+class SearchResult(NamedTuple):
+	"""The result of `titanic_search`.
+
+	Attributes:
+	    pipeline (Pipeline): The best pipeline, fitted on all the rows.
+	    best (Candidate): The candidate of the best pipeline.
+	    candidates (List[Candidate]): Every candidate cross validated, in the order they ran.
+	    seconds (float): The wall-clock time of the search and of the final fit.
+	    out_of_time (bool): Whether candidates were left out to keep within the time budget.
+	"""
+
+	pipeline: Pipeline
+	best: Candidate
+	candidates: List[Candidate]
+	seconds: float
+	out_of_time: bool
+
+
+def titanic_pipeline(
+	classifier: ClassifierMixin | None = None,
+	memory: str | None = None,
 ) -> Pipeline:
-	"""Train a model into a pipeline.
+	"""The pipeline of the titanic model, not fitted yet.
 
 	Args:
-	    df (pd.Dataframe): The dataframe with the data to train the model.
 	    classifier (Callable, optional): The classifier to use.
-	        Defaults to RandomForestClassifier(n_estimators=100, random_state=42).
+	        Defaults to a new RandomForestClassifier(n_estimators=100, random_state=42).
+	    memory (str, optional): A folder to cache the fitted preprocessing in, see `Pipeline`. Defaults to None.
 	"""
-	# Preprocess the data
-	X = df.drop(
-		columns=['Survived', 'PassengerId', 'Name', 'Ticket', 'Cabin']
-	)  # OPTIONAL [1]: add 'set_type' or other columns that shouldn't be passed to the model.
-	y = df['Survived']
+	from sklearn.compose import ColumnTransformer
+	from sklearn.ensemble import RandomForestClassifier
+	from sklearn.impute import SimpleImputer
+	from sklearn.pipeline import Pipeline
+	from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
-	# Drop rows with missing target values
-	missing_target_rows = y.isna()
-	X = X[~missing_target_rows]
-	y = y[~missing_target_rows]
+	if classifier is None:
+		classifier = RandomForestClassifier(n_estimators=100, random_state=42)
 
 	# Preprocessing for numerical columns
 	numeric_features = ['Age', 'SibSp', 'Parch', 'Fare']
@@ -60,9 +124,207 @@ def titanic_train(
 	)
 
 	# Create the pipeline with preprocessing and the Random Forest classifier
-	pipeline = Pipeline(steps=[('preprocessor', preprocessor), ('classifier', classifier)])
+	return Pipeline(steps=[('preprocessor', preprocessor), ('classifier', classifier)], memory=memory)
+
+
+def _training_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+	"""Splits the features from the label, without the rows missing the label."""
+	# The training query selects only the features and the label, the other columns may be missing
+	X = df.drop(
+		columns=['Survived', 'PassengerId', 'Name', 'Ticket', 'Cabin'], errors='ignore'
+	)  # OPTIONAL [1]: add 'set_type' or other columns that shouldn't be passed to the model.
+	y = df['Survived']
+
+	# Drop rows with missing target values
+	missing_target_rows = y.isna()
+	return X[~missing_target_rows], y[~missing_target_rows]
+
+
+def titanic_features(df: pd.DataFrame) -> Features:
+	"""Fits the preprocessing of the pipeline and transforms the training data with it.
+
+	Args:
+	    df (pd.Dataframe): The dataframe with the data to train the model.
+	"""
+	X, y = _training_data(df)
+	preprocessor = titanic_pipeline()[0]
+	return Features(preprocessor=preprocessor, matrix=preprocessor.fit_transform(X, y), label=y)
+
+
+def features_key(df: pd.DataFrame) -> str:
+	"""A hash of the training data and of the preprocessing, the key of its `Features`.
+
+	Two dataframes with the same rows, in the same order, have the same key. The parameters of
+	the preprocessing and the version of sklearn are part of it, a change to either of them
+	makes new features.
+
+	Args:
+	    df (pd.Dataframe): The dataframe with the data to train the model.
+	"""
+	import pandas as pd
+	import sklearn
+
+	X, y = _training_data(df)
+	params = titanic_pipeline()[0].get_params(deep=True)
+	digest = hashlib.sha256(sklearn.__version__.encode('utf-8'))
+	digest.update(repr(sorted((name, repr(value)) for name, value in params.items() if not hasattr(value, 'get_params'))).encode('utf-8'))
+	digest.update(repr([(name, str(dtype)) for name, dtype in X.dtypes.items()]).encode('utf-8'))
+	digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+	digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+	return digest.hexdigest()
+
+
+def titanic_train(
+	df: pd.DataFrame,
+	classifier: ClassifierMixin | None = None,
+	features: Features | None = None,
+) -> Pipeline:
+	"""Train a model into a pipeline.
+
+	Args:
+	    df (pd.Dataframe): The dataframe with the data to train the model.
+	    classifier (Callable, optional): The classifier to use.
+	        Defaults to a new RandomForestClassifier(n_estimators=100, random_state=42).
+	    features (Features, optional): The preprocessing of `df`, as returned by `titanic_features`.
+	        Only the classifier is fitted then, on its matrix. Defaults to fitting the whole pipeline.
+	"""
+	if features is not None:
+		pipeline = titanic_pipeline(classifier=classifier)
+		pipeline.steps[0] = ('preprocessor', features.preprocessor)
+		pipeline[-1].fit(features.matrix, features.label)
+		return pipeline
+
+	X, y = _training_data(df)
+	pipeline = titanic_pipeline(classifier=classifier)
 
 	# Train the model on the training data
 	pipeline.fit(X, y)
 
 	return pipeline
+
+
+def _cross_validate(pipeline: Pipeline, params: Dict[str, Any], X: pd.DataFrame, y: pd.Series, cv: Any, iteration: int) -> Candidate:
+	"""Cross validates a candidate, in a worker of the search."""
+	import numpy as np
+	from sklearn.base import clone
+	from sklearn.model_selection import cross_val_score
+
+	start = time.perf_counter()
+	scores = cross_val_score(clone(pipeline).set_params(**params), X, y, cv=cv, scoring='accuracy', error_score=np.nan)
+	return Candidate(
+		params=params,
+		mean_score=float(np.mean(scores)),
+		std_score=float(np.std(scores)),
+		seconds=time.perf_counter() - start,
+		n_samples=len(y),
+		iteration=iteration,
+	)
+
+
+def titanic_search(
+	df: pd.DataFrame,
+	strategy: str = 'random',
+	n_candidates: int = 20,
+	cv: int = 5,
+	n_jobs: int = -1,
+	time_budget: float | None = None,
+	search_space: Dict[str, Sequence[Any]] = SEARCH_SPACE,
+	random_state: int = 42,
+) -> SearchResult:
+	"""Searches the parameters of the titanic pipeline, and fits the best one on all the rows.
+
+	The candidates are drawn at random from `search_space` and cross validated in parallel, in
+	`n_jobs` worker processes. With the `halving` strategy, the candidates first run on a
+	sample of the rows, and only the best third of them go on to the next iteration, on three
+	times more rows, until the last ones run on all the rows. The candidates share a cache of
+	the fitted preprocessing on disk, `Pipeline(memory=)`: the ones with the same preprocessing
+	parameters on the same folds fit it once.
+
+	The candidates run in rounds of `n_jobs`. A round is left out, with the ones after it,
+	when it would end after `time_budget` seconds judging by the previous one. The first round
+	always runs, and the final fit of the best pipeline is not counted in the budget.
+
+	Args:
+	    df (pd.Dataframe): The dataframe with the data to train the model.
+	    strategy (str, optional): `random` or `halving`. Defaults to 'random'.
+	    n_candidates (int, optional): The candidates drawn. Defaults to 20.
+	    cv (int, optional): The stratified folds of the cross validation. Defaults to 5.
+	    n_jobs (int, optional): The worker processes, -1 for one per core. Defaults to -1.
+	    time_budget (float, optional): The seconds the search runs for at most. Defaults to no limit.
+	    search_space (Dict[str, Sequence[Any]], optional): The values of each parameter. Defaults to SEARCH_SPACE.
+	    random_state (int, optional): The seed of the candidates, of the folds and of the samples. Defaults to 42.
+
+	Returns:
+	    SearchResult: The best pipeline, fitted, and the cross validation of every candidate.
+
+	Raises:
+	    ValueError: If the strategy is unknown.
+	"""
+	import tempfile
+
+	import joblib
+	import numpy as np
+	from sklearn.model_selection import ParameterSampler, StratifiedKFold
+
+	if strategy not in ('random', 'halving'):
+		raise ValueError(f"The strategy must be 'random' or 'halving', got {strategy!r}.")
+
+	start = time.perf_counter()
+	X, y = _training_data(df)
+	folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+	params = list(ParameterSampler(search_space, n_iter=n_candidates, random_state=random_state))
+	n_workers = joblib.effective_n_jobs(n_jobs)
+
+	# Successive halving: the best third goes on to each next iteration, on three times the rows
+	factor = 3
+	iterations = int(np.ceil(np.log(len(params)) / np.log(factor))) if strategy == 'halving' and len(params) > 1 else 0
+	order = np.random.default_rng(random_state).permutation(len(y))
+
+	candidates: List[Candidate] = []
+	out_of_time = False
+	round_seconds = None
+	with tempfile.TemporaryDirectory() as cache, joblib.Parallel(n_jobs=n_jobs, backend='loky') as parallel:
+		pipeline = titanic_pipeline(memory=cache)
+		for iteration in range(iterations + 1):
+			# Every iteration has at least enough rows of each class for the folds
+			n_samples = max(len(y) // factor ** (iterations - iteration), 2 * cv * factor)
+			sample = np.sort(order[:n_samples])
+			X_sample, y_sample = X.iloc[sample], y.iloc[sample]
+
+			results = []
+			for first in range(0, len(params), n_workers):
+				if round_seconds is not None and time_budget is not None:
+					if time.perf_counter() - start + round_seconds > time_budget:
+						out_of_time = True
+						break
+
+				round_start = time.perf_counter()
+				results += parallel(
+					joblib.delayed(_cross_validate)(pipeline, candidate, X_sample, y_sample, folds, iteration)
+					for candidate in params[first : first + n_workers]
+				)
+				round_seconds = time.perf_counter() - round_start
+
+			candidates += results
+			if out_of_time or not results:
+				break
+
+			# The rounds of the next iteration run on more rows
+			round_seconds *= factor
+			ranked = sorted(results, key=lambda candidate: -np.nan_to_num(candidate.mean_score, nan=-np.inf))
+			params = [candidate.params for candidate in ranked[: int(np.ceil(len(ranked) / factor))]]
+
+	# The best candidate of the last iteration that ran, on the most rows
+	last = max(candidate.iteration for candidate in candidates)
+	best = max((candidate for candidate in candidates if candidate.iteration == last), key=lambda c: np.nan_to_num(c.mean_score, nan=-np.inf))
+
+	best_pipeline = titanic_pipeline().set_params(**best.params)
+	best_pipeline.fit(X, y)
+
+	return SearchResult(
+		pipeline=best_pipeline,
+		best=best,
+		candidates=candidates,
+		seconds=time.perf_counter() - start,
+		out_of_time=out_of_time,
+	)
@@ -1,37 +1,44 @@
+from __future__ import annotations
+
 import json
 import os
+from typing import TYPE_CHECKING
 
 import functions_framework
 from cloudevents.http import CloudEvent
-from google.cloud import bigquery, storage
+
+# pandas and sklearn are imported by the first training
+if TYPE_CHECKING:
+	import pandas as pd
+	from google.cloud import storage
+	from sklearn.pipeline import Pipeline
 
 try:
-	from funcs import common, gcp_apis, models, train_models
+	from funcs import common, forest, gcp_apis, models, registry, train_models
 except ImportError:
 	from c_train_model.app.funcs import (
 		common,
+		forest,
 		gcp_apis,
 		models,
+		registry,
 		train_models,
 	)
 
 
 def load_clients(gcp_project_id: str) -> models.GCPClients:
-	"""Load the GCP clients.
+	"""Load the GCP clients, shared by every invocation of this instance.
 
 	Args:
 	    gcp_project_id (str): The GCP project ID.
 
 	Returns:
-	    GCPClients: A tuple of GCP clients.
+	    GCPClients: The GCP clients of the process, each one built the first time it is used.
 	        With the following attributes:
 	            storage_client: A storage client.
 	            bigquery_client: A bigquery client.
 	"""
-	storage_client = storage.Client(project=gcp_project_id)
-	bigquery_client = bigquery.Client(project=gcp_project_id)
-
-	return models.GCPClients(storage_client=storage_client, bigquery_client=bigquery_client)
+	return registry.clients.get(gcp_project_id=gcp_project_id)
 
 
 ##############################
@@ -54,22 +61,88 @@ def _env_vars() -> models.EnvVars:
 		gcp_project_id=os.getenv('_GCP_PROJECT_ID', 'gcp_project_id'),
 		bucket_name=os.getenv('_GCS_BUCKET_NAME_MODELS', 'bucket_name'),
 		topic_training_complete=os.getenv('TOPIC_TRAINING_COMPLETE', 'topic_training_complete'),
+		model_artifact_format=os.getenv('_MODEL_ARTIFACT_FORMAT', 'joblib'),
+		model_name=os.getenv('_MODEL_NAME', 'nar-rayya'),
+		training_data_fetch=os.getenv('_TRAINING_DATA_FETCH', 'rest'),
+		read_streams=int(os.getenv('_READ_STREAMS', '4')),
+		train_sample_percent=float(os.getenv('_TRAIN_SAMPLE_PERCENT')) if os.getenv('_TRAIN_SAMPLE_PERCENT') else None,
+		training_mode=os.getenv('_TRAINING_MODE', 'fixed'),
+		search_candidates=int(os.getenv('_SEARCH_CANDIDATES', '20')),
+		search_cv=int(os.getenv('_SEARCH_CV', '5')),
+		search_n_jobs=int(os.getenv('_SEARCH_N_JOBS', '-1')),
+		search_seconds=float(os.getenv('_SEARCH_SECONDS')) if os.getenv('_SEARCH_SECONDS') else None,
+		training_cache=os.getenv('_TRAINING_CACHE', 'no') == 'yes',
 	)
 
 
+# Registers the clients at cold start, every invocation reuses them
 if os.getenv('_CI_TESTING', 'no') == 'no':
 	env_vars = _env_vars()
 	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
 
 
+def search_pipeline(df: pd.DataFrame, env_vars: models.EnvVars) -> Pipeline:
+	"""Searches the parameters of the pipeline and logs the cross validation of each candidate.
+
+	Args:
+	    df (pd.DataFrame): The training data.
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+
+	Returns:
+	    Pipeline: The best pipeline, fitted on all the rows.
+	"""
+	result = train_models.titanic_search(
+		df=df,
+		strategy=env_vars.training_mode,
+		n_candidates=env_vars.search_candidates,
+		cv=env_vars.search_cv,
+		n_jobs=env_vars.search_n_jobs,
+		time_budget=env_vars.search_seconds,
+	)
+
+	for candidate in result.candidates:
+		print(json.dumps({'severity': 'INFO', 'message': 'Search candidate', **candidate._asdict()}, default=str))
+	print(
+		json.dumps(
+			{
+				'severity': 'INFO',
+				'message': f'Searched {len(result.candidates)} candidates in {result.seconds:.1f}s',
+				'best': result.best._asdict(),
+				'out_of_time': result.out_of_time,
+			},
+			default=str,
+		)
+	)
+	return result.pipeline
+
+
+def cached_features(df: pd.DataFrame, env_vars: models.EnvVars, CS: storage.Client) -> train_models.Features:
+	"""Loads the preprocessed features of the training data from the bucket, or fits and saves them.
+
+	Args:
+	    df (pd.DataFrame): The training data.
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+	    CS (storage.Client): The storage client.
+
+	Returns:
+	    train_models.Features: The preprocessing of the training data.
+	"""
+	key = train_models.features_key(df=df)
+	features = gcp_apis.features_load_from_storage(CS=CS, bucket_name=env_vars.bucket_name, key=key, model_name=env_vars.model_name)
+	if features is not None:
+		print(json.dumps({'severity': 'INFO', 'message': f'Reusing the preprocessed features {key}'}))
+		return features
+
+	features = train_models.titanic_features(df=df)
+	gcp_apis.features_save_to_storage(CS=CS, bucket_name=env_vars.bucket_name, features=features, key=key, model_name=env_vars.model_name)
+	return features
+
+
 @functions_framework.cloud_event
 def main(cloud_event: CloudEvent) -> None:
 	"""Entrypoint of the cloud function."""
-	if not hasattr(main, 'env_vars'):
-		env_vars = _env_vars()
-
-	if not hasattr(main, 'gcp_clients'):
-		gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
+	env_vars = _env_vars()
+	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
 
 	event_message: dict = cloud_event.get_data()  # type: ignore
 
@@ -79,21 +152,101 @@ def main(cloud_event: CloudEvent) -> None:
 	if event_message['message']['attributes']['train_model'] == 'True':
 		path = common.get_path_to_file()
 
-		query = common.query_train_data(
+		# Only the columns and rows the pipeline uses, in the window the message asks for if any
+		window = data.get('training_window')
+		train_query = common.query_train_data(
 			table_fqn=data['training_data_table'],  # type: ignore
 			query_path=path,
+			windows=[common.Window(**window)] if window else (),
+			sample_percent=env_vars.train_sample_percent,
 		)
+
+		# A training on the same snapshot, with the same settings, would train the same model again
+		snapshot = None
+		if env_vars.training_cache:
+			snapshot = gcp_apis.table_snapshot(
+				BQ=gcp_clients.bigquery_client,  # type: ignore
+				table_fqn=data['training_data_table'],  # type: ignore
+				query=train_query.query,
+				parameters=train_query.parameters,
+				settings=env_vars._asdict(),
+			)
+			last = gcp_apis.snapshot_load_from_storage(
+				CS=gcp_clients.storage_client,
+				bucket_name=env_vars.bucket_name,
+				model_name=env_vars.model_name,
+			)
+			if last is not None and last['fingerprint'] == snapshot.fingerprint():
+				print(
+					json.dumps(
+						{
+							'severity': 'INFO',
+							'message': f'The training data is unchanged since version {last["version"]}, skipping the training',
+							'fingerprint': last['fingerprint'],
+						}
+					)
+				)
+				return
+
+		# The Storage Read API reads the result as Arrow, in parallel streams, instead of JSON pages
 		df = gcp_apis.query_to_pandas_dataframe(
-			query=query,
+			query=train_query.query,
 			BQ=gcp_clients.bigquery_client,  # type: ignore
+			read_client=gcp_clients.bigquery_read_client if env_vars.training_data_fetch == 'storage' else None,
+			max_streams=env_vars.read_streams,
+			dtypes=gcp_apis.TRAIN_DTYPES,
+			query_parameters=train_query.parameters,
 		)
 
-		pipeline = train_models.titanic_train(
-			df=df,
-		)
-
-		gcp_apis.model_save_to_storage(
+		if env_vars.training_mode == 'fixed':
+			# The preprocessing of the same data is fitted once, the next trainings fit the classifier only
+			pipeline = train_models.titanic_train(
+				df=df,
+				features=cached_features(df=df, env_vars=env_vars, CS=gcp_clients.storage_client) if env_vars.training_cache else None,
+			)
+		else:
+			pipeline = search_pipeline(df=df, env_vars=env_vars)
+
+		# Each training saves a new version, the endpoint swaps it in once it is published
+		version = common.model_version()
+		model_name = f'{env_vars.model_name}/{version}'
+
+		# The mmap artifact holds the forest arrays, the endpoint maps them instead of unpickling the estimator
+		if env_vars.model_artifact_format == 'mmap':
+			gcp_apis.model_save_to_storage(
+				CS=gcp_clients.storage_client,
+				model=forest.mmap_artifact(pipeline=pipeline),
+				bucket_name=env_vars.bucket_name,
+				model_name=model_name,
+			)
+		else:
+			gcp_apis.model_save_to_storage(
+				CS=gcp_clients.storage_client,
+				model=pipeline,
+				bucket_name=env_vars.bucket_name,
+				model_name=model_name,
+			)
+
+			# The endpoint scores the forest over its flat arrays, without unpickling the estimator
+			gcp_apis.forest_save_to_storage(
+				CS=gcp_clients.storage_client,
+				forest_bytes=forest.forest_to_bytes(forest=forest.export_forest(classifier=pipeline[-1])),
+				bucket_name=env_vars.bucket_name,
+				model_name=model_name,
+			)
+
+		gcp_apis.model_publish_version(
 			CS=gcp_clients.storage_client,
-			model=pipeline,
 			bucket_name=env_vars.bucket_name,
+			version=version,
+			model_name=env_vars.model_name,
 		)
+
+		if snapshot is not None:
+			gcp_apis.snapshot_save_to_storage(
+				CS=gcp_clients.storage_client,
+				bucket_name=env_vars.bucket_name,
+				snapshot=snapshot,
+				version=version,
+				model_name=env_vars.model_name,
+			)
@@ -1 +1,3 @@
-SELECT * FROM `{table_source}`
+SELECT {columns}
+FROM `{table_source}`{sample}
+{where}
@@ -0,0 +1,137 @@
+"""Local stand-ins for the GCP clients, to run the training data fetch offline."""
+
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+from google.cloud import bigquery
+
+
+class FakeQueryJob:
+    """A finished query job, whose result is saved to `destination`."""
+
+    def __init__(self, destination: bigquery.TableReference) -> None:
+        self.destination = destination
+
+    def result(self) -> 'FakeQueryJob':
+        return self
+
+
+class FakeBigQueryClient:
+    """Answers every query with the same result table.
+
+    Implements the subset of `bigquery.Client` used with the Storage Read API: `query`
+    returns a job whose `destination` is the table the result is saved to. `get_table`
+    returns the metadata given in `tables`.
+
+    Attributes:
+        project (str): The project of the client.
+        tables (Dict[str, SimpleNamespace]): The metadata of each table, by fully-qualified name.
+        queries (List[str]): The queries run.
+    """
+
+    def __init__(self, project: str = 'project', tables: Optional[Dict[str, SimpleNamespace]] = None) -> None:
+        self.project = project
+        self.tables = tables or {}
+        self.queries: List[str] = []
+
+    def get_table(self, table: str, **kwargs: Any) -> SimpleNamespace:
+        """The metadata of a table of `tables`, its `modified` time and `num_rows`."""
+        return self.tables[table]
+
+    def query(self, query: str, **kwargs: Any) -> FakeQueryJob:
+        self.queries.append(query)
+        return FakeQueryJob(destination=bigquery.TableReference.from_string(f'{self.project}._anonymous.result'))
+
+
+class FakeBigQueryReadClient:
+    """Serves a table over the Storage Read API, as Arrow IPC messages.
+
+    Implements the subset of `bigquery_storage.BigQueryReadClient` used by the training:
+    `create_read_session` splits the table between at most `max_stream_count` streams,
+    or `max_streams` when it is 0, and `read_rows` yields each stream in record batches
+    of `batch_rows` rows.
+
+    Attributes:
+        table (pa.Table): The table served, for every read session.
+        sessions (List[Dict[str, Any]]): The arguments of each `create_read_session` call.
+        reads (List[str]): The streams read.
+    """
+
+    def __init__(self, table: pa.Table, max_streams: int = 4, batch_rows: int = 100) -> None:
+        self.table = table
+        self.max_streams = max_streams
+        self.batch_rows = batch_rows
+        self.sessions: List[Dict[str, Any]] = []
+        self.reads: List[str] = []
+        self._streams: Dict[str, pa.Table] = {}
+
+    def create_read_session(self, parent: str, read_session: Dict[str, Any], max_stream_count: int = 0) -> SimpleNamespace:
+        self.sessions.append({'parent': parent, 'read_session': read_session, 'max_stream_count': max_stream_count})
+
+        table = self.table
+        if read_session['read_options']['selected_fields']:
+            table = table.select(read_session['read_options']['selected_fields'])
+
+        count = min(max_stream_count or self.max_streams, self.max_streams, table.num_rows)
+        size = -(-table.num_rows // count) if count else 0
+        streams = []
+        for index in range(count):
+            name = f'{read_session["table"]}/streams/{len(self.sessions)}-{index}'
+            self._streams[name] = table.slice(index * size, size)
+            streams.append(SimpleNamespace(name=name))
+
+        return SimpleNamespace(
+            streams=streams,
+            arrow_schema=SimpleNamespace(serialized_schema=table.schema.serialize().to_pybytes()),
+        )
+
+    def read_rows(self, name: str, **kwargs: Any) -> Iterator[SimpleNamespace]:
+        self.reads.append(name)
+        for batch in self._streams[name].to_batches(max_chunksize=self.batch_rows):
+            yield SimpleNamespace(arrow_record_batch=SimpleNamespace(serialized_record_batch=batch.serialize().to_pybytes()))
+
+
+class FakeBlob:
+    """A blob of `FakeStorageClient`, a file of its folder."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def upload_from_string(self, data: bytes, content_type: str = 'text/plain') -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+    def download_as_bytes(self) -> bytes:
+        return self.path.read_bytes()
+
+
+class FakeBucket:
+    """A bucket of `FakeStorageClient`, a subfolder of its folder."""
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self.folder / name)
+
+    def get_blob(self, name: str) -> Optional[FakeBlob]:
+        return FakeBlob(self.folder / name) if (self.folder / name).is_file() else None
+
+
+class FakeStorageClient:
+    """Keeps the buckets in a local folder, a bucket per subfolder and a file per blob.
+
+    Implements the subset of `storage.Client` used by the training: `bucket(name).blob(name)`
+    to upload a file and `bucket(name).get_blob(name)` to download one, None when missing.
+
+    Attributes:
+        folder (Path): The folder of the buckets.
+    """
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self.folder / bucket_name)
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from c_train_model.app.funcs import common
+
+
+def test_model_version() -> None:
+    now = datetime(2024, 1, 15, 10, 30, tzinfo=timezone(timedelta(hours=1)))
+
+    version = common.model_version(now=now)
+
+    assert version.startswith("20240115T093000Z-")
+    assert version != common.model_version(now=now)
+
+
+def test_model_versions_sort_by_time() -> None:
+    versions = [common.model_version(now=datetime(2024, 1, day, tzinfo=timezone.utc)) for day in (9, 10, 11)]
+
+    assert sorted(versions) == versions
+
+
+QUERY_PATH = Path(__file__).parents[1] / "app" / "resources" / "select_train_data.sql"
+
+
+def test_query_train_data_selects_the_training_columns() -> None:
+    train_query = common.query_train_data(table_fqn="project.dataset.facts", query_path=QUERY_PATH)
+
+    assert train_query.query == (
+        "SELECT `Age`, `SibSp`, `Parch`, `Fare`, `Sex`, `Embarked`, `Pclass`, `Survived` "
+        "FROM `project.dataset.facts` WHERE `Survived` IS NOT NULL"
+    )
+    assert train_query.parameters == {}
+
+
+def test_query_train_data_windows_and_sample() -> None:
+    train_query = common.query_train_data(
+        table_fqn="project.dataset.facts",
+        query_path=QUERY_PATH,
+        columns=["Age", "Survived"],
+        labelled_only=False,
+        windows=[
+            common.Window("PassengerId", start=100, end=200),
+            common.Window("Embarked", values=["S", "it's  two"]),
+        ],
+        sample_percent=12.5,
+    )
+
+    assert train_query.query == (
+        "SELECT `Age`, `Survived` FROM `project.dataset.facts` TABLESAMPLE SYSTEM (12.5 PERCENT) "
+        "WHERE `PassengerId` >= @window_0_start AND `PassengerId` < @window_0_end "
+        "AND `Embarked` IN UNNEST(@window_1_values)"
+    )
+    # The values are sent as they are, never written in the SQL
+    assert train_query.parameters == {
+        "window_0_start": ("INT64", 100),
+        "window_0_end": ("INT64", 200),
+        "window_1_values": ("STRING", ["S", "it's  two"]),
+    }
+
+
+def test_query_train_data_without_filters() -> None:
+    train_query = common.query_train_data(table_fqn="project.dataset.facts", query_path=QUERY_PATH, columns=["Age"], labelled_only=False)
+
+    assert train_query.query == "SELECT `Age` FROM `project.dataset.facts`"
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"columns": ["Age; DROP TABLE facts"]},
+    {"windows": [common.Window("Pclass`", values=[1])]},
+    {"windows": [common.Window("Embarked", values=[object()])]},
+    {"windows": [common.Window("Pclass", values=["1"])]},
+    {"windows": [common.Window("Pclass", values=[True])]},
+    {"windows": [common.Window("Fare", start=float("nan"))]},
+    {"windows": [common.Window("Fare", end=float("inf"))]},
+    {"sample_percent": 0},
+    {"sample_percent": 101},
+])
+def test_query_train_data_invalid(kwargs: dict) -> None:
+    with pytest.raises(ValueError):
+        common.query_train_data(table_fqn="project.dataset.facts", query_path=QUERY_PATH, **kwargs)
+
+
+@pytest.mark.parametrize("column", ["run_hash", "ingested_at"])
+def test_query_train_data_window_on_a_column_not_in_the_table(column: str) -> None:
+    with pytest.raises(ValueError, match=f"The table has no column '{column}'"):
+        common.query_train_data(table_fqn="project.dataset.facts", query_path=QUERY_PATH, windows=[common.Window(column, values=["abc"])])
@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from c_train_model.app.funcs import forest
+
+
+@pytest.fixture(scope="module")
+def classifier() -> RandomForestClassifier:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 4))
+    y = np.where(X[:, 0] + X[:, 1] > 0, "yes", "no")
+    return RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+
+
+def test_export_forest_concatenates_the_trees(classifier: RandomForestClassifier) -> None:
+    arrays = forest.export_forest(classifier)
+
+    node_counts = [estimator.tree_.node_count for estimator in classifier.estimators_]
+    assert arrays["roots"].tolist() == np.cumsum([0] + node_counts[:-1]).tolist()
+    assert len(arrays["threshold"]) == len(arrays["feature"]) == len(arrays["value"]) == sum(node_counts)
+    assert arrays["classes"].tolist() == ["no", "yes"]
+    assert int(arrays["n_features"]) == 4
+    assert int(arrays["max_depth"]) == max(estimator.tree_.max_depth for estimator in classifier.estimators_)
+    np.testing.assert_allclose(arrays["value"].sum(axis=1), 1.0)
+
+
+def test_export_forest_leaves_point_to_themselves(classifier: RandomForestClassifier) -> None:
+    arrays = forest.export_forest(classifier)
+
+    tree = classifier.estimators_[1].tree_
+    offset = arrays["roots"][1]
+    leaves = np.flatnonzero(tree.children_left == -1)
+    assert (arrays["children_left"][offset + leaves] == offset + leaves).all()
+    assert (arrays["children_right"][offset + leaves] == offset + leaves).all()
+    assert arrays["children_left"][offset] == offset + tree.children_left[0]
+
+
+def test_export_forest_only_random_forests() -> None:
+    with pytest.raises(ValueError):
+        forest.export_forest(SVC())
+    with pytest.raises(ValueError):
+        forest.export_forest(RandomForestClassifier())
+
+
+def test_forest_to_bytes(classifier: RandomForestClassifier) -> None:
+    arrays = forest.export_forest(classifier)
+
+    with np.load(io.BytesIO(forest.forest_to_bytes(arrays))) as npz:
+        assert set(npz.files) == set(arrays)
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(npz[name], array)
+
+
+def test_mmap_artifact(classifier: RandomForestClassifier) -> None:
+    scaler = StandardScaler().fit(np.ones((3, 4)))
+    pipeline = Pipeline(steps=[("scaler", scaler), ("classifier", classifier)])
+
+    artifact = forest.mmap_artifact(pipeline)
+
+    assert artifact["preprocessor"].steps == [("scaler", scaler)]
+    np.testing.assert_array_equal(artifact["forest"]["threshold"], forest.export_forest(classifier)["threshold"])
@@ -1,13 +1,31 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
 from unittest import mock
 
 import pandas as pd
+import pyarrow as pa
 import pytest
-from google.cloud import storage
+from google.cloud import bigquery, storage
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.pipeline import Pipeline
 
-from c_train_model.app.funcs.gcp_apis import model_save_to_storage
-from c_train_model.app.funcs.train_models import titanic_train
+from c_train_model.app.funcs.gcp_apis import (
+    TRAIN_DTYPES,
+    arrow_to_pandas,
+    features_load_from_storage,
+    features_save_to_storage,
+    forest_save_to_storage,
+    model_publish_version,
+    model_save_to_storage,
+    query_to_arrow,
+    query_to_pandas_dataframe,
+    snapshot_load_from_storage,
+    snapshot_save_to_storage,
+    table_snapshot,
+)
+from c_train_model.app.funcs.train_models import titanic_features, titanic_train
+
+from c_train_model.tests import fakes
 
 
 @pytest.fixture
@@ -65,3 +83,172 @@ def test_model_save_to_storage(
 
     model_save_to_storage(mock_client, bucket_name,
                           pipeline_titanic, model_name)
+
+
+def test_forest_save_to_storage(storage_client: mock.Mock) -> None:
+    forest_save_to_storage(storage_client, "test-bucket", b"forest", "test-model")
+
+    storage_client.bucket.assert_called_once_with("test-bucket")
+    storage_client.bucket.return_value.blob.assert_called_once_with("test-model.forest.npz")
+    storage_client.bucket.return_value.blob.return_value.upload_from_string.assert_called_once_with(
+        data=b"forest", content_type="application/octet-stream")
+
+
+def test_model_publish_version(storage_client: mock.Mock) -> None:
+    model_publish_version(storage_client, "test-bucket", "20240115T093000Z-1a2b3c", "test-model")
+
+    storage_client.bucket.return_value.blob.assert_called_once_with("test-model.latest")
+    storage_client.bucket.return_value.blob.return_value.upload_from_string.assert_called_once_with(
+        data=b"20240115T093000Z-1a2b3c", content_type="text/plain")
+
+
+@pytest.fixture
+def titanic_table() -> pa.Table:
+    return pa.table({
+        'PassengerId': pa.array(range(1, 251), pa.int64()),
+        'Survived': pa.array([i % 3 == 0 if i % 50 else None for i in range(250)], pa.bool_()),
+        'Pclass': pa.array([1 + i % 3 for i in range(250)], pa.int64()),
+        'Sex': pa.array(['male' if i % 2 else 'female' for i in range(250)]),
+        'Age': pa.array([float(i % 80) if i % 7 else None for i in range(250)]),
+        'SibSp': pa.array([i % 4 for i in range(250)], pa.int64()),
+        'Embarked': pa.array([('S', 'C', 'Q', None)[i % 4] for i in range(250)]),
+    })
+
+
+def test_query_to_arrow_reads_every_stream(titanic_table: pa.Table) -> None:
+    bigquery_client = fakes.FakeBigQueryClient(project='billing')
+    read_client = fakes.FakeBigQueryReadClient(table=titanic_table, max_streams=8, batch_rows=30)
+
+    table = query_to_arrow(query='SELECT 1', BQ=bigquery_client, read_client=read_client, max_streams=3)
+
+    assert table.equals(titanic_table)
+    assert bigquery_client.queries == ['SELECT 1']
+    session, = read_client.sessions
+    assert session['parent'] == 'projects/billing'
+    assert session['read_session']['table'] == 'projects/billing/datasets/_anonymous/tables/result'
+    assert session['read_session']['data_format'] == 'ARROW'
+    assert session['max_stream_count'] == 3
+    assert len(read_client.reads) == 3
+
+
+def test_query_to_arrow_selected_columns(titanic_table: pa.Table) -> None:
+    read_client = fakes.FakeBigQueryReadClient(table=titanic_table)
+
+    table = query_to_arrow(query='SELECT 1', BQ=fakes.FakeBigQueryClient(), read_client=read_client, columns=['Sex', 'Age'])
+
+    assert table.column_names == ['Sex', 'Age']
+    assert read_client.sessions[0]['read_session']['read_options']['selected_fields'] == ['Sex', 'Age']
+
+
+def test_query_to_arrow_empty_result(titanic_table: pa.Table) -> None:
+    read_client = fakes.FakeBigQueryReadClient(table=titanic_table.slice(0, 0))
+
+    table = query_to_arrow(query='SELECT 1', BQ=fakes.FakeBigQueryClient(), read_client=read_client)
+
+    assert table.num_rows == 0
+    assert table.schema.equals(titanic_table.schema)
+
+
+def test_arrow_to_pandas_compact_types(titanic_table: pa.Table) -> None:
+    df = arrow_to_pandas(table=titanic_table, dtypes=TRAIN_DTYPES | {'Age': 'float32', 'Sex': 'dictionary'})
+
+    assert df['Pclass'].dtype == 'Int8'
+    assert df['SibSp'].dtype == 'Int8'
+    assert df['Survived'].dtype == 'boolean'
+    assert df['Survived'].isna().sum() == 5
+    assert df['Age'].dtype == 'float32'
+    assert df['Sex'].dtype == 'category'
+    assert df['PassengerId'].dtype == 'Int64'
+    # Strings keep None for missing values, as the REST fetch returns them
+    assert df['Embarked'].dtype == object
+    assert df['Embarked'].iloc[3] is None
+
+
+def test_arrow_to_pandas_values_too_large(titanic_table: pa.Table) -> None:
+    with pytest.raises(pa.ArrowInvalid):
+        arrow_to_pandas(table=titanic_table, dtypes={'PassengerId': 'int8'})
+
+
+def test_query_to_pandas_dataframe_storage_read_matches_rest(titanic_table: pa.Table) -> None:
+    bigquery_client = mock.Mock(spec=bigquery.Client)
+    bigquery_client.query.return_value.to_dataframe.return_value = titanic_table.to_pandas(
+        types_mapper={pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}.get
+    )
+    rest = query_to_pandas_dataframe(query='SELECT 1', BQ=bigquery_client, dtypes=TRAIN_DTYPES)
+
+    storage_read = query_to_pandas_dataframe(
+        query='SELECT 1',
+        BQ=fakes.FakeBigQueryClient(),
+        read_client=fakes.FakeBigQueryReadClient(table=titanic_table),
+        dtypes=TRAIN_DTYPES,
+    )
+
+    pd.testing.assert_frame_equal(storage_read, rest, check_dtype=False)
+    assert storage_read.memory_usage().sum() < rest.memory_usage().sum()
+
+
+def test_query_to_pandas_dataframe_query_parameters() -> None:
+    bigquery_client = mock.Mock(spec=bigquery.Client)
+
+    query_to_pandas_dataframe(
+        query='SELECT 1 WHERE `Pclass` >= @start AND `Embarked` IN UNNEST(@values)',
+        BQ=bigquery_client,
+        query_parameters={'start': ('INT64', 2), 'values': ('STRING', ['S', 'C'])},
+    )
+
+    job_config = bigquery_client.query.call_args.kwargs['job_config']
+    assert job_config.query_parameters == [
+        bigquery.ScalarQueryParameter('start', 'INT64', 2),
+        bigquery.ArrayQueryParameter('values', 'STRING', ['S', 'C']),
+    ]
+
+
+@pytest.fixture
+def facts_client() -> fakes.FakeBigQueryClient:
+    modified = datetime(2024, 1, 15, 9, 30, tzinfo=timezone.utc)
+    return fakes.FakeBigQueryClient(tables={'p.d.facts': SimpleNamespace(modified=modified, num_rows=891)})
+
+
+def test_table_snapshot(facts_client: fakes.FakeBigQueryClient) -> None:
+    snapshot = table_snapshot(facts_client, 'p.d.facts', query='SELECT 1', settings={'training_mode': 'fixed'})
+
+    assert snapshot.modified == '2024-01-15T09:30:00+00:00'
+    assert snapshot.num_rows == 891
+    for changed in ({'num_rows': 892}, {'query': 'SELECT 2'}, {'parameters': {'start': ('INT64', 2)}}, {'settings': {'training_mode': 'random'}}):
+        assert snapshot._replace(**changed).fingerprint() != snapshot.fingerprint()
+
+
+def test_snapshot_save_and_load(tmp_path, facts_client: fakes.FakeBigQueryClient) -> None:
+    CS = fakes.FakeStorageClient(tmp_path)
+    snapshot = table_snapshot(facts_client, 'p.d.facts')
+
+    assert snapshot_load_from_storage(CS, 'models', model_name='nar-rayya') is None
+    snapshot_save_to_storage(CS, 'models', snapshot=snapshot, version='v1', model_name='nar-rayya')
+
+    record = snapshot_load_from_storage(CS, 'models', model_name='nar-rayya')
+    assert record['fingerprint'] == snapshot.fingerprint()
+    assert record['version'] == 'v1'
+    assert (tmp_path / 'models' / 'nar-rayya.snapshot').is_file()
+
+
+def test_features_save_and_load(tmp_path) -> None:
+    CS = fakes.FakeStorageClient(tmp_path)
+    df = pd.DataFrame({
+        'Survived': [True, False, True],
+        'Sex': ['male', 'female', None],
+        'Pclass': [1, 2, 3],
+        'Age': [30.0, None, 40.0],
+        'SibSp': [1, 0, 1],
+        'Parch': [0, 1, 0],
+        'Fare': [10.0, 20.0, 30.0],
+        'Embarked': ['S', 'C', None],
+    })
+    features = titanic_features(df)
+
+    assert features_load_from_storage(CS, 'models', key='abc') is None
+    features_save_to_storage(CS, 'models', features=features, key='abc')
+
+    loaded = features_load_from_storage(CS, 'models', key='abc')
+    assert (loaded.matrix == features.matrix).all()
+    assert loaded.label.tolist() == features.label.tolist()
+    assert (loaded.preprocessor.transform(df) == features.matrix).all()
@@ -1,13 +1,21 @@
+import base64
+import json
+from datetime import datetime, timezone
 from pathlib import Path
+from types import SimpleNamespace
 from unittest import mock
 
 import pandas as pd
+import pyarrow as pa
 import pytest
 from cloudevents.http import CloudEvent
 from google.cloud import bigquery, storage
 
 from c_train_model.app import main
-from c_train_model.app.funcs import models
+from c_train_model.app.funcs import common, models
+from c_train_model.app.funcs.train_models import titanic_train
+
+from c_train_model.tests import fakes
 
 
 @pytest.fixture
@@ -101,9 +109,13 @@ def simple_pandas_dataframe() -> pd.DataFrame:
 @mock.patch('c_train_model.app.main.load_clients')
 @mock.patch('c_train_model.app.main.gcp_apis.query_to_pandas_dataframe')
 @mock.patch('c_train_model.app.main.gcp_apis.model_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.forest_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.model_publish_version')
 @mock.patch('c_train_model.app.main.common.query_train_data')
 def test_main(
     mock_query_train_data: mock.Mock,
+    mock_model_publish_version: mock.Mock,
+    mock_forest_save_to_storage: mock.Mock,
     mock_model_save_to_storage: mock.Mock,
     mock_query_to_pandas_dataframe: mock.Mock,
     mock_load_clients: mock.Mock,
@@ -114,7 +126,7 @@ def test_main(
     simple_pandas_dataframe: pd.DataFrame,
 ) -> None:
 
-    mock_query_train_data.return_value = 'SELECT * FROM some_table'
+    mock_query_train_data.return_value = common.TrainQuery('SELECT * FROM some_table')
     mock_load_clients.return_value = gcp_clients
     mock_query_to_pandas_dataframe.return_value = simple_pandas_dataframe
     mock_env_vars.return_value = env_vars_filled
@@ -122,19 +134,223 @@ def test_main(
 
     mock_query_train_data.assert_called_once_with(
         table_fqn='closeracademy-handson.jm_test_to_delete.jm_test-delete-titanic_facts',
-        query_path=Path('./resources/select_train_data.sql')
+        query_path=Path('./resources/select_train_data.sql'),
+        windows=(),
+        sample_percent=None,
     )
 
     mock_query_to_pandas_dataframe.assert_called_once_with(
-        query=main.common.query_train_data(
-            table_fqn='closeracademy-handson.jm_test_to_delete.jm_test-delete-titanic_facts',
-            query_path=Path('./resources/select_train_data.sql')
-        ),
+        query='SELECT * FROM some_table',
         BQ=gcp_clients.bigquery_client,
+        read_client=None,
+        max_streams=4,
+        dtypes=main.gcp_apis.TRAIN_DTYPES,
+        query_parameters={},
     )
 
+    version = mock_model_publish_version.call_args.kwargs['version']
     mock_model_save_to_storage.assert_called_once_with(
         CS=gcp_clients.storage_client,
         model=mock.ANY,
         bucket_name=env_vars_filled.bucket_name,
+        model_name=f'nar-rayya/{version}',
+    )
+
+    mock_forest_save_to_storage.assert_called_once_with(
+        CS=gcp_clients.storage_client,
+        forest_bytes=mock.ANY,
+        bucket_name=env_vars_filled.bucket_name,
+        model_name=f'nar-rayya/{version}',
+    )
+
+    mock_model_publish_version.assert_called_once_with(
+        CS=gcp_clients.storage_client,
+        bucket_name=env_vars_filled.bucket_name,
+        version=version,
+        model_name='nar-rayya',
+    )
+
+
+@mock.patch('c_train_model.app.main._env_vars')
+@mock.patch('c_train_model.app.main.load_clients')
+@mock.patch('c_train_model.app.main.gcp_apis.query_to_pandas_dataframe')
+@mock.patch('c_train_model.app.main.gcp_apis.model_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.forest_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.model_publish_version')
+@mock.patch('c_train_model.app.main.common.query_train_data')
+def test_main_mmap_artifact(
+    mock_query_train_data: mock.Mock,
+    mock_model_publish_version: mock.Mock,
+    mock_forest_save_to_storage: mock.Mock,
+    mock_model_save_to_storage: mock.Mock,
+    mock_query_to_pandas_dataframe: mock.Mock,
+    mock_load_clients: mock.Mock,
+    mock_env_vars: mock.Mock,
+    cloud_event: CloudEvent,
+    env_vars_filled: models.EnvVars,
+    gcp_clients: models.GCPClients,
+    simple_pandas_dataframe: pd.DataFrame,
+) -> None:
+    mock_load_clients.return_value = gcp_clients
+    mock_query_to_pandas_dataframe.return_value = simple_pandas_dataframe
+    mock_env_vars.return_value = env_vars_filled._replace(model_artifact_format='mmap')
+
+    main.main(cloud_event)
+
+    artifact = mock_model_save_to_storage.call_args.kwargs['model']
+    assert set(artifact) == {'preprocessor', 'forest'}
+    mock_forest_save_to_storage.assert_not_called()
+    mock_model_publish_version.assert_called_once()
+
+
+@mock.patch('c_train_model.app.main._env_vars')
+@mock.patch('c_train_model.app.main.load_clients')
+@mock.patch('c_train_model.app.main.gcp_apis.model_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.forest_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.model_publish_version')
+@mock.patch('c_train_model.app.main.common.query_train_data', return_value=common.TrainQuery('SELECT * FROM some_table'))
+def test_main_storage_read(
+    mock_query_train_data: mock.Mock,
+    mock_model_publish_version: mock.Mock,
+    mock_forest_save_to_storage: mock.Mock,
+    mock_model_save_to_storage: mock.Mock,
+    mock_load_clients: mock.Mock,
+    mock_env_vars: mock.Mock,
+    cloud_event: CloudEvent,
+    env_vars_filled: models.EnvVars,
+    storage_client: mock.Mock,
+    simple_pandas_dataframe: pd.DataFrame,
+) -> None:
+    read_client = fakes.FakeBigQueryReadClient(table=pa.Table.from_pandas(simple_pandas_dataframe), batch_rows=1)
+    mock_load_clients.return_value = models.GCPClients(
+        storage_client=storage_client,
+        bigquery_client=fakes.FakeBigQueryClient(),
+        bigquery_read_client=read_client,
+    )
+    mock_env_vars.return_value = env_vars_filled._replace(training_data_fetch='storage', read_streams=2)
+
+    main.main(cloud_event)
+
+    assert read_client.sessions[0]['max_stream_count'] == 2
+    assert len(read_client.reads) == 2
+    pipeline = mock_model_save_to_storage.call_args.kwargs['model']
+    assert pipeline.predict(simple_pandas_dataframe).tolist() == titanic_train(simple_pandas_dataframe).predict(simple_pandas_dataframe).tolist()
+
+
+@mock.patch('c_train_model.app.main._env_vars')
+@mock.patch('c_train_model.app.main.load_clients')
+@mock.patch('c_train_model.app.main.gcp_apis.query_to_pandas_dataframe')
+@mock.patch('c_train_model.app.main.gcp_apis.model_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.forest_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.model_publish_version')
+@mock.patch('c_train_model.app.main.common.get_path_to_file', return_value=Path(main.__file__).parent / 'resources' / 'select_train_data.sql')
+def test_main_training_window(
+    mock_get_path_to_file: mock.Mock,
+    mock_model_publish_version: mock.Mock,
+    mock_forest_save_to_storage: mock.Mock,
+    mock_model_save_to_storage: mock.Mock,
+    mock_query_to_pandas_dataframe: mock.Mock,
+    mock_load_clients: mock.Mock,
+    mock_env_vars: mock.Mock,
+    cloud_event: CloudEvent,
+    env_vars_filled: models.EnvVars,
+    gcp_clients: models.GCPClients,
+    simple_pandas_dataframe: pd.DataFrame,
+) -> None:
+    data = {'training_data_table': 'p.d.titanic_facts', 'training_window': {'column': 'Pclass', 'values': [1, 2]}}
+    cloud_event.data['message']['data'] = base64.b64encode(json.dumps(data).encode('utf-8')).decode('utf-8')
+    mock_load_clients.return_value = gcp_clients
+    # The query selects the training columns only
+    mock_query_to_pandas_dataframe.return_value = simple_pandas_dataframe[['Age', 'SibSp', 'Parch', 'Fare', 'Sex', 'Embarked', 'Pclass', 'Survived']]
+    mock_env_vars.return_value = env_vars_filled._replace(train_sample_percent=10.0)
+
+    main.main(cloud_event)
+
+    query = mock_query_to_pandas_dataframe.call_args.kwargs['query']
+    assert 'FROM `p.d.titanic_facts` TABLESAMPLE SYSTEM (10 PERCENT)' in query
+    assert query.endswith('WHERE `Survived` IS NOT NULL AND `Pclass` IN UNNEST(@window_0_values)')
+    assert mock_query_to_pandas_dataframe.call_args.kwargs['query_parameters'] == {'window_0_values': ('INT64', [1, 2])}
+    mock_model_publish_version.assert_called_once()
+
+
+@mock.patch('c_train_model.app.main._env_vars')
+@mock.patch('c_train_model.app.main.load_clients')
+@mock.patch('c_train_model.app.main.gcp_apis.query_to_pandas_dataframe')
+@mock.patch('c_train_model.app.main.gcp_apis.model_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.forest_save_to_storage')
+@mock.patch('c_train_model.app.main.gcp_apis.model_publish_version')
+@mock.patch('c_train_model.app.main.common.query_train_data', return_value=common.TrainQuery('SELECT * FROM some_table'))
+def test_main_search(
+    mock_query_train_data: mock.Mock,
+    mock_model_publish_version: mock.Mock,
+    mock_forest_save_to_storage: mock.Mock,
+    mock_model_save_to_storage: mock.Mock,
+    mock_query_to_pandas_dataframe: mock.Mock,
+    mock_load_clients: mock.Mock,
+    mock_env_vars: mock.Mock,
+    cloud_event: CloudEvent,
+    env_vars_filled: models.EnvVars,
+    gcp_clients: models.GCPClients,
+    simple_pandas_dataframe: pd.DataFrame,
+    capsys: pytest.CaptureFixture,
+) -> None:
+    mock_load_clients.return_value = gcp_clients
+    mock_query_to_pandas_dataframe.return_value = simple_pandas_dataframe
+    mock_env_vars.return_value = env_vars_filled._replace(training_mode='random', search_candidates=2, search_cv=2, search_n_jobs=1)
+
+    main.main(cloud_event)
+
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert [log['message'] for log in logs].count('Search candidate') == 2
+    assert 'mean_score' in logs[-1]['best']
+    pipeline = mock_model_save_to_storage.call_args.kwargs['model']
+    assert pipeline.get_params()['classifier__n_estimators'] == logs[-1]['best']['params']['classifier__n_estimators']
+    mock_forest_save_to_storage.assert_called_once()
+
+
+@mock.patch('c_train_model.app.main._env_vars')
+@mock.patch('c_train_model.app.main.load_clients')
+@mock.patch('c_train_model.app.main.gcp_apis.query_to_pandas_dataframe')
+@mock.patch('c_train_model.app.main.common.query_train_data', return_value=common.TrainQuery('SELECT * FROM some_table'))
+def test_main_training_cache(
+    mock_query_train_data: mock.Mock,
+    mock_query_to_pandas_dataframe: mock.Mock,
+    mock_load_clients: mock.Mock,
+    mock_env_vars: mock.Mock,
+    cloud_event: CloudEvent,
+    env_vars_filled: models.EnvVars,
+    simple_pandas_dataframe: pd.DataFrame,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture,
+) -> None:
+    table_fqn = 'closeracademy-handson.jm_test_to_delete.jm_test-delete-titanic_facts'
+    facts = SimpleNamespace(modified=datetime(2024, 1, 15, tzinfo=timezone.utc), num_rows=4)
+    mock_load_clients.return_value = models.GCPClients(
+        storage_client=fakes.FakeStorageClient(tmp_path),
+        bigquery_client=fakes.FakeBigQueryClient(tables={table_fqn: facts}),
     )
+    mock_query_to_pandas_dataframe.return_value = simple_pandas_dataframe
+    mock_env_vars.return_value = env_vars_filled._replace(training_cache=True)
+    bucket = tmp_path / env_vars_filled.bucket_name
+
+    def trainings() -> int:
+        return len(list(bucket.glob('nar-rayya/*.forest.npz')))
+
+    main.main(cloud_event)
+    assert trainings() == 1
+    first = json.loads((bucket / 'nar-rayya.snapshot').read_text())
+    assert first['version'] == (bucket / 'nar-rayya.latest').read_text()
+    assert len(list(bucket.glob('nar-rayya.features/*'))) == 1
+
+    # The same snapshot: the training is skipped, without querying the table
+    main.main(cloud_event)
+    assert trainings() == 1
+    assert mock_query_to_pandas_dataframe.call_count == 1
+    assert 'skipping the training' in capsys.readouterr().out
+
+    # The table changed, with the same training data: the preprocessed features are reused
+    facts.modified = datetime(2024, 1, 16, tzinfo=timezone.utc)
+    main.main(cloud_event)
+    assert trainings() == 2
+    assert 'Reusing the preprocessed features' in capsys.readouterr().out
+    assert json.loads((bucket / 'nar-rayya.snapshot').read_text())['fingerprint'] != first['fingerprint']
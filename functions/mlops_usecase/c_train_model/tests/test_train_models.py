@@ -1,8 +1,10 @@
+import numpy as np
 import pandas as pd
+import pytest
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.svm import SVC
 
-from c_train_model.app.funcs.train_models import titanic_train
+from c_train_model.app.funcs.train_models import features_key, titanic_features, titanic_search, titanic_train
 
 
 def test_titanic_train_rfc() -> None:
@@ -95,3 +97,80 @@ def test_titanic_train_svm() -> None:
     assert len(y_pred) == 2
     for y in y_pred:
         assert y in [True, False]
+
+
+@pytest.fixture(scope='module')
+def passengers() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = 180
+    sex = rng.choice(['male', 'female'], n)
+    pclass = rng.integers(1, 4, n)
+    return pd.DataFrame({
+        'Survived': (sex == 'female') & (pclass < 3) | (rng.random(n) < 0.1),
+        'Sex': sex,
+        'Pclass': pclass,
+        'Age': np.where(rng.random(n) < 0.1, np.nan, rng.uniform(1, 80, n)),
+        'SibSp': rng.integers(0, 4, n),
+        'Parch': rng.integers(0, 3, n),
+        'Fare': rng.uniform(5, 100, n),
+        'Embarked': rng.choice(['S', 'C', 'Q', None], n),
+    })
+
+
+SMALL_SPACE = {'classifier__n_estimators': [5, 10], 'classifier__max_depth': [2, 4, None], 'preprocessor__num__imputer__strategy': ['median', 'mean']}
+
+
+def test_titanic_search_random(passengers: pd.DataFrame) -> None:
+    result = titanic_search(passengers, strategy='random', n_candidates=4, cv=3, n_jobs=1, search_space=SMALL_SPACE)
+
+    assert len(result.candidates) == 4
+    assert all(candidate.n_samples == len(passengers) and candidate.seconds > 0 for candidate in result.candidates)
+    assert result.best.mean_score == max(candidate.mean_score for candidate in result.candidates)
+    assert not result.out_of_time
+
+    # The best pipeline is fitted on all the rows, without the cache of the search
+    assert result.pipeline.memory is None
+    assert result.pipeline.get_params()['classifier__n_estimators'] == result.best.params['classifier__n_estimators']
+    assert len(result.pipeline.predict(passengers)) == len(passengers)
+
+
+def test_titanic_search_halving(passengers: pd.DataFrame) -> None:
+    result = titanic_search(passengers, strategy='halving', n_candidates=9, cv=2, n_jobs=1, search_space=SMALL_SPACE)
+
+    # 9 candidates on a ninth of the rows, the best 3 on a third, the best one on all of them
+    assert [sum(c.iteration == i for c in result.candidates) for i in range(3)] == [9, 3, 1]
+    assert [c.n_samples for c in result.candidates if c.iteration == 1] == [len(passengers) // 3] * 3
+    assert result.best.iteration == 2
+    assert result.best.n_samples == len(passengers)
+
+
+def test_titanic_search_time_budget(passengers: pd.DataFrame) -> None:
+    result = titanic_search(passengers, strategy='random', n_candidates=4, cv=2, n_jobs=1, time_budget=0, search_space=SMALL_SPACE)
+
+    # The first round always runs
+    assert len(result.candidates) == 1
+    assert result.out_of_time
+
+
+def test_titanic_search_unknown_strategy(passengers: pd.DataFrame) -> None:
+    with pytest.raises(ValueError):
+        titanic_search(passengers, strategy='grid')
+
+
+def test_titanic_train_features(passengers: pd.DataFrame) -> None:
+    features = titanic_features(passengers)
+    pipeline = titanic_train(passengers, features=features)
+
+    # Fitting the classifier on the features trains the same model as fitting the whole pipeline
+    assert pipeline[0] is features.preprocessor
+    assert pipeline.predict_proba(passengers).tolist() == titanic_train(passengers).predict_proba(passengers).tolist()
+
+
+def test_features_key(passengers: pd.DataFrame) -> None:
+    assert features_key(passengers) == features_key(passengers.copy())
+    # The columns the pipeline does not use are not part of the key
+    assert features_key(passengers) == features_key(passengers.assign(Name='name'))
+
+    changed = passengers.copy()
+    changed.loc[0, 'Fare'] += 1
+    assert features_key(changed) != features_key(passengers)
@@ -0,0 +1,112 @@
+"""A cache of the predictions of the endpoint, for the same features sent again."""
+
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Tuple
+
+from . import records
+
+
+def cache_key(version: str, features: Mapping[str, Any]) -> Tuple[Hashable, ...]:
+    """The key of the prediction of a version of the model for validated features.
+
+    The features are the ones `records.validate` converted to the types the model is trained
+    with: `"3"`, `3` and `3.0` are the same Pclass, `22` and `22.0` the same Age. The other
+    fields of the record do not change the prediction and are left out.
+
+    Args:
+        version (str): The version of the model.
+        features (Mapping[str, Any]): The features of a valid record.
+
+    Returns:
+        Tuple[Hashable, ...]: The version followed by the features, in the order of `records.FEATURES`.
+    """
+    return (version, *(features[name] for name in records.FEATURES))
+
+
+class PredictionCache:
+    """Keeps the latest predictions, least recently used first out, each one for `ttl` seconds.
+
+    Args:
+        max_entries (int, optional): The most predictions kept. Defaults to 10000.
+        ttl (float, optional): Seconds a prediction is kept after it is made. Defaults to 3600.
+        clock (Callable[[], float], optional): The clock of the expirations. Defaults to `time.monotonic`.
+
+    Attributes:
+        hits (int): The number of predictions found in the cache.
+        misses (int): The number of predictions not found, or expired.
+        evictions (int): The number of predictions removed to keep at most `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0, clock: Callable[[], float] = time.monotonic) -> None:
+        """Initializes an empty cache."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Key -> time it expires at and prediction, the least recently used first
+        self._entries: collections.OrderedDict[Hashable, Tuple[float, Any]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """The number of predictions in the cache, expired ones included until they are looked up."""
+        return len(self._entries)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Looks up the predictions of the keys.
+
+        Args:
+            keys (Iterable[Hashable]): The keys, from `cache_key`.
+
+        Returns:
+            Dict[Hashable, Any]: The prediction of each key found, the others are missing.
+        """
+        found = {}
+        with self._lock:
+            now = self.clock()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    entry = None
+
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+        return found
+
+    def put_many(self, predictions: Mapping[Hashable, Any]) -> None:
+        """Adds predictions, removing the least recently used ones beyond `max_entries`.
+
+        Args:
+            predictions (Mapping[Hashable, Any]): The prediction of each key.
+        """
+        with self._lock:
+            expires = self.clock() + self.ttl
+            for key, prediction in predictions.items():
+                self._entries[key] = (expires, prediction)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes every prediction, the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """The counters of the cache and its size, to be logged.
+
+        Returns:
+            Dict[str, int]: The hits, misses, evictions and entries.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self._entries)}
@@ -0,0 +1,69 @@
+"""The JSON codec of the endpoint: orjson when it is installed, the standard library otherwise.
+
+The bodies of the requests are decoded, and the responses and the logs encoded, by the
+same codec. Both encode compact JSON, without spaces, NumPy values as the Python values
+they hold, dates in ISO 8601 and the other values JSON has no type for with `str`.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # The standard library decodes and encodes the same JSON, slower
+    orjson = None
+
+# Raised for a body that is not valid JSON, by either codec
+JSONDecodeError = json.JSONDecodeError
+
+
+def _default(obj: Any) -> Any:
+    """Writes NumPy values as the Python values they hold, dates in ISO 8601 as orjson does, and any other value as its `str`."""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    return str(obj)
+
+
+def loads(data: bytes | str) -> Any:
+    """Decodes a JSON document.
+
+    Args:
+        data (bytes | str): The document, UTF-8 encoded if bytes.
+
+    Returns:
+        Any: The decoded value.
+
+    Raises:
+        JSONDecodeError: If the document is not valid JSON. orjson's error subclasses it.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encodes a value as compact JSON.
+
+    Args:
+        obj (Any): The value, of JSON types, NumPy values or dates. Other values are written as their `str`.
+
+    Returns:
+        bytes: The UTF-8 encoded document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps_text(obj: Any) -> str:
+    """Encodes a value as compact JSON text, e.g. for a log line.
+
+    Args:
+        obj (Any): The value, see `dumps`.
+
+    Returns:
+        str: The document.
+    """
+    return dumps(obj).decode('utf-8')
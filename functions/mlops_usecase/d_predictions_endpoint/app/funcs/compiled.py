@@ -0,0 +1,216 @@
+"""The fitted titanic pipeline compiled into plain Python and NumPy, to predict without DataFrames.
+
+`pipeline.predict` on a single record spends most of its time building a
+DataFrame and looking its columns up in the ColumnTransformer, not in the
+classifier. `compile_pipeline` reads the fitted parameters of the
+preprocessing steps instead: the imputer statistics, the scaler means and
+scales, the one-hot categories and the column order. The compiled pipeline
+encodes records into the same float matrix, and feeds it straight to the
+fitted classifier.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+    from sklearn.base import ClassifierMixin
+    from sklearn.pipeline import Pipeline
+
+# Appends the encoded features of a record to a row of the feature matrix
+Encoder = Callable[[Dict[str, Any], List[float]], None]
+
+
+def _is_nan(value: Any) -> bool:
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _imputer(fill: Any, numeric: bool) -> Callable[[Any], Any]:
+    """Replaces missing values, as a fitted SimpleImputer with `missing_values=np.nan`.
+
+    In a numeric column pandas stores None as NaN, so both are imputed. In an object
+    column None is kept as is, and SimpleImputer leaves it alone.
+    """
+    if numeric:
+        return lambda value: fill if value is None or _is_nan(value) else value
+    return lambda value: fill if _is_nan(value) else value
+
+
+def _scaler(mean: float, scale: float) -> Callable[[Any], Any]:
+    """Scales a value, with the same float operations as a fitted StandardScaler."""
+    return lambda value: (math.nan if value is None else float(value) - mean) / scale
+
+
+def _compile_transformer(transformer: Any, columns: Sequence[str]) -> Tuple[Encoder, int]:
+    """Compiles one transformer of a ColumnTransformer into an encoder.
+
+    Returns:
+        Tuple[Encoder, int]: The encoder and the number of features it outputs.
+
+    Raises:
+        ValueError: If the transformer has a step that cannot be compiled.
+    """
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    if transformer == 'passthrough':
+        steps = []
+    elif isinstance(transformer, Pipeline):
+        steps = [step for _, step in transformer.steps if step != 'passthrough']
+    else:
+        steps = [transformer]
+
+    # The steps applied to the value of each column, in order
+    chains: List[List[Callable[[Any], Any]]] = [[] for _ in columns]
+    categories: List[Dict[Any, int]] | None = None
+    nan_indexes: List[int | None] = []
+    width = len(columns)
+
+    for step in steps:
+        if categories is not None:
+            raise ValueError('OneHotEncoder must be the last step of a transformer.')
+
+        if isinstance(step, SimpleImputer):
+            if step.add_indicator or not _is_nan(step.missing_values):
+                raise ValueError('Only SimpleImputer with missing_values=np.nan and without indicator can be compiled.')
+            numeric = step.statistics_.dtype.kind in 'fiu'
+            for chain, fill in zip(chains, step.statistics_.tolist()):
+                chain.append(_imputer(fill=fill, numeric=numeric))
+
+        elif isinstance(step, StandardScaler):
+            means = step.mean_.tolist() if step.with_mean else [0.0] * len(columns)
+            scales = step.scale_.tolist() if step.with_std else [1.0] * len(columns)
+            for chain, mean, scale in zip(chains, means, scales):
+                chain.append(_scaler(mean=mean, scale=scale))
+
+        elif isinstance(step, OneHotEncoder):
+            if step.drop is not None or step.handle_unknown != 'ignore' or step.min_frequency is not None or step.max_categories is not None:
+                raise ValueError('Only OneHotEncoder with handle_unknown="ignore", without drop or infrequent categories can be compiled.')
+            categories = []
+            for column_categories in step.categories_:
+                values = column_categories.tolist()
+                categories.append({value: index for index, value in enumerate(values) if not _is_nan(value)})
+                nan_indexes.append(next((index for index, value in enumerate(values) if _is_nan(value)), None))
+            width = sum(len(column_categories) for column_categories in step.categories_)
+
+        else:
+            raise ValueError(f'{type(step).__name__} cannot be compiled.')
+
+    def _values(record: Dict[str, Any]) -> List[Any]:
+        values = []
+        for column, chain in zip(columns, chains):
+            value = record.get(column)
+            for apply in chain:
+                value = apply(value)
+            values.append(value)
+        return values
+
+    if categories is None:
+
+        def _encode(record: Dict[str, Any], row: List[float]) -> None:
+            row.extend(math.nan if value is None else float(value) for value in _values(record))
+
+        return _encode, width
+
+    def _encode_one_hot(record: Dict[str, Any], row: List[float]) -> None:
+        for value, column_categories, nan_index in zip(_values(record), categories, nan_indexes):
+            one_hot = [0.0] * (len(column_categories) + (nan_index is not None))
+            # Unknown values are all zeros, as with handle_unknown='ignore'
+            index = nan_index if _is_nan(value) else column_categories.get(value)
+            if index is not None:
+                one_hot[index] = 1.0
+            row.extend(one_hot)
+
+    return _encode_one_hot, width
+
+
+class CompiledPipeline:
+    """The preprocessing of a fitted pipeline as plain Python, followed by its fitted classifier.
+
+    Args:
+        encoders (List[Encoder]): The encoders of the ColumnTransformer, in its column order.
+        n_features (int): The number of features the encoders output.
+        classifier (ClassifierMixin): The fitted classifier of the pipeline, or an equivalent with a `predict` method.
+    """
+
+    def __init__(self, encoders: List[Encoder], n_features: int, classifier: ClassifierMixin) -> None:
+        """Keeps the encoders and the classifier."""
+        self.encoders = encoders
+        self.n_features = n_features
+        self.classifier = classifier
+
+    def transform(self, records: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Encodes records into the feature matrix of the classifier.
+
+        Args:
+            records (Sequence[Dict[str, Any]]): The features of each record, as validated by `records.validate`.
+
+        Returns:
+            np.ndarray: A float matrix with one row per record.
+        """
+        import numpy as np
+
+        rows = []
+        for record in records:
+            row: List[float] = []
+            for encode in self.encoders:
+                encode(record, row)
+            rows.append(row)
+        return np.array(rows, dtype=np.float64).reshape(len(records), self.n_features)
+
+    def predict(self, records: Sequence[Dict[str, Any]]) -> List[Any]:
+        """Predicts records, as `pipeline.predict` on a DataFrame of them.
+
+        Args:
+            records (Sequence[Dict[str, Any]]): The features of each record, as validated by `records.validate`.
+
+        Returns:
+            List[Any]: The prediction of each record.
+        """
+        return self.classifier.predict(self.transform(records)).tolist()
+
+
+def compile_pipeline(pipeline: Pipeline, classifier: Any = None) -> CompiledPipeline:
+    """Compiles a fitted pipeline made of a ColumnTransformer and a classifier.
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline, as trained by `train_models.titanic_train`.
+        classifier (Any, optional): Predicts instead of the classifier of the pipeline, as `forest.Forest`
+            does from the exported arrays of the same forest. Defaults to the classifier of the pipeline.
+
+    Returns:
+        CompiledPipeline: The compiled pipeline.
+
+    Raises:
+        ValueError: If the pipeline has a step that cannot be compiled.
+    """
+    from sklearn.compose import ColumnTransformer
+
+    if len(pipeline.steps) != 2 or not isinstance(pipeline.steps[0][1], ColumnTransformer):
+        raise ValueError('Only a ColumnTransformer followed by a classifier can be compiled.')
+
+    preprocessor: ColumnTransformer = pipeline.steps[0][1]
+    if preprocessor.sparse_output_:
+        raise ValueError('A ColumnTransformer with a sparse output cannot be compiled.')
+
+    encoders = []
+    n_features = 0
+    for _, transformer, columns in preprocessor.transformers_:
+        if transformer == 'drop' or len(columns) == 0:
+            continue
+        if not all(isinstance(column, str) for column in columns):
+            raise ValueError('Only columns selected by name can be compiled.')
+
+        encode, width = _compile_transformer(transformer=transformer, columns=list(columns))
+        encoders.append(encode)
+        n_features += width
+
+    if classifier is None:
+        classifier = pipeline.steps[-1][1]
+    elif classifier.n_features_in_ != n_features or classifier.classes_.tolist() != pipeline.classes_.tolist():
+        raise ValueError('The classifier does not have the features and classes of the pipeline.')
+
+    return CompiledPipeline(encoders=encoders, n_features=n_features, classifier=classifier)
@@ -0,0 +1,158 @@
+"""A RandomForestClassifier scored over the flat arrays exported by `c_train_model`.
+
+`RandomForestClassifier.predict` walks each tree in turn through the generic
+sklearn machinery, with a fixed cost per tree and per call that dominates
+small batches. Here every sample walks every tree at once: one NumPy step
+per level, over the (tree, sample) pairs that have not reached a leaf yet.
+The arrays are loaded from a `.npz` file, or memory mapped from the mmap
+artifact of the training, without unpickling the estimator.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Mapping
+
+if TYPE_CHECKING:
+    import numpy as np
+    from sklearn.pipeline import Pipeline
+
+ARRAYS = (
+    'feature',
+    'threshold',
+    'children_left',
+    'children_right',
+    'missing_go_to_left',
+    'value',
+    'roots',
+    'classes',
+    'max_depth',
+    'n_features',
+)
+
+
+class Forest:
+    """Predicts as the RandomForestClassifier the arrays were exported from.
+
+    Args:
+        arrays (Mapping[str, np.ndarray]): The arrays returned by `forest.export_forest` in `c_train_model`.
+
+    Raises:
+        ValueError: If an array is missing.
+    """
+
+    def __init__(self, arrays: Mapping[str, np.ndarray]) -> None:
+        """Keeps the arrays of the forest."""
+        missing = [name for name in ARRAYS if name not in arrays]
+        if missing:
+            raise ValueError(f'The forest is missing the arrays {missing}.')
+
+        self.arrays: Dict[str, np.ndarray] = {name: arrays[name] for name in ARRAYS}
+        self.classes_ = self.arrays['classes']
+        self.n_features_in_ = int(self.arrays['n_features'])
+        self.max_depth = int(self.arrays['max_depth'])
+
+        import numpy as np
+
+        # Leaves are their own children. The left and right child of node i are at 2i and 2i + 1,
+        # so the next node is a single lookup
+        self._is_leaf = self.arrays['children_left'] == np.arange(len(self.arrays['children_left']))
+        self._children = np.stack([self.arrays['children_left'], self.arrays['children_right']], axis=1).ravel()
+
+    @classmethod
+    def load(cls, file: str | BinaryIO) -> Forest:
+        """Loads a forest saved by `forest.forest_to_bytes` in `c_train_model`.
+
+        Args:
+            file (str | BinaryIO): The path or the file object of the `.npz` file.
+
+        Returns:
+            Forest: The forest.
+        """
+        import numpy as np
+
+        with np.load(file, allow_pickle=False) as npz:
+            return cls({name: npz[name] for name in npz.files})
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Finds the leaf of each sample in each tree.
+
+        Args:
+            X (np.ndarray): The feature matrix, one row per sample.
+
+        Returns:
+            np.ndarray: The index of the leaf of each sample, one row per tree.
+        """
+        import numpy as np
+
+        # Trees split on float32 features against float64 thresholds, as sklearn does
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'X must have {self.n_features_in_} features, got shape {X.shape}.')
+
+        arrays = self.arrays
+        n_trees, n_samples = len(arrays['roots']), X.shape[0]
+
+        # One (tree, sample) pair per position, tree by tree, with the offset of the sample in the flat X
+        nodes = np.repeat(arrays['roots'], n_samples)
+        offsets = np.tile(np.arange(n_samples) * X.shape[1], n_trees)
+        X = X.ravel()
+
+        active = np.flatnonzero(~self._is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            values = X[offsets[active] + arrays['feature'][current]]
+            go_right = ~((values <= arrays['threshold'][current]) | (np.isnan(values) & arrays['missing_go_to_left'][current]))
+            nodes[active] = children = self._children[2 * current + go_right]
+            active = active[~self._is_leaf[children]]
+        return nodes.reshape(n_trees, n_samples)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Predicts the class probabilities of each sample, the mean of the probabilities of the trees.
+
+        Args:
+            X (np.ndarray): The feature matrix, one row per sample.
+
+        Returns:
+            np.ndarray: The probability of each class, one row per sample.
+        """
+        import numpy as np
+
+        leaves = self.apply(X)
+        value = self.arrays['value']
+
+        # Summed tree by tree, in the order of the forest, for the same rounding as sklearn
+        proba = np.zeros((leaves.shape[1], value.shape[1]), dtype=np.float64)
+        for tree_leaves in leaves:
+            proba += value[tree_leaves]
+        proba /= leaves.shape[0]
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predicts the class of each sample.
+
+        Args:
+            X (np.ndarray): The feature matrix, one row per sample.
+
+        Returns:
+            np.ndarray: The class of each sample.
+        """
+        import numpy as np
+
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def pipeline_from_artifact(artifact: Dict[str, Any]) -> Pipeline:
+    """Rebuilds the pipeline from the mmap artifact of the training, `forest.mmap_artifact` in `c_train_model`.
+
+    Loaded with `joblib.load(mmap_mode='r')`, the arrays of the forest are read only views of the
+    file: the workers of an instance share its pages, and loading only maps it.
+
+    Args:
+        artifact (Dict[str, Any]): The loaded artifact, with the `preprocessor` pipeline and the `forest` arrays.
+
+    Returns:
+        Pipeline: The preprocessing steps followed by the forest, which predicts as the pipeline that was trained.
+    """
+    from sklearn.pipeline import Pipeline
+
+    return Pipeline(steps=artifact['preprocessor'].steps + [('classifier', Forest(artifact['forest']))])
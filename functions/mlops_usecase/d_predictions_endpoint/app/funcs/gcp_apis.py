@@ -1,8 +1,21 @@
+from __future__ import annotations
 
+import atexit
 import json
-from typing import Any, Dict, Sequence
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Sequence
 
-from google.cloud import bigquery, storage
+if TYPE_CHECKING:
+    import pandas as pd
+    from google.cloud import bigquery, storage
+
+# The training saves the flat arrays of the forest next to the model, as `<model>.forest.npz`
+FOREST_SUFFIX = '.forest.npz'
+
+# The training writes the latest version of the model to `<model>.latest`, its versions are `<model>/<version>`
+LATEST_SUFFIX = '.latest'
 
 
 def transfer_blob_to_temp(
@@ -49,8 +62,9 @@ def bigquery_insert_json_row(
         table_fqn (str): The fully qualified name of the table.
         row (Dict[str, Any]): The row to insert into the table.
     """
-    def _filter_dict(d: Dict[str, str]) -> Dict[str, str]:
-        return {k: v for k, v in d.items() if isinstance(v, str) and bool(v.strip())}
+    def _filter_dict(d: Dict[str, Any]) -> Dict[str, Any]:
+        # The blank strings are missing values, the numbers are kept, e.g. the prediction
+        return {k: v for k, v in d.items() if v is not None and not (isinstance(v, str) and not v.strip())}
 
     if not isinstance(row, Sequence) and isinstance(row, Dict):
         row = [row]
@@ -65,3 +79,371 @@ def bigquery_insert_json_row(
         return errors
     else:
         return None
+
+
+def storage_list_blobs(CS: storage.Client, bucket_name: str, prefix: str) -> List[str]:
+    """Lists the names of the blobs under a prefix.
+
+    Args:
+        CS (storage.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket.
+        prefix (str): The prefix of the names.
+
+    Returns:
+        List[str]: The names of the blobs, sorted.
+    """
+    return sorted(blob.name for blob in CS.list_blobs(bucket_name, prefix=prefix))
+
+
+def storage_read_bytes(CS: storage.Client, bucket_name: str, blob_name: str) -> bytes | None:
+    """Downloads a blob.
+
+    Args:
+        CS (storage.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket.
+        blob_name (str): The name of the blob.
+
+    Returns:
+        bytes | None: The contents of the blob, None if it does not exist.
+    """
+    blob = CS.bucket(bucket_name).get_blob(blob_name)
+    if blob is None:
+        return None
+    return blob.download_as_bytes()
+
+
+def storage_write_bytes(CS: storage.Client, bucket_name: str, blob_name: str, data: bytes, content_type: str = 'application/octet-stream') -> None:
+    """Uploads a blob, in place of the one of the same name if any.
+
+    Args:
+        CS (storage.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket.
+        blob_name (str): The name of the blob.
+        data (bytes): The contents of the blob.
+        content_type (str, optional): The content type of the blob. Defaults to `application/octet-stream`.
+    """
+    CS.bucket(bucket_name).blob(blob_name).upload_from_string(data, content_type=content_type)
+
+
+def bigquery_table_num_rows(BQ: bigquery.Client, table_fqn: str) -> int:
+    """The number of rows of a table.
+
+    Args:
+        BQ (bigquery.Client): The bigquery client.
+        table_fqn (str): The fully qualified name of the table.
+
+    Returns:
+        int: The rows of the table, as of its last change.
+    """
+    return int(BQ.get_table(table_fqn).num_rows or 0)
+
+
+def bigquery_read_rows(BQ: bigquery.Client, table_fqn: str, start: int, max_rows: int) -> pd.DataFrame:
+    """Reads a range of the rows of a table, without running a query.
+
+    Args:
+        BQ (bigquery.Client): The bigquery client.
+        table_fqn (str): The fully qualified name of the table.
+        start (int): The index of the first row.
+        max_rows (int): The most rows read.
+
+    Returns:
+        pd.DataFrame: The rows.
+    """
+    rows = BQ.list_rows(table_fqn, start_index=start, max_results=max_rows)
+    return rows.to_dataframe(create_bqstorage_client=False)
+
+
+def bigquery_load_json_from_storage(BQ: bigquery.Client, table_fqn: str, source_uri: str, job_id: str | None = None) -> int:
+    """Appends NDJSON files of Google Cloud Storage to a table, with a single load job.
+
+    The load job is atomic: all the rows of the files are appended, or none of them. When
+    a job with the id `job_id` already exists, the files are not loaded again: that job
+    is waited on instead, so a load started by a run that crashed is never repeated.
+
+    Args:
+        BQ (bigquery.Client): The bigquery client.
+        table_fqn (str): The fully qualified name of the table.
+        source_uri (str): The `gs://` URI of the files, with a `*` wildcard to load several.
+        job_id (str, optional): The id of the load job. Defaults to a random one.
+
+    Returns:
+        int: The rows appended.
+
+    Raises:
+        google.api_core.exceptions.GoogleAPICallError: If the load job fails.
+    """
+    from google.api_core import exceptions
+    from google.cloud import bigquery
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        # The rows hold the other columns of the record, as the rows logged by the endpoint
+        ignore_unknown_values=True,
+    )
+    try:
+        job = BQ.load_table_from_uri(source_uri, table_fqn, job_id=job_id, job_config=job_config)
+    except exceptions.Conflict:
+        if job_id is None:
+            raise
+        job = BQ.get_job(job_id)
+    job.result()
+    return int(job.output_rows or 0)
+
+
+class BigQueryRowLogger:
+    """Inserts rows into a BigQuery table from a background thread, off the request path.
+
+    Rows are put in a bounded queue and a worker thread inserts them in batches of up
+    to `max_rows`, or sooner when the oldest waiting row is `max_latency` seconds old.
+    When the queue is full, a call to `log` blocks up to `put_timeout` seconds in all for
+    room, slowing the callers down to the pace of BigQuery, then drops the rows left and
+    counts them.
+
+    Rows still in the queue when the process exits are inserted by `close`, registered
+    to run at exit.
+
+    Args:
+        BQ (bigquery.Client): The bigquery client.
+        table_fqn (str): The fully qualified name of the table.
+        max_rows (int, optional): The most rows of an insert. Defaults to 500.
+        max_latency (float, optional): Seconds a row waits at most before being inserted. Defaults to 1.
+        max_queue_rows (int, optional): The most rows waiting to be inserted. Defaults to 10000.
+        put_timeout (float, optional): Seconds a call to `log` waits for room in a full queue,
+            whatever its number of rows. Defaults to 0.1.
+
+    Attributes:
+        inserted (int): The number of rows inserted.
+        failed (int): The number of rows BigQuery did not insert.
+        dropped (int): The number of rows dropped because the queue was full.
+    """
+
+    def __init__(
+        self,
+        BQ: bigquery.Client,
+        table_fqn: str,
+        max_rows: int = 500,
+        max_latency: float = 1.0,
+        max_queue_rows: int = 10000,
+        put_timeout: float = 0.1,
+    ) -> None:
+        """Starts the worker thread."""
+        self.BQ = BQ
+        self.table_fqn = table_fqn
+        self.max_rows = max_rows
+        self.max_latency = max_latency
+        self.put_timeout = put_timeout
+        self.inserted = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_rows)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='bigquery-row-logger', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Queues rows to be inserted, without waiting for the insert.
+
+        Args:
+            rows (Sequence[Dict[str, Any]]): The rows to insert into the table.
+        """
+        # One deadline for all the rows, a batch waits no longer than a single row
+        deadline = time.monotonic() + self.put_timeout
+        dropped = 0
+        for row in rows:
+            try:
+                self._queue.put(row, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                dropped += 1
+
+        if dropped:
+            with self._lock:
+                self.dropped += dropped
+                total_dropped = self.dropped
+            print(json.dumps({
+                'message': f'Dropped {dropped} rows for {self.table_fqn}, the queue is full',
+                'severity': 'WARNING',
+                'rows_dropped': total_dropped,
+            }))
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Inserts the rows queued so far and waits for the insert.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the insert. Defaults to no limit.
+        """
+        if self._closed:
+            return
+
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        flushed.wait(timeout=timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Inserts the queued rows and stops the worker thread.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the last insert. Defaults to 10.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        """Inserts the queued rows in batches, until `close` queues None."""
+        batch: List[Dict[str, Any]] = []
+        deadline = 0.0
+
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0) if batch else None)
+            except queue.Empty:
+                # The oldest row waited long enough
+                self._insert(batch)
+                batch = []
+                continue
+
+            if item is None or isinstance(item, threading.Event):
+                self._insert(batch)
+                batch = []
+                if item is None:
+                    return
+                item.set()
+                continue
+
+            if not batch:
+                deadline = time.monotonic() + self.max_latency
+            batch.append(item)
+            if len(batch) >= self.max_rows:
+                self._insert(batch)
+                batch = []
+
+    def _insert(self, batch: List[Dict[str, Any]]) -> None:
+        """Inserts a batch of rows, counting the ones that failed."""
+        if not batch:
+            return
+
+        try:
+            errors = bigquery_insert_json_row(BQ=self.BQ, table_fqn=self.table_fqn, row=batch)
+        except Exception as e:
+            print(json.dumps({'message': f'Failed to insert {len(batch)} rows: {e}', 'severity': 'ERROR'}))
+            self.failed += len(batch)
+            return
+
+        failed = len({error['index'] for error in errors}) if errors else 0
+        self.failed += failed
+        self.inserted += len(batch) - failed
+
+
+class BlobPoller:
+    """Polls a Cloud Storage blob from a background thread, and calls back with its contents when it changes.
+
+    The generation of a blob changes on every write. Each poll is a metadata request, the
+    contents are only downloaded when the generation changed, at that generation. When the
+    callback fails the generation is left as it was, and the next poll tries again.
+
+    Args:
+        CS (storage.Client): A Google Cloud Storage client object.
+        bucket_name (str): The name of the bucket of the blob.
+        blob_name (str): The name of the blob.
+        on_change (Callable[[str], None]): Called with the contents of the blob when it changes.
+        interval (float, optional): Seconds between two polls. Defaults to 60.
+
+    Attributes:
+        generation (int | None): The generation of the blob last passed to `on_change`.
+        polls (int): The number of polls.
+        changes (int): The number of changes passed to `on_change`.
+        failures (int): The number of polls that failed, in the request or in `on_change`.
+    """
+
+    def __init__(
+        self,
+        CS: storage.Client,
+        bucket_name: str,
+        blob_name: str,
+        on_change: Callable[[str], None],
+        interval: float = 60.0,
+    ) -> None:
+        """Keeps the blob to poll, `start` starts polling it."""
+        self.CS = CS
+        self.bucket_name = bucket_name
+        self.blob_name = blob_name
+        self.on_change = on_change
+        self.interval = interval
+        self.generation: int | None = None
+        self.polls = 0
+        self.changes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def poll(self) -> bool:
+        """Checks the blob once, and calls back if it changed.
+
+        Returns:
+            bool: Whether the blob exists.
+
+        Raises:
+            Exception: The errors of the request or of `on_change`.
+        """
+        with self._lock:
+            self.polls += 1
+            blob = self.CS.bucket(self.bucket_name).get_blob(self.blob_name)
+            if blob is None:
+                return False
+
+            if blob.generation != self.generation:
+                self.on_change(blob.download_as_text(if_generation_match=blob.generation))
+                self.generation = blob.generation
+                self.changes += 1
+            return True
+
+    def start(self) -> None:
+        """Starts polling in a background thread, every `interval` seconds."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='blob-poller', daemon=True)
+            self._thread.start()
+
+    def after_fork(self, CS: storage.Client) -> None:
+        """Starts polling again in a forked process, with a client of the process.
+
+        A forked process does not inherit the thread of the parent, and must not share its connections.
+
+        Args:
+            CS (storage.Client): A Google Cloud Storage client of the process.
+        """
+        self.CS = CS
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.start()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stops polling, after the poll in progress if any.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the poll in progress. Defaults to 10.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        """Polls until `close`, logging the failures."""
+        while not self._stopped.wait(timeout=self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.failures += 1
+                print(json.dumps({
+                    'message': f'Polling gs://{self.bucket_name}/{self.blob_name} failed: {e}',
+                    'severity': 'ERROR',
+                    'poll_failures': self.failures,
+                }))
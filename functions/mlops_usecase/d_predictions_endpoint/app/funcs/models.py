@@ -1,19 +1,88 @@
 """Models for the ingest_data function. Simplifies type hinting."""
-from typing import NamedTuple
 
-from google.cloud import bigquery, storage
+from __future__ import annotations
 
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Tuple
 
-class GCPClients(NamedTuple):
-    """A named tuple that contains clients for Google Cloud Platform services.
+if TYPE_CHECKING:
+    from google.cloud import bigquery, storage
+    from sklearn.pipeline import Pipeline
+
+
+def _build_storage_client(gcp_project_id: str | None) -> storage.Client:
+    from google.cloud import storage
+
+    return storage.Client(project=gcp_project_id)
+
+
+def _build_bigquery_client(gcp_project_id: str | None) -> bigquery.Client:
+    from google.cloud import bigquery
+
+    return bigquery.Client(project=gcp_project_id)
+
+
+class GCPClients:
+    """Clients for Google Cloud Platform services, each one built the first time it is used.
+
+    The google.cloud libraries are imported by the first use of their client too, so a
+    code path only pays for the clients it needs. Clients given to the constructor are
+    used as they are, e.g. mocks in tests.
+
+    Args:
+        gcp_project_id (str, optional): The project of the clients built on first use.
+        storage_client (google.cloud.storage.Client, optional): A client to use instead of building one.
+        bigquery_client (google.cloud.bigquery.Client, optional): A client to use instead of building one.
 
     Attributes:
         storage_client (google.cloud.storage.Client): A client for Google Cloud Storage.
         bigquery_client (google.cloud.bigquery.Client): A client for Google BigQuery.
-        publisher (google.cloud.pubsub_v1.PublisherClient): A client for Google Cloud Pub/Sub.
+        closed (bool): Whether the clients are closed, after which they cannot be used.
     """
-    storage_client: storage.Client
-    bigquery_client: bigquery.Client
+
+    def __init__(
+        self,
+        gcp_project_id: str | None = None,
+        storage_client: storage.Client | None = None,
+        bigquery_client: bigquery.Client | None = None,
+    ) -> None:
+        """Keeps the given clients, the others are built on first use."""
+        self.gcp_project_id = gcp_project_id
+        self._clients: Dict[str, Any] = {
+            'storage_client': storage_client,
+            'bigquery_client': bigquery_client,
+        }
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _client(self, name: str, build: Callable[[str | None], Any]) -> Any:
+        """Returns the client called `name`, built only once even when first used by several threads."""
+        if self.closed:
+            raise ValueError('The GCP clients are closed.')
+
+        if self._clients[name] is None:
+            with self._lock:
+                if self._clients[name] is None:
+                    self._clients[name] = build(self.gcp_project_id)
+        return self._clients[name]
+
+    def close(self) -> None:
+        """Closes the clients built so far, and their connection pools."""
+        with self._lock:
+            self.closed = True
+            for client in self._clients.values():
+                if client is not None:
+                    client.close()
+
+    @property
+    def storage_client(self) -> storage.Client:
+        """The Google Cloud Storage client."""
+        return self._client('storage_client', _build_storage_client)
+
+    @property
+    def bigquery_client(self) -> bigquery.Client:
+        """The Google BigQuery client."""
+        return self._client('bigquery_client', _build_bigquery_client)
 
 
 class EnvVars(NamedTuple):
@@ -24,8 +93,83 @@ class EnvVars(NamedTuple):
         bucket_name (str): The name of the Google Cloud Storage bucket where the model artifacts will be stored.
         model_location (str): The location of the trained model within the Google Cloud Storage bucket.
         predictions_table (str): The name of the BigQuery table where prediction results will be stored.
+        max_batch_records (int): The maximum number of records of a batch prediction request.
+        log_batch_rows (int): The most prediction rows inserted into BigQuery at once.
+        log_flush_seconds (float): Seconds a prediction row waits at most before being inserted.
+        log_queue_rows (int): The most prediction rows waiting to be inserted, before they are dropped.
+        model_poll_seconds (float): Seconds between two checks for a new version of the model, 0 to never check.
+        prediction_cache_entries (int): The most predictions cached, 0 to disable the cache.
+        prediction_cache_seconds (float): Seconds a cached prediction is kept.
+        prediction_cache_log_every (int): The requests between two logs of the counters of the cache.
+        coalesce_window_ms (float): Milliseconds a single record request waits for concurrent ones, to be
+            predicted in one call, 0 to predict each request on its own.
+        coalesce_max_records (int): The records queued that end the wait of the concurrent requests.
     """
     gcp_project_id: str
     bucket_name: str
     model_location: str
     predictions_table: str
+    max_batch_records: int = 1000
+    log_batch_rows: int = 500
+    log_flush_seconds: float = 1.0
+    log_queue_rows: int = 10000
+    model_poll_seconds: float = 60.0
+    prediction_cache_entries: int = 10000
+    prediction_cache_seconds: float = 3600.0
+    prediction_cache_log_every: int = 100
+    coalesce_window_ms: float = 0.0
+    coalesce_max_records: int = 64
+
+
+class ServeOptions(NamedTuple):
+    """A named tuple representing the options of the self-hosted server of the endpoint, see `serve`.
+
+    Attributes:
+        bind (str): The address the server listens on, `host:port`.
+        workers (int): The worker processes, forked once the model is loaded.
+        threads (int): The threads of each worker, each one serving a request at a time.
+        blas_threads (int): The BLAS and OpenMP threads of each worker.
+        timeout (int): Seconds a request runs at most before its worker is restarted.
+        max_requests (int): The requests a worker serves before it is replaced, 0 to keep it.
+    """
+    bind: str = '0.0.0.0:8080'
+    workers: int = 1
+    threads: int = 8
+    blas_threads: int = 1
+    timeout: int = 30
+    max_requests: int = 0
+
+
+class ScoreOptions(NamedTuple):
+    """A named tuple representing the options of the bulk scoring job, see `score`.
+
+    Attributes:
+        source (str): The records scored: a BigQuery table, `project.dataset.table`, or the CSV
+            files of a Google Cloud Storage prefix, `gs://bucket/prefix`.
+        job (str): The name of the job, its chunks are written under `scoring/<job>/` of the
+            bucket of the models. Running a job again resumes it.
+        chunk_rows (int): The rows of a chunk of a table. A CSV file is a chunk.
+        workers (int): The processes scoring the chunks, forked once the model is loaded.
+        blas_threads (int): The BLAS and OpenMP threads of each process.
+    """
+    source: str
+    job: str
+    chunk_rows: int = 50000
+    workers: int = 1
+    blas_threads: int = 1
+
+
+class ServedModel(NamedTuple):
+    """A loaded version of the model, swapped in whole when a new version is published.
+
+    Attributes:
+        version (str): The version of the model, logged with its predictions.
+        pipeline (Pipeline): The loaded pipeline.
+        compiled_pipeline (Any): The compiled pipeline, `compiled.CompiledPipeline`, None if the
+            pipeline cannot be compiled.
+        files (Tuple[str, ...]): The local files of the version, removed once it is swapped out.
+    """
+    version: str
+    pipeline: Pipeline
+    compiled_pipeline: Any
+    files: Tuple[str, ...] = ()
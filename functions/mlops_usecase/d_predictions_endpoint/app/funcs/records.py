@@ -0,0 +1,195 @@
+"""Parsing and validation of the records sent to the predictions endpoint."""
+
+import math
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from . import codec
+
+# The features of the model and the type it is trained with, as in facts_titanic_schema.json
+FEATURES: Dict[str, type] = {
+    'Age': float,
+    'SibSp': int,
+    'Parch': int,
+    'Fare': float,
+    'Sex': str,
+    'Embarked': str,
+    'Pclass': int,
+}
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# The model of the rows of the predictions table
+MODEL_ID = 'titanic_basic'
+
+
+class Record(NamedTuple):
+    """A record of a prediction request.
+
+    Attributes:
+        data (Any): The record as sent, None if it is not valid JSON.
+        features (Dict[str, Any] | None): The features of the model, converted to the types it is
+            trained with. None if the record is not valid.
+        errors (List[str]): Why the record is not valid, empty if it is.
+    """
+    data: Any
+    features: Dict[str, Any] | None
+    errors: List[str]
+
+
+def _string(name: str) -> Callable[[Any], Any]:
+    """The converter of a string feature."""
+    error = f'{name} must be a string.'
+
+    def convert(value: Any) -> Any:
+        if value is None or type(value) is str:
+            return value
+        raise ValueError(error)
+
+    return convert
+
+
+def _number(name: str, integer: bool) -> Callable[[Any], Any]:
+    """The converter of a number feature, to an int or to a float."""
+    not_a_number = f'{name} must be a number.'
+    not_finite = f'{name} must be a finite number.'
+    not_an_integer = f'{name} must be an integer.'
+
+    def convert(value: Any) -> Any:
+        if value is None:
+            return None
+
+        # JSON numbers first. JSON booleans are ints in Python, but never a valid number of passengers or fare
+        value_type = type(value)
+        if value_type is int:
+            return value if integer else float(value)
+        if value_type is float:
+            number = value
+        elif value_type is str:
+            try:
+                number = float(value)
+            except ValueError:
+                raise ValueError(not_a_number) from None
+        else:
+            raise ValueError(not_a_number)
+
+        if not math.isfinite(number):
+            raise ValueError(not_finite)
+        if integer:
+            if not number.is_integer():
+                raise ValueError(not_an_integer)
+            return int(number)
+        return number
+
+    return convert
+
+
+def compile_spec(features: Dict[str, type]) -> Tuple[Tuple[str, Callable[[Any], Any]], ...]:
+    """Compiles the validation of the features, once, into a converter per feature.
+
+    Each converter checks and converts a value to the type the model is trained with, and raises
+    a ValueError saying why it cannot. Missing values are kept as None, the pipeline imputes them.
+
+    Args:
+        features (Dict[str, type]): The type of each feature, `str`, `int` or `float`.
+
+    Returns:
+        Tuple[Tuple[str, Callable[[Any], Any]], ...]: The name and the converter of each feature, in order.
+
+    Raises:
+        ValueError: If a feature has another type.
+    """
+    spec = []
+    for name, feature_type in features.items():
+        if feature_type is str:
+            spec.append((name, _string(name)))
+        elif feature_type in (int, float):
+            spec.append((name, _number(name, integer=feature_type is int)))
+        else:
+            raise ValueError(f'{name} has a type without a converter, {feature_type}.')
+    return tuple(spec)
+
+
+# The validation of the records, compiled from the input columns of the model
+SPEC = compile_spec(FEATURES)
+
+
+def validate(data: Any) -> Record:
+    """Validates a record and converts its features to the types the model is trained with.
+
+    Args:
+        data (Any): The record as sent.
+
+    Returns:
+        Record: The record, with its features if it is valid or its errors if it is not.
+    """
+    if not isinstance(data, dict):
+        return Record(data=data, features=None, errors=['The record must be a JSON object.'])
+
+    features: Dict[str, Any] = {}
+    errors: List[str] = []
+    for name, convert in SPEC:
+        try:
+            features[name] = convert(data.get(name))
+        except ValueError as e:
+            errors.append(str(e))
+
+    if errors:
+        return Record(data=data, features=None, errors=errors)
+    return Record(data=data, features=features, errors=[])
+
+
+def parse_body(body: bytes, mimetype: str) -> Tuple[List[Record], bool]:
+    """Parses the body of a prediction request into validated records.
+
+    A JSON object is a single record. A JSON array, or an NDJSON body with one JSON
+    object per line, is a batch of records. The body is decoded once, by `codec`.
+
+    Args:
+        body (bytes): The body of the request.
+        mimetype (str): The mimetype of the body, `application/json` or `application/x-ndjson`.
+
+    Returns:
+        Tuple[List[Record], bool]: The records, in the order they were sent, and whether
+        the body is a batch.
+
+    Raises:
+        ValueError: If the body is not valid JSON, or not an object or an array.
+    """
+    if mimetype == NDJSON_MIMETYPE:
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(validate(codec.loads(line)))
+            except codec.JSONDecodeError as e:
+                records.append(Record(data=None, features=None, errors=[f'Invalid JSON: {e}']))
+        return records, True
+
+    data = codec.loads(body)
+    if isinstance(data, list):
+        return [validate(item) for item in data], True
+    if isinstance(data, dict):
+        return [validate(data)], False
+    raise ValueError('The body must be a JSON object or an array of JSON objects.')
+
+
+def prediction_row(data: Dict[str, Any], prediction: Any, prediction_uuid: str, version: str) -> Dict[str, Any]:
+    """The row of the predictions table of a valid record and its prediction.
+
+    Args:
+        data (Dict[str, Any]): The record as sent.
+        prediction (Any): The prediction of the model.
+        prediction_uuid (str): The uuid of the prediction.
+        version (str): The version of the model that predicted it.
+
+    Returns:
+        Dict[str, Any]: The row, the values of the record as strings, without the missing ones,
+        and the prediction as a float, the type of its column.
+    """
+    return {k: str(v) for k, v in data.items() if v is not None} | {
+        'uuid': prediction_uuid,
+        'model_prediction': float(prediction),
+        'model_id': MODEL_ID,
+        'model_version': version,
+    }
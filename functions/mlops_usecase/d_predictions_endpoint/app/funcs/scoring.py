@@ -0,0 +1,243 @@
+"""Chunks, checkpoints and rows of the bulk scoring job, see `score`.
+
+A job scores its source chunk by chunk. Each chunk scored is written as an NDJSON file of
+rows of the predictions table, `chunk-<index>.json`, under the prefix of the job: the files
+written are the checkpoint, a job run again scores only the chunks without one. Once every
+chunk is written, they are appended to the predictions table by a single load job.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from . import codec, models, records
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+GCS_SCHEME = 'gs://'
+
+# The files of a job, under its prefix
+CHUNK_PREFIX = 'chunk-'
+CHUNK_SUFFIX = '.json'
+MANIFEST = 'manifest.json'
+# Written once the chunks are loaded, a job run again does not load them twice
+LOADED = '_LOADED'
+
+
+class Chunk(NamedTuple):
+    """A chunk of the source of a job.
+
+    Attributes:
+        index (int): The index of the chunk, in the order of the source.
+        source (str): The table, or the name of the CSV file in its bucket.
+        start (int): The first row of a chunk of a table.
+        rows (int): The rows of a chunk of a table, 0 for a file.
+    """
+    index: int
+    source: str
+    start: int = 0
+    rows: int = 0
+
+    @property
+    def name(self) -> str:
+        """The name of the file of the rows of the chunk, under the prefix of the job."""
+        return f'{CHUNK_PREFIX}{self.index:06d}{CHUNK_SUFFIX}'
+
+
+class ChunkResult(NamedTuple):
+    """A chunk scored.
+
+    Attributes:
+        index (int): The index of the chunk.
+        rows (int): The records predicted, a row each.
+        invalid (int): The records not valid, without a row.
+        seconds (float): The time to read, score and write the chunk.
+    """
+    index: int
+    rows: int
+    invalid: int
+    seconds: float
+
+
+def split_gcs_uri(uri: str) -> Tuple[str, str]:
+    """The bucket and the prefix of a `gs://bucket/prefix` URI.
+
+    Args:
+        uri (str): The URI.
+
+    Returns:
+        Tuple[str, str]: The name of the bucket and the prefix, possibly empty.
+
+    Raises:
+        ValueError: If the URI is not a `gs://` one.
+    """
+    if not uri.startswith(GCS_SCHEME):
+        raise ValueError(f'{uri} is not a gs:// URI.')
+    bucket_name, _, prefix = uri[len(GCS_SCHEME):].partition('/')
+    return bucket_name, prefix
+
+
+def table_chunks(table_fqn: str, num_rows: int, chunk_rows: int) -> List[Chunk]:
+    """Splits a table in chunks of consecutive rows.
+
+    Args:
+        table_fqn (str): The fully qualified name of the table.
+        num_rows (int): The rows of the table.
+        chunk_rows (int): The most rows of a chunk.
+
+    Returns:
+        List[Chunk]: The chunks, in the order of the rows.
+    """
+    return [
+        Chunk(index=index, source=table_fqn, start=start, rows=min(chunk_rows, num_rows - start))
+        for index, start in enumerate(range(0, num_rows, chunk_rows))
+    ]
+
+
+def file_chunks(blob_names: Iterable[str]) -> List[Chunk]:
+    """A chunk per CSV file.
+
+    Args:
+        blob_names (Iterable[str]): The names of the blobs of the source prefix.
+
+    Returns:
+        List[Chunk]: The chunks, in the order of the names. The other blobs are skipped.
+    """
+    names = sorted(name for name in blob_names if name.lower().endswith('.csv'))
+    return [Chunk(index=index, source=name) for index, name in enumerate(names)]
+
+
+def finished_chunks(blob_names: Iterable[str]) -> Set[int]:
+    """The indexes of the chunks already scored, from the names of the blobs of the job.
+
+    Args:
+        blob_names (Iterable[str]): The names of the blobs under the prefix of the job.
+
+    Returns:
+        Set[int]: The indexes of the chunks with a file of rows.
+    """
+    finished = set()
+    for name in blob_names:
+        base = name.rpartition('/')[2]
+        if base.startswith(CHUNK_PREFIX) and base.endswith(CHUNK_SUFFIX):
+            finished.add(int(base[len(CHUNK_PREFIX):-len(CHUNK_SUFFIX)]))
+    return finished
+
+
+def load_job_id(job: str) -> str:
+    """The id of the load job of a job, the same for every run of the job.
+
+    A run that crashed once the load job started finds it by its id, instead of loading the chunks twice.
+
+    Args:
+        job (str): The name of the job.
+
+    Returns:
+        str: The id, the name with the characters a job id cannot have replaced, and a hash of the name.
+    """
+    digest = hashlib.sha256(job.encode('utf-8')).hexdigest()[:12]
+    return f'scoring-{re.sub(r"[^A-Za-z0-9_-]", "_", job)}-{digest}'
+
+
+def job_manifest(options: models.ScoreOptions, version: str, chunks: int) -> Dict[str, Any]:
+    """What a job scores, saved by its first run and checked by the next ones.
+
+    Args:
+        options (models.ScoreOptions): The options of the job.
+        version (str): The version of the model scoring the job.
+        chunks (int): The chunks of the source.
+
+    Returns:
+        Dict[str, Any]: The manifest of the job.
+    """
+    return {'source': options.source, 'chunk_rows': options.chunk_rows, 'version': version, 'chunks': chunks}
+
+
+def check_manifest(manifest: Dict[str, Any], options: models.ScoreOptions, chunks: int | None = None) -> None:
+    """Checks that a job is resumed with the options it started with, its chunks would not match otherwise.
+
+    Args:
+        manifest (Dict[str, Any]): The manifest saved by the first run of the job.
+        options (models.ScoreOptions): The options of this run.
+        chunks (int, optional): The chunks of the source now, not checked if None. Defaults to None.
+
+    Raises:
+        ValueError: If the source or the rows of a chunk differ, or the source has other chunks.
+    """
+    for name in ('source', 'chunk_rows'):
+        if manifest[name] != getattr(options, name):
+            raise ValueError(f'Job {options.job} was started with {name} {manifest[name]}, not {getattr(options, name)}.')
+    if chunks is not None and manifest['chunks'] != chunks:
+        raise ValueError(f'Job {options.job} was started with {manifest["chunks"]} chunks, its source has {chunks} now.')
+
+
+def frame_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """The records of a chunk, as the endpoint receives them.
+
+    Missing values are None. Whole floats are integers: the integer columns of a CSV file
+    with missing values are read as floats.
+
+    Args:
+        frame (pd.DataFrame): The rows of the chunk.
+
+    Returns:
+        List[Dict[str, Any]]: A record per row.
+    """
+    data = frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+    for record in data:
+        for name, value in record.items():
+            if type(value) is float and value.is_integer():
+                record[name] = int(value)
+    return data
+
+
+def score_records(data: List[Dict[str, Any]], predict: Callable[[List[Dict[str, Any]]], List[Any]], version: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Validates records and predicts the valid ones, with a single call to the model.
+
+    Args:
+        data (List[Dict[str, Any]]): The records.
+        predict (Callable[[List[Dict[str, Any]]], List[Any]]): Predicts the features of valid records.
+        version (str): The version of the model.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], int]: The rows of the predictions table of the valid records,
+        as the endpoint logs them, and the number of records not valid.
+    """
+    valid = [record for record in map(records.validate, data) if record.features is not None]
+    predictions = predict([record.features for record in valid]) if valid else []
+    rows = [
+        records.prediction_row(data=record.data, prediction=prediction, prediction_uuid=str(uuid.uuid1()), version=version)
+        for record, prediction in zip(valid, predictions)
+    ]
+    return rows, len(data) - len(valid)
+
+
+def ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    """Encodes rows as NDJSON, a JSON object per line.
+
+    Args:
+        rows (List[Dict[str, Any]]): The rows.
+
+    Returns:
+        bytes: The UTF-8 encoded lines.
+    """
+    return b''.join(codec.dumps(row) + b'\n' for row in rows)
+
+
+def throughput(rows: int, seconds: float, cores: int) -> Dict[str, float]:
+    """The throughput of a run of a job.
+
+    Args:
+        rows (int): The rows scored by the run.
+        seconds (float): The wall-clock time of the run.
+        cores (int): The cores scoring the chunks.
+
+    Returns:
+        Dict[str, float]: The rows per second, overall and per core.
+    """
+    rows_per_second = rows / seconds if seconds > 0 else 0.0
+    return {'rows_per_second': round(rows_per_second, 1), 'rows_per_second_per_core': round(rows_per_second / max(cores, 1), 1)}
@@ -1,25 +1,58 @@
-import json
+from __future__ import annotations
+
+import contextlib
+import itertools
 import os
+import threading
 import traceback
 import uuid
+from typing import TYPE_CHECKING, Any, Dict, List
 
 import flask
-import joblib
-import pandas as pd
-from flask import abort, jsonify, make_response
-from google.cloud import bigquery, storage
-from sklearn.pipeline import Pipeline
+from flask import abort, make_response
+
+# joblib, pandas and sklearn are imported by the first model load and prediction
+if TYPE_CHECKING:
+	from sklearn.pipeline import Pipeline
 
 try:
-	from funcs import gcp_apis, models
+	from funcs import batching, cache, codec, compiled, forest, gcp_apis, models, records, registry
 except ImportError:
 	from d_predictions_endpoint.app.funcs import (
+		batching,
+		cache,
+		codec,
+		compiled,
+		forest,
 		gcp_apis,
 		models,
+		records,
+		registry,
 	)
 
-# Load the pipeline from the pickle file
-pipeline: Pipeline | None = None
+# The version of the model serving the requests, swapped whole when a new version is published
+served_model: models.ServedModel | None = None
+_served_model_lock = threading.Lock()
+
+# Polls the latest version of the model and swaps it in, off the request path
+model_poller: gcp_apis.BlobPoller | None = None
+
+# The predictions of the features sent again, None when disabled
+prediction_cache: cache.PredictionCache | None = None
+_prediction_cache_lock = threading.Lock()
+# The requests served with the cache, its counters are logged once every `prediction_cache_log_every`
+_prediction_cache_requests = itertools.count(1)
+
+# The bytes of the body of a request logged, a batch can be up to `max_batch_records` records
+_LOGGED_BODY_BYTES = 256
+
+# Predicts the single records of concurrent requests in one call, None when disabled
+request_coalescer: batching.RequestCoalescer | None = None
+_request_coalescer_lock = threading.Lock()
+
+# Inserts the predictions into BigQuery in the background
+prediction_logger: gcp_apis.BigQueryRowLogger | None = None
+_prediction_logger_lock = threading.Lock()
 
 ################
 # 1. Clients ###
@@ -27,21 +60,18 @@ pipeline: Pipeline | None = None
 
 
 def load_clients(gcp_project_id: str) -> models.GCPClients:
-	"""Load the GCP clients.
+	"""Load the GCP clients, shared by every invocation of this instance.
 
 	Args:
 	    gcp_project_id (str): The GCP project ID.
 
 	Returns:
-	    GCPClients: A tuple of GCP clients.
+	    GCPClients: The GCP clients of the process, each one built the first time it is used.
 	        With the following attributes:
 	            storage_client: A storage client.
 	            bigquery_client: A bigquery client.
 	"""
-	storage_client = storage.Client(project=gcp_project_id)
-	bigquery_client = bigquery.Client(project=gcp_project_id)
-
-	return models.GCPClients(storage_client=storage_client, bigquery_client=bigquery_client)
+	return registry.clients.get(gcp_project_id=gcp_project_id)
 
 
 def _env_vars() -> models.EnvVars:
@@ -62,37 +92,359 @@ def _env_vars() -> models.EnvVars:
 		predictions_table=f"""{os.getenv("_GCP_PROJECT_ID", "gcp_project_id")}.\
 {os.getenv("_BIGQUERY_DATASET_ID", "bq_table_fqn_dst")}.\
 {os.getenv("_BIGQUERY_TABLE_ID", "bq_table_fqn_tbl")}""",
+		max_batch_records=int(os.getenv('_MAX_BATCH_RECORDS', '1000')),
+		log_batch_rows=int(os.getenv('_LOG_BATCH_ROWS', '500')),
+		log_flush_seconds=float(os.getenv('_LOG_FLUSH_SECONDS', '1.0')),
+		log_queue_rows=int(os.getenv('_LOG_QUEUE_ROWS', '10000')),
+		model_poll_seconds=float(os.getenv('_MODEL_POLL_SECONDS', '60')),
+		prediction_cache_entries=int(os.getenv('_PREDICTION_CACHE_ENTRIES', '10000')),
+		prediction_cache_seconds=float(os.getenv('_PREDICTION_CACHE_SECONDS', '3600')),
+		prediction_cache_log_every=int(os.getenv('_PREDICTION_CACHE_LOG_EVERY', '100')),
+		coalesce_window_ms=float(os.getenv('_COALESCE_WINDOW_MS', '0')),
+		coalesce_max_records=int(os.getenv('_COALESCE_MAX_RECORDS', '64')),
 	)
 
 
-def load_model(env_vars: models.EnvVars, gcp_clients: models.GCPClients, model_name: str = 'model') -> None:
-	"""Downloads a machine learning model from Google Cloud Storage and loads it into memory using joblib.
+def load_model(env_vars: models.EnvVars, gcp_clients: models.GCPClients, model_name: str = 'model', start_polling: bool = True) -> None:
+	"""Loads the latest version of the model, once per instance, and starts polling for new versions.
+
+	The training saves each version as `<model_location>/<version>` and writes the latest one to
+	`<model_location>.latest`. The poller checks its generation every `model_poll_seconds`, and swaps
+	in a new version once it is loaded. A model saved before versions, as `model_location` itself,
+	is served as version `model_location` until a version is published.
 
 	Args:
 	    env_vars (models.EnvVars): An object containing environment variables required for the function.
 	    gcp_clients (models.GCPClients): An object containing Google Cloud Platform clients required for the function.
-	    model_name (str): The model namo retrieve from Cloud Storage.
+	    model_name (str): The prefix of the files of the model in /tmp.
+	    start_polling (bool): Whether to start the thread of the poller, else `after_fork` starts it.
 
 	Returns:
 	    None
 	"""
-	# Load the pipeline from the pickle file
-	global pipeline
-	if pipeline is None:
+	global model_poller
+	if served_model is not None:
+		return
+
+	with _served_model_lock:
+		if served_model is not None:
+			return
+
+		def _swap_in(version: str) -> None:
+			version = version.strip()
+			# The clients are closed before the workers are forked, each worker loads with its own
+			swap_model(
+				model=load_version(
+					env_vars=env_vars,
+					gcp_clients=load_clients(gcp_project_id=env_vars.gcp_project_id) if gcp_clients.closed else gcp_clients,
+					version=version,
+					location=f'{env_vars.model_location}/{version}',
+					model_name=model_name,
+				)
+			)
+
+		model_poller = gcp_apis.BlobPoller(
+			CS=gcp_clients.storage_client,
+			bucket_name=env_vars.bucket_name,
+			blob_name=env_vars.model_location + gcp_apis.LATEST_SUFFIX,
+			on_change=_swap_in,
+			interval=env_vars.model_poll_seconds,
+		)
+		if not model_poller.poll():
+			swap_model(
+				model=load_version(
+					env_vars=env_vars, gcp_clients=gcp_clients, version=env_vars.model_location, location=env_vars.model_location, model_name=model_name
+				)
+			)
+		if start_polling and env_vars.model_poll_seconds > 0:
+			model_poller.start()
+
+
+def after_fork(env_vars: models.EnvVars) -> None:
+	"""Starts what a worker forked from a process with the model loaded does not inherit.
+
+	The worker inherits the loaded model, its pages shared with the parent until they are
+	written to, but neither the threads of the parent nor connections it can use: the poller
+	polls from a new thread with the clients of the worker, built on first use. The prediction
+	logger is started by the first request of the worker.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+	"""
+	if model_poller is not None and env_vars.model_poll_seconds > 0:
+		model_poller.after_fork(CS=load_clients(gcp_project_id=env_vars.gcp_project_id).storage_client)
+
+
+def load_version(env_vars: models.EnvVars, gcp_clients: models.GCPClients, version: str, location: str, model_name: str = 'model') -> models.ServedModel:
+	"""Downloads a version of the model from Google Cloud Storage, loads it using joblib and warms it up.
+
+	Its NumPy arrays are memory mapped from /tmp. The mmap artifact of the training holds the arrays of
+	its forest, the workers of the instance share their pages instead of each copying the trees.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+	    gcp_clients (models.GCPClients): An object containing Google Cloud Platform clients required for the function.
+	    version (str): The version of the model.
+	    location (str): The location of the version in the bucket.
+	    model_name (str): The prefix of the files of the model in /tmp.
+
+	Returns:
+	    models.ServedModel: The loaded version, ready to be swapped in.
+	"""
+	import joblib
+
+	# Each version has its own files, the ones of the version being served stay as they are
+	file_name = f'{model_name}-{version}'.replace('/', '-')
+	gcp_apis.transfer_blob_to_temp(CS=gcp_clients.storage_client, gcs_input_bucket=env_vars.bucket_name, file_location=location, model_name=file_name)
+	files = ['/tmp/' + file_name]
+
+	model = joblib.load('/tmp/' + file_name, mmap_mode='r')
+	if isinstance(model, dict):
+		pipeline = forest.pipeline_from_artifact(artifact=model)
+		compiled_pipeline = compile_model(pipeline=pipeline)
+	else:
+		pipeline = model
+		classifier = load_forest(env_vars=env_vars, gcp_clients=gcp_clients, location=location, model_name=file_name)
+		if classifier is not None:
+			files.append('/tmp/' + file_name + gcp_apis.FOREST_SUFFIX)
+		compiled_pipeline = compile_model(pipeline=pipeline, classifier=classifier)
+
+	served = models.ServedModel(version=version, pipeline=pipeline, compiled_pipeline=compiled_pipeline, files=tuple(files))
+
+	# The first prediction of a version is the slowest, it is made before a request uses the version
+	_predict(model=served, features=[records.validate({}).features])
+	return served
+
+
+def swap_model(model: models.ServedModel) -> None:
+	"""Serves a loaded version of the model in place of the one being served.
+
+	Requests read `served_model` once, each one is served by a single version. The files of the
+	previous version are removed, its memory maps stay valid for the requests still using it. The
+	cached predictions are cleared, those of the previous version would never be hit again.
+
+	Args:
+	    model (models.ServedModel): The loaded version.
+	"""
+	global served_model
+	previous, served_model = served_model, model
+	cache_stats = None
+	if prediction_cache is not None:
+		cache_stats = prediction_cache.stats()
+		prediction_cache.clear()
+	print(
+		codec.dumps_text(
+			{
+				'severity': 'INFO',
+				'message': f'Serving version {model.version} of the model',
+				'previous_version': previous.version if previous is not None else None,
+				'prediction_cache': cache_stats,
+			}
+		)
+	)
+
+	if previous is not None:
+		for path in set(previous.files) - set(model.files):
+			with contextlib.suppress(FileNotFoundError):
+				os.remove(path)
+
+
+def load_forest(env_vars: models.EnvVars, gcp_clients: models.GCPClients, location: str, model_name: str = 'model') -> forest.Forest | None:
+	"""Downloads the flat arrays of the forest the training saves next to the model.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+	    gcp_clients (models.GCPClients): An object containing Google Cloud Platform clients required for the function.
+	    location (str): The location of the model in the bucket.
+	    model_name (str): The name of the model in /tmp.
+
+	Returns:
+	    forest.Forest | None: The forest, None if the model has no exported forest.
+	"""
+	file_name = model_name + gcp_apis.FOREST_SUFFIX
+	try:
 		gcp_apis.transfer_blob_to_temp(
-			CS=gcp_clients.storage_client, gcs_input_bucket=env_vars.bucket_name, file_location=env_vars.model_location, model_name=model_name
+			CS=gcp_clients.storage_client,
+			gcs_input_bucket=env_vars.bucket_name,
+			file_location=location + gcp_apis.FOREST_SUFFIX,
+			model_name=file_name,
 		)
-		pipeline = joblib.load('/tmp/' + model_name)
+	except ValueError:
+		print(codec.dumps_text({'severity': 'INFO', 'message': 'The model has no exported forest, predicting with its classifier'}))
+		return None
+	return forest.Forest.load('/tmp/' + file_name)
+
+
+def compile_model(pipeline: Pipeline, classifier: forest.Forest | None = None) -> compiled.CompiledPipeline | None:
+	"""Compiles the pipeline, to predict without building DataFrames.
+
+	Args:
+	    pipeline (Pipeline): The loaded pipeline.
+	    classifier (forest.Forest | None): Predicts instead of the classifier of the pipeline.
+
+	Returns:
+	    compiled.CompiledPipeline | None: The compiled pipeline, None if the pipeline has steps
+	        that cannot be compiled and is used as is.
+	"""
+	try:
+		return compiled.compile_pipeline(pipeline=pipeline, classifier=classifier)
+	except ValueError as e:
+		if classifier is not None:
+			print(codec.dumps_text({'severity': 'WARNING', 'message': 'The forest does not match the model, predicting with its classifier', 'error': str(e)}))
+			return compile_model(pipeline=pipeline)
+		print(codec.dumps_text({'severity': 'WARNING', 'message': 'The model cannot be compiled, predicting with the pipeline', 'error': str(e)}))
+		return None
 
 
+def _predict(model: models.ServedModel, features: List[Dict[str, Any]]) -> List[Any]:
+	"""Predicts the features of valid records with the compiled pipeline, or with the pipeline on a DataFrame."""
+	if model.compiled_pipeline is not None:
+		return model.compiled_pipeline.predict(features)
+
+	import pandas as pd
+
+	return model.pipeline.predict(pd.DataFrame.from_records(features, columns=list(records.FEATURES))).tolist()
+
+
+def _predict_coalesced(model: models.ServedModel, features: List[Dict[str, Any]]) -> List[Any]:
+	"""Predicts as `_predict`, a single record is predicted with the ones of the concurrent requests."""
+	if request_coalescer is not None and len(features) == 1:
+		return request_coalescer.submit(key=model, items=features)
+	return _predict(model=model, features=features)
+
+
+def _predict_cached(model: models.ServedModel, features: List[Dict[str, Any]]) -> List[Any]:
+	"""Predicts as `_predict_coalesced`, only the features without a cached prediction of the version go to the model."""
+	if prediction_cache is None:
+		return _predict_coalesced(model=model, features=features)
+
+	keys = [cache.cache_key(version=model.version, features=record) for record in features]
+	predictions = prediction_cache.get_many(keys)
+
+	# The features sent more than once in the batch are predicted once
+	missing = {key: record for key, record in zip(keys, features) if key not in predictions}
+	if missing:
+		predicted = dict(zip(missing, _predict_coalesced(model=model, features=list(missing.values()))))
+		prediction_cache.put_many(predicted)
+		predictions.update(predicted)
+	return [predictions[key] for key in keys]
+
+
+def log_prediction_cache(env_vars: models.EnvVars) -> None:
+	"""Counts a request served with the cache, and logs its counters once every `prediction_cache_log_every` requests.
+
+	The hit rate of a model is reported while it serves, not only when a new version clears the cache.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+	"""
+	if prediction_cache is None or next(_prediction_cache_requests) % env_vars.prediction_cache_log_every:
+		return
+
+	print(codec.dumps_text({'severity': 'INFO', 'message': 'Prediction cache counters', 'prediction_cache': prediction_cache.stats()}))
+
+
+def load_prediction_cache(env_vars: models.EnvVars) -> cache.PredictionCache | None:
+	"""Creates the cache of the predictions, once per instance.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+
+	Returns:
+	    cache.PredictionCache | None: The cache of the predictions, None if `prediction_cache_entries` is 0.
+	"""
+	global prediction_cache
+	if prediction_cache is None and env_vars.prediction_cache_entries > 0:
+		with _prediction_cache_lock:
+			if prediction_cache is None:
+				prediction_cache = cache.PredictionCache(max_entries=env_vars.prediction_cache_entries, ttl=env_vars.prediction_cache_seconds)
+	return prediction_cache
+
+
+def load_request_coalescer(env_vars: models.EnvVars) -> batching.RequestCoalescer | None:
+	"""Creates the coalescer of the concurrent requests, once per instance.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+
+	Returns:
+	    batching.RequestCoalescer | None: The coalescer of the requests, None if `coalesce_window_ms` is 0.
+	"""
+	global request_coalescer
+	if request_coalescer is None and env_vars.coalesce_window_ms > 0:
+		with _request_coalescer_lock:
+			if request_coalescer is None:
+				request_coalescer = batching.RequestCoalescer(
+					predict=lambda model, features: _predict(model=model, features=features),
+					max_wait=env_vars.coalesce_window_ms / 1000,
+					max_records=env_vars.coalesce_max_records,
+				)
+	return request_coalescer
+
+
+def load_prediction_logger(env_vars: models.EnvVars, gcp_clients: models.GCPClients) -> gcp_apis.BigQueryRowLogger:
+	"""Starts the background logger of the predictions, once per instance.
+
+	Args:
+	    env_vars (models.EnvVars): An object containing environment variables required for the function.
+	    gcp_clients (models.GCPClients): An object containing Google Cloud Platform clients required for the function.
+
+	Returns:
+	    gcp_apis.BigQueryRowLogger: The logger inserting the predictions into BigQuery.
+	"""
+	global prediction_logger
+	if prediction_logger is None:
+		with _prediction_logger_lock:
+			if prediction_logger is None:
+				prediction_logger = gcp_apis.BigQueryRowLogger(
+					BQ=gcp_clients.bigquery_client,
+					table_fqn=env_vars.predictions_table,
+					max_rows=env_vars.log_batch_rows,
+					max_latency=env_vars.log_flush_seconds,
+					max_queue_rows=env_vars.log_queue_rows,
+				)
+	return prediction_logger
+
+
+# Registers the clients, loads the model and starts the logger at cold start, every invocation reuses them.
+# Preloaded by `serve` before it forks its workers, the threads and the clients are left to each worker
 if os.getenv('_CI_TESTING', 'no') == 'no':
 	env_vars = _env_vars()
+	preload = os.getenv('_SERVE_PRELOAD', 'no') == 'yes'
 	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
-	load_model(env_vars=env_vars, gcp_clients=gcp_clients)
+	load_prediction_cache(env_vars=env_vars)
+	load_request_coalescer(env_vars=env_vars)
+	load_model(env_vars=env_vars, gcp_clients=gcp_clients, start_polling=not preload)
+	if preload:
+		registry.clients.invalidate(gcp_project_id=env_vars.gcp_project_id)
+	else:
+		load_prediction_logger(env_vars=env_vars, gcp_clients=gcp_clients)
+
+
+def _json_response(payload: Dict[str, Any]) -> flask.Response:
+	"""A JSON response, encoded by `codec`."""
+	return flask.Response(codec.dumps(payload), mimetype='application/json')
+
+
+def _body_prefix(body: bytes) -> str:
+	"""The start of the body of a request, to be logged."""
+	prefix = body[:_LOGGED_BODY_BYTES].decode('utf-8', errors='replace')
+	return prefix + '...' if len(body) > _LOGGED_BODY_BYTES else prefix
 
 
 def predict(request: flask.Request) -> flask.Response:
-	"""Endpoint function that receives a POST request with JSON data and returns a prediction as a JSON response.
+	"""Endpoint function that receives a POST request with JSON data and returns predictions as a JSON response.
+
+	The body is either a single JSON object, answered with its prediction, or a batch
+	of records: a JSON array, or NDJSON with `Content-Type: application/x-ndjson`. A
+	batch is predicted with a single call to the model, for the records whose prediction
+	is not cached yet. A single record waits for the ones of the concurrent requests, up to
+	`coalesce_window_ms`, and they are predicted in one call. Every record predicted gets its
+	own uuid and log row, cached or not. The predictions are logged to BigQuery in the
+	background, the response does not wait for the insert.
+	The body is decoded once, and the response encoded, by `codec`.
+	Its results come back in the order of the records, each one with its prediction or
+	with the reasons it is not valid.
 
 	Args:
 	    request (flask.Request): The request object.
@@ -101,55 +453,81 @@ def predict(request: flask.Request) -> flask.Response:
 	    flask.Response: The response object.
 	"""
 	if request.method == 'OPTIONS':
-		response = make_response(json.dumps({}), 204)
+		response = make_response(codec.dumps({}), 204)
 		response.headers.set('Access-Control-Allow-Origin', '*')
 		response.headers.set('Access-Control-Allow-Headers', 'Content-Type')
 		response.headers.set('Access-Control-Allow-Methods', 'POST, GET')
 		response.headers.set('Access-Control-Max-Age', '3600')
 		return response
 
-	print(request.get_json())
-	# Abort if no model is loaded
-	if not pipeline:
-		print(json.dumps({'severity': 'WARNING', 'message': 'No model is running', 'request': request.get_json()}))
+	# The body is decoded once, by `parse_body`
+	body = request.get_data()
+	# The version serving this request, a version swapped in meanwhile serves the next ones
+	model = served_model
+	if model is None:
+		print(codec.dumps_text({'severity': 'WARNING', 'message': 'No model is running', 'request': _body_prefix(body)}))
 		raise ValueError('No model is running')
 
-	if request.content_type != 'application/json':
-		abort(400, "Content-Type must be 'application/json'")
-	# Set CORS headers for the preflight request
+	if request.mimetype not in ('application/json', records.NDJSON_MIMETYPE):
+		abort(400, f"Content-Type must be 'application/json' or '{records.NDJSON_MIMETYPE}'")
+
+	env_vars = _env_vars()
+	gcp_clients = load_clients(gcp_project_id=env_vars.gcp_project_id)
 
 	try:
-		prediction_uuid = str(uuid.uuid1())
-		point_json: dict = json.loads(request.data)
-		point = pd.DataFrame.from_dict([point_json])  # type: ignore
-		prediction = pipeline.predict(point).tolist()[0]  # type: ignore
+		batch, is_batch = records.parse_body(body=body, mimetype=request.mimetype)
+	except ValueError as e:
+		abort(400, str(e))
 
-		# Return the prediction as a JSON response
-		response = jsonify(
-			{
-				'prediction': prediction,
-				'uuid': prediction_uuid,
-			}
-		)
+	# The start of the body only, a batch would flood the logs
+	print(codec.dumps_text({'severity': 'DEBUG', 'message': f'Received {len(batch)} records', 'records': len(batch), 'request': _body_prefix(body)}))
+
+	if len(batch) > env_vars.max_batch_records:
+		abort(413, f'A batch holds at most {env_vars.max_batch_records} records, got {len(batch)}.')
+
+	if not is_batch and batch[0].errors:
+		abort(400, ' '.join(batch[0].errors))
+
+	try:
+		# One call to the model for all the valid records of the batch not in the cache
+		valid = [record.features for record in batch if record.features is not None]
+		predictions = iter(_predict_cached(model=model, features=valid) if valid else [])
+		log_prediction_cache(env_vars=env_vars)
+
+		results = []
+		rows = []
+		for index, record in enumerate(batch):
+			if record.errors:
+				results.append({'index': index, 'errors': record.errors})
+				continue
+
+			prediction_uuid = str(uuid.uuid1())
+			prediction = next(predictions)
+			results.append({'index': index, 'prediction': prediction, 'uuid': prediction_uuid})
+			rows.append(records.prediction_row(data=record.data, prediction=prediction, prediction_uuid=prediction_uuid, version=model.version))
+
+		# Return the predictions as a JSON response
+		if is_batch:
+			response = _json_response({'predictions': results})
+		else:
+			response = _json_response(
+				{
+					'prediction': results[0]['prediction'],
+					'uuid': results[0]['uuid'],
+				}
+			)
 		response.headers.set('Access-Control-Allow-Origin', '*')
 
-		gcp_apis.bigquery_insert_json_row(
-			BQ=gcp_clients.bigquery_client,  # type: ignore
-			table_fqn=env_vars.predictions_table,  # type: ignore
-			row=[
-				{k: str(v) for k, v in point_json.items()}
-				| {'uuid': prediction_uuid, 'model_prediction': str(prediction), 'model_id': 'titanic_basic', 'model_version': 'allonz-y'}
-			],
-		)
+		load_prediction_logger(env_vars=env_vars, gcp_clients=gcp_clients).log(rows=rows)
 
 		return response
 	except Exception as e:
 		print(
-			json.dumps(
+			codec.dumps_text(
 				{
 					'severity': 'ERROR',
 					'message': 'Request Failed. traceback: {trace}'.format(trace=traceback.print_exc()),
-					'request': request.get_json(),
+					'request': _body_prefix(body),
 					'error': str(e),
 				}
 			)
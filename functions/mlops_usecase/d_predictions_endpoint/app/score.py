@@ -0,0 +1,247 @@
+"""Offline bulk scoring of a BigQuery table, or of the CSV files of a Google Cloud Storage prefix.
+
+Scores the records with the version of the model the endpoint serves, instead of a
+request per record. The source is split in chunks: rows of a table, or a CSV file
+each. The model is loaded once, before a pool of processes is forked, and each
+process reads, scores and writes a chunk at a time. The rows of a chunk, in the
+shape of the rows the endpoint logs, are written to an NDJSON file under
+`scoring/<job>/` of the bucket of the models: the files written are the
+checkpoint, a job run again after a crash scores only the chunks left. Once all
+the chunks are written, they are appended to the predictions table by a single
+load job. Its id is derived from the name of the job, a run again after a crash
+finds the load started instead of loading the chunks twice. The throughput of the
+run is logged in rows per second per core.
+
+    cd d_predictions_endpoint/app && _SCORE_SOURCE=gs://bucket/passengers _SCORE_JOB=backlog python score.py
+
+The options are read from the environment, see `_score_options`.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import gc
+import io
+import multiprocessing
+import os
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Dict, List
+
+try:
+	import serve
+	from funcs import codec, gcp_apis, models, scoring
+except ImportError:
+	from d_predictions_endpoint.app import serve
+	from d_predictions_endpoint.app.funcs import codec, gcp_apis, models, scoring
+
+if TYPE_CHECKING:
+	import pandas as pd
+
+# The files of the jobs are under `<prefix>/<job>/` of the bucket of the models
+SCORING_PREFIX = 'scoring'
+
+
+def _score_options() -> models.ScoreOptions:
+	"""Load the options of the job from the environment.
+
+	Returns:
+	    models.ScoreOptions: The options of the job.
+	"""
+	return models.ScoreOptions(
+		source=os.environ['_SCORE_SOURCE'],
+		job=os.getenv('_SCORE_JOB', 'scoring'),
+		chunk_rows=int(os.getenv('_SCORE_CHUNK_ROWS', '50000')),
+		workers=int(os.getenv('_SCORE_WORKERS', str(os.cpu_count() or 1))),
+		blas_threads=int(os.getenv('_SCORE_BLAS_THREADS', '1')),
+	)
+
+
+def _chunks(options: models.ScoreOptions, gcp_clients: models.GCPClients) -> List[scoring.Chunk]:
+	"""The chunks of the source of the job."""
+	if options.source.startswith(scoring.GCS_SCHEME):
+		bucket_name, prefix = scoring.split_gcs_uri(options.source)
+		return scoring.file_chunks(gcp_apis.storage_list_blobs(CS=gcp_clients.storage_client, bucket_name=bucket_name, prefix=prefix))
+
+	num_rows = gcp_apis.bigquery_table_num_rows(BQ=gcp_clients.bigquery_client, table_fqn=options.source)
+	return scoring.table_chunks(table_fqn=options.source, num_rows=num_rows, chunk_rows=options.chunk_rows)
+
+
+def _read_chunk(chunk: scoring.Chunk, options: models.ScoreOptions, gcp_clients: models.GCPClients) -> pd.DataFrame:
+	"""The rows of a chunk of the source of the job."""
+	import pandas as pd
+
+	if options.source.startswith(scoring.GCS_SCHEME):
+		bucket_name, _ = scoring.split_gcs_uri(options.source)
+		data = gcp_apis.storage_read_bytes(CS=gcp_clients.storage_client, bucket_name=bucket_name, blob_name=chunk.source)
+		if data is None:
+			raise ValueError(f'Blob {chunk.source} does not exist.')
+		return pd.read_csv(io.BytesIO(data))
+
+	return gcp_apis.bigquery_read_rows(BQ=gcp_clients.bigquery_client, table_fqn=chunk.source, start=chunk.start, max_rows=chunk.rows)
+
+
+def _load_version(endpoint: ModuleType, env_vars: models.EnvVars, gcp_clients: models.GCPClients, version: str) -> None:
+	"""Serves the version of the model a job started with, when another version is published since."""
+	if endpoint.served_model is not None and endpoint.served_model.version == version:
+		return
+
+	location = env_vars.model_location if version == env_vars.model_location else f'{env_vars.model_location}/{version}'
+	endpoint.swap_model(model=endpoint.load_version(env_vars=env_vars, gcp_clients=gcp_clients, version=version, location=location))
+
+
+def _init_worker(blas_threads: int) -> None:
+	"""Pins the BLAS and OpenMP threads of a new process of the pool."""
+	from threadpoolctl import threadpool_limits
+
+	threadpool_limits(limits=blas_threads)
+
+
+def _score_chunk(chunk: scoring.Chunk, options: models.ScoreOptions, env_vars: models.EnvVars, prefix: str) -> scoring.ChunkResult:
+	"""Reads, scores and writes a chunk, in a process of the pool.
+
+	The process inherits the model loaded before the fork. Its clients are its own, built on first use.
+	"""
+	start = time.perf_counter()
+	endpoint = serve._endpoint()
+	gcp_clients = endpoint.load_clients(gcp_project_id=env_vars.gcp_project_id)
+	model = endpoint.served_model
+
+	frame = _read_chunk(chunk=chunk, options=options, gcp_clients=gcp_clients)
+	rows, invalid = scoring.score_records(
+		data=scoring.frame_records(frame),
+		predict=lambda features: endpoint._predict(model=model, features=features),
+		version=model.version,
+	)
+	# The chunk is finished once its file is written
+	gcp_apis.storage_write_bytes(
+		CS=gcp_clients.storage_client,
+		bucket_name=env_vars.bucket_name,
+		blob_name=f'{prefix}/{chunk.name}',
+		data=scoring.ndjson(rows),
+		content_type='application/x-ndjson',
+	)
+	return scoring.ChunkResult(index=chunk.index, rows=len(rows), invalid=invalid, seconds=time.perf_counter() - start)
+
+
+def run(options: models.ScoreOptions, env_vars: models.EnvVars) -> Dict[str, Any]:
+	"""Scores the chunks of a job not scored yet, then loads the rows of all its chunks.
+
+	Args:
+	    options (models.ScoreOptions): The options of the job.
+	    env_vars (models.EnvVars): The environment variables of the endpoint.
+
+	Returns:
+	    Dict[str, Any]: The report of the run, also logged.
+
+	Raises:
+	    ValueError: If the job was started with another source, or a chunk cannot be read.
+	"""
+	endpoint = serve._endpoint()
+	gcp_clients = endpoint.load_clients(gcp_project_id=env_vars.gcp_project_id)
+	prefix = f'{SCORING_PREFIX}/{options.job}'
+	report: Dict[str, Any] = {'severity': 'INFO', 'message': f'Scored job {options.job}', 'job': options.job}
+
+	def _read(name: str) -> bytes | None:
+		return gcp_apis.storage_read_bytes(CS=gcp_clients.storage_client, bucket_name=env_vars.bucket_name, blob_name=f'{prefix}/{name}')
+
+	def _write(name: str, data: Dict[str, Any]) -> None:
+		gcp_apis.storage_write_bytes(
+			CS=gcp_clients.storage_client, bucket_name=env_vars.bucket_name, blob_name=f'{prefix}/{name}', data=codec.dumps(data), content_type='application/json'
+		)
+
+	manifest = _read(scoring.MANIFEST)
+	saved = codec.loads(manifest) if manifest is not None else None
+	if saved is not None:
+		scoring.check_manifest(manifest=saved, options=options)
+
+	loaded = _read(scoring.LOADED)
+	if loaded is not None:
+		report |= {'message': f'Job {options.job} is already loaded'} | codec.loads(loaded)
+		print(codec.dumps_text(report))
+		return report
+
+	chunks = _chunks(options=options, gcp_clients=gcp_clients)
+	if saved is None:
+		endpoint.load_model(env_vars=env_vars, gcp_clients=gcp_clients, start_polling=False)
+		version = endpoint.served_model.version
+		_write(scoring.MANIFEST, scoring.job_manifest(options=options, version=version, chunks=len(chunks)))
+	else:
+		# A job resumed is scored by the version it started with, on the same chunks
+		scoring.check_manifest(manifest=saved, options=options, chunks=len(chunks))
+		version = saved['version']
+		_load_version(endpoint=endpoint, env_vars=env_vars, gcp_clients=gcp_clients, version=version)
+
+	finished = scoring.finished_chunks(gcp_apis.storage_list_blobs(CS=gcp_clients.storage_client, bucket_name=env_vars.bucket_name, prefix=prefix + '/'))
+	pending = [chunk for chunk in chunks if chunk.index not in finished]
+	workers = max(1, min(options.workers, len(pending)))
+
+	results: List[scoring.ChunkResult] = []
+	start = time.perf_counter()
+	if pending:
+		# The objects loaded so far are left out of the garbage collections, the processes share their pages
+		gc.freeze()
+		try:
+			with concurrent.futures.ProcessPoolExecutor(
+				max_workers=workers,
+				mp_context=multiprocessing.get_context('fork'),
+				initializer=_init_worker,
+				initargs=(options.blas_threads,),
+			) as executor:
+				futures = [executor.submit(_score_chunk, chunk, options, env_vars, prefix) for chunk in pending]
+				# A chunk that fails stops the run once the chunks started are written, the next run resumes after them
+				for future in concurrent.futures.as_completed(futures):
+					result = future.result()
+					results.append(result)
+					print(
+						codec.dumps_text(
+							{
+								'severity': 'DEBUG',
+								'message': f'Scored chunk {result.index} of job {options.job}',
+								'chunks_finished': len(finished) + len(results),
+								'chunks': len(chunks),
+							}
+							| result._asdict()
+						)
+					)
+		finally:
+			gc.unfreeze()
+	seconds = time.perf_counter() - start
+
+	# A single load job appends the rows of every chunk, of this run and of the runs before
+	rows_loaded = 0
+	if chunks:
+		rows_loaded = gcp_apis.bigquery_load_json_from_storage(
+			BQ=gcp_clients.bigquery_client,
+			table_fqn=env_vars.predictions_table,
+			source_uri=f'{scoring.GCS_SCHEME}{env_vars.bucket_name}/{prefix}/{scoring.CHUNK_PREFIX}*',
+			job_id=scoring.load_job_id(options.job),
+		)
+	_write(scoring.LOADED, {'rows_loaded': rows_loaded, 'version': version})
+
+	rows = sum(result.rows for result in results)
+	cores = min(workers, os.cpu_count() or 1)
+	report |= {
+		'version': version,
+		'chunks': len(chunks),
+		'chunks_resumed': len(chunks) - len(pending),
+		'rows': rows,
+		'invalid': sum(result.invalid for result in results),
+		'rows_loaded': rows_loaded,
+		'seconds': round(seconds, 3),
+		'cores': cores,
+	} | scoring.throughput(rows=rows, seconds=seconds, cores=cores)
+	print(codec.dumps_text(report))
+	return report
+
+
+def score() -> None:
+	"""Runs the job until its rows are loaded."""
+	options = _score_options()
+	for name in serve.BLAS_THREADS_VARIABLES:
+		os.environ.setdefault(name, str(options.blas_threads))
+	run(options=options, env_vars=serve._endpoint()._env_vars())
+
+
+if __name__ == '__main__':
+	score()
@@ -0,0 +1,130 @@
+"""Self-hosted server of the predictions endpoint, outside of Cloud Functions.
+
+Serves `main.predict` with gunicorn. The model is loaded once, by the server
+before it forks its workers: the workers share the pages of its arrays copy on
+write instead of each one loading its own copy. Each worker serves requests
+from a pool of threads, with its BLAS and OpenMP threads pinned, so the
+workers do not oversubscribe the CPUs.
+
+    cd d_predictions_endpoint/app && python serve.py
+
+The options are read from the environment, see `_serve_options`.
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+from types import ModuleType
+from typing import Any
+
+import flask
+from gunicorn.app.base import BaseApplication
+
+try:
+	from funcs import models
+except ImportError:
+	from d_predictions_endpoint.app.funcs import models
+
+# The libraries read these once, when they are first imported by the server
+BLAS_THREADS_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def _serve_options() -> models.ServeOptions:
+	"""Load the options of the server from the environment.
+
+	Returns:
+	    models.ServeOptions: The options of the server.
+	"""
+	return models.ServeOptions(
+		bind=f"0.0.0.0:{os.getenv('PORT', '8080')}",
+		workers=int(os.getenv('_SERVE_WORKERS', str(os.cpu_count() or 1))),
+		threads=int(os.getenv('_SERVE_THREADS', '8')),
+		blas_threads=int(os.getenv('_SERVE_BLAS_THREADS', '1')),
+		timeout=int(os.getenv('_SERVE_TIMEOUT', '30')),
+		max_requests=int(os.getenv('_SERVE_MAX_REQUESTS', '0')),
+	)
+
+
+def _endpoint() -> ModuleType:
+	"""The module of the endpoint, whose import loads the model."""
+	# The server loads the model, each worker starts its own threads and clients, see `main.after_fork`
+	os.environ.setdefault('_SERVE_PRELOAD', 'yes')
+	try:
+		import main
+	except ImportError:
+		from d_predictions_endpoint.app import main
+	return main
+
+
+def create_app() -> flask.Flask:
+	"""The WSGI application of the endpoint, every request of `/` is passed to `main.predict`.
+
+	Returns:
+	    flask.Flask: The application.
+	"""
+	endpoint = _endpoint()
+	app = flask.Flask('predictions_endpoint')
+	app.add_url_rule('/', 'predict', lambda: endpoint.predict(flask.request), methods=['GET', 'POST', 'OPTIONS'])
+	return app
+
+
+def post_fork(server: Any, worker: Any) -> None:
+	"""Pins the BLAS and OpenMP threads of a new worker, and starts its background threads.
+
+	Args:
+	    server (gunicorn.arbiter.Arbiter): The server.
+	    worker (gunicorn.workers.base.Worker): The new worker.
+	"""
+	from threadpoolctl import threadpool_limits
+
+	threadpool_limits(limits=_serve_options().blas_threads)
+	endpoint = _endpoint()
+	endpoint.after_fork(env_vars=endpoint._env_vars())
+
+
+class ServingApplication(BaseApplication):
+	"""The gunicorn server of the endpoint, with the model loaded before the workers are forked.
+
+	Args:
+	    options (models.ServeOptions): The options of the server.
+	"""
+
+	def __init__(self, options: models.ServeOptions) -> None:
+		"""Keeps the options, `run` starts the server."""
+		self.options = options
+		super().__init__()
+
+	def load_config(self) -> None:
+		"""Sets the options of gunicorn."""
+		settings = {
+			'bind': self.options.bind,
+			'workers': self.options.workers,
+			'threads': self.options.threads,
+			'worker_class': 'gthread',
+			'timeout': self.options.timeout,
+			'max_requests': self.options.max_requests,
+			'preload_app': True,
+			'post_fork': post_fork,
+		}
+		for name, value in settings.items():
+			self.cfg.set(name, value)
+
+	def load(self) -> flask.Flask:
+		"""Loads the model in the server, before the workers are forked."""
+		app = create_app()
+		# The objects loaded so far are left out of the garbage collections, which would write to their pages
+		gc.freeze()
+		return app
+
+
+def serve() -> None:
+	"""Runs the server until it is stopped."""
+	options = _serve_options()
+	for name in BLAS_THREADS_VARIABLES:
+		os.environ.setdefault(name, str(options.blas_threads))
+	ServingApplication(options=options).run()
+
+
+if __name__ == '__main__':
+	serve()
@@ -0,0 +1,57 @@
+"""Local stand-ins for the GCP clients, to run the bulk scoring job offline."""
+
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+class FakeBlob:
+    """A blob of `FakeStorageClient`, a file of its folder."""
+
+    def __init__(self, path: Path, name: str) -> None:
+        self.path = path
+        self.name = name
+
+    def upload_from_string(self, data: bytes, content_type: str = 'text/plain') -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+    def download_as_bytes(self) -> bytes:
+        return self.path.read_bytes()
+
+
+class FakeBucket:
+    """A bucket of `FakeStorageClient`, a subfolder of its folder."""
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self.folder / name, name)
+
+    def get_blob(self, name: str) -> Optional[FakeBlob]:
+        return FakeBlob(self.folder / name, name) if (self.folder / name).is_file() else None
+
+
+class FakeStorageClient:
+    """Keeps the buckets in a local folder, a bucket per subfolder and a file per blob.
+
+    Implements the subset of `storage.Client` used by the scoring job: `bucket(name).blob(name)`
+    to upload a file, `bucket(name).get_blob(name)` to download one, None when missing, and
+    `list_blobs`. The folder is shared by the processes forked from the one that built it.
+
+    Attributes:
+        folder (Path): The folder of the buckets.
+    """
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self.folder / bucket_name)
+
+    def list_blobs(self, bucket_name: str, prefix: str = '') -> Iterator[FakeBlob]:
+        folder = self.folder / bucket_name
+        for path in folder.rglob('*'):
+            name = path.relative_to(folder).as_posix()
+            if path.is_file() and name.startswith(prefix):
+                yield FakeBlob(path, name)
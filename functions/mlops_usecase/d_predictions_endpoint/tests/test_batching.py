@@ -0,0 +1,91 @@
+import threading
+from typing import Any, List
+
+import pytest
+
+from d_predictions_endpoint.app.funcs import batching
+
+
+class Recorder:
+    """Predicts the double of each record, and records the batches it is called with."""
+
+    def __init__(self) -> None:
+        self.calls: List[tuple] = []
+
+    def __call__(self, key: Any, items: List[int]) -> List[int]:
+        self.calls.append((key, list(items)))
+        if 'fail' in items:
+            raise ValueError('Cannot predict.')
+        return [item * 2 for item in items]
+
+
+def _submit_concurrently(coalescer: batching.RequestCoalescer, requests: List[tuple]) -> List[Any]:
+    results: List[Any] = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def _submit(index: int, key: Any, items: List[Any]) -> None:
+        barrier.wait()
+        try:
+            results[index] = coalescer.submit(key=key, items=items)
+        except ValueError as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=_submit, args=(index, *request)) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_coalescer_single_request() -> None:
+    predict = Recorder()
+    coalescer = batching.RequestCoalescer(predict=predict, max_wait=0.001)
+
+    assert coalescer.submit(key='v1', items=[1]) == [2]
+    assert predict.calls == [('v1', [1])]
+
+
+def test_coalescer_predicts_concurrent_requests_in_one_call() -> None:
+    predict = Recorder()
+    coalescer = batching.RequestCoalescer(predict=predict, max_wait=5, max_records=8)
+
+    # The 8th record ends the wait, long before the window
+    results = _submit_concurrently(coalescer, [('v1', [index]) for index in range(8)])
+
+    assert results == [[index * 2] for index in range(8)]
+    assert len(predict.calls) == 1
+    assert sorted(predict.calls[0][1]) == list(range(8))
+    assert coalescer.stats() == {'batches': 1, 'records': 8, 'requests': 8, 'records_per_batch': 8.0}
+
+
+def test_coalescer_one_call_per_key() -> None:
+    predict = Recorder()
+    coalescer = batching.RequestCoalescer(predict=predict, max_wait=5, max_records=4)
+
+    results = _submit_concurrently(coalescer, [('v1', [1]), ('v2', [2]), ('v1', [3]), ('v2', [4])])
+
+    assert results == [[2], [4], [6], [8]]
+    assert sorted((key, sorted(items)) for key, items in predict.calls) == [('v1', [1, 3]), ('v2', [2, 4])]
+
+
+def test_coalescer_raises_the_error_of_the_batch() -> None:
+    predict = Recorder()
+    coalescer = batching.RequestCoalescer(predict=predict, max_wait=5, max_records=2)
+
+    results = _submit_concurrently(coalescer, [('v1', [1]), ('v1', ['fail'])])
+
+    assert all(isinstance(result, ValueError) for result in results)
+    # The next requests are predicted
+    assert coalescer.submit(key='v1', items=[3]) == [6]
+
+
+@pytest.mark.parametrize('max_wait', [0.0, 0.001])
+def test_coalescer_many_requests(max_wait: float) -> None:
+    predict = Recorder()
+    coalescer = batching.RequestCoalescer(predict=predict, max_wait=max_wait, max_records=16)
+
+    results = _submit_concurrently(coalescer, [('v1', [index, index + 1]) for index in range(50)])
+
+    assert results == [[index * 2, index * 2 + 2] for index in range(50)]
+    assert coalescer.stats()['records'] == 100
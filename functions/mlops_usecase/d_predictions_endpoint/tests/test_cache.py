@@ -0,0 +1,62 @@
+from unittest import mock
+
+from d_predictions_endpoint.app.funcs import cache, records
+
+POINT = {'Age': 22, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': '3'}
+
+
+def _key(version: str = 'v1', **changes) -> tuple:
+    return cache.cache_key(version=version, features=records.validate(POINT | changes).features)
+
+
+def test_cache_key_of_the_converted_features() -> None:
+    assert _key() == _key(Age='22.0', Pclass=3) == _key(PassengerId=1)
+    assert _key() != _key(Age=23)
+    assert _key() != _key(Embarked=None)
+    assert _key('v1') != _key('v2')
+
+
+def test_prediction_cache_hits_and_misses() -> None:
+    prediction_cache = cache.PredictionCache()
+
+    assert prediction_cache.get_many([_key()]) == {}
+    prediction_cache.put_many({_key(): 0})
+
+    assert prediction_cache.get_many([_key(), _key(Age=23)]) == {_key(): 0}
+    assert prediction_cache.stats() == {'hits': 1, 'misses': 2, 'evictions': 0, 'entries': 1}
+
+
+def test_prediction_cache_evicts_the_least_recently_used() -> None:
+    prediction_cache = cache.PredictionCache(max_entries=2)
+    prediction_cache.put_many({_key(Age=1): 1, _key(Age=2): 2})
+
+    # Age 1 is used, Age 2 is the least recently used
+    prediction_cache.get_many([_key(Age=1)])
+    prediction_cache.put_many({_key(Age=3): 3})
+
+    assert prediction_cache.get_many([_key(Age=age) for age in (1, 2, 3)]) == {_key(Age=1): 1, _key(Age=3): 3}
+    assert prediction_cache.evictions == 1
+    assert len(prediction_cache) == 2
+
+
+def test_prediction_cache_expires_after_ttl() -> None:
+    clock = mock.Mock(return_value=0.0)
+    prediction_cache = cache.PredictionCache(ttl=10, clock=clock)
+    prediction_cache.put_many({_key(): 0})
+
+    clock.return_value = 9.9
+    assert prediction_cache.get_many([_key()]) == {_key(): 0}
+
+    clock.return_value = 10.0
+    assert prediction_cache.get_many([_key()]) == {}
+    assert len(prediction_cache) == 0
+
+
+def test_prediction_cache_clear_keeps_the_counters() -> None:
+    prediction_cache = cache.PredictionCache()
+    prediction_cache.put_many({_key(): 0})
+    prediction_cache.get_many([_key()])
+
+    prediction_cache.clear()
+
+    assert prediction_cache.stats() == {'hits': 1, 'misses': 0, 'evictions': 0, 'entries': 0}
@@ -0,0 +1,38 @@
+import datetime
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from d_predictions_endpoint.app.funcs import codec
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request):
+    """Runs the test with orjson, and with the standard library as when orjson is not installed."""
+    if request.param == "orjson":
+        yield
+    else:
+        with mock.patch.object(codec, "orjson", None):
+            yield
+
+
+def test_loads(backend) -> None:
+    assert codec.loads(b'{"Age": 22, "Sex": "m\\u00e4le", "Embarked": null, "Fare": 7.25}') == {"Age": 22, "Sex": "mäle", "Embarked": None, "Fare": 7.25}
+    assert codec.loads('[1, 2]') == [1, 2]
+
+
+@pytest.mark.parametrize("body", [b"{bad", b"", b'{"a": 1} x'])
+def test_loads_invalid_json(backend, body: bytes) -> None:
+    with pytest.raises(codec.JSONDecodeError):
+        codec.loads(body)
+
+
+def test_dumps(backend) -> None:
+    when = datetime.datetime(2024, 1, 15, 9, 30)
+    encoded = codec.dumps({"prediction": np.int64(1), "scores": np.array([0.25, 0.75]), "uuid": "é", "when": when})
+
+    assert isinstance(encoded, bytes)
+    assert codec.loads(encoded) == {"prediction": 1, "scores": [0.25, 0.75], "uuid": "é", "when": "2024-01-15T09:30:00"}
+    assert b" " not in codec.dumps({"a": [1, 2], "b": None})
+    assert codec.dumps_text({"severity": "INFO"}) == '{"severity":"INFO"}'
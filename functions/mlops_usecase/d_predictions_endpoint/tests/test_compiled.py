@@ -0,0 +1,97 @@
+import pathlib
+import warnings
+from typing import Any, Dict, List
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from c_train_model.app.funcs.forest import export_forest
+from c_train_model.app.funcs.train_models import titanic_train
+from d_predictions_endpoint.app.funcs import compiled, forest, records
+
+TITANIC_CSV = pathlib.Path(__file__).parents[4] / "resources" / "mlops_usecase" / "data" / "titanic.csv"
+TEST_MODEL = pathlib.Path(__file__).parent / "resources" / "nar-rayya"
+
+# Missing and unknown values, that the pipeline imputes or encodes as all zeros
+EDGE_CASES = [
+    dict.fromkeys(records.FEATURES),
+    {"Age": None, "SibSp": 1, "Parch": 0, "Fare": None, "Sex": "unknown", "Embarked": "Q", "Pclass": 7},
+    {"Age": 0.42, "SibSp": 8, "Parch": 6, "Fare": 512.3292, "Sex": "female", "Embarked": None, "Pclass": 1},
+]
+
+
+@pytest.fixture(scope="module")
+def titanic() -> pd.DataFrame:
+    return pd.read_csv(TITANIC_CSV)
+
+
+@pytest.fixture(scope="module")
+def features(titanic: pd.DataFrame) -> List[Dict[str, Any]]:
+    """The passengers of the titanic dataset, validated as the endpoint does."""
+    df = titanic[list(records.FEATURES)]
+    points = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    return [records.validate(point).features for point in points]
+
+
+@pytest.fixture(scope="module", params=["nar-rayya", "titanic_train"])
+def pipeline(request: pytest.FixtureRequest, titanic: pd.DataFrame) -> Pipeline:
+    warnings.simplefilter("ignore")
+    if request.param == "nar-rayya":
+        return joblib.load(TEST_MODEL)
+    return titanic_train(titanic)
+
+
+def _dataframe(features: List[Dict[str, Any]]) -> pd.DataFrame:
+    return pd.DataFrame.from_records(features, columns=list(records.FEATURES))
+
+
+def test_compiled_pipeline_matches_pipeline(pipeline: Pipeline, features: List[Dict[str, Any]]) -> None:
+    compiled_pipeline = compiled.compile_pipeline(pipeline)
+
+    np.testing.assert_array_equal(compiled_pipeline.transform(features), pipeline[:-1].transform(_dataframe(features)))
+    assert compiled_pipeline.predict(features) == pipeline.predict(_dataframe(features)).tolist()
+
+
+def test_compiled_pipeline_matches_pipeline_on_single_records(pipeline: Pipeline, features: List[Dict[str, Any]]) -> None:
+    compiled_pipeline = compiled.compile_pipeline(pipeline)
+
+    for point in features + EDGE_CASES:
+        np.testing.assert_array_equal(compiled_pipeline.transform([point]), pipeline[:-1].transform(_dataframe([point])))
+
+
+def test_compiled_pipeline_with_forest_matches_pipeline(titanic: pd.DataFrame, features: List[Dict[str, Any]]) -> None:
+    pipeline = titanic_train(titanic)
+
+    compiled_pipeline = compiled.compile_pipeline(pipeline, classifier=forest.Forest(export_forest(pipeline[-1])))
+
+    assert compiled_pipeline.predict(features) == pipeline.predict(_dataframe(features)).tolist()
+
+
+def test_compile_pipeline_with_another_forest(titanic: pd.DataFrame) -> None:
+    pipeline = titanic_train(titanic)
+    other = RandomForestClassifier(n_estimators=2).fit(titanic[["Pclass", "SibSp", "Parch"]], titanic["Survived"])
+
+    with pytest.raises(ValueError):
+        compiled.compile_pipeline(pipeline, classifier=forest.Forest(export_forest(other)))
+
+
+def test_compiled_pipeline_without_records(pipeline: Pipeline) -> None:
+    compiled_pipeline = compiled.compile_pipeline(pipeline)
+
+    assert compiled_pipeline.transform([]).shape == (0, compiled_pipeline.n_features)
+
+
+def test_compile_pipeline_unsupported_step(titanic: pd.DataFrame) -> None:
+    preprocessor = ColumnTransformer(transformers=[("num", MinMaxScaler(), ["Fare"])])
+    pipeline = Pipeline(steps=[("preprocessor", preprocessor), ("classifier", DecisionTreeClassifier())])
+    pipeline.fit(titanic[["Fare"]], titanic["Survived"])
+
+    with pytest.raises(ValueError, match="MinMaxScaler"):
+        compiled.compile_pipeline(pipeline)
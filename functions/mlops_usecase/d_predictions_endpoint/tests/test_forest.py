@@ -0,0 +1,72 @@
+import io
+import pathlib
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from c_train_model.app.funcs.forest import export_forest, forest_to_bytes, mmap_artifact
+from c_train_model.app.funcs.train_models import titanic_train
+from d_predictions_endpoint.app.funcs import forest
+
+TITANIC_CSV = pathlib.Path(__file__).parents[4] / "resources" / "mlops_usecase" / "data" / "titanic.csv"
+
+
+@pytest.fixture(scope="module")
+def titanic_matrix() -> tuple:
+    """The transformed passengers of the titanic dataset and the forest of `titanic_train`."""
+    df = pd.read_csv(TITANIC_CSV)
+    pipeline = titanic_train(df)
+    return pipeline[:-1].transform(df), pipeline[-1]
+
+
+def test_forest_matches_random_forest(titanic_matrix: tuple) -> None:
+    X, classifier = titanic_matrix
+    model = forest.Forest.load(io.BytesIO(forest_to_bytes(export_forest(classifier))))
+
+    np.testing.assert_array_equal(model.predict_proba(X), classifier.predict_proba(X))
+    np.testing.assert_array_equal(model.predict(X), classifier.predict(X))
+    for row in X[:50]:
+        np.testing.assert_array_equal(model.predict_proba(row[np.newaxis]), classifier.predict_proba(row[np.newaxis]))
+
+
+def test_forest_matches_random_forest_with_missing_values() -> None:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 5))
+    y = rng.choice(["a", "b", "c"], size=300)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    classifier = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+
+    model = forest.Forest(export_forest(classifier))
+
+    np.testing.assert_array_equal(model.predict_proba(X), classifier.predict_proba(X))
+    assert model.predict(X).tolist() == classifier.predict(X).tolist()
+
+
+def test_forest_checks_the_number_of_features(titanic_matrix: tuple) -> None:
+    X, classifier = titanic_matrix
+    model = forest.Forest(export_forest(classifier))
+
+    with pytest.raises(ValueError):
+        model.predict(X[:, 1:])
+
+
+def test_forest_missing_arrays(titanic_matrix: tuple) -> None:
+    arrays = export_forest(titanic_matrix[1])
+    del arrays["value"]
+
+    with pytest.raises(ValueError, match="value"):
+        forest.Forest(arrays)
+
+
+def test_pipeline_from_mmap_artifact(tmp_path: pathlib.Path) -> None:
+    df = pd.read_csv(TITANIC_CSV)
+    trained = titanic_train(df)
+    joblib.dump(mmap_artifact(trained), tmp_path / "model")
+
+    pipeline = forest.pipeline_from_artifact(joblib.load(tmp_path / "model", mmap_mode="r"))
+
+    assert isinstance(pipeline[-1].arrays["value"], np.memmap)
+    np.testing.assert_array_equal(pipeline.predict(df), trained.predict(df))
@@ -0,0 +1,175 @@
+import threading
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+import pytest
+from google.cloud import bigquery
+
+from d_predictions_endpoint.app.funcs import gcp_apis
+
+
+def _rows(count: int, start: int = 0) -> List[Dict[str, Any]]:
+    return [{'uuid': str(i), 'model_prediction': 1.0} for i in range(start, start + count)]
+
+
+@pytest.fixture
+def bigquery_client() -> mock.Mock:
+    client = mock.Mock(spec=bigquery.Client)
+    client.insert_rows_json.return_value = []
+    return client
+
+
+def _inserted(bigquery_client: mock.Mock) -> List[List[str]]:
+    return [[row['uuid'] for row in c.kwargs['json_rows']] for c in bigquery_client.insert_rows_json.call_args_list]
+
+
+def test_insert_json_row_keeps_numbers(bigquery_client: mock.Mock) -> None:
+    gcp_apis.bigquery_insert_json_row(BQ=bigquery_client, table_fqn='p.d.t', row={'uuid': 'a', 'model_prediction': 0.0, 'Sex': ' ', 'Age': None})
+
+    assert bigquery_client.insert_rows_json.call_args.kwargs['json_rows'] == [{'uuid': 'a', 'model_prediction': 0.0}]
+
+
+def test_row_logger_inserts_in_batches_of_max_rows(bigquery_client: mock.Mock) -> None:
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t', max_rows=3, max_latency=60)
+
+    logger.log(_rows(7))
+    logger.close()
+
+    assert _inserted(bigquery_client) == [['0', '1', '2'], ['3', '4', '5'], ['6']]
+    assert logger.inserted == 7
+
+
+def test_row_logger_inserts_after_max_latency(bigquery_client: mock.Mock) -> None:
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t', max_rows=100, max_latency=0.05)
+
+    logger.log(_rows(2))
+    deadline = time.monotonic() + 5
+    while not bigquery_client.insert_rows_json.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert _inserted(bigquery_client) == [['0', '1']]
+    logger.close()
+
+
+def test_row_logger_flush_waits_for_the_insert(bigquery_client: mock.Mock) -> None:
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t', max_rows=100, max_latency=60)
+
+    logger.log(_rows(2))
+    logger.flush()
+
+    assert _inserted(bigquery_client) == [['0', '1']]
+    logger.close()
+
+
+def test_row_logger_drops_rows_when_full(bigquery_client: mock.Mock) -> None:
+    release = threading.Event()
+    bigquery_client.insert_rows_json.side_effect = lambda **kwargs: release.wait() and []
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t', max_rows=1, max_queue_rows=2, put_timeout=0.01)
+
+    # The first row is being inserted, two more fill the queue, the last two are dropped
+    logger.log(_rows(1))
+    while not bigquery_client.insert_rows_json.called:
+        time.sleep(0.001)
+    logger.log(_rows(4, start=1))
+
+    assert logger.dropped == 2
+    release.set()
+    logger.close()
+    assert _inserted(bigquery_client) == [['0'], ['1'], ['2']]
+
+
+def test_row_logger_waits_once_per_call_when_full(bigquery_client: mock.Mock) -> None:
+    release = threading.Event()
+    bigquery_client.insert_rows_json.side_effect = lambda **kwargs: release.wait() and []
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t', max_rows=1, max_queue_rows=1, put_timeout=0.05)
+
+    logger.log(_rows(1))
+    while not bigquery_client.insert_rows_json.called:
+        time.sleep(0.001)
+    start = time.monotonic()
+    logger.log(_rows(50, start=1))
+
+    # 49 rows do not fit, but the call waits for a single timeout, not one per row
+    assert time.monotonic() - start < 1
+    assert logger.dropped == 49
+    release.set()
+    logger.close()
+
+
+def test_row_logger_counts_failed_rows(bigquery_client: mock.Mock) -> None:
+    bigquery_client.insert_rows_json.return_value = [{'index': 1, 'errors': [{'reason': 'invalid'}]}]
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t')
+
+    logger.log(_rows(3))
+    logger.close()
+
+    assert (logger.inserted, logger.failed) == (2, 1)
+
+
+def test_row_logger_survives_insert_exceptions(bigquery_client: mock.Mock) -> None:
+    bigquery_client.insert_rows_json.side_effect = [ConnectionError('reset'), []]
+    logger = gcp_apis.BigQueryRowLogger(BQ=bigquery_client, table_fqn='p.d.t')
+
+    logger.log(_rows(2))
+    logger.flush()
+    logger.log(_rows(1))
+    logger.close()
+
+    assert (logger.inserted, logger.failed) == (1, 2)
+
+
+def _storage_client(*generations: int | None) -> mock.Mock:
+    """A client whose blob has each generation in turn, None when it does not exist."""
+    blobs = [None if generation is None else mock.Mock(generation=generation, **{'download_as_text.return_value': f'v{generation}'}) for generation in generations]
+    client = mock.Mock()
+    client.bucket.return_value.get_blob.side_effect = blobs
+    return client
+
+
+def test_blob_poller_missing_blob() -> None:
+    on_change = mock.Mock()
+    poller = gcp_apis.BlobPoller(CS=_storage_client(None), bucket_name='bucket', blob_name='model.latest', on_change=on_change)
+
+    assert poller.poll() is False
+    on_change.assert_not_called()
+
+
+def test_blob_poller_calls_back_on_new_generations() -> None:
+    on_change = mock.Mock()
+    storage_client = _storage_client(1, 1, 2)
+    poller = gcp_apis.BlobPoller(CS=storage_client, bucket_name='bucket', blob_name='model.latest', on_change=on_change)
+
+    assert all(poller.poll() for _ in range(3))
+
+    assert on_change.call_args_list == [mock.call('v1'), mock.call('v2')]
+    assert (poller.generation, poller.polls, poller.changes) == (2, 3, 2)
+    storage_client.bucket.return_value.get_blob.assert_called_with('model.latest')
+
+
+def test_blob_poller_retries_after_a_failed_callback() -> None:
+    on_change = mock.Mock(side_effect=[ValueError('bad version'), None])
+    poller = gcp_apis.BlobPoller(CS=_storage_client(1, 1), bucket_name='bucket', blob_name='model.latest', on_change=on_change)
+
+    with pytest.raises(ValueError):
+        poller.poll()
+    assert poller.generation is None
+
+    poller.poll()
+    assert poller.generation == 1
+    assert on_change.call_count == 2
+
+
+def test_blob_poller_thread_counts_failures(capsys: pytest.CaptureFixture) -> None:
+    storage_client = mock.Mock()
+    storage_client.bucket.return_value.get_blob.side_effect = ConnectionError('unreachable')
+    poller = gcp_apis.BlobPoller(CS=storage_client, bucket_name='bucket', blob_name='model.latest', on_change=mock.Mock(), interval=0.01)
+
+    poller.start()
+    deadline = time.monotonic() + 5
+    while poller.failures < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    poller.close()
+
+    assert poller.failures >= 2
+    assert '"severity": "ERROR"' in capsys.readouterr().out
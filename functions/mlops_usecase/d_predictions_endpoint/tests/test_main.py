@@ -1,12 +1,25 @@
+import io
+import itertools
+import json
+import os
 import pathlib
+import shutil
+import threading
 from unittest import mock
 
+import flask
+import joblib
+import numpy as np
+import pandas as pd
 import pytest
+import werkzeug
 from functions_framework import create_app
 from google.cloud import bigquery, storage
 
+from c_train_model.app.funcs.forest import mmap_artifact
+from c_train_model.app.funcs.train_models import titanic_train
 from d_predictions_endpoint.app import main  # noqa
-from d_predictions_endpoint.app.funcs import gcp_apis  # noqa
+from d_predictions_endpoint.app.funcs import gcp_apis, models, records  # noqa
 
 
 def _relative_path() -> pathlib.Path:
@@ -99,6 +112,364 @@ def test_predict_function_executes(
         assert resp.data == b"success"
 
 
+POINT = {"Age": 22, "SibSp": 1, "Parch": 0, "Fare": 7.25,
+         "Sex": "male", "Embarked": "S", "Pclass": "3"}
+
+
+@pytest.fixture
+def loaded_model(bigquery_client: mock.Mock):
+    """Serves the test model, with the BigQuery inserts mocked."""
+    served_model = models.ServedModel(version="test-version", pipeline=joblib.load(_relative_path() / "resources" / "nar-rayya"), compiled_pipeline=None)
+    with mock.patch.object(main, 'served_model', served_model), \
+            mock.patch.object(main, 'load_clients', return_value=models.GCPClients(bigquery_client=bigquery_client)), \
+            mock.patch.object(main, 'prediction_logger', None), \
+            mock.patch.object(main, 'prediction_cache', None), \
+            mock.patch.object(main, 'request_coalescer', None), \
+            mock.patch.object(main.gcp_apis, 'bigquery_insert_json_row') as mock_insert:
+        yield mock_insert
+
+        if main.prediction_logger is not None:
+            main.prediction_logger.close()
+
+
+def _post(**kwargs) -> flask.Response:
+    """Posts a request to the endpoint, and waits for its predictions to be logged."""
+    with flask.Flask(__name__).test_request_context("/", method="POST", **kwargs):
+        response = main.predict(flask.request)
+
+    if main.prediction_logger is not None:
+        main.prediction_logger.flush()
+    return response
+
+
+def test_predict_single_record(loaded_model: mock.Mock) -> None:
+    resp = _post(json=POINT)
+
+    assert set(resp.get_json()) == {"prediction", "uuid"}
+    row, = loaded_model.call_args.kwargs["row"]
+    assert row["uuid"] == resp.get_json()["uuid"]
+    assert row["Pclass"] == "3"
+    assert row["model_version"] == "test-version"
+
+
+def test_predict_decodes_the_body_once(loaded_model: mock.Mock) -> None:
+    with mock.patch.object(records.codec, "loads", wraps=records.codec.loads) as mock_loads:
+        resp = _post(json=[POINT, POINT])
+
+    mock_loads.assert_called_once()
+    assert resp.mimetype == "application/json"
+    assert b" " not in resp.get_data()
+
+
+def test_predict_single_record_invalid(loaded_model: mock.Mock) -> None:
+    with pytest.raises(werkzeug.exceptions.BadRequest):
+        _post(json=POINT | {"Age": "old"})
+
+    loaded_model.assert_not_called()
+
+
+def test_predict_batch(loaded_model: mock.Mock) -> None:
+    points = [POINT, POINT | {"Age": "old"}, 5, POINT | {"Sex": "female", "Pclass": 1}]
+
+    with mock.patch.object(main.served_model.pipeline, "predict", wraps=main.served_model.pipeline.predict) as mock_predict:
+        resp = _post(json=points)
+
+    results = resp.get_json()["predictions"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert results[1]["errors"] == ["Age must be a number."]
+    assert results[2]["errors"] == ["The record must be a JSON object."]
+
+    # A single call to the model, and the valid records logged in a single insert
+    mock_predict.assert_called_once()
+    assert len(mock_predict.call_args.args[0]) == 2
+    rows = loaded_model.call_args.kwargs["row"]
+    assert [row["uuid"] for row in rows] == [results[0]["uuid"], results[3]["uuid"]]
+    assert [row["model_prediction"] for row in rows] == [float(results[0]["prediction"]), float(results[3]["prediction"])]
+
+
+def test_predict_logs_the_start_of_the_body(loaded_model: mock.Mock, capsys: pytest.CaptureFixture) -> None:
+    body = json.dumps([POINT] * 50)
+
+    _post(data=body, content_type="application/json")
+
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    received, = [log for log in logs if log.get("records") is not None]
+    assert received["records"] == 50
+    assert received["request"] == body[:main._LOGGED_BODY_BYTES] + "..."
+
+
+def test_predict_batch_matches_single_records(loaded_model: mock.Mock) -> None:
+    points = [POINT | {"Age": age, "Sex": sex} for age in (2, 30, None) for sex in ("male", "female")]
+
+    batch = [result["prediction"] for result in _post(json=points).get_json()["predictions"]]
+
+    assert batch == [_post(json=point).get_json()["prediction"] for point in points]
+
+
+def test_predict_compiled_matches_pipeline(loaded_model: mock.Mock) -> None:
+    points = [POINT | {"Age": age, "Sex": sex, "Embarked": embarked}
+              for age in (2, 30, None) for sex in ("male", "female", None) for embarked in ("C", None)]
+    expected = [result["prediction"] for result in _post(json=points).get_json()["predictions"]]
+
+    compiled_model = main.served_model._replace(compiled_pipeline=main.compile_model(main.served_model.pipeline))
+    with mock.patch.object(main, "served_model", compiled_model), \
+            mock.patch.object(compiled_model.pipeline, "predict") as mock_predict:
+        batch = [result["prediction"] for result in _post(json=points).get_json()["predictions"]]
+        single = [_post(json=point).get_json()["prediction"] for point in points]
+
+    assert batch == single == expected
+    mock_predict.assert_not_called()
+
+
+def test_predict_cached_skips_the_model(loaded_model: mock.Mock) -> None:
+    main.load_prediction_cache(env_vars=main._env_vars())
+    # The same features as POINT once converted, with a field the model does not use
+    same = POINT | {"Age": "22.0", "Pclass": 3, "PassengerId": 7}
+
+    with mock.patch.object(main.served_model.pipeline, "predict", wraps=main.served_model.pipeline.predict) as mock_predict:
+        responses = [_post(json=point).get_json() for point in (POINT, POINT, same)]
+
+    mock_predict.assert_called_once()
+    assert len({response["prediction"] for response in responses}) == 1
+    assert main.prediction_cache.stats() == {"hits": 2, "misses": 1, "evictions": 0, "entries": 1}
+
+    # Each request still has its own uuid and log row
+    rows = [c.kwargs["row"][0] for c in loaded_model.call_args_list]
+    assert [row["uuid"] for row in rows] == [response["uuid"] for response in responses]
+    assert len({response["uuid"] for response in responses}) == 3
+    assert rows[2]["PassengerId"] == "7"
+
+
+def test_predict_logs_the_cache_counters_without_a_swap(loaded_model: mock.Mock, capsys: pytest.CaptureFixture) -> None:
+    env_vars = main._env_vars()._replace(prediction_cache_log_every=2)
+    main.load_prediction_cache(env_vars=env_vars)
+
+    with mock.patch.object(main, "_env_vars", return_value=env_vars), \
+            mock.patch.object(main, "_prediction_cache_requests", itertools.count(1)):
+        for _ in range(4):
+            _post(json=POINT)
+
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    counters = [log["prediction_cache"] for log in logs if log.get("message") == "Prediction cache counters"]
+    assert counters == [
+        {"hits": 1, "misses": 1, "evictions": 0, "entries": 1},
+        {"hits": 3, "misses": 1, "evictions": 0, "entries": 1},
+    ]
+
+
+def test_predict_batch_cached(loaded_model: mock.Mock) -> None:
+    main.load_prediction_cache(env_vars=main._env_vars())
+    female = POINT | {"Sex": "female", "Pclass": 1}
+    single = _post(json=POINT).get_json()["prediction"]
+
+    with mock.patch.object(main.served_model.pipeline, "predict", wraps=main.served_model.pipeline.predict) as mock_predict:
+        results = _post(json=[female, POINT, female, POINT | {"Age": "old"}]).get_json()["predictions"]
+
+    # Only the features not cached go to the model, once each
+    mock_predict.assert_called_once()
+    assert len(mock_predict.call_args.args[0]) == 1
+    assert results[1]["prediction"] == single
+    assert results[0]["prediction"] == results[2]["prediction"]
+    assert len(loaded_model.call_args.kwargs["row"]) == 3
+
+
+def test_predict_without_cache(loaded_model: mock.Mock) -> None:
+    assert main.load_prediction_cache(env_vars=main._env_vars()._replace(prediction_cache_entries=0)) is None
+
+    with mock.patch.object(main.served_model.pipeline, "predict", wraps=main.served_model.pipeline.predict) as mock_predict:
+        _post(json=POINT)
+        _post(json=POINT)
+
+    assert mock_predict.call_count == 2
+
+
+def test_swap_model_clears_the_cache(loaded_model: mock.Mock) -> None:
+    main.load_prediction_cache(env_vars=main._env_vars())
+    _post(json=POINT)
+    assert len(main.prediction_cache) == 1
+
+    main.swap_model(main.served_model._replace(version="test-version-2"))
+
+    assert len(main.prediction_cache) == 0
+    resp = _post(json=POINT)
+    assert loaded_model.call_args.kwargs["row"][0]["model_version"] == "test-version-2"
+    assert resp.get_json()["prediction"] == main.served_model.pipeline.predict(pd.DataFrame([POINT])).tolist()[0]
+
+
+def test_predict_coalesces_concurrent_requests(loaded_model: mock.Mock) -> None:
+    coalescer = main.load_request_coalescer(env_vars=main._env_vars()._replace(coalesce_window_ms=5000, coalesce_max_records=4))
+    points = [POINT | {"Age": age} for age in (5, 30, 60, 90)]
+    expected = main.served_model.pipeline.predict(pd.DataFrame(points)).tolist()
+    responses = [None] * len(points)
+
+    def _request(index: int) -> None:
+        responses[index] = _post(json=points[index]).get_json()
+
+    with mock.patch.object(main.served_model.pipeline, "predict", wraps=main.served_model.pipeline.predict) as mock_predict:
+        threads = [threading.Thread(target=_request, args=(index,)) for index in range(len(points))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+    # The 4 requests are predicted in one call, each one gets its own prediction and uuid
+    mock_predict.assert_called_once()
+    assert [response["prediction"] for response in responses] == expected
+    assert len({response["uuid"] for response in responses}) == 4
+    assert coalescer.stats()["records_per_batch"] == 4
+
+
+def test_load_request_coalescer_disabled(loaded_model: mock.Mock) -> None:
+    assert main.load_request_coalescer(env_vars=main._env_vars()._replace(coalesce_window_ms=0)) is None
+
+
+def test_load_forest_without_exported_forest(storage_client: mock.Mock) -> None:
+    env_vars = main._env_vars()
+    with mock.patch.object(main.gcp_apis, "transfer_blob_to_temp", side_effect=ValueError("Blob does not exist.")) as mock_transfer:
+        assert main.load_forest(env_vars=env_vars, gcp_clients=models.GCPClients(storage_client=storage_client), location="nar-rayya/v1") is None
+
+    assert mock_transfer.call_args.kwargs["file_location"] == "nar-rayya/v1.forest.npz"
+
+
+@pytest.fixture
+def titanic_df() -> pd.DataFrame:
+    return pd.DataFrame({"Survived": [1, 0, 1, 0], "PassengerId": [1, 2, 3, 4], "Name": "n", "Ticket": "t", "Cabin": "c"}
+                        | {"Age": [30, 25, None, 35], "SibSp": [1, 0, 1, 0], "Parch": [0, 1, 0, 1], "Fare": [10.0, 20.0, 30.0, 40.0],
+                           "Sex": ["male", "female", "male", "female"], "Embarked": ["S", "C", "S", None], "Pclass": [1, 2, 3, 1]})
+
+
+@pytest.fixture
+def bucket(storage_client: mock.Mock, tmp_path: pathlib.Path):
+    """A bucket in a local folder: `write` saves a blob, `transfer_blob_to_temp` and the poller read them."""
+    generations = {}
+
+    def write(name: str, content: bytes) -> None:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(content)
+        generations[name] = generations.get(name, 0) + 1
+
+    def get_blob(name: str) -> mock.Mock | None:
+        if name not in generations:
+            return None
+        blob = mock.Mock(generation=generations[name])
+        blob.download_as_text.return_value = (tmp_path / name).read_text()
+        return blob
+
+    def transfer(CS, gcs_input_bucket: str, file_location: str, model_name: str = "model") -> None:
+        if file_location not in generations:
+            raise ValueError(f"Blob {file_location} does not exist.")
+        shutil.copy(tmp_path / file_location, "/tmp/" + model_name)
+
+    storage_client.bucket.return_value.get_blob.side_effect = get_blob
+    with mock.patch.object(main, "served_model", None), mock.patch.object(main, "model_poller", None), \
+            mock.patch.object(main.gcp_apis, "transfer_blob_to_temp", side_effect=transfer):
+        yield write
+
+        if main.model_poller is not None:
+            main.model_poller.close()
+        for path in main.served_model.files if main.served_model else ():
+            os.remove(path)
+
+
+def _artifact(df: pd.DataFrame) -> bytes:
+    bytes_container = io.BytesIO()
+    joblib.dump(mmap_artifact(titanic_train(df)), bytes_container)
+    return bytes_container.getvalue()
+
+
+def test_load_model_mmap_artifact(storage_client: mock.Mock, bucket, titanic_df: pd.DataFrame) -> None:
+    bucket("nar-rayya/v1", _artifact(titanic_df))
+    bucket("nar-rayya.latest", b"v1")
+    env_vars = main._env_vars()._replace(model_location="nar-rayya", model_poll_seconds=0)
+
+    with mock.patch.object(main.gcp_apis, "transfer_blob_to_temp", wraps=main.gcp_apis.transfer_blob_to_temp) as mock_transfer:
+        main.load_model(env_vars=env_vars, gcp_clients=models.GCPClients(storage_client=storage_client), model_name="test-model")
+
+    assert main.served_model.version == "v1"
+    assert isinstance(main.served_model.compiled_pipeline.classifier.arrays["value"], np.memmap)
+    assert main.served_model.pipeline.predict(titanic_df).tolist() == titanic_train(titanic_df).predict(titanic_df).tolist()
+    # The forest is in the artifact, it is not downloaded on its own
+    mock_transfer.assert_called_once()
+
+
+def test_load_model_before_versions(storage_client: mock.Mock, bucket) -> None:
+    bucket("nar-rayya", (_relative_path() / "resources" / "nar-rayya").read_bytes())
+    env_vars = main._env_vars()._replace(model_location="nar-rayya", model_poll_seconds=0)
+
+    main.load_model(env_vars=env_vars, gcp_clients=models.GCPClients(storage_client=storage_client), model_name="test-model")
+
+    assert main.served_model.version == "nar-rayya"
+
+
+def test_model_poller_swaps_new_versions(storage_client: mock.Mock, bucket, titanic_df: pd.DataFrame) -> None:
+    bucket("nar-rayya/v1", _artifact(titanic_df))
+    bucket("nar-rayya.latest", b"v1")
+    env_vars = main._env_vars()._replace(model_location="nar-rayya", model_poll_seconds=0)
+    main.load_model(env_vars=env_vars, gcp_clients=models.GCPClients(storage_client=storage_client), model_name="test-model")
+    v1 = main.served_model
+
+    # Without a new version the poll does nothing
+    main.model_poller.poll()
+    assert main.served_model is v1
+
+    bucket("nar-rayya/v2", _artifact(titanic_df.assign(Survived=1 - titanic_df["Survived"])))
+    bucket("nar-rayya.latest", b"v2\n")
+    main.model_poller.poll()
+
+    assert main.served_model.version == "v2"
+    assert not any(os.path.exists(path) for path in v1.files)
+    with mock.patch.object(main, "load_clients"), mock.patch.object(main, "load_prediction_logger"):
+        assert _post(json=POINT).get_json()["prediction"] == 1 - v1.compiled_pipeline.predict([records.validate(POINT).features])[0]
+
+
+def test_model_poller_keeps_serving_when_a_version_fails(storage_client: mock.Mock, bucket, titanic_df: pd.DataFrame) -> None:
+    bucket("nar-rayya/v1", _artifact(titanic_df))
+    bucket("nar-rayya.latest", b"v1")
+    env_vars = main._env_vars()._replace(model_location="nar-rayya", model_poll_seconds=0)
+    main.load_model(env_vars=env_vars, gcp_clients=models.GCPClients(storage_client=storage_client), model_name="test-model")
+
+    # The pointer is written before the version is saved
+    bucket("nar-rayya.latest", b"v2")
+    with pytest.raises(ValueError):
+        main.model_poller.poll()
+    assert main.served_model.version == "v1"
+
+    bucket("nar-rayya/v2", _artifact(titanic_df))
+    main.model_poller.poll()
+    assert main.served_model.version == "v2"
+
+
+def test_compile_model_with_another_forest(loaded_model: mock.Mock) -> None:
+    other = mock.Mock(n_features_in_=3, classes_=main.served_model.pipeline.classes_)
+
+    compiled_pipeline = main.compile_model(main.served_model.pipeline, classifier=other)
+
+    assert compiled_pipeline.classifier is main.served_model.pipeline[-1]
+
+
+def test_predict_ndjson(loaded_model: mock.Mock) -> None:
+    body = "\n".join(json.dumps(point) for point in [POINT, POINT]) + "\n{bad\n"
+
+    results = _post(data=body, content_type="application/x-ndjson").get_json()["predictions"]
+
+    assert [("prediction" in result, "errors" in result) for result in results] == [(True, False), (True, False), (False, True)]
+
+
+def test_predict_batch_too_large(loaded_model: mock.Mock) -> None:
+    with mock.patch.dict("os.environ", {"_MAX_BATCH_RECORDS": "2"}):
+        with pytest.raises(werkzeug.exceptions.RequestEntityTooLarge):
+            _post(json=[POINT] * 3)
+
+    loaded_model.assert_not_called()
+
+
+def test_predict_batch_without_valid_records(loaded_model: mock.Mock) -> None:
+    results = _post(json=[5]).get_json()["predictions"]
+
+    assert results == [{"index": 0, "errors": ["The record must be a JSON object."]}]
+    loaded_model.assert_not_called()
+
+
 # @pytest.fixture
 # def client():
 #     app = Flask(__name__)
@@ -0,0 +1,110 @@
+import json
+import pathlib
+from typing import Any
+
+import pytest
+
+from d_predictions_endpoint.app.funcs import records
+
+PREDICTIONS_SCHEMA = pathlib.Path(__file__).parents[4] / 'resources' / 'mlops_usecase' / 'bigquery' / 'titanic_predictions.json'
+POINT = {'Age': 22, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': '3'}
+
+
+def test_validate_converts_to_the_training_types() -> None:
+    record = records.validate(POINT | {'PassengerId': 1})
+
+    assert record.errors == []
+    assert record.features == {'Age': 22.0, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': 3}
+    assert record.data['PassengerId'] == 1
+
+
+def test_validate_keeps_missing_values() -> None:
+    record = records.validate({'Sex': 'female'})
+
+    assert record.errors == []
+    assert record.features == {'Age': None, 'SibSp': None, 'Parch': None, 'Fare': None, 'Sex': 'female', 'Embarked': None, 'Pclass': None}
+
+
+@pytest.mark.parametrize('data, errors', [
+    ([POINT], ['The record must be a JSON object.']),
+    (POINT | {'Age': 'old'}, ['Age must be a number.']),
+    (POINT | {'SibSp': 1.5, 'Sex': 1}, ['SibSp must be an integer.', 'Sex must be a string.']),
+    (POINT | {'Parch': True}, ['Parch must be a number.']),
+    (POINT | {'Fare': 'nan'}, ['Fare must be a finite number.']),
+])
+def test_validate_errors(data: object, errors: list) -> None:
+    record = records.validate(data)
+
+    assert record.features is None
+    assert record.errors == errors
+
+
+def test_parse_body_single_object() -> None:
+    batch, is_batch = records.parse_body(json.dumps(POINT).encode('utf-8'), mimetype='application/json')
+
+    assert not is_batch
+    assert [record.features['Pclass'] for record in batch] == [3]
+
+
+def test_parse_body_json_array() -> None:
+    body = json.dumps([POINT, POINT | {'Age': 'old'}]).encode('utf-8')
+
+    batch, is_batch = records.parse_body(body, mimetype='application/json')
+
+    assert is_batch
+    assert [record.errors for record in batch] == [[], ['Age must be a number.']]
+
+
+def test_parse_body_ndjson() -> None:
+    body = f'{json.dumps(POINT)}\n\n{{bad\n{json.dumps(POINT)}\n'.encode('utf-8')
+
+    batch, is_batch = records.parse_body(body, mimetype=records.NDJSON_MIMETYPE)
+
+    assert is_batch
+    assert len(batch) == 3
+    assert batch[1].data is None
+    assert batch[1].errors[0].startswith('Invalid JSON')
+    assert batch[0].errors == batch[2].errors == []
+
+
+@pytest.mark.parametrize('body', [b'{bad', b'"a string"'])
+def test_parse_body_invalid(body: bytes) -> None:
+    with pytest.raises(ValueError):
+        records.parse_body(body, mimetype='application/json')
+
+
+def test_compile_spec_unknown_type() -> None:
+    with pytest.raises(ValueError, match='without a converter'):
+        records.compile_spec({'Age': 'timestamp'})
+
+
+def _matches(value: Any, column_type: str) -> bool:
+    """Whether BigQuery reads a JSON value as a value of a column type, numbers may be quoted."""
+    if column_type == 'STRING':
+        return isinstance(value, str)
+    if isinstance(value, bool):
+        return False
+    if column_type == 'INTEGER':
+        return isinstance(value, int) or (isinstance(value, str) and value.lstrip('-').isdigit())
+    if isinstance(value, str):
+        try:
+            float(value)
+        except ValueError:
+            return False
+        return True
+    return isinstance(value, (int, float))
+
+
+@pytest.mark.parametrize('prediction', [True, False, 1, 0.75])
+def test_prediction_row_matches_the_predictions_table(prediction: Any) -> None:
+    schema = json.loads(PREDICTIONS_SCHEMA.read_text())
+
+    row = records.prediction_row(data=POINT | {'Embarked': None}, prediction=prediction, prediction_uuid='uuid', version='v1')
+
+    assert row['model_prediction'] == float(prediction)
+    assert {field['name'] for field in schema if field['mode'] == 'REQUIRED'} <= set(row)
+    for field in schema:
+        if field['name'] in row:
+            assert _matches(row[field['name']], field['type']), field['name']
+    # The row goes through JSON as it is, with the prediction as a number
+    assert json.loads(json.dumps(row)) == row
@@ -0,0 +1,127 @@
+import json
+import pathlib
+from types import SimpleNamespace
+from unittest import mock
+
+import joblib
+import pandas as pd
+import pytest
+from google.api_core import exceptions
+from google.cloud import bigquery
+
+from d_predictions_endpoint.app import main, score
+from d_predictions_endpoint.app.funcs import models, scoring
+
+from .fakes import FakeStorageClient
+
+TITANIC_CSV = pathlib.Path(__file__).parents[4] / "resources" / "mlops_usecase" / "data" / "titanic.csv"
+TEST_MODEL = pathlib.Path(__file__).parent / "resources" / "nar-rayya"
+ENV_VARS = models.EnvVars(gcp_project_id="project", bucket_name="models", model_location="nar-rayya", predictions_table="project.dataset.predictions")
+
+
+@pytest.fixture
+def titanic_df() -> pd.DataFrame:
+    return pd.read_csv(TITANIC_CSV)
+
+
+@pytest.fixture
+def clients(tmp_path: pathlib.Path):
+    """Serves the test model, with the buckets in a folder and the load job mocked."""
+    storage_client = FakeStorageClient(tmp_path)
+    bigquery_client = mock.Mock(spec=bigquery.Client)
+    bigquery_client.load_table_from_uri.side_effect = lambda source_uri, table_fqn, job_id, job_config: SimpleNamespace(
+        result=lambda: None, output_rows=sum(len(path.read_bytes().splitlines()) for path in (tmp_path / "models" / "scoring").rglob("chunk-*"))
+    )
+    pipeline = joblib.load(TEST_MODEL)
+    served_model = models.ServedModel(version="v1", pipeline=pipeline, compiled_pipeline=main.compile_model(pipeline))
+    gcp_clients = models.GCPClients(storage_client=storage_client, bigquery_client=bigquery_client)
+
+    with mock.patch.object(main, "served_model", served_model), mock.patch.object(main, "load_clients", return_value=gcp_clients), \
+            mock.patch("builtins.print"):
+        yield gcp_clients
+
+
+def _rows(tmp_path: pathlib.Path, job: str) -> list:
+    return [json.loads(line) for path in sorted((tmp_path / "models" / "scoring" / job).glob("chunk-*")) for line in path.read_bytes().splitlines()]
+
+
+def test_score_options(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("_SCORE_SOURCE", "gs://data/passengers")
+    monkeypatch.setenv("_SCORE_JOB", "backlog")
+    monkeypatch.setenv("_SCORE_WORKERS", "3")
+
+    options = score._score_options()
+
+    assert (options.source, options.job, options.workers, options.chunk_rows) == ("gs://data/passengers", "backlog", 3, 50000)
+
+
+def test_run_bigquery_table(clients: models.GCPClients, tmp_path: pathlib.Path, titanic_df: pd.DataFrame) -> None:
+    bigquery_client = clients.bigquery_client
+    bigquery_client.get_table.return_value = SimpleNamespace(num_rows=len(titanic_df))
+    bigquery_client.list_rows.side_effect = lambda table, start_index, max_results: SimpleNamespace(
+        to_dataframe=lambda **kwargs: titanic_df.iloc[start_index:start_index + max_results]
+    )
+
+    report = score.run(options=models.ScoreOptions(source="project.dataset.passengers", job="table", chunk_rows=300, workers=2), env_vars=ENV_VARS)
+
+    assert (report["chunks"], report["chunks_resumed"], report["rows"], report["rows_loaded"]) == (3, 0, len(titanic_df), len(titanic_df))
+    assert report["rows_per_second_per_core"] > 0
+
+    # The rows of the endpoint, a single load job of every chunk
+    rows = _rows(tmp_path, "table")
+    assert [int(row["PassengerId"]) for row in rows] == titanic_df["PassengerId"].tolist()
+    assert {row["model_version"] for row in rows} == {"v1"}
+    assert {row["model_prediction"] for row in rows} <= {0.0, 1.0}
+    bigquery_client.load_table_from_uri.assert_called_once()
+    assert bigquery_client.load_table_from_uri.call_args.args[:2] == ("gs://models/scoring/table/chunk-*", ENV_VARS.predictions_table)
+    assert bigquery_client.load_table_from_uri.call_args.kwargs["job_id"] == scoring.load_job_id("table")
+
+
+def test_run_resumes_after_a_failed_chunk(clients: models.GCPClients, tmp_path: pathlib.Path, titanic_df: pd.DataFrame) -> None:
+    source = clients.storage_client.bucket("data")
+    for index, start in enumerate(range(0, len(titanic_df), 300)):
+        source.blob(f"passengers/part-{index}.csv").upload_from_string(titanic_df.iloc[start:start + 300].to_csv(index=False).encode("utf-8"))
+    # A file that cannot be read, until it is written again
+    source.blob("passengers/part-1.csv").upload_from_string(b"")
+    options = models.ScoreOptions(source="gs://data/passengers/", job="files", workers=2)
+
+    with pytest.raises(pd.errors.EmptyDataError):
+        score.run(options=options, env_vars=ENV_VARS)
+    assert len(_rows(tmp_path, "files")) == len(titanic_df) - 300
+    clients.bigquery_client.load_table_from_uri.assert_not_called()
+
+    source.blob("passengers/part-1.csv").upload_from_string(titanic_df.iloc[300:600].to_csv(index=False).encode("utf-8"))
+    report = score.run(options=options, env_vars=ENV_VARS)
+
+    assert (report["chunks"], report["chunks_resumed"], report["rows"], report["rows_loaded"]) == (3, 2, 300, len(titanic_df))
+    assert sorted(int(row["PassengerId"]) for row in _rows(tmp_path, "files")) == titanic_df["PassengerId"].tolist()
+
+    # The rows are loaded once
+    report = score.run(options=options, env_vars=ENV_VARS)
+    assert report["rows_loaded"] == len(titanic_df)
+    clients.bigquery_client.load_table_from_uri.assert_called_once()
+
+
+def test_run_does_not_load_twice_after_a_crash(clients: models.GCPClients, tmp_path: pathlib.Path, titanic_df: pd.DataFrame) -> None:
+    clients.storage_client.bucket("data").blob("passengers/part-0.csv").upload_from_string(titanic_df.to_csv(index=False).encode("utf-8"))
+    options = models.ScoreOptions(source="gs://data/passengers/", job="files", workers=1)
+    score.run(options=options, env_vars=ENV_VARS)
+    load = clients.bigquery_client.load_table_from_uri.call_args.kwargs
+
+    # The run crashed after the load job started, before writing that the chunks are loaded
+    (tmp_path / "models" / "scoring" / "files" / "_LOADED").unlink()
+    clients.bigquery_client.load_table_from_uri.side_effect = exceptions.Conflict("Already Exists")
+    clients.bigquery_client.get_job.return_value = SimpleNamespace(result=lambda: None, output_rows=len(titanic_df))
+    report = score.run(options=options, env_vars=ENV_VARS)
+
+    assert clients.bigquery_client.load_table_from_uri.call_args.kwargs["job_id"] == load["job_id"]
+    clients.bigquery_client.get_job.assert_called_once_with(load["job_id"])
+    assert report["rows_loaded"] == len(titanic_df)
+
+
+def test_run_with_other_options(clients: models.GCPClients, tmp_path: pathlib.Path, titanic_df: pd.DataFrame) -> None:
+    clients.storage_client.bucket("data").blob("passengers/part-0.csv").upload_from_string(titanic_df.to_csv(index=False).encode("utf-8"))
+    score.run(options=models.ScoreOptions(source="gs://data/passengers/", job="files", workers=1), env_vars=ENV_VARS)
+
+    with pytest.raises(ValueError, match="was started with source"):
+        score.run(options=models.ScoreOptions(source="project.dataset.passengers", job="files"), env_vars=ENV_VARS)
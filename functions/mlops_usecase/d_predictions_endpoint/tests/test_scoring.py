@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from d_predictions_endpoint.app.funcs import models, records, scoring
+
+POINT = {'Age': 22, 'SibSp': 1, 'Parch': 0, 'Fare': 7.25, 'Sex': 'male', 'Embarked': 'S', 'Pclass': 3}
+
+
+def test_table_chunks() -> None:
+    chunks = scoring.table_chunks(table_fqn='p.d.t', num_rows=25, chunk_rows=10)
+
+    assert [(chunk.start, chunk.rows) for chunk in chunks] == [(0, 10), (10, 10), (20, 5)]
+    assert [chunk.name for chunk in chunks] == ['chunk-000000.json', 'chunk-000001.json', 'chunk-000002.json']
+    assert scoring.table_chunks(table_fqn='p.d.t', num_rows=0, chunk_rows=10) == []
+
+
+def test_file_chunks_and_finished_chunks() -> None:
+    chunks = scoring.file_chunks(['in/b.csv', 'in/a.CSV', 'in/_SUCCESS'])
+
+    assert [(chunk.index, chunk.source) for chunk in chunks] == [(0, 'in/a.CSV'), (1, 'in/b.csv')]
+    assert scoring.finished_chunks(['scoring/job/manifest.json', 'scoring/job/chunk-000002.json', 'scoring/job/chunk-000010.json']) == {2, 10}
+
+
+def test_split_gcs_uri() -> None:
+    assert scoring.split_gcs_uri('gs://bucket/some/prefix') == ('bucket', 'some/prefix')
+    assert scoring.split_gcs_uri('gs://bucket') == ('bucket', '')
+    with pytest.raises(ValueError):
+        scoring.split_gcs_uri('p.d.t')
+
+
+def test_check_manifest() -> None:
+    options = models.ScoreOptions(source='p.d.t', job='backlog', chunk_rows=10)
+    manifest = scoring.job_manifest(options=options, version='v1', chunks=3)
+
+    scoring.check_manifest(manifest=manifest, options=options._replace(workers=8))
+    with pytest.raises(ValueError, match='chunk_rows'):
+        scoring.check_manifest(manifest=manifest, options=options._replace(chunk_rows=20))
+    with pytest.raises(ValueError, match='its source has 4 now'):
+        scoring.check_manifest(manifest=manifest, options=options, chunks=4)
+
+
+def test_frame_records() -> None:
+    frame = pd.DataFrame({'Age': [22.0, np.nan, 0.42], 'Sex': ['male', None, 'female']})
+
+    assert scoring.frame_records(frame) == [{'Age': 22, 'Sex': 'male'}, {'Age': None, 'Sex': None}, {'Age': 0.42, 'Sex': 'female'}]
+
+
+def test_score_records() -> None:
+    calls = []
+
+    def _predict(features: list) -> list:
+        calls.append(features)
+        return [1] * len(features)
+
+    rows, invalid = scoring.score_records(data=[POINT, POINT | {'Age': 'old'}, POINT | {'PassengerId': 7}], predict=_predict, version='v1')
+
+    assert invalid == 1
+    assert len(calls) == 1 and len(calls[0]) == 2
+    assert rows[1]['PassengerId'] == '7'
+    assert {row['model_version'] for row in rows} == {'v1'}
+    assert rows[0] == records.prediction_row(data=POINT, prediction=1, prediction_uuid=rows[0]['uuid'], version='v1')
+    assert [json.loads(line) for line in scoring.ndjson(rows).splitlines()] == rows
+
+
+def test_throughput() -> None:
+    assert scoring.throughput(rows=1000, seconds=2.0, cores=4) == {'rows_per_second': 500.0, 'rows_per_second_per_core': 125.0}
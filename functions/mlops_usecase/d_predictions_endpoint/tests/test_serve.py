@@ -0,0 +1,130 @@
+import pathlib
+import threading
+from unittest import mock
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from google.cloud import bigquery, storage
+
+from d_predictions_endpoint.app import main, serve
+from d_predictions_endpoint.app.funcs import gcp_apis, models, records
+
+TEST_MODEL = pathlib.Path(__file__).parent / "resources" / "nar-rayya"
+
+
+def _points(n: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    return [
+        {"Age": float(rng.uniform(1, 80)) if rng.random() > 0.1 else None, "SibSp": int(rng.integers(0, 4)), "Parch": int(rng.integers(0, 3)),
+         "Fare": float(rng.uniform(5, 100)), "Sex": str(rng.choice(["male", "female"])), "Embarked": str(rng.choice(["S", "C", "Q"])),
+         "Pclass": int(rng.integers(1, 4))}
+        for _ in range(n)
+    ]
+
+
+@pytest.fixture
+def served(request, monkeypatch: pytest.MonkeyPatch):
+    """Serves the test model, compiled or not, with the BigQuery inserts mocked."""
+    monkeypatch.setenv("_SERVE_PRELOAD", "yes")
+    pipeline = joblib.load(TEST_MODEL)
+    compiled_pipeline = main.compile_model(pipeline) if request.param == "compiled" else None
+    served_model = models.ServedModel(version="v1", pipeline=pipeline, compiled_pipeline=compiled_pipeline)
+    with mock.patch.object(main, "served_model", served_model), \
+            mock.patch.object(main, "load_clients", return_value=models.GCPClients(bigquery_client=mock.Mock(spec=bigquery.Client))), \
+            mock.patch.object(main, "prediction_logger", None), \
+            mock.patch.object(main, "prediction_cache", None), \
+            mock.patch.object(main, "request_coalescer", None), \
+            mock.patch.object(main.gcp_apis, "bigquery_insert_json_row") as mock_insert:
+        yield mock_insert
+
+        if main.prediction_logger is not None:
+            main.prediction_logger.close()
+
+
+def test_serve_options(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("PORT", "9000")
+    monkeypatch.setenv("_SERVE_WORKERS", "3")
+    monkeypatch.setenv("_SERVE_THREADS", "4")
+
+    options = serve._serve_options()
+
+    assert options.bind == "0.0.0.0:9000"
+    assert (options.workers, options.threads, options.blas_threads) == (3, 4, 1)
+
+
+def test_serving_application_preloads_the_model() -> None:
+    application = serve.ServingApplication(options=models.ServeOptions(workers=3, threads=4))
+
+    assert application.cfg.preload_app
+    assert (application.cfg.workers, application.cfg.threads) == (3, 4)
+    assert application.cfg.worker_class_str == "gthread"
+    assert application.cfg.post_fork is serve.post_fork
+
+
+@pytest.mark.parametrize("served", ["compiled"], indirect=True)
+def test_create_app_predicts(served: mock.Mock) -> None:
+    app = serve.create_app()
+
+    response = app.test_client().post("/", json=_points(1)[0])
+
+    assert response.status_code == 200
+    assert response.get_json()["prediction"] in (0, 1)
+
+
+def test_post_fork_pins_threads_and_restarts_the_poller() -> None:
+    poller = gcp_apis.BlobPoller(CS=mock.Mock(spec=storage.Client), bucket_name="b", blob_name="m.latest", on_change=mock.Mock(), interval=3600)
+    worker_clients = models.GCPClients(storage_client=mock.Mock(spec=storage.Client))
+
+    with mock.patch.object(main, "model_poller", poller), mock.patch.object(main, "load_clients", return_value=worker_clients), \
+            mock.patch("threadpoolctl.threadpool_limits") as mock_limits:
+        serve.post_fork(server=None, worker=None)
+
+    try:
+        mock_limits.assert_called_once_with(limits=1)
+        assert poller.CS is worker_clients.storage_client
+        assert poller._thread is not None and poller._thread.is_alive()
+    finally:
+        poller.close()
+
+
+@pytest.mark.parametrize("served", ["compiled", "pipeline"], indirect=True)
+def test_predict_is_thread_safe(served: mock.Mock) -> None:
+    """Concurrent requests, while versions are swapped in, get the predictions of sequential ones."""
+    points = _points(320)
+    pipeline = main.served_model.pipeline
+    features = [records.validate(point).features for point in points]
+    expected = pipeline.predict(pd.DataFrame.from_records(features, columns=list(records.FEATURES))).tolist()
+
+    app = serve.create_app()
+    threads = 16
+    barrier = threading.Barrier(threads + 1)
+    results = [None] * len(points)
+    errors = []
+
+    def _client(offset: int) -> None:
+        client = app.test_client()
+        barrier.wait()
+        try:
+            for index in range(offset, len(points), threads):
+                results[index] = client.post("/", json=points[index]).get_json()["prediction"]
+        except Exception as e:
+            errors.append(e)
+
+    clients = [threading.Thread(target=_client, args=(offset,)) for offset in range(threads)]
+    for client in clients:
+        client.start()
+    barrier.wait()
+
+    # The same pipeline swapped in again and again as new versions, while the requests run
+    with mock.patch("builtins.print"):
+        version = 1
+        while any(client.is_alive() for client in clients):
+            version += 1
+            main.swap_model(main.served_model._replace(version=f"v{version}"))
+    for client in clients:
+        client.join(timeout=30)
+
+    assert not errors
+    assert results == expected